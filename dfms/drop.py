@@ -34,6 +34,7 @@ import math
 import os
 import random
 import shutil
+import tempfile
 import threading
 import time
 import re
@@ -976,18 +977,65 @@ class NgasDROP(AbstractDROP):
 class InMemoryDROP(AbstractDROP):
     """
     A DROP that points data stored in memory.
+
+    Once COMPLETED, its data can be spilled into a file to free memory, in
+    which case reads are served from the file until it's unspilled again.
     """
 
     def initialize(self, **kwargs):
         self._buf = BytesIO()
+        self._bufId = id(self._buf)
+        self._spillFile = None
+        self._spillLock = threading.Lock()
 
     def getIO(self):
-        return MemoryIO(self._buf)
+        with self._spillLock:
+            if self._spillFile is not None:
+                return FileIO(self._spillFile)
+            return MemoryIO(self._buf)
+
+    @property
+    def spilled(self):
+        """
+        Whether the data of this DROP currently lives in a spill file
+        """
+        return self._spillFile is not None
+
+    def spill(self, dirname):
+        """
+        Moves the data of this DROP into a file under `dirname`. Readers that
+        already opened this DROP keep reading from memory.
+        """
+        if self.status != DROPStates.COMPLETED:
+            raise Exception("%r is in state %s (!=COMPLETED), cannot be spilled" % (self, self.status))
+        with self._spillLock:
+            if self._spillFile is not None:
+                return
+            # UIDs are only unique within a session, so they cannot be used
+            # as file names by themselves
+            prefix = re.sub(':|%s' % os.sep, '_', self.uid) + '_'
+            fd, fname = tempfile.mkstemp(prefix=prefix, dir=dirname)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._buf.getvalue())
+            self._spillFile = fname
+            self._buf = None
+
+    def unspill(self):
+        """
+        Brings the data of this DROP back into memory from its spill file
+        """
+        with self._spillLock:
+            if self._spillFile is None:
+                return
+            with open(self._spillFile, 'rb') as f:
+                self._buf = BytesIO(f.read())
+            os.unlink(self._spillFile)
+            self._spillFile = None
 
     @property
     def dataURL(self):
         hostname = os.uname()[1]
-        return "mem://%s/%d/%d" % (hostname, os.getpid(), id(self._buf))
+        return "mem://%s/%d/%d" % (hostname, os.getpid(), self._bufId)
 
 class NullDROP(AbstractDROP):
     """
@@ -1381,6 +1429,19 @@ class InputFiredAppDROP(AppDROP):
         if self._n_tries < 1:
             raise InvalidDropException(self, 'Invalid n_tries, must be a positive number')
 
+        # Resources needed by this application while it runs. Memory and
+        # scratch disk space are given in MB. When executed by a Node Manager
+        # that enforces resource limits the execution is delayed until these
+        # resources are available in the node.
+        try:
+            self._resources = {'num_cpus': int(self._getArg(kwargs, 'num_cpus', 1)),
+                               'memory':   float(self._getArg(kwargs, 'memory', 0)),
+                               'scratch':  float(self._getArg(kwargs, 'scratch', 0))}
+        except ValueError:
+            raise InvalidDropException(self, 'Invalid resource requirements, must be numbers')
+        if any(v < 0 for v in self._resources.values()):
+            raise InvalidDropException(self, 'Invalid resource requirements, must be non-negative')
+
     def addStreamingInput(self, streamingInputDrop, back=True):
         raise InvalidRelationshipException(DROPRel(streamingInputDrop, DROPLinkType.STREAMING_INPUT, self),
                                            "InputFiredAppDROPs don't accept streaming inputs")
@@ -1427,13 +1488,36 @@ class InputFiredAppDROP(AppDROP):
             else:
                 self.async_execute()
 
+    @property
+    def resources(self):
+        """
+        The resources needed by this application while it runs
+        """
+        return dict(self._resources)
+
     def async_execute(self):
         # Return immediately, but schedule the execution of this app
+        # If we have been given a resource ledger we first need to wait until
+        # the resources we need are available
+        ledger = getattr(self, '_resource_ledger', None)
+        if ledger is None:
+            self._start_execution(self.execute)
+            return
+
+        resources = self.resources
+        def execute_and_release():
+            try:
+                self.execute()
+            finally:
+                ledger.release(resources)
+        ledger.admit(resources, lambda: self._start_execution(execute_and_release))
+
+    def _start_execution(self, execute):
         # If we have been given a thread pool use that
         if hasattr(self, '_tp'):
-            self._tp.apply_async(self.execute)
+            self._tp.apply_async(execute)
         else:
-            t = threading.Thread(target=self.execute)
+            t = threading.Thread(target=execute)
             t.daemon = 1
             t.start()
 
@@ -0,0 +1,994 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+An array-backed representation of the DAGs partitioned by the schedulers.
+
+`ArrayDAG` stores node and edge attributes as NumPy columns, and the
+structure of the graph as CSR arrays of successors and predecessors, with its
+topological order cached until the structure changes. It offers the subset of
+the networkx ``DiGraph`` interface used by the schedulers and the PGTs
+(``G.node[u]``, ``G.edge[u][v]``, ``G.edges(data=True)``, etc.), where
+attribute dictionaries are views reading and writing through to the columns,
+plus vectorised versions of the algorithms the schedulers run the most.
+
+Nodes are identified by their IDs, like in networkx, and internally by their
+position in the columns. Nodes and edges are iterated over in the order a
+networkx graph built the same way would follow.
+"""
+
+import numbers
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
+import networkx as nx
+import numpy as np
+import six
+
+
+_missing = object()
+_int_types = set(six.integer_types + (np.int64, np.int32))
+
+def _is_real(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+def _indptr(rows, n):
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr
+
+def _gather(indptr, rows):
+    """
+    Returns the positions of the CSR entries of `rows`, grouped by row and in
+    the same order than `rows`
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    ends = np.cumsum(counts)
+    if (len(ends) == 0 or ends[-1] == 0):
+        return np.zeros(0, dtype=np.int64)
+    return np.repeat(starts - ends + counts, counts) + np.arange(ends[-1])
+
+class _Column(object):
+    """
+    The values of an attribute, plus a mask of the entries without one (None
+    if they all have it). Real numbers are kept in numeric arrays, anything
+    else in object arrays. Arrays can be longer than the number of entries.
+    """
+
+    __slots__ = ('values', 'absent')
+
+    def __init__(self, values, absent=None):
+        self.values = values
+        self.absent = absent
+
+    @staticmethod
+    def from_values(values):
+        values = list(values)
+        absent = None
+        if any(v is _missing for v in values):
+            absent = np.array([v is _missing for v in values], dtype=bool)
+        present = [v for v in values if v is not _missing]
+        if all(isinstance(v, numbers.Integral) and not isinstance(v, bool) for v in present):
+            arr = np.array([0 if v is _missing else v for v in values], dtype=np.int64)
+        elif all(_is_real(v) for v in present):
+            arr = np.array([0 if v is _missing else v for v in values], dtype=np.float64)
+        else:
+            arr = np.empty(len(values), dtype=object)
+            for i, v in enumerate(values):
+                arr[i] = None if v is _missing else v
+        return _Column(arr, absent)
+
+    @staticmethod
+    def empty(n):
+        return _Column(np.zeros(n, dtype=np.int64), np.ones(n, dtype=bool))
+
+    def copy(self):
+        return _Column(self.values.copy(), None if self.absent is None else self.absent.copy())
+
+    def resize(self, n):
+        """Makes room for at least `n` entries, the new ones being absent"""
+        old = len(self.values)
+        if (n <= old):
+            return
+        n = max(n, 2 * old)
+        values = np.zeros(n, dtype=self.values.dtype)
+        if (values.dtype.kind == 'O'):
+            values[:] = None
+        values[:old] = self.values
+        absent = np.ones(n, dtype=bool)
+        absent[:old] = False if self.absent is None else self.absent
+        self.values = values
+        self.absent = absent
+
+    def has(self, i):
+        return self.absent is None or not self.absent[i]
+
+    def get(self, i, default=None):
+        if (self.absent is not None and self.absent[i]):
+            return default
+        v = self.values[i]
+        return v if self.values.dtype.kind == 'O' else v.item()
+
+    def set(self, i, value):
+        values = self.values
+        kind = values.dtype.kind
+        if (kind != 'O'):
+            if (not _is_real(value)):
+                self.values = values = values.astype(object)
+            elif (kind in 'iu' and not isinstance(value, numbers.Integral)):
+                self.values = values = values.astype(np.float64)
+        values[i] = value
+        if (self.absent is not None):
+            self.absent[i] = False
+
+    def unset(self, i):
+        if (self.absent is None):
+            self.absent = np.zeros(len(self.values), dtype=bool)
+        self.absent[i] = True
+        if (self.values.dtype.kind == 'O'):
+            self.values[i] = None
+
+    def numeric(self, n, default):
+        """Returns the first `n` values as a numeric array, absent ones as `default`"""
+        values = self.values[:n]
+        if (values.dtype.kind == 'O'):
+            values = values.astype(np.float64)
+        if (self.absent is not None and self.absent[:n].any()):
+            values = np.where(self.absent[:n], default, values)
+        return values
+
+class ArrayDAG(object):
+    """
+    A directed acyclic graph stored in arrays.
+
+    ids: the IDs of the nodes, in the order of their attributes
+    src, dst: the positions (in `ids`) of the nodes at both ends of each edge,
+              in the order the edges were added. Repeated edges are merged
+              like networkx does (the last attributes win)
+    node_attrs, edge_attrs: {name : values}, where values are given in the
+              order of `ids` and `src`/`dst` respectively. A value of
+              `ArrayDAG.missing` means the node/edge doesn't have the attribute
+    order: the positions of the nodes in the order they are iterated over
+           (by default the same order than `ids`)
+
+    Edges added after the graph is built are kept apart from the CSR arrays
+    until the structure is needed again, so adding edges one by one is cheap.
+    """
+
+    missing = _missing
+
+    def __init__(self, ids, src=(), dst=(), node_attrs=None, edge_attrs=None, order=None):
+        n = len(ids)
+        ids = _Column.from_values(ids).values
+        self._n = n
+        self._ids = ids
+        self._dense = n if (ids.dtype.kind == 'i' and np.array_equal(ids, np.arange(1, n + 1))) else 0
+        self._index = {} if self._dense else dict((v, i) for i, v in enumerate(ids.tolist()))
+        self._order = np.arange(n, dtype=np.int64) if order is None else np.asarray(order, dtype=np.int64)
+        self._ncols = dict((k, _Column.from_values(v)) for k, v in (node_attrs or {}).items())
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        ecols = dict((k, _Column.from_values(v)) for k, v in (edge_attrs or {}).items())
+        keep = self._merge_repeated(n, src, dst, ecols)
+        if (keep is not None):
+            src, dst = src[keep], dst[keep]
+            ecols = dict((k, _Column(c.values[keep], None if c.absent is None else c.absent[keep]))
+                         for k, c in ecols.items())
+        self._m = len(src)
+        self._src = src
+        self._dst = dst
+        self._dead = None
+        self._ecols = ecols
+        self._adj_lists = None
+        self.graph = {}
+        # what this DAG doesn't share with its copies (None: everything)
+        self._owned = None
+        self._invalidate()
+        self._compact()
+
+    @staticmethod
+    def _merge_repeated(n, src, dst, ecols):
+        """
+        Returns which edges to keep if some are repeated (None otherwise),
+        moving the attributes of the last repetition into the first one
+        """
+        if (len(src) == 0):
+            return None
+        key = src * n + dst
+        order = np.argsort(key, kind='mergesort')
+        skey = key[order]
+        starts = np.flatnonzero(np.r_[True, skey[1:] != skey[:-1]])
+        if (len(starts) == len(src)):
+            return None
+        ends = np.r_[starts[1:], len(src)] - 1
+        first, last = order[starts], order[ends]
+        for c in ecols.values():
+            c.values[first] = c.values[last]
+            if (c.absent is not None):
+                c.absent[first] = c.absent[last]
+        return np.sort(first)
+
+    @staticmethod
+    def insertion_order(n, src, dst):
+        """
+        Returns the order in which networkx would iterate over the nodes of a
+        graph built by adding each node (in position order) followed by its
+        outgoing edges, which also adds the successors not seen yet
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        order = np.argsort(src, kind='mergesort')
+        counts = np.bincount(src, minlength=n)
+        # the sequence in which nodes are mentioned
+        starts = np.cumsum(counts) - counts + np.arange(n)
+        events = np.empty(n + len(src), dtype=np.int64)
+        is_start = np.zeros(len(events), dtype=bool)
+        is_start[starts] = True
+        events[starts] = np.arange(n)
+        events[~is_start] = dst[order]
+        _, first = np.unique(events, return_index=True)
+        return np.argsort(first, kind='mergesort')
+
+    @staticmethod
+    def from_networkx(G):
+        """Returns an ArrayDAG with the same nodes, edges and attributes than `G`"""
+        nodes = list(G.nodes(data=True))
+        edges = list(G.edges(data=True))
+        ids = [n for n, _ in nodes]
+        index = dict((n, i) for i, n in enumerate(ids))
+        node_attrs = {}
+        for i, (_, data) in enumerate(nodes):
+            for k, v in data.items():
+                node_attrs.setdefault(k, [_missing] * len(nodes))[i] = v
+        edge_attrs = {}
+        for i, (_, _, data) in enumerate(edges):
+            for k, v in data.items():
+                edge_attrs.setdefault(k, [_missing] * len(edges))[i] = v
+        dag = ArrayDAG(ids, [index[u] for u, _, _ in edges], [index[v] for _, v, _ in edges],
+                       node_attrs, edge_attrs)
+        dag.graph.update(G.graph)
+        return dag
+
+    def to_networkx(self):
+        """Returns a networkx DiGraph with the same nodes, edges and attributes"""
+        G = nx.DiGraph()
+        G.graph.update(self.graph)
+        for n, data in self.nodes(data=True):
+            G.add_node(n, **dict(data))
+        for u, v, data in self.edges(data=True):
+            G.add_edge(u, v, **dict(data))
+        return G
+
+    def copy(self):
+        """
+        Returns a copy of this DAG. Both DAGs share their arrays until they
+        modify them (see `_own`), so copying only costs as much as the number
+        of attributes, plus the adjacency lists used by `has_path` being
+        rebuilt if the copy needs them
+        """
+        other = ArrayDAG.__new__(ArrayDAG)
+        other.__dict__.update(self.__dict__)
+        other._ncols = dict(self._ncols)
+        other._ecols = dict(self._ecols)
+        other._adj_lists = None
+        other.graph = dict(self.graph)
+        self._owned = set()
+        other._owned = set()
+        return other
+
+    def _own(self, what):
+        """
+        Makes a private copy of the data identified by `what` if it could
+        still be shared with other copies of this DAG. `what` is 'index' for
+        the positions of the nodes, 'edges' for the edge arrays and lists, or
+        a ('n', name) or ('e', name) tuple for node and edge attributes.
+        Arrays that are only replaced, never written (e.g., the CSR arrays),
+        don't need this.
+        """
+        owned = self._owned
+        if (owned is None or what in owned):
+            return
+        if (what == 'index'):
+            self._index = dict(self._index)
+        elif (what == 'edges'):
+            self._src = self._src.copy()
+            self._dst = self._dst.copy()
+            self._dead = None if self._dead is None else self._dead.copy()
+            self._extra_out = dict((k, list(v)) for k, v in self._extra_out.items())
+            self._extra_in = dict((k, list(v)) for k, v in self._extra_in.items())
+            self._extra_index = dict(self._extra_index)
+        else:
+            cols = self._ncols if what[0] == 'n' else self._ecols
+            if (what[1] in cols):
+                cols[what[1]] = cols[what[1]].copy()
+        owned.add(what)
+
+    # --------------------------------------------------------------------
+    # Internal structure
+    # --------------------------------------------------------------------
+
+    def _invalidate(self):
+        """Called when the structure changes, dropping everything derived from it"""
+        self._stale = True
+        self._topo = None
+        self._levels = None
+        self._edge_order = None
+
+    def _compact(self):
+        """Rebuilds the CSR arrays if the structure of the graph changed"""
+        if (not self._stale):
+            return
+        n, m = self._n, self._m
+        eids = np.arange(m, dtype=np.int64)
+        if (self._dead is not None):
+            eids = eids[~self._dead[:m]]
+        src = self._src[eids]
+        dst = self._dst[eids]
+        # stable sorts keep the order in which edges were added
+        order = np.argsort(src, kind='mergesort')
+        self._out_ptr = _indptr(src, n)
+        self._out_eid = eids[order]
+        order = np.argsort(dst, kind='mergesort')
+        self._in_ptr = _indptr(dst, n)
+        self._in_eid = eids[order]
+        order = np.lexsort((dst, src))
+        self._key_eid = eids[order]
+        self._key_dst = dst[order]
+        self._extra_out = {}
+        self._extra_in = {}
+        self._extra_index = {}
+        self._stale = False
+
+    def _structure(self):
+        """
+        Returns the topological order of the nodes (positions, by level and
+        then in iteration order) and their levels (the number of edges of
+        the longest path reaching them), computing them if needed
+        """
+        self._compact()
+        if (self._topo is None):
+            n = self._n
+            rank = self._rank()
+            succ = self._dst[self._out_eid]
+            indeg = np.diff(self._in_ptr)
+            levels = np.zeros(n, dtype=np.int64)
+            frontier = np.flatnonzero(indeg == 0)
+            topo = []
+            level = 0
+            while len(frontier):
+                frontier = frontier[np.argsort(rank[frontier], kind='mergesort')]
+                levels[frontier] = level
+                topo.append(frontier)
+                targets, counts = np.unique(succ[_gather(self._out_ptr, frontier)], return_counts=True)
+                indeg[targets] -= counts
+                frontier = targets[indeg[targets] == 0]
+                level += 1
+            topo = np.concatenate(topo) if topo else np.zeros(0, dtype=np.int64)
+            if (len(topo) < n):
+                raise nx.NetworkXUnfeasible("Graph contains a cycle.")
+            self._topo = topo
+            self._levels = levels
+            self._levels_list = levels.tolist()
+        return self._topo, self._levels
+
+    def _rank(self):
+        rank = np.empty(self._n, dtype=np.int64)
+        rank[self._order] = np.arange(self._n)
+        return rank
+
+    def _pos(self, n):
+        if ((type(n) in _int_types or isinstance(n, numbers.Integral)) and 0 < n <= self._dense):
+            return int(n) - 1
+        return self._index[n]
+
+    def _has_pos(self, n):
+        try:
+            self._pos(n)
+            return True
+        except (KeyError, TypeError):
+            return False
+
+    def _is_dead(self, e):
+        return self._dead is not None and self._dead[e]
+
+    def _eid(self, i, j):
+        """Returns the ID of the edge between positions i and j, or -1"""
+        e = self._extra_index.get((i, j), -1)
+        if (e >= 0 and not self._is_dead(e)):
+            return e
+        ptr = self._out_ptr
+        if (i + 1 < len(ptr)):
+            a, b = ptr[i], ptr[i + 1]
+            if (a < b):
+                k = a + np.searchsorted(self._key_dst[a:b], j)
+                if (k < b and self._key_dst[k] == j):
+                    e = int(self._key_eid[k])
+                    if (not self._is_dead(e)):
+                        return e
+        return -1
+
+    def _edge_ids(self, i, out=True):
+        """Returns the IDs of the edges going out of (or into) position i"""
+        if (out):
+            ptr, eids, extra = self._out_ptr, self._out_eid, self._extra_out
+        else:
+            ptr, eids, extra = self._in_ptr, self._in_eid, self._extra_in
+        if (i + 1 < len(ptr)):
+            eids = eids[ptr[i]:ptr[i + 1]]
+            if (self._dead is not None):
+                eids = eids[~self._dead[eids]]
+        else:
+            eids = eids[0:0]
+        more = extra.get(i, None)
+        if (more):
+            eids = np.concatenate((eids, more))
+        return eids
+
+    def _adjacency(self):
+        """
+        Returns the successors and predecessors of each node as lists of
+        positions, which are faster to walk through. They are built when
+        first needed and kept up to date from then on.
+        """
+        if (self._adj_lists is None):
+            self._compact()
+            lists = []
+            for ptr, others in ((self._out_ptr, self._dst[self._out_eid]),
+                                (self._in_ptr, self._src[self._in_eid])):
+                ptr = ptr.tolist()
+                others = others.tolist()
+                lists.append([others[ptr[i]:ptr[i + 1]] for i in range(self._n)])
+            self._adj_lists = tuple(lists)
+        return self._adj_lists
+
+    def _neighbours(self, i, out=True):
+        eids = self._edge_ids(i, out)
+        others = self._dst[eids] if out else self._src[eids]
+        return self._ids[others].tolist(), eids.tolist()
+
+    def _add_nodes(self, ids):
+        """Adds new nodes with the given IDs, returning their positions"""
+        old = self._n
+        n = old + len(ids)
+        if (ids):
+            self._own('index')
+        for k, v in enumerate(ids):
+            self._index[v] = old + k
+        if (ids):
+            new = _Column.from_values(ids).values
+            if (self._ids.dtype != new.dtype):
+                self._ids = self._ids.astype(object)
+            self._ids = np.concatenate((self._ids, new))
+        self._order = np.concatenate((self._order, np.arange(old, n, dtype=np.int64)))
+        self._n = n
+        if (self._adj_lists is not None):
+            for l in self._adj_lists:
+                l.extend([] for _ in ids)
+        for c in self._ncols.values():
+            c.resize(n)
+        self._invalidate()
+        return range(old, n)
+
+    def _new_edge(self, i, j):
+        self._own('edges')
+        e = self._m
+        if (e >= len(self._src)):
+            size = max(e + 1, 2 * e)
+            for name in ('_src', '_dst'):
+                arr = np.zeros(size, dtype=np.int64)
+                arr[:e] = getattr(self, name)[:e]
+                setattr(self, name, arr)
+            if (self._dead is not None):
+                dead = np.zeros(size, dtype=bool)
+                dead[:e] = self._dead[:e]
+                self._dead = dead
+        for c in self._ecols.values():
+            c.resize(e + 1)
+        self._src[e] = i
+        self._dst[e] = j
+        self._m = e + 1
+        # the CSR arrays are still used (with the new edge on the side) until
+        # the structure is needed again
+        self._extra_out.setdefault(i, []).append(e)
+        self._extra_in.setdefault(j, []).append(e)
+        self._extra_index[(i, j)] = e
+        if (self._adj_lists is not None):
+            self._adj_lists[0][i].append(j)
+            self._adj_lists[1][j].append(i)
+        self._invalidate()
+        return e
+
+    def _set_attr(self, cols, size, i, key, value):
+        col = cols.get(key, None)
+        if (col is None):
+            col = cols[key] = _Column.empty(size)
+        col.set(i, value)
+
+    def _set_node_attr(self, i, key, value):
+        self._own(('n', key))
+        self._set_attr(self._ncols, len(self._ids), i, key, value)
+
+    def _set_edge_attr(self, e, key, value):
+        self._own(('e', key))
+        self._set_attr(self._ecols, len(self._src), e, key, value)
+
+    # --------------------------------------------------------------------
+    # networkx DiGraph interface
+    # --------------------------------------------------------------------
+
+    @property
+    def node(self):
+        return _NodeMap(self)
+
+    @property
+    def succ(self):
+        return _Adjacency(self, True)
+
+    adj = succ
+    edge = succ
+
+    @property
+    def pred(self):
+        return _Adjacency(self, False)
+
+    def __getitem__(self, n):
+        return self.succ[n]
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        return iter(self._ids[self._order].tolist())
+
+    def __contains__(self, n):
+        return self._has_pos(n)
+
+    def has_node(self, n):
+        return self._has_pos(n)
+
+    def number_of_nodes(self):
+        return self._n
+
+    def number_of_edges(self):
+        if (self._dead is None):
+            return self._m
+        return self._m - int(self._dead[:self._m].sum())
+
+    def nodes(self, data=False):
+        ids = self._ids[self._order].tolist()
+        if (not data):
+            return ids
+        return [(n, _NodeAttrs(self, i)) for n, i in zip(ids, self._order.tolist())]
+
+    def _edges_in_order(self):
+        if (self._edge_order is None):
+            self._compact()
+            eids = self._out_eid
+            rank = self._rank()
+            self._edge_order = eids[np.argsort(rank[self._src[eids]], kind='mergesort')]
+        return self._edge_order
+
+    def _edge_list(self, eids, data):
+        us = self._ids[self._src[eids]].tolist()
+        vs = self._ids[self._dst[eids]].tolist()
+        if (not data):
+            return list(zip(us, vs))
+        return [(u, v, _EdgeAttrs(self, e)) for u, v, e in zip(us, vs, eids.tolist())]
+
+    def edges(self, data=False):
+        return self._edge_list(self._edges_in_order(), data)
+
+    def edges_by_weight(self, weight='weight', default_weight=1, data=True):
+        """
+        Returns the edges sorted by decreasing weight, equally weighted edges
+        staying in iteration order
+        """
+        eids = self._edges_in_order()
+        ws = self._ecols[weight].numeric(self._m, default_weight)[eids] if weight in self._ecols else None
+        if (ws is not None):
+            eids = eids[np.argsort(-ws, kind='mergesort')]
+        return self._edge_list(eids, data)
+
+    def successors(self, n):
+        return self._neighbours(self._pos(n), True)[0]
+
+    neighbors = successors
+
+    def predecessors(self, n):
+        return self._neighbours(self._pos(n), False)[0]
+
+    def has_edge(self, u, v):
+        try:
+            return self._eid(self._pos(u), self._pos(v)) >= 0
+        except KeyError:
+            return False
+
+    def add_node(self, n, attr_dict=None, **attr):
+        self.add_nodes_from([n], **dict(attr_dict or {}, **attr))
+
+    def add_nodes_from(self, nodes, **attr):
+        nodes = [(n[0], n[1]) if isinstance(n, tuple) else (n, {}) for n in nodes]
+        new = []
+        seen = set()
+        for n, _ in nodes:
+            if (not self._has_pos(n) and n not in seen):
+                new.append(n)
+                seen.add(n)
+        self._add_nodes(new)
+        for n, data in nodes:
+            i = self._pos(n)
+            for k, v in attr.items():
+                self._set_node_attr(i, k, v)
+            for k, v in data.items():
+                self._set_node_attr(i, k, v)
+
+    def add_edge(self, u, v, attr_dict=None, **attr):
+        new = [n for n in (u, v) if not self._has_pos(n)]
+        if (new):
+            self.add_nodes_from(new)
+        i, j = self._pos(u), self._pos(v)
+        e = self._eid(i, j)
+        if (e < 0):
+            e = self._new_edge(i, j)
+        for k, val in six.iteritems(dict(attr_dict or {}, **attr)):
+            self._set_edge_attr(e, k, val)
+
+    def add_edges_from(self, ebunch, attr_dict=None, **attr):
+        attr = dict(attr_dict or {}, **attr)
+        for ed in ebunch:
+            data = dict(attr, **ed[2]) if len(ed) == 3 else attr
+            self.add_edge(ed[0], ed[1], **data)
+
+    def add_weighted_edges_from(self, ebunch, weight='weight', **attr):
+        self.add_edges_from(((u, v, {weight: w}) for u, v, w in ebunch), **attr)
+
+    def remove_edge(self, u, v):
+        try:
+            i, j = self._pos(u), self._pos(v)
+        except KeyError:
+            i = j = None
+        e = -1 if i is None else self._eid(i, j)
+        if (e < 0):
+            raise nx.NetworkXError("The edge %s-%s not in graph." % (u, v))
+        self._own('edges')
+        if (self._dead is None):
+            self._dead = np.zeros(len(self._src), dtype=bool)
+        self._dead[e] = True
+        if (self._extra_index.get((i, j), -1) == e):
+            del self._extra_index[(i, j)]
+            self._extra_out[i].remove(e)
+            self._extra_in[j].remove(e)
+        if (self._adj_lists is not None):
+            self._adj_lists[0][i].remove(j)
+            self._adj_lists[1][j].remove(i)
+        # dead edges are dropped from the CSR arrays on the next rebuild
+        self._invalidate()
+
+    def remove_edges_from(self, ebunch):
+        for ed in ebunch:
+            try:
+                self.remove_edge(ed[0], ed[1])
+            except nx.NetworkXError:
+                pass
+
+    # --------------------------------------------------------------------
+    # Vectorised algorithms
+    # --------------------------------------------------------------------
+
+    def node_array(self, name):
+        """
+        Returns the values of the numeric node attribute `name` as an array
+        indexed by node position, which can be modified in place to change
+        them all at once (until nodes are added or the DAG is copied). All
+        nodes must have the attribute.
+        """
+        self._own(('n', name))
+        col = self._ncols[name]
+        n = self._n
+        if (col.absent is not None and col.absent[:n].any()):
+            raise ValueError("Not all nodes have attribute %s" % (name,))
+        if (col.values.dtype.kind == 'O'):
+            # e.g., numbers replacing other values
+            values = col.values[:n].tolist()
+            if (not all(_is_real(v) for v in values)):
+                raise ValueError("Node attribute %s is not numeric for all nodes" % (name,))
+            integral = all(isinstance(v, numbers.Integral) for v in values)
+            col.values = np.zeros(len(col.values), dtype=np.int64 if integral else np.float64)
+            col.values[:n] = values
+        return col.values[:n]
+
+    def topological_sort(self):
+        """Returns the IDs of the nodes in topological order"""
+        return self._ids[self._structure()[0]].tolist()
+
+    def is_directed_acyclic_graph(self):
+        try:
+            self._structure()
+            return True
+        except nx.NetworkXUnfeasible:
+            return False
+
+    def has_path(self, u, v):
+        """
+        Whether there is a path from u to v. The search goes forward from u
+        and backward from v, always expanding the smallest frontier, and
+        skips the nodes that cannot be on such a path given their levels
+        (when they are known)
+        """
+        i, j = self._pos(u), self._pos(v)
+        if (i == j):
+            return True
+        # levels are not recomputed after each change of the structure
+        levels = None
+        if (not self._stale):
+            self._structure()
+            levels = self._levels_list
+            li, lj = levels[i], levels[j]
+            if (li >= lj):
+                return False
+        seen = [set([i]), set([j])]
+        frontiers = [[i], [j]]
+        adjacency = self._adjacency()
+        while frontiers[0] and frontiers[1]:
+            d = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            nexts = []
+            mine, others, adj = seen[d], seen[1 - d], adjacency[d]
+            for a in frontiers[d]:
+                for b in adj[a]:
+                    if (b in others):
+                        return True
+                    if (b in mine):
+                        continue
+                    if (levels is not None and (levels[b] >= lj if d == 0 else levels[b] <= li)):
+                        continue
+                    mine.add(b)
+                    nexts.append(b)
+            frontiers[d] = nexts
+        return False
+
+    def _top_levels(self, weight, default_weight):
+        """
+        Returns the top levels of all nodes, with the position of the
+        predecessor they are reached from (see `DAGUtil.get_longest_path`),
+        computed one level at a time
+        """
+        topo, levels = self._structure()
+        n = self._n
+        nw = self._ncols[weight].numeric(n, 0) if weight in self._ncols else np.zeros(n, dtype=np.int64)
+        ew = self._ecols[weight].numeric(self._m, default_weight) if weight in self._ecols \
+            else np.full(self._m, default_weight)
+        sink_w = np.where(np.diff(self._out_ptr) == 0, nw, 0)
+        ids = self._ids if self._ids.dtype.kind in 'iuf' else np.arange(n)
+        dist = np.zeros(n, dtype=np.result_type(nw, ew))
+        pred = np.arange(n, dtype=np.int64)
+        bounds = np.searchsorted(levels[topo], np.arange(levels.max() + 2 if n else 1))
+        for l in range(1, len(bounds) - 1):
+            nodes = topo[bounds[l]:bounds[l + 1]]
+            eids = self._in_eid[_gather(self._in_ptr, nodes)]
+            us = self._src[eids]
+            vs = self._dst[eids]
+            cand = dist[us] + ew[eids] + nw[us] + sink_w[vs]
+            # the best predecessor of each v, breaking ties like max() does
+            order = np.lexsort((ids[us], cand, vs))
+            vs = vs[order]
+            last = order[np.r_[vs[1:] != vs[:-1], True]]
+            best_v = self._dst[eids[last]]
+            best = cand[last]
+            ok = best >= 0
+            dist[best_v] = np.where(ok, best, 0)
+            pred[best_v] = np.where(ok, us[last], best_v)
+        return dist, pred
+
+    def longest_path(self, weight='weight', default_weight=1, show_path=True):
+        """
+        Same as `DAGUtil.get_longest_path`: returns the longest path (or None
+        if `show_path` is False) and its length. The length is always the
+        same, but when several paths are equally long the one returned might
+        be a different one.
+        """
+        if (self._n == 0):
+            return ([] if show_path else None, 0)
+        dist, pred = self._top_levels(weight, default_weight)
+        topo = self._structure()[0]
+        ids = self._ids if self._ids.dtype.kind in 'iuf' else np.arange(self._n)
+        cands = np.flatnonzero(dist == dist.max())
+        cids = ids[pred[cands]]
+        cands = cands[cids == cids.max()]
+        rank = np.empty(self._n, dtype=np.int64)
+        rank[topo] = np.arange(self._n)
+        v = cands[np.argmin(rank[cands])]
+        lp = dist[v].item()
+        if (not show_path):
+            return (None, lp)
+        path = [v]
+        while pred[v] != v:
+            v = pred[v]
+            path.append(v)
+        path.reverse()
+        return (self._ids[path].tolist(), lp)
+
+    def levels(self, weight='weight', default_weight=1):
+        """
+        Returns the top levels ({v : (length, u)}, as computed by
+        `DAGUtil.get_longest_path`) and the bottom levels ({v : length}, the
+        length of the longest path from v to an exit node) of all nodes
+        """
+        dist, pred = self._top_levels(weight, default_weight)
+        topo, levels = self._structure()
+        n = self._n
+        nw = self._ncols[weight].numeric(n, 0) if weight in self._ncols else np.zeros(n, dtype=np.int64)
+        ew = self._ecols[weight].numeric(self._m, default_weight) if weight in self._ecols \
+            else np.full(self._m, default_weight)
+        bottom = nw.astype(np.result_type(nw, ew))
+        outdeg = np.diff(self._out_ptr)
+        bounds = np.searchsorted(levels[topo], np.arange(levels.max() + 2 if n else 1))
+        for l in range(len(bounds) - 3, -1, -1):
+            nodes = topo[bounds[l]:bounds[l + 1]]
+            nodes = nodes[outdeg[nodes] > 0]
+            if (len(nodes) == 0):
+                continue
+            eids = self._out_eid[_gather(self._out_ptr, nodes)]
+            cand = ew[eids] + bottom[self._dst[eids]]
+            counts = outdeg[nodes]
+            starts = np.cumsum(counts) - counts
+            bottom[nodes] += np.maximum.reduceat(cand, starts)
+        ids = self._ids.tolist()
+        top = dict((ids[v], (d, ids[u])) for v, (d, u) in enumerate(zip(dist.tolist(), pred.tolist())))
+        return top, dict(zip(ids, bottom.tolist()))
+
+class _NodeMap(Mapping):
+    """The ``G.node`` view of an `ArrayDAG`"""
+
+    __slots__ = ('_dag',)
+
+    def __init__(self, dag):
+        self._dag = dag
+
+    def __getitem__(self, n):
+        return _NodeAttrs(self._dag, self._dag._pos(n))
+
+    def __contains__(self, n):
+        return self._dag._has_pos(n)
+
+    def __iter__(self):
+        return iter(self._dag)
+
+    def __len__(self):
+        return len(self._dag)
+
+class _Attrs(MutableMapping):
+    """The attributes of an element of an `ArrayDAG`, living in its columns"""
+
+    __slots__ = ('_dag', '_i')
+
+    def __init__(self, dag, i):
+        self._dag = dag
+        self._i = i
+
+    def __getitem__(self, key):
+        col = self._cols().get(key, None)
+        value = _missing if col is None else col.get(self._i, _missing)
+        if (value is _missing):
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        col = self._cols().get(key, None)
+        return col is not None and col.has(self._i)
+
+    def __delitem__(self, key):
+        if (key not in self):
+            raise KeyError(key)
+        self._dag._own((self._kind, key))
+        self._cols()[key].unset(self._i)
+
+    def __iter__(self):
+        return iter([k for k, c in self._cols().items() if c.has(self._i)])
+
+    def __len__(self):
+        return sum(1 for c in self._cols().values() if c.has(self._i))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class _NodeAttrs(_Attrs):
+
+    __slots__ = ()
+    _kind = 'n'
+
+    def _cols(self):
+        return self._dag._ncols
+
+    def __setitem__(self, key, value):
+        self._dag._set_node_attr(self._i, key, value)
+
+class _EdgeAttrs(_Attrs):
+
+    __slots__ = ()
+    _kind = 'e'
+
+    def _cols(self):
+        return self._dag._ecols
+
+    def __setitem__(self, key, value):
+        self._dag._set_edge_attr(self._i, key, value)
+
+class _Adjacency(Mapping):
+    """The ``G.succ`` (or ``G.edge``) and ``G.pred`` views of an `ArrayDAG`"""
+
+    __slots__ = ('_dag', '_out')
+
+    def __init__(self, dag, out):
+        self._dag = dag
+        self._out = out
+
+    def __getitem__(self, n):
+        return _Neighbours(self._dag, self._dag._pos(n), self._out)
+
+    def __contains__(self, n):
+        return self._dag._has_pos(n)
+
+    def __iter__(self):
+        return iter(self._dag)
+
+    def __len__(self):
+        return len(self._dag)
+
+class _Neighbours(Mapping):
+    """The successors (or predecessors) of a node, with the edge attributes"""
+
+    __slots__ = ('_dag', '_i', '_out')
+
+    def __init__(self, dag, i, out):
+        self._dag = dag
+        self._i = i
+        self._out = out
+
+    def _eid(self, n):
+        j = self._dag._pos(n)
+        return self._dag._eid(self._i, j) if self._out else self._dag._eid(j, self._i)
+
+    def __getitem__(self, n):
+        e = self._eid(n)
+        if (e < 0):
+            raise KeyError(n)
+        return _EdgeAttrs(self._dag, e)
+
+    def __contains__(self, n):
+        try:
+            return self._eid(n) >= 0
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return iter(self._dag._neighbours(self._i, self._out)[0])
+
+    def __len__(self):
+        return len(self._dag._edge_ids(self._i, self._out))
+
+    def items(self):
+        others, eids = self._dag._neighbours(self._i, self._out)
+        return [(n, _EdgeAttrs(self._dag, e)) for n, e in zip(others, eids)]
@@ -0,0 +1,328 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A compact, columnar representation of Physical Graph Templates.
+
+The DROPs unrolled from the same logical graph node share almost all their
+values, and only differ in their instance ID (from which their OID is derived)
+and their relationships. `DropColumns` stores those shared values once per
+template, the instance IDs in a list, the values that differ from the template
+(if any) as per-instance overrides, and the relationships as integer CSR
+arrays. DROP specifications are only built when they are needed, e.g., when
+serialising the graph.
+"""
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy as np
+
+from dfms.drop import dropdict
+
+
+# The 1-N relationships between DROPs, in the order they are stored
+REL_NAMES = ('consumers', 'streamingConsumers', 'inputs', 'streamingInputs', 'outputs', 'producers')
+
+_missing = object()
+
+class DropColumns(object):
+    """
+    A sequence of DROP specifications, stored column-wise. Items are
+    `DropView` objects that read and write through to the columns, and that
+    can be expanded into `dropdict` objects.
+    """
+
+    def __init__(self, drops=()):
+        self._templates = [] # (oid prefix, oid suffix, shared values, keys order)
+        self._template_ids = {}
+        tpl = []
+        self._iids = []
+        self._oids = {} # index -> OID, only for OIDs not derived from the template
+        self._overrides = {} # index -> {key: value}
+
+        edge_src = []
+        edge_rel = []
+        edge_dst = []
+        for i, drop in enumerate(drops):
+            tpl.append(self._add_drop(i, drop))
+            for r, rel in enumerate(REL_NAMES):
+                for other in drop.get(rel, ()):
+                    edge_src.append(i)
+                    edge_rel.append(r)
+                    edge_dst.append(other)
+
+        self._tpl = np.array(tpl, dtype=np.int32)
+        self._index = None
+        self._build_csr(edge_src, edge_rel, edge_dst)
+
+    def _add_drop(self, i, drop):
+
+        oid = drop['oid']
+        iid = drop.get('iid', None)
+        pos = -1 if iid is None else oid.rfind(iid)
+        if pos >= 0:
+            prefix, suffix = oid[:pos], oid[pos + len(iid):]
+        else:
+            prefix, suffix = None, None
+            self._oids[i] = oid
+        self._iids.append(iid)
+
+        key = (prefix, suffix, drop.get('nm', None), drop['type'])
+        tid = self._template_ids.get(key, None)
+        if tid is None:
+            tid = self._template_ids[key] = len(self._templates)
+            values = dict((k, v) for k, v in drop.items() if k not in REL_NAMES and k not in ('oid', 'iid'))
+            self._templates.append((prefix, suffix, values, tuple(drop)))
+            return tid
+
+        values = self._templates[tid][2]
+        overrides = None
+        for k, v in drop.items():
+            if k in REL_NAMES or k in ('oid', 'iid'):
+                continue
+            if k not in values or values[k] != v:
+                overrides = overrides or {}
+                overrides[k] = v
+        if any(k not in drop for k in values):
+            for k in values:
+                if k not in drop:
+                    overrides = overrides or {}
+                    overrides[k] = _missing
+        if overrides:
+            self._overrides[i] = overrides
+        return tid
+
+    def _build_csr(self, edge_src, edge_rel, edge_dst):
+
+        index = self._oid_index()
+        dst = []
+        unresolved = []
+        for n, other in enumerate(edge_dst):
+            j = index.get(other, -1)
+            if j < 0:
+                unresolved.append((edge_src[n], REL_NAMES[edge_rel[n]], other))
+            dst.append(j)
+        self._index = None
+
+        n_drops = len(self)
+        src = np.array(edge_src, dtype=np.int64)
+        rel = np.array(edge_rel, dtype=np.int8)
+        dst = np.array(dst, dtype=np.int32)
+        self._csr = {}
+        for r, name in enumerate(REL_NAMES):
+            sel = (rel == r) & (dst >= 0)
+            if not sel.any():
+                continue
+            # a stable sort keeps the original order of the relationships
+            rsrc = src[sel]
+            order = np.argsort(rsrc, kind='mergesort')
+            indptr = np.zeros(n_drops + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rsrc, minlength=n_drops), out=indptr[1:])
+            self._csr[name] = (indptr, dst[sel][order])
+
+        # Relationships with DROPs outside this collection are kept as they
+        # are, as if they had been set on the DROP afterwards
+        for i, rel, other in unresolved:
+            self.add_link(i, rel, other)
+
+    def _oid_index(self):
+        if self._index is None:
+            self._index = dict((self.oid(i), i) for i in range(len(self)))
+        return self._index
+
+    def __len__(self):
+        return len(self._iids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        return DropView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield DropView(self, i)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def index(self, oid):
+        """Returns the position of the DROP with OID `oid`"""
+        return self._oid_index()[oid]
+
+    def oid(self, i):
+        oid = self._oids.get(i, None)
+        if oid is None:
+            prefix, suffix, _, _ = self._templates[self._tpl[i]]
+            oid = prefix + self._iids[i] + suffix
+        return oid
+
+    def neighbours(self, i, rel):
+        """
+        Returns an array with the positions of the DROPs that DROP `i` is
+        related to via `rel`. Relationships with DROPs outside this collection
+        are ignored.
+        """
+        overrides = self._overrides.get(i, None)
+        if overrides is not None and rel in overrides:
+            index = self._oid_index()
+            links = overrides[rel] if overrides[rel] is not _missing else ()
+            return np.array([index[oid] for oid in links if oid in index], dtype=np.int32)
+        if rel not in self._csr:
+            return np.zeros(0, dtype=np.int32)
+        indptr, indices = self._csr[rel]
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def _links(self, i, rel):
+        if rel not in self._csr:
+            return []
+        indptr, indices = self._csr[rel]
+        return [self.oid(j) for j in indices[indptr[i]:indptr[i + 1]]]
+
+    def get(self, i, key, default=None):
+        if key == 'oid':
+            return self.oid(i)
+        elif key == 'iid':
+            iid = self._iids[i]
+            return default if iid is None else iid
+
+        overrides = self._overrides.get(i, None)
+        if overrides is not None and key in overrides:
+            value = overrides[key]
+            return default if value is _missing else value
+
+        if key in REL_NAMES:
+            links = self._links(i, key)
+            return links if links else default
+        return self._templates[self._tpl[i]][2].get(key, default)
+
+    def set(self, i, key, value):
+        if key == 'oid':
+            self._oids[i] = value
+            self._index = None
+        elif key == 'iid':
+            oid = self.oid(i)
+            self._iids[i] = value
+            self._oids[i] = oid
+        else:
+            self._overrides.setdefault(i, {})[key] = value
+
+    def add_link(self, i, rel, oid):
+        """Adds `oid` to the `rel` relationship of DROP `i`"""
+        links = self.get(i, rel, [])
+        if oid not in links:
+            self.set(i, rel, links + [oid])
+
+    def keys(self, i):
+        """Returns the keys of DROP `i`, in the order of its template"""
+        order = self._templates[self._tpl[i]][3]
+        candidates = list(order)
+        candidates += [k for k in ('oid', 'iid') + REL_NAMES if k not in order]
+        candidates += [k for k in self._overrides.get(i, ()) if k not in candidates]
+        return [k for k in candidates if self._has(i, k)]
+
+    def _has(self, i, key):
+        value = self.get(i, key, _missing)
+        if key in REL_NAMES:
+            return value is not _missing and len(value) > 0
+        return value is not _missing
+
+    def expand(self, i):
+        """Returns the `dropdict` for DROP `i`"""
+        return dropdict((k, self.get(i, k)) for k in self.keys(i))
+
+    def expanded(self):
+        """Returns a generator yielding the `dropdict` of each DROP"""
+        for i in range(len(self)):
+            yield self.expand(i)
+
+    @property
+    def num_templates(self):
+        return len(self._templates)
+
+class DropView(Mapping):
+    """
+    A DROP specification living in a `DropColumns` object. It offers the same
+    interface than `dropdict`, and changes are written into the columns.
+    """
+
+    __slots__ = ('_columns', '_i')
+
+    def __init__(self, columns, i):
+        self._columns = columns
+        self._i = i
+
+    def __getitem__(self, key):
+        value = self._columns.get(self._i, key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._columns.get(self._i, key, _missing) is not _missing
+
+    def __setitem__(self, key, value):
+        self._columns.set(self._i, key, value)
+
+    def __iter__(self):
+        return iter(self._columns.keys(self._i))
+
+    def __len__(self):
+        return len(self._columns.keys(self._i))
+
+    def __eq__(self, other):
+        return isinstance(other, DropView) and other._columns is self._columns and other._i == self._i
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._columns), self._i))
+
+    def __repr__(self):
+        return 'DropView(%r)' % (self.expand(),)
+
+    @property
+    def index(self):
+        return self._i
+
+    def expand(self):
+        return self._columns.expand(self._i)
+
+    def _addSomething(self, other, key):
+        self._columns.add_link(self._i, key, other['oid'])
+
+    def addConsumer(self, other):
+        self._addSomething(other, 'consumers')
+    def addStreamingConsumer(self, other):
+        self._addSomething(other, 'streamingConsumers')
+    def addInput(self, other):
+        self._addSomething(other, 'inputs')
+    def addStreamingInput(self, other):
+        self._addSomething(other, 'streamingInputs')
+    def addOutput(self, other):
+        self._addSomething(other, 'outputs')
+    def addProducer(self, other):
+        self._addSomething(other, 'producers')
@@ -51,14 +51,15 @@ Examples of logical graph node JSON representation
 from collections import defaultdict
 import collections
 import datetime
+import itertools
 import json
 import logging
 import math
+import multiprocessing
 import os
 import random
 import re
 import time
-from itertools import product
 
 import networkx as nx
 import numpy as np
@@ -66,6 +67,7 @@ import six
 
 from dfms.dropmake.utils.bash_parameter import BashCommand
 from dfms.drop import dropdict
+from dfms.dropmake.drop_columns import DropColumns, DropView
 from dfms.dropmake.scheduler import MySarkarScheduler, DAGUtil, MinNumPartsScheduler, PSOScheduler
 from dfms.graph_loader import STORAGE_TYPES
 
@@ -626,7 +628,7 @@ class PGT(object):
         self._drop_list = drop_list
         self._drop_list_len = len(drop_list)
         self._extra_drops = [] # artifacts DROPs produced during L2G mapping
-        self._dag = DAGUtil.build_dag_from_drops(self._drop_list) if build_dag else None
+        self._dag = DAGUtil.build_array_dag_from_drops(self._drop_list) if build_dag else None
         self._json_str = None
         self._oid_gid_map = dict()
         self._gid_island_id_map = dict()
@@ -700,7 +702,8 @@ class PGT(object):
     @property
     def dag(self):
         """
-            Return the networkx nx.DiGraph object
+            Return the DAG, an ArrayDAG object (which offers the same
+            interface than a networkx nx.DiGraph)
 
         The weight of the same edge (u, v) also depends.
         If it is called after the partitioning, it could have been zeroed
@@ -727,7 +730,7 @@ class PGT(object):
         G = self.dag
         if (G is None):
             if (force_answer):
-                self._dag = DAGUtil.build_dag_from_drops(self._drop_list)
+                self._dag = DAGUtil.build_array_dag_from_drops(self._drop_list)
                 G = self.dag
             else:
                 return None
@@ -748,10 +751,13 @@ class PGT(object):
         return self._json_str
         # return self.to_gojs_json()
 
-    def to_pg_spec(self, node_list, ret_str=True, num_islands=1, tpl_nodes_len=0):
+    def to_pg_spec(self, node_list, ret_str=True, num_islands=1, tpl_nodes_len=0, ret_iter=False):
         """
         convert pgt to pg specification, and map that to the hardware resources
 
+        ret_iter:
+            Return a generator yielding the mapped DROPs (when not `ret_str`)
+
         node_list:
             A list of nodes (list), whose length == (num_islands + num_node_mgrs)
             We assume that the MasterDropManager's node is NOT in the node_list
@@ -783,8 +789,8 @@ class PGT(object):
         if (nodes_len < 2): # enough for at least 1 dim and 1 nm
             raise GPGTException("Too few nodes: {0}".format(nodes_len))
         num_parts = self._num_parts_done
-        drop_list = self._drop_list + self._extra_drops
-        logger.info("Drops count: {0}, partitions count: {1}, nodes count: {2}".format(len(drop_list), num_parts, nodes_len))
+        drop_list = itertools.chain(self._drop_list, self._extra_drops)
+        logger.info("Drops count: {0}, partitions count: {1}, nodes count: {2}".format(self._drop_list_len + len(self._extra_drops), num_parts, nodes_len))
 
         if (form_island and (num_islands + num_parts > nodes_len)):
             # if form_island, each part should already be guranteed
@@ -811,20 +817,27 @@ class PGT(object):
             nm_list = ['#%s' % x for x in range(nm_len)] # so that nm_list[i] == '#i'
             is_list = ['#%s' % x for x in range(len(is_list))] # so that is_list[i] == '#i'
 
-        for drop in drop_list:
-            oid = drop['oid']
-            # For now, simply round robin, but need to consider
-            # nodes cross COMPUTE islands which has
-            #TODO consider distance between a pair of nodes
-            gid = lm[oid]
-            drop['node'] = nm_list[gid]
-            isid = lm2[gid] % num_islands if form_island else 0
-            drop['island'] = is_list[isid]
+        def map_drops():
+            for drop in drop_list:
+                # DROPs in columns are expanded only now
+                if (isinstance(drop, DropView)):
+                    drop = drop.expand()
+                oid = drop['oid']
+                # For now, simply round robin, but need to consider
+                # nodes cross COMPUTE islands which has
+                #TODO consider distance between a pair of nodes
+                gid = lm[oid]
+                drop['node'] = nm_list[gid]
+                isid = lm2[gid] % num_islands if form_island else 0
+                drop['island'] = is_list[isid]
+                yield drop
 
         if (ret_str):
-            return json.dumps(drop_list, indent=2)
+            return json.dumps(list(map_drops()), indent=2)
+        elif (ret_iter):
+            return map_drops()
         else:
-            return drop_list
+            return list(map_drops())
 
     def to_gojs_json(self, string_rep=True, visual=False):
         """
@@ -903,9 +916,9 @@ class PGT(object):
                     else:
                         link['to'] = oup
                     links.append(link)
-            for gn in add_nodes:
-                #logger.debug("added gid = {0} for new node {1}".format(gn[4], gn[0]))
-                G.add_node(gn[0], weight=gn[1], dt=gn[2], drop_spec=gn[3], gid=gn[4])
+            #logger.debug("added gid = {0} for new node {1}".format(gn[4], gn[0]))
+            G.add_nodes_from((gn[0], dict(weight=gn[1], dt=gn[2], drop_spec=gn[3], gid=gn[4]))
+                             for gn in add_nodes)
             G.remove_edges_from(remove_edges)
             G.add_edges_from(add_edges)
             self._extra_drops = extra_drops
@@ -947,9 +960,12 @@ class MetisPGTP(PGT):
     http://glaros.dtc.umn.edu/gkhome/metis/metis/overview
     """
     def __init__(self, drop_list, num_partitions=1, min_goal=0,
-                par_label="Partition", ptype=0, ufactor=10, merge_parts=False):
+                par_label="Partition", ptype=0, ufactor=10, merge_parts=False,
+                partitioner='auto'):
         """
         num_partitions:  number of partitions supplied by users (int)
+        partitioner:    'metis', 'native' or 'auto' (METIS if available),
+                        see `DAGUtil.import_partitioner`
         TODO - integrate from within PYTHON module (using C API) soon!
         """
         super(MetisPGTP, self).__init__(drop_list, build_dag=False)
@@ -973,7 +989,8 @@ class MetisPGTP(PGT):
         self._u_factor = ufactor
         self._metis_logs = []
         self._G = self.to_partition_input()
-        self._metis = DAGUtil.import_metis()
+        self._partitioner = partitioner
+        self._metis = DAGUtil.import_partitioner(partitioner)
         self._group_workloads = dict() # k - gid, v - a tuple of (tw, sz)
         self._merge_parts = merge_parts
         self._metis_out = None # initial internal partition result
@@ -992,6 +1009,9 @@ class MetisPGTP(PGT):
         G.graph['node_weight_attr'] = 'tw'
         G.graph['node_size_attr'] = 'sz'
 
+        if (isinstance(droplist, DropColumns)):
+            return self._columns_to_partition_input(G, droplist)
+
         for i, drop in enumerate(droplist):
             oid = drop['oid']
             key_dict[oid] = i + 1 #METIS index starts from 1
@@ -1042,6 +1062,35 @@ class MetisPGTP(PGT):
             %(resource.getrusage(resource.RUSAGE_SELF)[2] / 1024.0 ** 2))
         return G
 
+    def _columns_to_partition_input(self, G, drops):
+        """
+        Same as to_partition_input, but using the relationships stored in
+        DropColumns directly
+        """
+        for i in range(len(drops)):
+            myk = i + 1
+            tt = drops.get(i, 'type')
+            if ('plain' == tt):
+                dst = 'consumers' # outbound keyword
+                ust = 'producers'
+                tw = 1 # task weight is zero for a Data DROP
+                sz = drops.get(i, 'dw', 1) # size
+            elif ('app' == tt):
+                dst = 'outputs'
+                ust = 'inputs'
+                tw = drops.get(i, 'tw')
+                sz = 1
+            G.add_node(myk, tw=tw, sz=sz, oid=drops.oid(i))
+            for j in itertools.chain(drops.neighbours(i, dst), drops.neighbours(i, ust)):
+                if ('plain' == tt):
+                    lw = drops.get(i, 'dw')
+                elif ('app' == tt):
+                    lw = drops.get(j, 'dw', 1)
+                if (lw <= 0):
+                    lw = 1
+                G.add_edge(myk, int(j) + 1, weight=lw)
+        return G
+
     def _set_metis_log(self, logtext):
         self._metis_logs = logtext.split("\n")
 
@@ -1166,7 +1215,7 @@ class MetisPGTP(PGT):
 
         if (visual):
             if (self.dag is None):
-                self._dag = DAGUtil.build_dag_from_drops(self._drop_list)
+                self._dag = DAGUtil.build_array_dag_from_drops(self._drop_list)
             jsobj = super(MetisPGTP, self).to_gojs_json(string_rep=False, visual=visual)
         else:
             jsobj = None
@@ -1178,11 +1227,12 @@ class MetisPGTP(PGT):
             return jsobj
 
     def merge_partitions(self, new_num_parts, form_island=False,
-                        island_type=0, visual=False):
+                        island_type=0, visual=False, partitioner=None):
         """
         This merging can form islands, i.e. reference-based merging
 
         island_type:    integer, 0 - data island, 1 - compute island
+        partitioner:    overrides the graph partitioner given at construction
 
         """
         # 0. parse the output and get all the partitions
@@ -1215,7 +1265,9 @@ class MetisPGTP(PGT):
         if (new_num_parts == 1):
             (edgecuts, metis_parts) = (0, [0] * len(G.nodes()))
         else:
-            (edgecuts, metis_parts) = self._metis.part_graph(G,
+            metis = self._metis if partitioner is None else\
+                    DAGUtil.import_partitioner(partitioner)
+            (edgecuts, metis_parts) = metis.part_graph(G,
                                             nparts=new_num_parts,
                                             ufactor=1)
         tmp_map = self._gid_island_id_map
@@ -1273,7 +1325,7 @@ class MySarkarPGTP(PGT):
     use the MySarkarScheduler to produce the PGTP
     """
     def __init__(self, drop_list, num_partitions=0, par_label="Partition",
-                 max_dop=8, merge_parts=False):
+                 max_dop=8, merge_parts=False, partitioner='auto'):
         """
         num_partitions: 0 - only do the initial logical partition
                         >1 - does logical partition, partition mergeing and
@@ -1281,6 +1333,8 @@ class MySarkarPGTP(PGT):
                 This parameter will simply ignored
                 To control the number of partitions, please call
                 def merge_partitions(self, new_num_parts, form_island=False)
+        partitioner: the graph partitioner used to merge partitions, see
+                `DAGUtil.import_partitioner`
         """
         super(MySarkarPGTP, self).__init__(drop_list)
         self._num_parts = num_partitions
@@ -1291,6 +1345,7 @@ class MySarkarPGTP(PGT):
         self._merge_parts = merge_parts
         #self._edge_cuts = None
         self._partitions = None
+        self._partitioner = partitioner
 
         self.init_scheduler()
 
@@ -1322,9 +1377,10 @@ class MySarkarPGTP(PGT):
         ret['num_parts'] = self._num_parts_done
 
     def merge_partitions(self, new_num_parts, form_island=False,
-                        island_type=0, visual=False):
+                        island_type=0, visual=False, partitioner=None):
         """
         island_type:    integer, 0 - data island, 1 - compute island
+        partitioner:    overrides the graph partitioner given at construction
         """
         if (not self._can_merge(new_num_parts)):
             return
@@ -1339,7 +1395,8 @@ class MySarkarPGTP(PGT):
         outer_groups = set()
         if (new_num_parts > 1):
             self._scheduler.merge_partitions(new_num_parts,
-                                bal_cond=island_type)
+                                bal_cond=island_type,
+                                partitioner=partitioner or self._partitioner)
         else:
             # all parts share the same outer group (island) when # of island == 1
             ppid = self._drop_list_len + len(groups) + 1
@@ -1484,13 +1541,15 @@ class MinNumPartsPGTP(MySarkarPGTP):
 
 class PSOPGTP(MySarkarPGTP):
     def __init__(self, drop_list, par_label="Partition", max_dop=8,
-    deadline=None, topk=30, swarm_size=40, merge_parts=False):
+    deadline=None, topk=30, swarm_size=40, merge_parts=False, processes=1):
         """
         PSO-based PGTP
+        processes: number of processes used to evaluate the particles
         """
         self._deadline = deadline
         self._topk = topk
         self._swarm_size = swarm_size
+        self._processes = processes
         super(PSOPGTP, self).__init__(drop_list, 0, par_label, max_dop, merge_parts)
         self._extra_drops = None
 
@@ -1499,7 +1558,37 @@ class PSOPGTP(MySarkarPGTP):
 
     def init_scheduler(self):
         self._scheduler = PSOScheduler(self._drop_list, max_dop=self._max_dop,
-        deadline=self._deadline, dag=self.dag, topk=self._topk, swarm_size=self._swarm_size)
+        deadline=self._deadline, dag=self.dag, topk=self._topk, swarm_size=self._swarm_size,
+        processes=self._processes)
+
+# The DROP that is actually linked for the source constructs that are not
+# linked themselves, by category
+_LINK_SOURCE_KEYS = {'Branch': 'null_drop', 'DataGather': 'gather-data_drop', 'GroupBy': 'grp-data_drop'}
+
+# The LG being unrolled by a worker process of LG._unroll_nodes_parallel
+_unroll_lg = None
+
+def _init_unroll_worker(lg):
+    global _unroll_lg
+    _unroll_lg = lg
+
+def _unroll_task(task):
+    """
+    Converts the instances [start, stop) of the top-level node number `idx` of
+    the LG (or the node altogether if they are None), returning the resulting
+    DROPs and artificial links
+    """
+    idx, start, stop = task
+    lg = _unroll_lg
+    lg._drop_dict = collections.defaultdict(list)
+    lg._artificial_links = []
+    lgn = lg._start_list[idx]
+    if (start is None):
+        lg.lgn_to_pgn(lgn)
+    else:
+        # the group's own artificial links are added only once
+        lg.lgn_to_pgn(lgn, instances=range(start, stop), group_links=(start == 0))
+    return list(lg._drop_dict.items()), lg._artificial_links
 
 class LG():
     """
@@ -1552,6 +1641,8 @@ class LG():
         # key - lgn id, val - a list of pgns associated with this lgn
         self._drop_dict = collections.defaultdict(list)
         self._lgn_list = all_list
+        # (source lgn id, target lgn id, link) added during the unrolling
+        self._artificial_links = []
 
     def validate_link(self, src, tgt):
         if (src.is_scatter() or tgt.is_scatter()):
@@ -1618,17 +1709,25 @@ class LG():
                 src.group_hierarchy,
                 tgt.group_hierarchy))
 
-    def lgn_to_pgn(self, lgn, iid='0', lpcxt=None):
+    def _add_artificial_link(self, src, tgt, lk):
+        src.add_output(tgt)
+        tgt.add_input(src)
+        self._lg_links.append(lk)
+        self._artificial_links.append((src.id, tgt.id, lk))
+
+    def lgn_to_pgn(self, lgn, iid='0', lpcxt=None, instances=None, group_links=True):
         """
         convert logical graph node to physical graph node
         without considering pg links
 
         iid:    instance id (string)
         lpcxt:  Loop context
+        instances:  the instances of the group to convert (default: all)
+        group_links:    whether to add the artificial links of the group
         """
         if (lgn.is_group()):
             extra_links_drops = (not lgn.is_scatter())
-            if (extra_links_drops):
+            if (extra_links_drops and group_links):
                 non_inputs = []
                 grp_starts = []
                 grp_ends = []
@@ -1648,20 +1747,16 @@ class LG():
                         raise GInvalidNode("Loop '{0}' should have at least one Start Component and one End Data".format(lgn.text))
                     for ge in grp_ends:
                         for gs in grp_starts: # make an artificial circle
-                            ge.add_output(gs)
-                            gs.add_input(ge)
                             lk = dict()
                             lk['from'] = ge.id
                             lk['to'] = gs.id
-                            self._lg_links.append(lk)
+                            self._add_artificial_link(ge, gs, lk)
                 else:
                     for gs in gs_list: # add artificial logical links to the "first" children
-                        lgn.add_input(gs)
-                        gs.add_output(lgn)
                         lk = dict()
                         lk['from'] = lgn.id
                         lk['to'] = gs.id
-                        self._lg_links.append(lk)
+                        self._add_artificial_link(gs, lgn, lk)
 
             multikey_grpby = False
             lgk = lgn.group_keys
@@ -1680,7 +1775,9 @@ class LG():
                 else:
                     return None
 
-            for i in range(lgn.dop):
+            if (instances is None):
+                instances = range(lgn.dop)
+            for i in instances:
                 miid = '{0}/{1}'.format(iid, i)
                 if (multikey_grpby):
                     #set up more refined hierarchical context for group by with multiple keys
@@ -1743,18 +1840,16 @@ class LG():
     def _link_drops(self, slgn, tlgn, src_drop, tgt_drop):
         """
         """
-        if (slgn.is_branch()):
-            sdrop = src_drop['null_drop']
-        elif (slgn.is_gather()):
-            sdrop = src_drop['gather-data_drop']
-        elif (slgn.is_groupby()):
-            sdrop = src_drop['grp-data_drop']
+        # called once per link of the unrolled graph, so the categories are
+        # looked up only once instead of via is_branch(), is_gather(), etc.
+        s_type = slgn.jd['category']
+        t_type = tlgn.jd['category']
+        if (s_type in _LINK_SOURCE_KEYS):
+            sdrop = src_drop[_LINK_SOURCE_KEYS[s_type]]
         else:
             sdrop = src_drop
 
         tdrop = tgt_drop
-        s_type = slgn.jd['category']
-        t_type = tlgn.jd['category']
 
         if (s_type in ['Component', 'BashShellApp', 'mpi']):
             sdrop.addOutput(tdrop)
@@ -1769,17 +1864,126 @@ class LG():
                 bc = tgt_drop['command']
                 bc.add_input_param(slgn.id, src_drop['oid'])
 
-    def unroll_to_tpl(self):
+    def unroll_to_tpl(self, processes=1):
         """
         Not thread-safe!
 
         1. just create pgn anyway
         2. sort out the links
+
+        With `processes` > 1 the top-level constructs are converted in a pool
+        of that many processes (see `_unroll_nodes_parallel`), yielding the
+        same DROPs as the serial conversion.
         """
+        self._unroll(processes)
+        ret = []
+        for drop_list in self._drop_dict.values():
+            ret += drop_list
+
+        for drop in ret:
+            self._finalise_drop(drop)
+
+        return ret
+
+    def unroll_to_tpl_iter(self, processes=1):
+        """
+        Like `unroll_to_tpl`, but returns a generator that yields the DROP
+        specifications one by one in topological order (i.e., a DROP comes
+        after all the DROPs it is linked from).
+
+        Note that the whole graph is still unrolled, and held in memory, before
+        the first specification is yielded, since DROPs can be linked to any
+        other DROP of the graph; peak memory usage therefore still grows with
+        the size of the graph. Specifications are released as they are
+        yielded though, so the caller can write them out (e.g., as a
+        newline-delimited JSON stream) without holding a second copy of the
+        whole graph.
+
+        Not thread-safe!
+        """
+        self._unroll(processes)
+        drops = {}
+        for drop_list in self._drop_dict.values():
+            for drop in drop_list:
+                drops[drop['oid']] = drop
+        self._drop_dict.clear()
+
+        # Kahn's algorithm, using the outbound links only
+        in_degree = collections.defaultdict(int)
+        for drop in drops.values():
+            for rel in ('consumers', 'streamingConsumers', 'outputs'):
+                for oid in drop.get(rel, []):
+                    if oid in drops:
+                        in_degree[oid] += 1
+
+        ready = collections.deque(oid for oid in drops if not in_degree[oid])
+        emitted = 0
+        while ready:
+            drop = drops.pop(ready.popleft())
+            for rel in ('consumers', 'streamingConsumers', 'outputs'):
+                for oid in drop.get(rel, []):
+                    if oid not in in_degree:
+                        continue
+                    in_degree[oid] -= 1
+                    if not in_degree[oid]:
+                        del in_degree[oid]
+                        ready.append(oid)
+            emitted += 1
+            yield self._finalise_drop(drop)
+
+        if drops:
+            raise GraphException("Cycle detected in session {0}, {1} DROPs could not be sorted".format(self._session_id, len(drops)))
+        logger.info("Unroll progress - {0} drops streamed for session {1}".format(emitted, self._session_id))
+
+    def _finalise_drop(self, drop):
+        if drop['type'] == 'app' and drop['app'].endswith('BashShellApp'):
+            bc = drop['command']
+            drop['command'] = bc.to_real_command()
+        return drop
+
+    def _unroll_nodes_parallel(self, processes):
+        """
+        Converts the top-level logical graph nodes using a pool of `processes`
+        processes. The instances of top-level groups are independent from each
+        other, so they are split into several tasks. The results of all tasks
+        are merged in the order the serial conversion would have produced
+        them (OIDs depend only on the node and instance ids anyway), and the
+        artificial links added by the workers are replayed here.
+
+        Only this conversion is parallel: the DROPs are linked afterwards in
+        this process, which for graphs with dense links between constructs
+        (e.g., cont_img) takes most of the time. unrollBenchmark.py shows how
+        much of the unrolling can be sped up for a given graph.
+        """
+        tasks = []
+        for idx, lgn in enumerate(self._start_list):
+            dop = lgn.dop if lgn.is_group() else 0
+            if (dop > 0):
+                chunk_size = int(math.ceil(dop / float(min(dop, processes * 4))))
+                for start in range(0, dop, chunk_size):
+                    tasks.append((idx, start, min(start + chunk_size, dop)))
+            else:
+                tasks.append((idx, None, None))
+
+        pool = multiprocessing.Pool(processes, initializer=_init_unroll_worker, initargs=(self,))
+        try:
+            for drop_dict, artificial_links in pool.imap(_unroll_task, tasks):
+                for lgn_id, drops in drop_dict:
+                    self._drop_dict[lgn_id] += drops
+                for sid, tid, lk in artificial_links:
+                    self._add_artificial_link(self._done_dict[sid], self._done_dict[tid], lk)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _unroll(self, processes=1):
         # each pg node needs to be taggged with iid
         # based purely on its h-level
-        for lgn in self._start_list:
-            self.lgn_to_pgn(lgn)
+        if (processes > 1):
+            self._unroll_nodes_parallel(processes)
+        else:
+            for lgn in self._start_list:
+                self.lgn_to_pgn(lgn)
 
         logger.info("Unroll progress - lgn_to_pgn done {0} for session {1}".format(len(self._start_list), self._session_id))
 
@@ -1846,8 +2050,12 @@ class LG():
                 elif (slgn.group is not None and slgn.group.is_loop() and
                 tlgn.group is not None and tlgn.group.is_loop() and (not slgn.h_related(tlgn))):
                     # stepwise locking for links between two Loops
-                    for sdrop, tdrop in product(sdrops, tdrops):
-                        if (sdrop['loop_cxt'] == tdrop['loop_cxt']):
+                    # bucket the tdrops by loop context to join them in linear time
+                    tdrops_by_cxt = collections.defaultdict(list)
+                    for tdrop in tdrops:
+                        tdrops_by_cxt[tdrop['loop_cxt']].append(tdrop)
+                    for sdrop in sdrops:
+                        for tdrop in tdrops_by_cxt.get(sdrop['loop_cxt'], []):
                             self._link_drops(slgn, tlgn, sdrop, tdrop)
                 else:
                     if (slgn.h_level >= tlgn.h_level):
@@ -1932,13 +2140,3 @@ class LG():
                         del sl_drop['gather-data_drop']
 
         logger.info("Unroll progress - extra drops done for session {0}".format(self._session_id))
-        ret = []
-        for drop_list in self._drop_dict.values():
-            ret += drop_list
-
-        for drop in ret:
-            if drop['type'] == 'app' and drop['app'].endswith('BashShellApp'):
-                bc = drop['command']
-                drop['command'] = bc.to_real_command()
-
-        return ret
@@ -25,7 +25,6 @@ https://confluence.ska-sdp.org/display/PRODUCTTREE/C.1.2.4.4.4+DFM+Physical+Grap
 import os
 import threading, json
 
-import networkx as nx
 import numpy as np
 
 from dfms.dropmake.pg_generator import GraphException
@@ -69,6 +68,38 @@ class PGUtil(object):
             pad[:, :(-1 * gap)] = s
         return np.vstack((pad, l))
 
+    @staticmethod
+    def vstack_runs(A, B, separator=False):
+        """
+        Same as `vstack_mat`, but for sparse matrices given as (runs, shape)
+        tuples (see `DAGUtil.runs_to_matrix`)
+        """
+        # like vstack_mat, the narrowest matrix goes first
+        if (A[1][1] > B[1][1]):
+            A, B = B, A
+        (ra, sa), (rb, sb) = A, B
+        offset = sa[0] + 1 if separator else sa[0]
+        rb = rb.copy()
+        rb[:, 0] += offset
+        return np.vstack((ra, rb)), (offset + sb[0], max(sa[1], sb[1]))
+
+    @staticmethod
+    def sparse_json(runs, shape, max_rows=None, max_cols=None):
+        """
+        Turns a sparse matrix (see `DAGUtil.runs_to_matrix`) into a JSON
+        object. If the matrix is larger than max_rows by max_cols it is
+        downsampled (see `DAGUtil.downsample_runs`) and returned as a dense
+        "matrix" together with the "scale" used for rows and columns,
+        otherwise its "runs" are returned as they are
+        """
+        M, N = shape
+        if ((max_rows and M > max_rows) or (max_cols and N > max_cols)):
+            ma, scale = DAGUtil.downsample_runs(runs, shape,
+                                                max_rows or M, max_cols or N)
+            return {'shape': list(ma.shape), 'scale': list(scale),
+                    'matrix': np.round(ma, 3).tolist()}
+        return {'shape': [M, N], 'runs': runs.tolist()}
+
 
 class PGManager(object):
     """
@@ -127,29 +158,40 @@ class PGManager(object):
         """
         return self._pgt_dict.get(pgt_id, None)
 
-    def get_gantt_chart(self, pgt_id, json_str=True):
+    def get_gantt_chart(self, pgt_id, json_str=True, sparse=False,
+                        max_rows=None, max_cols=None):
         """
         Return:
-            the gantt chart matrix (numarray) given a PGT id
+            the gantt chart matrix (numarray) given a PGT id. If sparse is
+            True the matrix is instead returned as a JSON object (see
+            `PGUtil.sparse_json`), downsampled to at most max_rows by max_cols
         """
         pgt = self.get_pgt(pgt_id)
         if (pgt is None):
             raise GraphException("PGT {0} not found".format(pgt_id))
         try:
-            gcm = DAGUtil.ganttchart_matrix(pgt.dag)
+            gcr = DAGUtil.ganttchart_runs(pgt.dag)
         except SchedulerException:
-            topo_sort = nx.topological_sort(pgt.dag)
+            topo_sort = DAGUtil.topological_sort(pgt.dag)
             DAGUtil.label_schedule(pgt.dag, topo_sort=topo_sort)
-            gcm = DAGUtil.ganttchart_matrix(pgt.dag, topo_sort=topo_sort)
+            gcr = DAGUtil.ganttchart_runs(pgt.dag, topo_sort=topo_sort)
 
+        if (sparse):
+            gcm = PGUtil.sparse_json(*gcr, max_rows=max_rows, max_cols=max_cols)
+            return json.dumps(gcm) if json_str else gcm
+        gcm = DAGUtil.runs_to_matrix(*gcr)
         if (json_str):
             gcm = json.dumps(gcm.tolist())
         return gcm
 
-    def get_schedule_matrices(self, pgt_id, json_str=True):
+    def get_schedule_matrices(self, pgt_id, json_str=True, sparse=False,
+                              max_rows=None, max_cols=None):
         """
         Return:
-            a list of schedule matrices (numarrays) given a PGT id
+            a list of schedule matrices (numarrays) given a PGT id, stacked
+            into a single one. If sparse is True it is instead returned as a
+            JSON object (see `PGUtil.sparse_json`), downsampled to at most
+            max_rows by max_cols
         """
         pgt = self.get_pgt(pgt_id)
         if (pgt is None):
@@ -160,11 +202,19 @@ class PGManager(object):
         except AttributeError:
             raise GraphException("Graph '{0}' has not yet been partitioned, so cannot produce scheduling matrix.".format(pgt_id))
         for part in parts:
-            sm = part.schedule.schedule_matrix
+            if (sparse):
+                sm = part.schedule.schedule_runs
+                stack = PGUtil.vstack_runs
+            else:
+                sm = part.schedule.schedule_matrix
+                stack = PGUtil.vstack_mat
             if (jsobj is None):
                 jsobj = sm
             else:
-                jsobj = PGUtil.vstack_mat(jsobj, sm, separator=True)
+                jsobj = stack(jsobj, sm, separator=True)
+        if (sparse):
+            jsobj = PGUtil.sparse_json(*jsobj, max_rows=max_rows, max_cols=max_cols)
+            return json.dumps(jsobj) if json_str else jsobj
         if (json_str):
             jsobj = json.dumps(jsobj.tolist())
         return jsobj
@@ -20,7 +20,9 @@
 #    MA 02111-1307  USA
 #
 
+import heapq
 import logging
+import multiprocessing
 import os, sys
 import platform
 import time, random
@@ -28,10 +30,13 @@ import time, random
 import pkg_resources
 
 import networkx as nx
+from networkx.algorithms.flow import shortest_augmenting_path
 import numpy as np
 from pyswarm import pso
 from collections import defaultdict
 
+from dfms.dropmake.array_dag import ArrayDAG
+from dfms.dropmake.drop_columns import DropColumns
 from dfms.dropmake.utils.anneal import Annealer
 from dfms.dropmake.utils.mcts import DAGTree, MCTS
 
@@ -49,11 +54,12 @@ class Schedule(object):
     def __init__(self, dag, max_dop):
         self._dag = dag
         self._max_dop = max_dop
-        self._topo_sort = nx.topological_sort(self._dag)
+        self._topo_sort = DAGUtil.topological_sort(self._dag)
         DAGUtil.label_schedule(self._dag, topo_sort=self._topo_sort)
         self._lpl = None
         self._wkl = None
         self._sma = None
+        self._sru = None
 
     @property
     def makespan(self):
@@ -63,14 +69,15 @@ class Schedule(object):
         return self._lpl
 
     @property
-    def schedule_matrix(self):
+    def schedule_runs(self):
         """
-        Return: a self._lpl x self._max_dop matrix
-                (X - time, Y - resource unit / parallel lane)
+        The schedule matrix in its sparse form, see `DAGUtil.runs_to_matrix`
+        Return: a (runs, (self._max_dop, makespan)) tuple
         """
-        if (self._sma is None):
+        if (self._sru is None):
             G = self._dag
             if (DEBUG):
+                lpl = DAGUtil.get_longest_path(G, show_path=True)
                 lpl_str = []
                 lpl_c = 0
                 for lpn in lpl[0]:
@@ -84,7 +91,7 @@ class Schedule(object):
             if (N < 1):
                 N = 1
             #print "N (makespan) is ", N, "M is ", M
-            ma = np.zeros((M, N), dtype=int)
+            runs = []
             pr = np.zeros((M), dtype=int)
             last_pid = -1
             prev_n = None
@@ -107,14 +114,25 @@ class Schedule(object):
                             break
                     if (found is None):
                         raise SchedulerException("Cannot find a idle PID, max_dop provided: {0}, actual max_dop: {1}\n Graph: {2}".format(M,
-                        'DAGUtil.get_max_dop(G)', G.nodes(data=True)))
-                        #DAGUtil.get_max_dop(G), G.nodes(data=True)))
+                        DAGUtil.get_max_dop(G), G.nodes(data=True)))
                     curr_pid = found
-                ma[curr_pid, stt:edt] = np.ones((1, edt - stt)) * n
+                # the matrix is only as wide as the makespan
+                if (stt < N):
+                    runs.append((curr_pid, stt, min(edt, N), n))
                 pr[curr_pid] = edt
                 last_pid = curr_pid
                 prev_n = n
-            self._sma = ma
+            self._sru = (np.array(runs, dtype=int).reshape((-1, 4)), (M, N))
+        return self._sru
+
+    @property
+    def schedule_matrix(self):
+        """
+        Return: a self._lpl x self._max_dop matrix
+                (X - time, Y - resource unit / parallel lane)
+        """
+        if (self._sma is None):
+            self._sma = DAGUtil.runs_to_matrix(*self.schedule_runs)
         return self._sma
 
     @property
@@ -124,11 +142,10 @@ class Schedule(object):
             the mean # of resource units per time unit consumed by the graph/partition
         """
         if (self._wkl is None):
-            ma = self.schedule_matrix
-            c = []
-            for i in range(ma.shape[1]):
-                c.append(np.count_nonzero(ma[:,i]))
-            self._wkl = int(np.mean(np.array(c))) # since METIS only accepts integer
+            # lanes never overlap, so the busy cells are those in the runs
+            runs, shape = self.schedule_runs
+            busy = np.sum(runs[:, 2] - runs[:, 1])
+            self._wkl = int(busy / float(shape[1])) # since METIS only accepts integer
         return self._wkl
 
     @property
@@ -160,7 +177,6 @@ class Partition(object):
         self._parent_id = None
         self._child_parts = None
         self._tmp_merge_dag = None
-        self._tmp_new_ac = None
         logger.debug("My dop = {0}".format(self._ask_max_dop))
 
     @property
@@ -241,7 +257,7 @@ class Partition(object):
         if (unew and vnew):
             mydop = DAGUtil.get_max_dop(self._dag)
         else:
-            mydop = self.probe_max_dop(u, v, unew, vnew)
+            mydop = self.probe_max_dop()
             #TODO - put the following code in a unit test!
             if (DEBUG):
                 mydop_slow = DAGUtil.get_max_dop(self._dag)#
@@ -284,10 +300,10 @@ class Partition(object):
                         if (len(self._dag.predecessors(vup)) == 0):
                             # link u to "root" parent of v to break antichain
                             self._dag.add_edge(u, vup)
-                            # change the original global graph
-                            global_dag.add_edge(u, vup, weight=0)
-                            if (not nx.is_directed_acyclic_graph(global_dag)):
-                                global_dag.remove_edge(u, vup)
+                            # change the original global graph, unless this
+                            # creates a cycle
+                            if (not DAGUtil.has_path(global_dag, vup, u)):
+                                global_dag.add_edge(u, vup, weight=0)
                 else:
                     u_downs = nx.descendants(self._dag, u)
                     for udo in u_downs:
@@ -296,12 +312,12 @@ class Partition(object):
                         if (len(self._dag.successors(udo)) == 0):
                             # link "leaf" children of u to v to break antichain
                             self._dag.add_edge(udo, v)
-                            # change the original global graph
-                            global_dag.add_edge(udo, v, weight=0)
-                            if (not nx.is_directed_acyclic_graph(global_dag)):
-                                global_dag.remove_edge(udo, v)
+                            # change the original global graph, unless this
+                            # creates a cycle
+                            if (not DAGUtil.has_path(global_dag, v, udo)):
+                                global_dag.add_edge(udo, v, weight=0)
 
-            self._max_dop = self.probe_max_dop(u, v, unew, vnew, update=True)
+            self._max_dop = self.probe_max_dop(update=True)
             #self._max_dop = DAGUtil.get_max_dop(self._dag)# this is too slow!
 
     def remove(self, n):
@@ -317,60 +333,16 @@ class Partition(object):
         self._dag.add_node(u, weight=weight)
         self._max_dop = 1
 
-    def probe_max_dop(self, u, v, unew, vnew, update=False):
+    def probe_max_dop(self, update=False):
         """
-        An incremental antichain (which appears significantly more efficient than the networkx antichains)
-        But only works for DoP, not for weighted width
+        Get the DoP of the partition, e.g. after some nodes have been added to
+        it. If `update` is True the maximum antichain is also kept
         """
-        if (self._max_antichains is None):
-            new_ac = DAGUtil.get_max_antichains(self._dag)
-            if (update):
-                self._max_antichains = new_ac
-            if (len(new_ac) == 0):
-                if (update):
-                    self._max_antichains = None
-                return 0
-            else:
-                return len(new_ac[0])
-        else:
-            if (update and self._tmp_new_ac is not None):
-                self._max_antichains, md = self._tmp_new_ac
-                self._tmp_new_ac = None
-                return md
+        antichain, md = DAGUtil.get_max_antichain(self._dag)
+        if (update):
+            self._max_antichains = [antichain] if antichain else None
+        return md
 
-            if (unew):
-                ups = nx.descendants(self._dag, u)
-                new_node = u
-            elif (vnew):
-                ups = nx.ancestors(self._dag, v)
-                new_node = v
-            else:
-                raise SchedulerException("u v are both new/old")
-            new_ac = []
-            md = 1
-            for ma in self._max_antichains: # missing elements in the current max_antichains!
-                #incremental updates
-                found = False
-                for n in ma:
-                    if (n in ups):
-                        found = True
-                        break
-                if (not found):
-                    mma = list(ma)
-                    mma.append(new_node)
-                    new_ac.append(mma)
-                    if (len(mma) > md):
-                        md = len(mma)
-                elif (len(ma) > md):
-                    md = len(ma)
-                new_ac.append(ma) # carry over, then prune it
-            if (len(new_ac) > 0):
-                self._tmp_new_ac = (new_ac, md)
-                if (update):
-                    self._max_antichains = new_ac
-                return md
-            else:
-                raise SchedulerException("No antichains")
     @property
     def cardinality(self):
         return len(self._dag.nodes())
@@ -571,14 +543,14 @@ class WeightedDilworthPartition(DilworthPartition):
                     rem = part_node_set - el_des - self_set
                     for rel in rem:
                         #check path on the global dag
-                        if (nx.has_path(global_dag, el, rel)):
+                        if (DAGUtil.has_path(global_dag, el, rel)):
                             el_des.add(rel)
                             #print("caught missing global edge 0")
 
                     rem = part_node_set - el_pred - self_set
                     for rel in rem:
                         #check path on the global dag
-                        if (nx.has_path(global_dag, rel, el)):
+                        if (DAGUtil.has_path(global_dag, rel, el)):
                             el_pred.add(rel)
                             #print("caught missing global edge 1")
                 for i in range(elcpu):
@@ -642,7 +614,7 @@ class WeightedDilworthPartition(DilworthPartition):
                     rem = part_node_set - el_des - self_set
                     for rel in rem:
                         #check path on the global dag
-                        if (nx.has_path(global_dag, el, rel)):
+                        if (DAGUtil.has_path(global_dag, el, rel)):
                             el_des.add(rel)
                             #print("caught missing global edge 2")
                 for udown in el_des:
@@ -687,11 +659,7 @@ class MultiWeightPartition(Partition):
         self._tc = defaultdict(set) #transitive closure
         self._w_attrs = w_attrs
         self._tc_time = 0.0
-        self._ac_sort_time = 0.0
-        self._ac_mem_time = 0.0
         self._ac_calc_time = 0.0
-        self._matrix_time1 = 0.0
-        self._matrix_time2 = 0.0
 
     def _add_to_tc(self, tc, el, dag, tmp_dag_list):
         """
@@ -708,7 +676,7 @@ class MultiWeightPartition(Partition):
             global_dag = self._global_dag
             for rel in rem:
                 if ((not rel in tc[el]) and
-                    nx.has_path(global_dag, el, rel)):
+                    DAGUtil.has_path(global_dag, el, rel)):
 
                     el_des.add(rel)
                     tmp_dag_list.append((el, rel))
@@ -717,7 +685,7 @@ class MultiWeightPartition(Partition):
             rem = part_node_set - el_pred
             for rel in rem:
                 if ((not el in tc[rel]) and
-                    nx.has_path(global_dag, rel, el)):
+                    DAGUtil.has_path(global_dag, rel, el)):
 
                     el_pred.add(rel)
                     tmp_dag_list.append((rel, el))
@@ -734,97 +702,15 @@ class MultiWeightPartition(Partition):
         """
         Get maximul weighted antichain length for each w_attr
 
+        The reachability between nodes of the partition through the global
+        DAG has been added to `dag` as extra edges by `_add_to_tc`
         """
-        self_w_attrs = self._w_attrs
-        leng = len(self_w_attrs)
-        max_width = [0] * leng
         stt = time.time()
-        dag_node = dag.node
-        N = list(dag)
-        num_nodes = len(N)                        # nodes
-        I = {u: i for i, u in enumerate(N)}        # node indices
-
-        def antichains():
-            """
-            adapted from
-            https://networkx.github.io/documentation/networkx-1.10/\
-            _modules/networkx/algorithms/dag.html
-            """
-            stt = time.time()
-            antichains_stacks = [([], nx.topological_sort(dag, reverse=True))]
-            self._ac_sort_time += time.time() - stt
-            while antichains_stacks:
-                (antichain, stack) = antichains_stacks.pop()
-                # Invariant:
-                #  - the elements of antichain are independent
-                #  - the elements of stack are independent from those of antichain
-                yield antichain
-                while stack:
-                    x = stack.pop()
-                    new_antichain = antichain + [x]
-                    #stt = time.time()
-                    new_stack = [
-                        t for t in stack if not ((t in tc[x]) or (x in tc[t]))]
-                    #self._ac_mem_time += time.time() - stt
-                    antichains_stacks.append((new_antichain, new_stack))
-
-        stt = time.time()
-        weight_matrix = np.zeros((num_nodes, leng))
-        for i, n in enumerate(N):
-            for j in range(leng):
-                weight_matrix[i][j] = dag_node[n][self_w_attrs[j]]
-        self._matrix_time1 += time.time() - stt
-
-        MAX_LEN = 10000
-        all_antichains = []
-        delta_t = 0
-
-        def process_antichain_matrix():
-            if (len(all_antichains) == 0):
-                return
-            antichain_matrix = np.zeros((len(all_antichains), num_nodes))
-            # if (self._gid in [194]):
-            #     print(antichain_matrix.shape, delta_t)
-
-            stt = time.time()
-            for i, antichain in enumerate(all_antichains):
-                for el in antichain:
-                    antichain_matrix[i][I[el]] = 1
-            self._matrix_time2 += time.time() - stt
-
-            sttt = time.time()
-            ret = list(np.max(np.dot(antichain_matrix, weight_matrix), axis=0))
-            self._ac_calc_time += time.time() - sttt
-            for i in range(leng):
-                if ret[i] > max_width[i]:
-                    max_width[i] = ret[i]
-
-        stt = time.time()
-        for ac in antichains():
-            if (ac == []):
-                continue
-            all_antichains.append(ac)
-            if (len(all_antichains) == MAX_LEN):
-                delta_t = time.time() - stt
-                self._ac_mem_time += delta_t
-                process_antichain_matrix()
-                del all_antichains[:]
-                stt = time.time()
-
-        process_antichain_matrix()
+        max_width = [DAGUtil.get_max_width(dag, weight=w_attr)
+                     for w_attr in self._w_attrs]
+        self._ac_calc_time += time.time() - stt
         return max_width
 
-        # cache = {}
-        # for antichain in antichains():
-        #     for i in range(leng):
-        #         attr = self_w_attrs[i]
-        #         s = sum([dag_node[n][attr] for n in antichain])
-        #         if (s > max_width[i]):
-        #             max_width[i] = s
-        # self._ac_calc_time += time.time() - stt
-        # del cache
-        # return max_width
-
     def can_add(self, u, v, gu, gv):
         dag = self._dag
         tc = self._tc
@@ -943,7 +829,7 @@ class KFamilyPartition(Partition):
             for rel in rem:
                 if (rel in tc[el]):
                     el_des.add(rel)
-                elif (nx.has_path(global_dag, el, rel)):
+                elif (DAGUtil.has_path(global_dag, el, rel)):
                     tc[el].add(rel)
                     el_des.add(rel)
 
@@ -951,7 +837,7 @@ class KFamilyPartition(Partition):
             for rel in rem:
                 if (el in tc[rel]):
                     el_pred.add(rel)
-                elif (nx.has_path(global_dag, rel, el)):
+                elif (DAGUtil.has_path(global_dag, rel, el)):
                     tc[rel].add(el)
                     el_pred.add(rel)
 
@@ -1136,7 +1022,7 @@ class Scheduler(object):
         """
         self._drop_list = drop_list
         if (dag is None):
-            self._dag = DAGUtil.build_dag_from_drops(self._drop_list)
+            self._dag = DAGUtil.build_array_dag_from_drops(self._drop_list)
         else:
             self._dag = dag
         self._max_dop = max_dop
@@ -1147,16 +1033,17 @@ class Scheduler(object):
     def partition_dag(self):
         raise SchedulerException("Not implemented. Try subclass instead")
 
-    def merge_partitions(self, num_partitions, bal_cond=0):
+    def merge_partitions(self, num_partitions, bal_cond=0, partitioner='auto'):
         """
         Merge M partitions into N partitions where N < M
             implemented using METIS for now
 
         bal_cond:  load balance condition (integer):
                     0 - workload, 1 - count
+        partitioner: the graph partitioner to use, see `DAGUtil.import_partitioner`
         """
         # 1. build the bi-directional graph (each partition is a node)
-        metis = DAGUtil.import_metis()
+        metis = DAGUtil.import_partitioner(partitioner)
         G = nx.Graph()
         G.graph['edge_weight_attr'] = 'weight'
         st_gid = len(self._drop_list) + len(self._parts) + 1
@@ -1229,6 +1116,7 @@ class MySarkarScheduler(Scheduler):
         super(MySarkarScheduler, self).__init__(drop_list, max_dop=max_dop, dag=dag)
         self._sspace = [3] * len(self._dag.edges()) # all edges are not zeroed
         self._dump_progress = dump_progress
+        self._critical_path = None
 
     def override_cannot_add(self):
         """
@@ -1247,6 +1135,10 @@ class MySarkarScheduler(Scheduler):
         Returns:
             Boolean
 
+        During partitioning ``self._critical_path`` holds a `CriticalPath`
+        that is kept up to date as edges are zeroed, and which can be queried
+        instead of recomputing longest paths.
+
         MySarkarScheduler always returns False
         """
         logger.debug("MySarkar time criticality called")
@@ -1276,8 +1168,14 @@ class MySarkarScheduler(Scheduler):
 
         # Get hold of all gnodes that belong to "part_removed"
         # and re-assign them to the new partitions
-        for n in part_removed._dag.nodes():
-            G.node[n]['gid'] = l_gid
+        if (isinstance(G, ArrayDAG)):
+            # all at once, since the nodes of each part have its gid
+            gids = G.node_array('gid')
+            gids[gids == r_gid] = l_gid
+            gids[gids > r_gid] -= 1
+        else:
+            for n in part_removed._dag.nodes():
+                G.node[n]['gid'] = l_gid
 
         index = None
         for i, part in enumerate(parts):
@@ -1285,8 +1183,9 @@ class MySarkarScheduler(Scheduler):
             if (p_gid > r_gid):
                 g_dict[p_gid - 1] = part
                 part._gid -= 1
-                for n in part._dag.nodes():
-                    G.node[n]['gid'] = part._gid
+                if (not isinstance(G, ArrayDAG)):
+                    for n in part._dag.nodes():
+                        G.node[n]['gid'] = part._gid
             elif (p_gid == r_gid):
                 #index = len(parts) - i - 1
                 index = i
@@ -1308,13 +1207,14 @@ class MySarkarScheduler(Scheduler):
         G = self._dag
         st_gid = len(self._drop_list) + 1
         init_c = st_gid
-        el = G.edges(data=True)
-        el.sort(key=lambda ed: ed[2]['weight'] * -1)
+        el = DAGUtil.edges_by_weight(G)
         stt = time.time()
-        topo_sorted = nx.topological_sort(G)
+        topo_sorted = DAGUtil.topological_sort(G)
         g_dict = self._part_dict#dict() #{gid : Partition}
         curr_lpl = None
         parts = []
+        # the longest path is maintained incrementally as edges are zeroed
+        self._critical_path = CriticalPath(G, topo_sort=topo_sorted)
         plots_data = []
         dump_progress = self._dump_progress
 
@@ -1335,8 +1235,9 @@ class MySarkarScheduler(Scheduler):
             gu = G.node[u]
             v = e[1]
             gv = G.node[v]
-            ow = G.edge[u][v]['weight']
-            G.edge[u][v]['weight'] = 0 #edge zeroing
+            ge = e[2] # same as G.edge[u][v]
+            ow = ge['weight']
+            ge['weight'] = 0 #edge zeroing
             ugid = gu.get('gid', None)
             vgid = gv.get('gid', None)
             if (ugid != vgid): # merge existing parts
@@ -1346,12 +1247,13 @@ class MySarkarScheduler(Scheduler):
                     st_gid -= 1
                     self._sspace[i] = 1
                 else:
-                    G.edge[u][v]['weight'] = ow
+                    ge['weight'] = ow
                     self._part_edges.append(e)
+            if (ge['weight'] != ow):
+                self._critical_path.update_edge(u, v)
             if (dump_progress):
                 bb = np.median([pp._tmp_max_dop for pp in parts])
-                curr_lpl = DAGUtil.get_longest_path(G, show_path=False,
-                topo_sort=topo_sorted)[1]
+                curr_lpl = self._critical_path.length
                 plots_data.append('%d,%d,%d' % (curr_lpl, len(parts), bb))
 
         edt = time.time() - stt
@@ -1359,9 +1261,7 @@ class MySarkarScheduler(Scheduler):
         if (dump_progress):
             with open('/tmp/%.3f_lpl_parts.csv' % time.time(), 'w') as of:
                 of.writelines(os.linesep.join(plots_data))
-        if (curr_lpl is None):
-            curr_lpl = DAGUtil.get_longest_path(G, show_path=False,
-            topo_sort=topo_sorted)[1]
+        curr_lpl = self._critical_path.length
         return ((st_gid - init_c), curr_lpl, edt, parts)
 
 class MinNumPartsScheduler(MySarkarScheduler):
@@ -1452,15 +1352,20 @@ class PSOScheduler(Scheduler):
                 based on X[i] value, reject or linearisation
             (2) returns makespan
     """
-    def __init__(self, drop_list, max_dop=8, dag=None, deadline=None, topk=30, swarm_size=40):
+    def __init__(self, drop_list, max_dop=8, dag=None, deadline=None, topk=30, swarm_size=40, processes=1):
+        """
+        processes: number of processes used to evaluate the particles of the
+        swarm (1 evaluates them serially)
+        """
         super(PSOScheduler, self).__init__(drop_list, max_dop=max_dop, dag=dag)
         self._deadline = deadline
+        self._processes = processes
         #search space: key - combination of X[i] (string),
         # val - a tuple of (critical_path (int), num_parts (int))
         self._sspace_dict = dict()
         self._topk = topk
         self._swarm_size = swarm_size
-        self._lite_dag = DAGUtil.build_dag_from_drops(self._drop_list, embed_drop=False)
+        self._lite_dag = DAGUtil.build_array_dag_from_drops(self._drop_list, embed_drop=False)
         self._call_counts = 0
         leng = len(self._lite_dag.edges())
         self._leng = leng
@@ -1479,10 +1384,15 @@ class PSOScheduler(Scheduler):
         lb = [0.99] * self._leng
         ub = [3.01] * self._leng
         stt = time.time()
-        if (self._deadline is None):
-            xopt, fopt = pso(self.objective_func, lb, ub, swarmsize=self._swarm_size)
+        kwargs = {'swarmsize': self._swarm_size}
+        if (self._deadline is not None):
+            kwargs['ieqcons'] = [self.constrain_func]
+        if (self._processes > 1):
+            xopt = self._parallel_pso(lb, ub)
         else:
-            xopt, fopt = pso(self.objective_func, lb, ub, ieqcons=[self.constrain_func], swarmsize=self._swarm_size)
+            res = pso(self.objective_func, lb, ub, **kwargs)
+            # pyswarm >= 1.0 returns an OptimizeResult instead of (xopt, fopt)
+            xopt = res[0] if isinstance(res, tuple) else res['x']
 
         curr_lpl, num_parts, parts, g_dict = self._partition_G(G, xopt)
         #curr_lpl, num_parts, parts, g_dict = self.objective_func(xopt)
@@ -1502,6 +1412,70 @@ class PSOScheduler(Scheduler):
         #print "call counts ", self._call_counts
         return (num_parts, curr_lpl, edt - stt, parts)
 
+    def _parallel_pso(self, lb, ub, omega=0.5, phip=0.5, phig=0.5, maxiter=100,
+                      minstep=1e-8, minfunc=1e-8):
+        """
+        The same search done by pyswarm's pso, but evaluating the particles of
+        each iteration in a pool of `self._processes` processes. The scheduler
+        is installed once in each process, so only the particles are sent to
+        them. Returns the best position found.
+        """
+        lb = np.array(lb)
+        ub = np.array(ub)
+        S, D = self._swarm_size, len(lb)
+        vhigh = np.abs(ub - lb)
+        vlow = -vhigh
+
+        pool = multiprocessing.Pool(min(self._processes, S), initializer=_init_search_worker, initargs=(self,))
+        try:
+            def evaluate(x):
+                # (objective, feasible) of each particle
+                res = pool.map(_pso_task, list(x))
+                return np.array([r[0] for r in res]), np.array([r[1] for r in res])
+
+            x = lb + np.random.rand(S, D) * (ub - lb)
+            fx, fs = evaluate(x)
+            p = x.copy()
+            fp = np.where(fs, fx, np.inf)
+            i_min = np.argmin(fp)
+            if (fp[i_min] < np.inf):
+                g, fg = p[i_min].copy(), fp[i_min]
+            else:
+                g, fg = x[0].copy(), np.inf
+            v = vlow + np.random.rand(S, D) * (vhigh - vlow)
+
+            for _ in range(maxiter):
+                rp = np.random.uniform(size=(S, D))
+                rg = np.random.uniform(size=(S, D))
+                v = omega * v + phip * rp * (p - x) + phig * rg * (g - x)
+                x = np.clip(x + v, lb, ub)
+                fx, fs = evaluate(x)
+
+                i_update = np.logical_and(fx < fp, fs)
+                p[i_update] = x[i_update]
+                fp[i_update] = fx[i_update]
+
+                i_min = np.argmin(fp)
+                if (fp[i_min] < fg):
+                    p_min = p[i_min].copy()
+                    stepsize = np.sqrt(np.sum((g - p_min) ** 2))
+                    converged = np.abs(fg - fp[i_min]) <= minfunc or stepsize <= minstep
+                    g, fg = p_min, fp[i_min]
+                    if (converged):
+                        break
+        finally:
+            pool.close()
+            pool.join()
+        return g
+
+    def _pso_particle(self, x):
+        """
+        Evaluates particle `x`, returning its objective and whether it
+        satisfies the constraints
+        """
+        feasible = self._deadline is None or self.constrain_func(x) >= 0
+        return self.objective_func(x), feasible
+
     def _partition_G(self, G, x):
         """
         A helper function to partition G based on a given scheme x
@@ -1510,8 +1484,7 @@ class PSOScheduler(Scheduler):
         #print x
         st_gid = len(self._drop_list) + 1
         init_c = st_gid
-        el = G.edges(data=True)
-        el.sort(key=lambda ed: ed[2]['weight'] * -1)
+        el = DAGUtil.edges_by_weight(G)
         #topo_sorted = nx.topological_sort(G)
         #g_dict = self._part_dict#dict() #{gid : Partition}
         g_dict = dict()
@@ -1531,8 +1504,9 @@ class PSOScheduler(Scheduler):
             gu = G.node[u]
             v = e[1]
             gv = G.node[v]
-            ow = G.edge[u][v]['weight']
-            G.edge[u][v]['weight'] = 0 #edge zeroing
+            ge = e[2] # same as G.edge[u][v]
+            ow = ge['weight']
+            ge['weight'] = 0 #edge zeroing
             recover_edge = False
 
             ugid = gu.get('gid', None)
@@ -1569,7 +1543,7 @@ class PSOScheduler(Scheduler):
                     else:
                         recover_edge = True #outright rejection
             if (recover_edge):
-                G.edge[u][v]['weight'] = ow
+                ge['weight'] = ow
                 self._part_edges.append(e)
         self._call_counts += 1
         #print "called {0} times, len parts = {1}".format(self._call_counts, len(parts))
@@ -1611,6 +1585,47 @@ class PSOScheduler(Scheduler):
         else:
             return stuff[1]
 
+    def _search(self, seed):
+        """
+        Runs a single search (subclasses implement this), returning the
+        state found and its score (the lower the better). If `seed` is not
+        None the random number generator is seeded with it first.
+        """
+        raise SchedulerException("Not implemented. Try subclass instead")
+
+    def _multi_start(self, starts, processes):
+        """
+        Runs `starts` independent searches, in parallel if `processes` > 1,
+        and returns the state and score of the best one
+        """
+        if (starts <= 1):
+            return self._search(None)
+        seeds = [random.randint(0, 2 ** 31 - 1) for _ in range(starts)]
+        if (processes <= 1):
+            results = [self._search(seed) for seed in seeds]
+        else:
+            pool = multiprocessing.Pool(min(processes, starts), initializer=_init_search_worker, initargs=(self,))
+            try:
+                results = pool.map(_search_task, seeds)
+            finally:
+                pool.close()
+                pool.join()
+        return min(results, key=lambda r: r[1])
+
+# The scheduler whose searches (or particles) are run by a worker process of
+# PSOScheduler._multi_start (or PSOScheduler._parallel_pso)
+_search_scheduler = None
+
+def _init_search_worker(scheduler):
+    global _search_scheduler
+    _search_scheduler = scheduler
+
+def _search_task(seed):
+    return _search_scheduler._search(seed)
+
+def _pso_task(x):
+    return _search_scheduler._pso_particle(x)
+
 class GraphAnnealer(Annealer):
     """
     Use simulated annealing for a DAG/Graph scheduling problem.
@@ -1676,10 +1691,27 @@ class MCTSScheduler(PSOScheduler):
     https://en.wikipedia.org/wiki/Monte_Carlo_tree_search
     Use basic functions in PSOScheduler by inheriting it for convinence
     """
-    def __init__(self, drop_list, max_dop=8, dag=None, deadline=None, max_moves=1000, max_calc_time=10):
-        super(MCTSScheduler, self).__init__(drop_list, max_dop, dag, deadline, None, 40)
+    def __init__(self, drop_list, max_dop=8, dag=None, deadline=None, max_moves=1000, max_calc_time=10,
+                 starts=1, processes=1):
+        """
+        starts: number of independent searches, the best of which is used
+        processes: number of processes the searches are run in
+        """
+        super(MCTSScheduler, self).__init__(drop_list, max_dop, dag, deadline, None, 40, processes)
         self._max_moves = max_moves
         self._max_calc_time = max_calc_time
+        self._starts = starts
+
+    def _search(self, seed):
+        if (seed is not None):
+            random.seed(seed)
+        stree = DAGTree(self._lite_dag, self)
+        mcts = MCTS(stree, calculation_time=self._max_calc_time, max_moves=self._max_moves)
+        state = mcts.run()
+        if (self._starts <= 1):
+            return (state, None)
+        # the payout of MCTS is the length of the critical path
+        return (state, self._partition_G(self._lite_dag.copy(), state)[0])
 
     def partition_dag(self):
         """
@@ -1692,13 +1724,7 @@ class MCTSScheduler(PSOScheduler):
         """
         stt = time.time()
         G = self._dag
-        stree = DAGTree(self._lite_dag, self)
-        mcts = MCTS(stree, calculation_time=self._max_calc_time, max_moves=self._max_moves)
-        # m, state = mcts.next_move()
-        # leng = len(G.edges())
-        # while (len(state) < leng):
-        #     m, state = mcts.next_move()
-        state = mcts.run()
+        state, _ = self._multi_start(self._starts, self._processes)
         if logger.isEnabledFor(logging.DEBUG):
             leng = len(G.edges())
             logger.debug("Each MCTS move on average took {0} seconds".formats((time.time() - stt) / leng))
@@ -1726,13 +1752,33 @@ class SAScheduler(PSOScheduler):
     http://apmonitor.com/me575/index.php/Main/SimulatedAnnealing
     Use basic functions in PSOScheduler by inheriting it for convinence
     """
-    def __init__(self, drop_list, max_dop=8, dag=None, deadline=None, topk=None, max_iter=6000):
+    def __init__(self, drop_list, max_dop=8, dag=None, deadline=None, topk=None, max_iter=6000,
+                 starts=1, processes=1):
         """
         A smaller topk corresponds to a smaller range of perturbation during neighbour search,
         which coudl result in more single-drop partitions
+
+        starts: number of independent annealings, the best of which is used
+        processes: number of processes the annealings are run in
         """
-        super(SAScheduler, self).__init__(drop_list, max_dop, dag, deadline, topk, 40)
+        super(SAScheduler, self).__init__(drop_list, max_dop, dag, deadline, topk, 40, processes)
         self._max_iter = max_iter
+        self._starts = starts
+        self._init_state = None
+
+    def _search(self, seed):
+        if (seed is not None):
+            random.seed(seed)
+        ga = GraphAnnealer(self._init_state, self, deadline=self._deadline, topk=self._topk)
+        #auto_schedule = ga.auto(minutes=self._max_wait)
+        #ga.set_schedule(auto_schedule)
+        ga.steps = self._max_iter
+        if (DEBUG):
+            ga.updates = 100
+        else:
+            ga.updates = 0
+        ga.save_state_on_exit = False
+        return ga.anneal()
 
     def partition_dag(self):
         """
@@ -1748,19 +1794,10 @@ class SAScheduler(PSOScheduler):
         mys = MySarkarScheduler(self._drop_list, max_dop=self._max_dop, dag=self._lite_dag.copy())
         num_parts_done, lpl, ptime, parts = mys.partition_dag()
         # print "initial num_parts = ", len(parts)
-        # 2. create the GraphAnnealer instance
+        # 2. start the annealing process(es) from there
         stt = time.time()
-        ga = GraphAnnealer(mys._sspace, self, deadline=self._deadline, topk=self._topk)
-        # 3. start the annealing process
-        #auto_schedule = ga.auto(minutes=self._max_wait)
-        #ga.set_schedule(auto_schedule)
-        ga.steps = self._max_iter
-        if (DEBUG):
-            ga.updates = 100
-        else:
-            ga.updates = 0
-        ga.save_state_on_exit = False
-        state, e = ga.anneal()
+        self._init_state = mys._sspace
+        state, e = self._multi_start(self._starts, self._processes)
         # 4. calculate the solution under the 'annealed' state
         curr_lpl, num_parts, parts, g_dict = self._partition_G(G, state)
         edt = time.time()
@@ -1790,6 +1827,131 @@ class DSCScheduler(Schedule):
     def partition_dag(self):
         pass
 
+class CriticalPath(object):
+    """
+    Keeps track of the longest path of a DAG while the weights of its edges
+    change, without walking the whole DAG after each change.
+
+    The top level of each node (its distance, as computed by
+    `DAGUtil.get_longest_path`) and its bottom level (the longest path from
+    the node to an exit node) are kept up to date. When the weight of an edge
+    (u, v) changes, only the top levels of v and its descendants, and the
+    bottom levels of u and its ancestors are recomputed, stopping as soon as
+    a level doesn't change. Node weights are assumed not to change.
+    """
+
+    def __init__(self, G, weight='weight', default_weight=1, topo_sort=None):
+        self._G = G
+        self._weight = weight
+        self._default_weight = default_weight
+        if (topo_sort is None):
+            topo_sort = DAGUtil.topological_sort(G)
+        topo_sort = list(topo_sort)
+        self._order = dict((n, i) for i, n in enumerate(topo_sort))
+        self._nw = dict((n, d.get(weight, 0)) for n, d in G.nodes(data=True))
+        if (isinstance(G, ArrayDAG)):
+            self._top, self._bottom = G.levels(weight, default_weight)
+        else:
+            self._top = {} # {v : (length, u)}
+            self._bottom = {} # {v : length}
+            for v in topo_sort:
+                self._top[v] = self._top_of(v)
+            for v in reversed(topo_sort):
+                self._bottom[v] = self._bottom_of(v)
+        # exit nodes, where the longest path ends, as a heap of (-length, v).
+        # Stale entries are discarded lazily
+        self._exits = [(-self._top[v][0], v) for v in topo_sort if not G.succ[v]]
+        heapq.heapify(self._exits)
+
+    def _top_of(self, v):
+        G = self._G
+        vw = self._nw[v] if not G.succ[v] else 0 # v node weight if no successor
+        us = [(self._top[u][0] + data.get(self._weight, self._default_weight) + self._nw[u] + vw, u)
+              for u, data in G.pred[v].items()]
+        maxu = max(us) if us else (0, v)
+        return maxu if maxu[0] >= 0 else (0, v)
+
+    def _bottom_of(self, v):
+        ls = [data.get(self._weight, self._default_weight) + self._bottom[s]
+              for s, data in self._G.succ[v].items()]
+        return self._nw[v] + (max(ls) if ls else 0)
+
+    def _propagate(self, start, levels, level_of, nexts, direction):
+        """
+        Recomputes the levels of `start` and of the nodes reachable from it
+        through `nexts`, in topological order (or reversed topological order
+        if `direction` is -1). Returns the nodes whose level changed.
+        """
+        changed = []
+        heap = [(direction * self._order[start], start)]
+        queued = set([start])
+        while heap:
+            _, n = heapq.heappop(heap)
+            queued.discard(n)
+            new = level_of(n)
+            old = levels[n]
+            levels[n] = new
+            if (new == old):
+                continue
+            changed.append(n)
+            # Keep going only if the length itself changed
+            if (direction == 1 and new[0] == old[0]):
+                continue
+            for m in nexts[n]:
+                if (m not in queued):
+                    queued.add(m)
+                    heapq.heappush(heap, (direction * self._order[m], m))
+        return changed
+
+    def update_edge(self, u, v):
+        """
+        Updates the levels after the weight of edge (u, v) has changed
+        """
+        G = self._G
+        for n in self._propagate(v, self._top, self._top_of, G.succ, 1):
+            if (not G.succ[n]):
+                heapq.heappush(self._exits, (-self._top[n][0], n))
+        self._propagate(u, self._bottom, self._bottom_of, G.pred, -1)
+
+    def _longest_exit(self):
+        exits = self._exits
+        while exits:
+            length, v = exits[0]
+            if (self._top[v][0] == -length):
+                return v
+            heapq.heappop(exits)
+        return None
+
+    @property
+    def length(self):
+        """The length of the current longest path"""
+        v = self._longest_exit()
+        return 0 if v is None else self._top[v][0]
+
+    @property
+    def path(self):
+        """The current longest path"""
+        v = self._longest_exit()
+        if (v is None):
+            return []
+        u = None
+        path = []
+        while u != v:
+            path.append(v)
+            u = v
+            v = self._top[v][1]
+        path.reverse()
+        return path
+
+    def length_through(self, u, v):
+        """
+        The length of the longest path going through edge (u, v), which is
+        what the longest path would become if that edge was the only one
+        changing weight and ended up being on it
+        """
+        ew = self._G.succ[u][v].get(self._weight, self._default_weight)
+        return self._top[u][0] + self._nw[u] + ew + self._bottom[v]
+
 class DAGUtil(object):
     """
     Helper functions dealing with DAG
@@ -1818,7 +1980,11 @@ class DAGUtil(object):
         path_length : float
             The length of the longest path
 
+        On an `ArrayDAG` this is computed in a vectorised way; among equally
+        long paths a different one might be returned though.
         """
+        if (isinstance(G, ArrayDAG)):
+            return G.longest_path(weight=weight, default_weight=default_weight, show_path=show_path)
         dist = {} # stores {v : (length, u)}
         if (topo_sort is None):
             topo_sort = nx.topological_sort(G)
@@ -1847,6 +2013,71 @@ class DAGUtil(object):
             path.reverse()
         return (path, lp)
 
+    @staticmethod
+    def topological_sort(G):
+        """
+        Returns a list with the nodes of G in topological order
+        """
+        if (isinstance(G, ArrayDAG)):
+            return G.topological_sort()
+        return list(nx.topological_sort(G))
+
+    @staticmethod
+    def has_path(G, u, v):
+        """
+        Returns whether there is a path from u to v in G
+        """
+        if (isinstance(G, ArrayDAG)):
+            return G.has_path(u, v)
+        return nx.has_path(G, u, v)
+
+    @staticmethod
+    def edges_by_weight(G, weight='weight'):
+        """
+        Returns a list with the edges of G (with their data) sorted by
+        decreasing weight, equally weighted edges staying in the order of
+        G.edges()
+        """
+        if (isinstance(G, ArrayDAG)):
+            return G.edges_by_weight(weight)
+        el = G.edges(data=True)
+        el.sort(key=lambda ed: ed[2][weight] * -1)
+        return el
+
+    @staticmethod
+    def get_max_antichain(G, weight=None, default_weight=1):
+        """
+        Get an antichain with the maximum (weighted) width of this DAG in
+        polynomial time, instead of enumerating all antichains
+
+        By (the weighted version of) Dilworth's theorem, the weight of the
+        maximum antichain equals the minimum flow covering each node at least
+        as many times as its weight. Starting from the trivial flow (one
+        path per node), the flow that can be cancelled is a maximum flow
+        running from the end of each node along the DAG edges to the start of
+        its descendants; since it can use DAG edges without limits the
+        transitive closure is never built. The antichain is given by the
+        nodes split by the corresponding minimum cut.
+
+        weight: node attribute to use as weight, or None to count nodes
+        Return : a tuple with the antichain (list) and its width
+        """
+        H = nx.DiGraph()
+        total = 0
+        for n, data in G.nodes(data=True):
+            w = 1 if weight is None else data.get(weight, default_weight)
+            total += w
+            H.add_edge('s', ('out', n), capacity=w)
+            H.add_edge(('in', n), 't', capacity=w)
+            H.add_edge(('in', n), ('out', n)) # no capacity means infinite
+        if (total == 0):
+            return ([], 0)
+        for u, v in G.edges():
+            H.add_edge(('out', u), ('in', v))
+        cut, (reachable, _) = nx.minimum_cut(H, 's', 't', flow_func=shortest_augmenting_path)
+        antichain = [n for n in G.nodes() if (('out', n) in reachable and ('in', n) not in reachable)]
+        return (antichain, total - cut)
+
     @staticmethod
     def get_max_width(G, weight='weight', default_weight=1):
         """
@@ -1854,14 +2085,7 @@ class DAGUtil(object):
         weight: float (for example, it could be RAM consumption in GB)
         Return : float
         """
-        max_width = 0
-        for antichain in nx.antichains(G):
-            t = 0
-            for n in antichain:
-                t += G.node[n].get(weight, default_weight)
-            if (t > max_width):
-                max_width = t
-        return max_width
+        return DAGUtil.get_max_antichain(G, weight=weight, default_weight=default_weight)[1]
 
     @staticmethod
     def get_max_dop(G):
@@ -1869,22 +2093,16 @@ class DAGUtil(object):
         Get the maximum degree of parallelism of this DAG
         return : int
         """
-        return max([len(antichain) for antichain in nx.antichains(G)])
-        """
-        max_dop = 0
-        for antichain in nx.antichains(G):
-            leng = len(antichain)
-            if (leng > max_dop):
-                max_dop = leng
-        return max_dop
-        """
+        return DAGUtil.get_max_antichain(G)[1]
 
     @staticmethod
     def get_max_antichains(G):
         """
-        return a list of antichains with Top-2 lengths
+        return a list with an antichain of maximum length
+        (an empty list if G is empty)
         """
-        return DAGUtil.prune_antichains(nx.antichains(G))
+        antichain = DAGUtil.get_max_antichain(G)[0]
+        return [antichain] if antichain else []
 
     @staticmethod
     def prune_antichains(antichains):
@@ -1904,7 +2122,7 @@ class DAGUtil(object):
         for each node, label its start and end time
         """
         if (topo_sort is None):
-            topo_sort = nx.topological_sort(G)
+            topo_sort = DAGUtil.topological_sort(G)
         for v in topo_sort:
             gv = G.node[v]
             parents = G.predecessors(v)
@@ -1920,39 +2138,87 @@ class DAGUtil(object):
                 gv['stt'] = ledt
             gv['edt'] = gv['stt'] + gv.get(weight, 0)
 
+    @staticmethod
+    def ganttchart_runs(G, topo_sort=None):
+        """
+        The gantt chart matrix in its sparse form, see `DAGUtil.runs_to_matrix`.
+        Row i is the i-th DROP in topological order, and its only run goes
+        from its start to its end time (with value 1)
+        Return: a (runs, (M (# of DROPs), N (longest path length))) tuple
+        """
+        N = DAGUtil.get_longest_path(G, show_path=False)[1]
+        M = len(G)
+        if (topo_sort is None):
+            topo_sort = DAGUtil.topological_sort(G)
+        try:
+            stt = np.array([G.node[n]['stt'] for n in topo_sort], dtype=int)
+            edt = np.array([G.node[n]['edt'] for n in topo_sort], dtype=int)
+        except KeyError as ke:
+            raise SchedulerException("No schedule labels found: {0}".\
+            format(str(ke)))
+        edt = np.minimum(edt, N)
+        rows = np.flatnonzero(edt > stt)
+        runs = np.column_stack((rows, stt[rows], edt[rows], np.ones_like(rows)))
+        return runs.astype(int).reshape((-1, 4)), (M, N)
+
     @staticmethod
     def ganttchart_matrix(G, topo_sort=None):
         """
         Return a M (# of DROPs) by N (longest path length) matrix
         """
-        lpl = DAGUtil.get_longest_path(G, show_path=True)
-        #N = lpl[1] - (len(lpl[0]) - 1)
-        N = lpl[1]
-        M = len(G.nodes())
-        ma = np.zeros((M, N), dtype=np.int)
-        if (topo_sort is None):
-            topo_sort = nx.topological_sort(G)
-        for i, n in enumerate(topo_sort):
-            node = G.node[n]
-            try:
-                stt = node['stt']
-                edt = node['edt']
-            except KeyError as ke:
-                raise SchedulerException("No schedule labels found: {0}".\
-                format(str(ke)))
-            #print i, n, stt, edt
-            leng = edt - stt
-            if (edt == stt):
-                continue
-            try:
-                ma[i, stt:edt] = np.ones((1, leng))
-            except:
-                logger.error("i, stt, edt, leng = %d, %d, %d, %d", i, stt, edt, leng)
-                logger.error("N, M = %d, %d, %d, %d", M, N)
-                raise
-            #print ma[i, :]
+        return DAGUtil.runs_to_matrix(*DAGUtil.ganttchart_runs(G, topo_sort=topo_sort))
+
+    @staticmethod
+    def runs_to_matrix(runs, shape):
+        """
+        Expand a sparse matrix into a dense one. Sparse matrices are given as
+        an array of runs, each run being a (row, start, end, value) tuple
+        meaning that columns start to end (excluded) of the row hold value.
+        Cells not covered by any run are 0
+        """
+        ma = np.zeros(shape, dtype=int)
+        for row, start, end, value in runs:
+            ma[row, start:end] = value
         return ma
 
+    @staticmethod
+    def downsample_runs(runs, shape, max_rows, max_cols):
+        """
+        Downsample a sparse matrix (see `DAGUtil.runs_to_matrix`) by grouping
+        its rows and columns into blocks so that it is at most max_rows by
+        max_cols large. Each cell of the result is the fraction of the block
+        covered by runs, and the runs are never expanded so this is linear in
+        the number of runs.
+
+        Return: a (matrix, (row block size, column block size)) tuple
+        """
+        M, N = shape
+        rf = max(1, -(-M // max_rows))
+        cf = max(1, -(-N // max_cols))
+        R = -(-M // rf)
+        C = -(-N // cf)
+        busy = np.zeros((R, C + 1))
+        if (len(runs)):
+            rb = runs[:, 0] // rf
+            start, end = runs[:, 1], runs[:, 2]
+            b0 = start // cf
+            b1 = (end - 1) // cf
+            same = (b0 == b1)
+            np.add.at(busy, (rb[same], b0[same]), end[same] - start[same])
+            diff = ~same
+            rb, start, end, b0, b1 = rb[diff], start[diff], end[diff], b0[diff], b1[diff]
+            # partial blocks at both ends, and full blocks in between
+            # accumulated as differences along the rows
+            np.add.at(busy, (rb, b0), (b0 + 1) * cf - start)
+            np.add.at(busy, (rb, b1), end - b1 * cf)
+            full = np.zeros((R, C + 1))
+            np.add.at(full, (rb, b0 + 1), cf)
+            np.add.at(full, (rb, b1), -cf)
+            busy += np.cumsum(full, axis=1)
+        rows = np.diff(np.minimum(np.arange(R + 1) * rf, M))
+        cols = np.diff(np.minimum(np.arange(C + 1) * cf, N))
+        return busy[:, :C] / np.outer(rows, cols), (rf, cf)
+
     @staticmethod
     def import_metis():
         try:
@@ -1967,6 +2233,29 @@ class DAGUtil(object):
             import metis as mt
         return mt
 
+    @staticmethod
+    def import_partitioner(partitioner='auto'):
+        """
+        Returns a module with a METIS-like part_graph function to partition
+        graphs with
+
+        partitioner:    'metis' - the METIS library
+                        'native' - `dfms.dropmake.utils.multilevel`
+                        'auto' - METIS if it can be loaded, native otherwise
+        """
+        if (partitioner == 'metis'):
+            return DAGUtil.import_metis()
+        elif (partitioner == 'native'):
+            from dfms.dropmake.utils import multilevel
+            return multilevel
+        elif (partitioner == 'auto'):
+            try:
+                return DAGUtil.import_metis()
+            except Exception as exp:
+                logger.warning("METIS cannot be loaded (%s), using the native partitioner", exp)
+                return DAGUtil.import_partitioner('native')
+        raise SchedulerException("Unknown graph partitioner: {0}".format(partitioner))
+
     @staticmethod
     def build_dag_from_drops(drop_list, embed_drop=True):
         """
@@ -1975,6 +2264,8 @@ class DAGUtil(object):
         tw - task weight
         dw - data weight / volume
         """
+        if (isinstance(drop_list, DropColumns)):
+            return DAGUtil._build_dag_from_columns(drop_list, embed_drop)
         key_dict = dict() # {oid : node_id}
         drop_dict = dict() # {oid : drop}
         for i, drop in enumerate(drop_list):
@@ -2012,6 +2303,86 @@ class DAGUtil(object):
                         G.add_weighted_edges_from([(myk, key_dict[oup], int(drop_dict[oup].get('dw', 5)))])
         return G
 
+    @staticmethod
+    def _build_dag_from_columns(drops, embed_drop=True):
+        """
+        Same as build_dag_from_drops, but using the relationships stored in
+        DropColumns directly
+        """
+        G = nx.DiGraph()
+        for i in range(len(drops)):
+            myk = i + 1
+            tt = drops.get(i, 'type')
+            if ('plain' == tt):
+                obk = 'consumers'
+                tw = 0
+                dtp = 0
+            elif ('app' == tt):
+                obk = 'outputs'
+                tw = int(drops.get(i, 'tw'))
+                dtp = 1
+            else:
+                raise SchedulerException("Drop Type '{0}' not supported".\
+                format(tt))
+            attrs = dict(weight=tw, text=drops.get(i, 'nm'), dt=dtp,
+                         num_cpus=drops.get(i, 'num_cpus', 1))
+            if (embed_drop):
+                attrs['drop_spec'] = drops[i]
+            G.add_node(myk, **attrs)
+            if ('plain' == tt):
+                dw = int(drops.get(i, 'dw'))
+                G.add_weighted_edges_from((myk, int(j) + 1, dw) for j in drops.neighbours(i, obk))
+            else:
+                G.add_weighted_edges_from((myk, int(j) + 1, int(drops.get(j, 'dw', 5))) for j in drops.neighbours(i, obk))
+        return G
+
+    @staticmethod
+    def build_array_dag_from_drops(drop_list, embed_drop=True):
+        """
+        Same as build_dag_from_drops, but returns an `ArrayDAG`, which needs
+        less memory and is faster to copy and to compute longest paths on
+        """
+        columns = isinstance(drop_list, DropColumns)
+        if (not columns):
+            key_dict = dict((drop['oid'], i) for i, drop in enumerate(drop_list)) # {oid : position}
+        weights, texts, dts, num_cpus, drop_specs = [], [], [], [], []
+        src, dst, ews = [], [], []
+        for i, drop in enumerate(drop_list):
+            tt = drop['type']
+            if ('plain' == tt):
+                obk = 'consumers' # outbound keyword
+                tw = 0
+                dtp = 0
+            elif ('app' == tt):
+                obk = 'outputs'
+                tw = int(drop['tw'])
+                dtp = 1
+            else:
+                raise SchedulerException("Drop Type '{0}' not supported".\
+                format(tt))
+            weights.append(tw)
+            texts.append(drop['nm'])
+            dts.append(dtp)
+            num_cpus.append(drop.get('num_cpus', 1))
+            drop_specs.append(drop)
+            if (columns):
+                outs = drop_list.neighbours(i, obk).tolist()
+            else:
+                outs = [key_dict[oup] for oup in drop.get(obk, [])]
+            for j in outs:
+                src.append(i)
+                dst.append(j)
+                if ('plain' == tt):
+                    ews.append(int(drop['dw']))
+                else:
+                    ews.append(int(drop_list[j].get('dw', 5)))
+        node_attrs = dict(weight=weights, text=texts, dt=dts, num_cpus=num_cpus)
+        if (embed_drop):
+            node_attrs['drop_spec'] = drop_specs
+        n = len(weights)
+        return ArrayDAG(range(1, n + 1), src, dst, node_attrs, {'weight': ews},
+                        order=ArrayDAG.insertion_order(n, src, dst))
+
     @staticmethod
     def metis_part(G, num_partitions):
         """
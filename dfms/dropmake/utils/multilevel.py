@@ -0,0 +1,451 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A multilevel k-way graph partitioner working on NumPy arrays, used when the
+METIS library is not available. Like METIS, it partitions undirected graphs
+into parts of balanced vertex weight while minimising the weight of the cut
+edges, in three phases:
+
+1. Coarsening: the graph is shrunk level after level by contracting heavy
+   edges. Matchings are computed for all vertices at once: every vertex
+   proposes to the neighbour it shares its heaviest edge with, and vertices
+   proposing to each other are matched. Vertices left alone (e.g. the many
+   neighbours of a scatter or gather DROP) are matched with other vertices
+   proposing to the same neighbour.
+2. Initial partitioning: the coarsest graph is recursively bisected by
+   growing regions from random vertices, keeping the best of a few tries.
+3. Uncoarsening: the partition is projected back level by level and refined
+   by moving boundary vertices to the part they are most connected to, as
+   long as the cut decreases and the parts stay balanced.
+
+Graphs are given in the CSR format used by METIS (see `part_csr`), and
+`part_graph` accepts networkx graphs like the METIS Python binding does, so
+this module can be used in its place.
+"""
+
+import heapq
+import logging
+import math
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+def _compress(n, src, dst, wgt):
+    """
+    CSR arrays of the n-vertex graph with edges src -> dst, without self
+    loops and with the weights of repeated edges added together
+    """
+    keep = (src != dst)
+    key = src[keep] * n + dst[keep]
+    wgt = wgt[keep]
+    order = np.argsort(key, kind='mergesort')
+    key, wgt = key[order], wgt[order]
+    key, first = np.unique(key, return_index=True)
+    adjwgt = np.add.reduceat(wgt, first) if len(first) else wgt
+    xadj = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(key // n, minlength=n), out=xadj[1:])
+    return xadj, key % n, adjwgt
+
+def _sources(xadj):
+    return np.repeat(np.arange(len(xadj) - 1), np.diff(xadj))
+
+def _edge_cut(src, adjncy, adjwgt, part):
+    # each edge is stored in both directions
+    return adjwgt[part[src] != part[adjncy]].sum() / 2.0
+
+def _firsts(keys):
+    """Mask of the first element of each run of equal keys"""
+    return np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, dtype=bool)
+
+def _match(graph, maxvwgt, rand, rounds=4):
+    """
+    Returns the vertex each vertex is matched with (itself if unmatched)
+    """
+    xadj, adjncy, adjwgt, vwgt = graph
+    n = len(vwgt)
+    src = _sources(xadj)
+    # symmetric keys break ties between edges of the same weight, so that
+    # the heaviest edges around are always chosen from both of their ends
+    rank = rand.permutation(n).astype(np.int64)
+    tie = np.minimum(rank[src], rank[adjncy]) * n + np.maximum(rank[src], rank[adjncy])
+    order = np.lexsort((-tie, -adjwgt, src))
+    src, dst = src[order], adjncy[order]
+    light = (vwgt[src] + vwgt[dst] <= maxvwgt)
+    match = np.full(n, -1, dtype=np.int64)
+    for _ in range(rounds):
+        free = (match < 0)
+        ok = light & free[src] & free[dst]
+        s, d = src[ok], dst[ok]
+        first = _firsts(s)
+        pref = np.full(n, -1, dtype=np.int64)
+        pref[s[first]] = d[first]
+        u = np.flatnonzero(pref >= 0)
+        u = u[pref[pref[u]] == u]
+        if (len(u) == 0):
+            break
+        match[u] = pref[u]
+
+    # two-hop matching of the vertices left, grouped by their heaviest
+    # neighbour
+    free = (match < 0)
+    ok = free[src]
+    s, d = src[ok], dst[ok]
+    first = _firsts(s)
+    s, d = s[first], d[first]
+    order = np.lexsort((vwgt[s], d))
+    s, d = s[order], d[order]
+    if (len(s) > 1):
+        # pair the 1st and 2nd vertices of each group, the 3rd and 4th, etc.
+        start = np.flatnonzero(_firsts(d))
+        pos = np.arange(len(s)) - np.repeat(start, np.diff(np.r_[start, len(s)]))
+        a = np.flatnonzero((pos % 2 == 0)[:-1] & (d[1:] == d[:-1]))
+        a = a[vwgt[s[a]] + vwgt[s[a + 1]] <= maxvwgt]
+        match[s[a]] = s[a + 1]
+        match[s[a + 1]] = s[a]
+
+    unmatched = (match < 0)
+    match[unmatched] = np.flatnonzero(unmatched)
+    return match
+
+def _contract(graph, match):
+    """
+    Returns the graph obtained by merging matched vertices, and the vertex
+    of the new graph each vertex is merged into
+    """
+    xadj, adjncy, adjwgt, vwgt = graph
+    n = len(vwgt)
+    _, cmap = np.unique(np.minimum(np.arange(n), match), return_inverse=True)
+    cmap = cmap.reshape(-1)
+    nc = int(cmap.max()) + 1 if n else 0
+    cvwgt = np.bincount(cmap, weights=vwgt, minlength=nc)
+    cxadj, cadjncy, cadjwgt = _compress(nc, cmap[_sources(xadj)], cmap[adjncy], adjwgt)
+    return (cxadj, cadjncy, cadjwgt, cvwgt), cmap
+
+def _grow_bisection(adj, vw, nodes, frac, rand, ntries, min_size=1, max_size=None):
+    """
+    Splits nodes in two by growing a region with about frac of their weight
+    from a random vertex, always adding the vertex that increases the cut
+    the least. The region has between min_size and max_size vertices.
+    Returns the vertices of the region of the best try.
+    """
+    if (max_size is None):
+        max_size = len(nodes)
+    inside = set(nodes)
+    total = sum(vw[u] for u in nodes)
+    target = frac * total
+    degree = dict((u, sum(w for v, w in adj[u] if v in inside)) for u in nodes)
+    best = None
+    for _ in range(ntries):
+        order = list(nodes)
+        rand.shuffle(order)
+        region = set()
+        weight = 0.0
+        gain = {}
+        heap = []
+        while ((weight < target or len(region) < min_size) and len(region) < max_size):
+            if (not heap):
+                while (order and order[-1] in region):
+                    order.pop()
+                if (not order):
+                    break
+                heap.append((-gain.get(order[-1], 0), order[-1]))
+            g, u = heapq.heappop(heap)
+            if (u in region or -g != gain.get(u, 0)):
+                continue
+            # stop where the weight is the closest to the target
+            if (len(region) >= min_size and weight + vw[u] - target > target - weight):
+                break
+            region.add(u)
+            weight += vw[u]
+            for v, w in adj[u]:
+                if (v in inside and v not in region):
+                    # gain = weight of edges to the region - weight of the others
+                    gain[v] = gain.get(v, -degree[v]) + 2 * w
+                    heapq.heappush(heap, (-gain[v], v))
+        cut = sum(w for u in region for v, w in adj[u] if v in inside and v not in region)
+        score = (cut, abs(weight - target))
+        if (best is None or score < best[0]):
+            best = (score, region)
+    return best[1]
+
+def _initial_partition(graph, nparts, rand, ntries=4):
+    """
+    Recursively bisects the (small) coarsest graph into nparts parts
+    """
+    xadj, adjncy, adjwgt, vwgt = graph
+    n = len(vwgt)
+    xadj, adjncy, adjwgt = xadj.tolist(), adjncy.tolist(), adjwgt.tolist()
+    adj = [list(zip(adjncy[xadj[u]:xadj[u + 1]], adjwgt[xadj[u]:xadj[u + 1]]))
+           for u in range(n)]
+    vw = vwgt.tolist()
+    part = np.zeros(n, dtype=np.int64)
+    todo = [(list(range(n)), 0, nparts)]
+    while todo:
+        nodes, first, k = todo.pop()
+        if (k == 1 or not nodes):
+            part[nodes] = first
+            continue
+        k0 = k // 2
+        # keep enough vertices on each side for all the parts
+        region = _grow_bisection(adj, vw, nodes, k0 / float(k), rand, ntries,
+                                 min_size=min(k0, len(nodes)),
+                                 max_size=max(len(nodes) - (k - k0), min(k0, len(nodes))))
+        todo.append(([u for u in nodes if u in region], first, k0))
+        todo.append(([u for u in nodes if u not in region], first + k0, k - k0))
+    return part
+
+def _connectivity(src, adjncy, adjwgt, part, nparts):
+    """
+    The weight of the edges between each vertex and each of its adjacent
+    parts, as (vertex, part, weight) arrays sorted by vertex
+    """
+    key, inv = np.unique(src * nparts + part[adjncy], return_inverse=True)
+    conn = np.bincount(inv.reshape(-1), weights=adjwgt, minlength=len(key))
+    return key // nparts, key % nparts, conn
+
+def _moves(graph, src, part, pwgts, nparts):
+    """
+    For each vertex with neighbours in other parts, the part it is most
+    connected to (the lightest one in case of ties), and the gain in cut
+    of moving it there. Returns (vertices, parts, gains) arrays.
+    """
+    xadj, adjncy, adjwgt, vwgt = graph
+    v, p, conn = _connectivity(src, adjncy, adjwgt, part, nparts)
+    own = (p == part[v])
+    internal = np.zeros(len(vwgt))
+    internal[v[own]] = conn[own]
+    v, p, conn = v[~own], p[~own], conn[~own]
+    order = np.lexsort((pwgts[p], -conn, v))
+    v, p, conn = v[order], p[order], conn[order]
+    first = _firsts(v)
+    v, p, conn = v[first], p[first], conn[first]
+    return v, p, conn - internal[v]
+
+def _refine(graph, part, nparts, maxpwgt, niter=10):
+    """
+    Greedy k-way refinement. Vertices are moved all at once, in one direction
+    only at each pass (to a part with a higher id, then a lower one) so that
+    neighbours don't swap places, and passes that don't reduce the cut are
+    undone.
+    """
+    xadj, adjncy, adjwgt, vwgt = graph
+    src = _sources(xadj)
+    pwgts = np.bincount(part, weights=vwgt, minlength=nparts)
+    cut = _edge_cut(src, adjncy, adjwgt, part)
+    idle = 0
+    for it in range(niter):
+        v, p, gain = _moves(graph, src, part, pwgts, nparts)
+        upward = (p > part[v]) if it % 2 == 0 else (p < part[v])
+        # moves that don't change the cut are still made if they improve
+        # the balance
+        better = (gain > 0) | ((gain == 0) & (pwgts[p] + vwgt[v] < pwgts[part[v]]))
+        ok = upward & better
+        v, p, gain = v[ok], p[ok], gain[ok]
+        # the best moves to each part are made until it is full
+        order = np.lexsort((-gain, p))
+        v, p = v[order], p[order]
+        cw = np.cumsum(vwgt[v])
+        start = np.flatnonzero(_firsts(p))
+        cw -= np.repeat(cw[start] - vwgt[v][start], np.diff(np.r_[start, len(v)]))
+        ok = (pwgts[p] + cw <= maxpwgt)
+        v, p = v[ok], p[ok]
+        # parts are never emptied: the worst move out of them is dropped
+        order = np.lexsort((-gain[order][ok], part[v]))
+        v, p = v[order], p[order]
+        src_part = part[v]
+        last = np.r_[src_part[1:] != src_part[:-1], True] if len(v) else np.zeros(0, dtype=bool)
+        sizes = np.bincount(part, minlength=nparts)
+        moved = np.bincount(src_part, minlength=nparts)
+        ok = ~(last & (moved[src_part] >= sizes[src_part]))
+        v, p = v[ok], p[ok]
+        if (len(v) == 0):
+            idle += 1
+            if (idle == 2):
+                break
+            continue
+        old = part[v]
+        part[v] = p
+        new_cut = _edge_cut(src, adjncy, adjwgt, part)
+        if (new_cut > cut):
+            part[v] = old
+            idle += 1
+            if (idle == 2):
+                break
+            continue
+        idle = 0
+        cut = new_cut
+        pwgts = np.bincount(part, weights=vwgt, minlength=nparts)
+    return part
+
+def _balance(graph, part, nparts, maxpwgt):
+    """
+    Moves vertices out of the parts heavier than maxpwgt, preferring those
+    whose move increases the cut the least
+    """
+    xadj, adjncy, adjwgt, vwgt = graph
+    pwgts = np.bincount(part, weights=vwgt, minlength=nparts)
+    if (pwgts.max() <= maxpwgt):
+        return part
+    src = _sources(xadj)
+    v, p, conn = _connectivity(src, adjncy, adjwgt, part, nparts)
+    own = (p == part[v])
+    internal = np.zeros(len(vwgt))
+    internal[v[own]] = conn[own]
+    links = {}
+    for u, q, c in zip(v[~own].tolist(), p[~own].tolist(), conn[~own].tolist()):
+        links.setdefault(u, []).append((q, c))
+    cand = np.flatnonzero(pwgts[part] > maxpwgt)
+    best = np.array([max(c for _, c in links.get(u, [(0, 0)])) for u in cand.tolist()])
+    cand = cand[np.argsort(internal[cand] - best, kind='mergesort')]
+    pw = pwgts.tolist()
+    for u in cand.tolist():
+        a = part[u]
+        w = vwgt[u]
+        if (pw[a] <= maxpwgt):
+            continue
+        dests = [(c, q) for q, c in links.get(u, []) if pw[q] + w <= maxpwgt]
+        if (dests):
+            q = max(dests)[1]
+        else:
+            q = min(range(nparts), key=pw.__getitem__)
+            if (q == a or pw[q] + w >= pw[a]):
+                continue
+        part[u] = q
+        pw[a] -= w
+        pw[q] += w
+    return part
+
+def part_csr(xadj, adjncy, nparts, adjwgt=None, vwgt=None, ufactor=30,
+             seed=0, niter=10, ntries=4):
+    """
+    Partitions the graph given in CSR format into nparts parts: the
+    neighbours of vertex i are adjncy[xadj[i]:xadj[i + 1]], and each edge
+    appears in both directions (like in METIS).
+
+    adjwgt:     the weights of the edges in adjncy (default 1)
+    vwgt:       the weights of the vertices (default 1)
+    ufactor:    the maximum load imbalance allowed, in thousandths (like in
+                METIS), i.e. parts can weigh up to 1 + ufactor / 1000 times
+                the average (or the average plus the mean vertex weight if
+                larger)
+    seed:       the seed of the random numbers used along the way
+
+    Returns: an (edge cut, array with the part of each vertex) tuple
+    """
+    xadj = np.asarray(xadj, dtype=np.int64)
+    adjncy = np.asarray(adjncy, dtype=np.int64)
+    n = len(xadj) - 1
+    adjwgt = np.ones(len(adjncy)) if adjwgt is None else np.asarray(adjwgt, dtype=float)
+    vwgt = np.ones(n) if vwgt is None else np.asarray(vwgt, dtype=float)
+    src = _sources(xadj)
+    if (n <= nparts):
+        part = np.arange(n, dtype=np.int64)
+        return _edge_cut(src, adjncy, adjwgt, part), part
+    rand = np.random.RandomState(seed)
+
+    # 1. coarsening
+    graph = (xadj, adjncy, adjwgt, vwgt)
+    coarsen_to = max(30 * nparts, 100)
+    maxvwgt = 1.5 * vwgt.sum() / coarsen_to
+    levels = []
+    while (len(graph[3]) > coarsen_to):
+        coarse, cmap = _contract(graph, _match(graph, maxvwgt, rand))
+        if (len(coarse[3]) > 0.95 * len(graph[3])):
+            break
+        levels.append((graph, cmap))
+        graph = coarse
+    logger.debug("Coarsened %d vertices into %d in %d levels", n, len(graph[3]), len(levels))
+
+    # 2. initial partitioning
+    part = _initial_partition(graph, nparts, rand, ntries=ntries)
+
+    # 3. uncoarsening
+    avg = vwgt.sum() / nparts
+    ub = 1 + ufactor / 1000.0
+    while True:
+        # coarse vertices are heavier, so the balance is looser there
+        maxpwgt = max(ub * avg, avg + graph[3].mean())
+        part = _balance(graph, part, nparts, maxpwgt)
+        part = _refine(graph, part, nparts, maxpwgt, niter=niter)
+        if (not levels):
+            break
+        graph, cmap = levels.pop()
+        part = part[cmap]
+
+    return _edge_cut(src, adjncy, adjwgt, part), part
+
+def _graph_to_csr(G):
+    """
+    The CSR arrays (and vertex sizes) of a networkx graph, using the same
+    graph attributes as the METIS binding to find the weights
+    """
+    nodes = list(G.nodes())
+    index = dict((u, i) for i, u in enumerate(nodes))
+    ew = G.graph.get('edge_weight_attr')
+    nw = G.graph.get('node_weight_attr')
+    ns = G.graph.get('node_size_attr')
+    if (isinstance(nw, (list, tuple))):
+        # only a single balancing constraint is supported
+        nw = nw[0]
+    data = dict(G.nodes(data=True))
+    vwgt = np.array([data[u].get(nw, 1) if nw else 1 for u in nodes], dtype=float)
+    vsize = np.array([data[u].get(ns, 1) if ns else 1 for u in nodes], dtype=float)
+    edges = list(G.edges(data=True))
+    src = np.array([index[u] for u, _, _ in edges], dtype=np.int64)
+    dst = np.array([index[v] for _, v, _ in edges], dtype=np.int64)
+    wgt = np.array([d.get(ew, 1) if ew else 1 for _, _, d in edges], dtype=float)
+    xadj, adjncy, adjwgt = _compress(len(nodes), np.concatenate((src, dst)),
+                                     np.concatenate((dst, src)), np.concatenate((wgt, wgt)))
+    return xadj, adjncy, adjwgt, vwgt, vsize
+
+def _volume(xadj, adjncy, vsize, part):
+    """Total communication volume of a partition (as defined by METIS)"""
+    src = _sources(xadj)
+    key = np.unique(src * (part.max() + 1) + part[adjncy])
+    v, p = key // (part.max() + 1), key % (part.max() + 1)
+    return vsize[v[p != part[v]]].sum()
+
+def _as_int(x):
+    return int(x) if x == math.floor(x) else x
+
+def part_graph(graph, nparts=2, tpwgts=None, ubvec=None, recursive=False, **opts):
+    """
+    Same as metis.part_graph, for networkx graphs. The vertex and edge
+    weights are found through the 'node_weight_attr', 'node_size_attr' and
+    'edge_weight_attr' graph attributes.
+
+    The supported options are ufactor, seed, niter and ncuts (number of
+    initial partitioning tries), plus objtype: the edge cut is always
+    minimised, but the total communication volume is returned if objtype
+    is 'vol'. recursive, tpwgts and ubvec are ignored.
+
+    Returns: an (edge cut or volume, list with the part of each vertex) tuple
+    """
+    xadj, adjncy, adjwgt, vwgt, vsize = _graph_to_csr(graph)
+    cut, part = part_csr(xadj, adjncy, nparts, adjwgt=adjwgt, vwgt=vwgt,
+                         ufactor=opts.get('ufactor', 30), seed=opts.get('seed', 0),
+                         niter=opts.get('niter', 10), ntries=opts.get('ncuts', 4))
+    if (opts.get('objtype') == 'vol' and len(part)):
+        cut = _volume(xadj, adjncy, vsize, part)
+    return _as_int(cut), part.tolist()
@@ -23,6 +23,7 @@
 
 import datetime
 import json
+import multiprocessing
 import optparse
 import os, traceback
 import signal
@@ -53,6 +54,9 @@ gen_pgt_sem = threading.Semaphore(1)
 err_prefix = "[Error]"
 MAX_PGT_FN_CNT= 300
 pgt_fn_count = 0
+# the gantt chart and schedule matrices are downsampled beyond this size
+MAX_MATRIX_ROWS = 768
+MAX_MATRIX_COLS = 1024
 
 def lg_path(lg_name):
     return "{0}/{1}".format(lg_dir, lg_name)
@@ -198,6 +202,14 @@ def load_pg_viewer():
         response.status = 404
         return "{0}: physical graph template (view) {1} not found\n".format(err_prefix, pgt_name)
 
+def matrix_size():
+    """
+    The maximum size of the matrices sent to the browser, which are
+    downsampled on the server side when larger
+    """
+    return dict(max_rows=int(request.query.get('max_rows', MAX_MATRIX_ROWS)),
+                max_cols=int(request.query.get('max_cols', MAX_MATRIX_COLS)))
+
 @get('/show_gantt_chart')
 def show_gantt_chart():
     """
@@ -214,7 +226,7 @@ def get_gantt_chart():
     """
     pgt_id = request.query.get('pgt_id')
     try:
-        ret = pg_mgr.get_gantt_chart(pgt_id)
+        ret = pg_mgr.get_gantt_chart(pgt_id, sparse=True, **matrix_size())
         return ret
     except GraphException as ge:
         response.status = 500
@@ -237,7 +249,7 @@ def get_schedule_mat():
     """
     pgt_id = request.query.get('pgt_id')
     try:
-        ret = pg_mgr.get_schedule_matrices(pgt_id)
+        ret = pg_mgr.get_schedule_matrices(pgt_id, sparse=True, **matrix_size())
         return ret
     except GraphException as ge:
         response.status = "500 {0}".format(ge)
@@ -329,15 +341,18 @@ def gen_pgt():
                     int(part), par_label, int(request.query.get('max_dop')),
                     merge_parts=mpp, optimistic_factor=time_greedy)
                 elif ('pso' == algo):
-                    params = ['deadline', 'topk', 'swarm_size']
-                    pars = [None, 30, 40]
+                    params = ['deadline', 'topk', 'swarm_size', 'processes']
+                    pars = [None, 30, 40, 1]
                     for i, para in enumerate(params):
                         try:
                             pars[i] = int(request.query.get(para))
                         except:
                             continue
+                    # don't let requests fork more processes than CPUs
+                    pars[3] = max(1, min(pars[3], multiprocessing.cpu_count()))
                     pgt = PSOPGTP(drop_list, par_label, int(request.query.get('max_dop')),
-                    deadline=pars[0], topk=pars[1], swarm_size=pars[2], merge_parts=mpp)
+                    deadline=pars[0], topk=pars[1], swarm_size=pars[2], merge_parts=mpp,
+                    processes=pars[3])
                 else:
                     raise GraphException("Unknown partition algorithm: {0}".format(algo))
             if (mpp):
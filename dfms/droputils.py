@@ -30,7 +30,8 @@ import threading
 import traceback
 
 from dfms.ddap_protocol import DROPStates
-from dfms.drop import AppDROP
+from dfms.drop import AppDROP, crc32
+from dfms.exceptions import InvalidGraphException
 from dfms.io import IOForURL, OpenMode
 
 
@@ -105,17 +106,42 @@ def allDropContents(drop):
     drop.close(desc)
     return allContents
 
-def copyDropContents(source, target, bufsize=4096):
+def copyDropContents(source, target, bufsize=4096, progress=None):
     '''
-    Manually copies data from one DROP into another, in bufsize steps
+    Manually copies data from one DROP into another, in bufsize steps. If
+    given, `progress` is called with the number of bytes copied on each step.
+    Returns the checksum of the data that was copied.
     '''
+    checksum = 0
     desc = source.open()
     read = source.read
-    buf = read(desc, bufsize)
-    while buf:
-        target.write(buf)
+    try:
         buf = read(desc, bufsize)
-    source.close(desc)
+        while buf:
+            target.write(buf)
+            checksum = crc32(buf, checksum)
+            if progress:
+                progress(len(buf))
+            buf = read(desc, bufsize)
+    finally:
+        source.close(desc)
+    return checksum
+
+def checksumDropContents(drop, bufsize=4096):
+    '''
+    Reads the contents of `drop` in bufsize steps and returns their checksum
+    '''
+    checksum = 0
+    desc = drop.open()
+    read = drop.read
+    try:
+        buf = read(desc, bufsize)
+        while buf:
+            checksum = crc32(buf, checksum)
+            buf = read(desc, bufsize)
+    finally:
+        drop.close(desc)
+    return checksum
 
 def getUpstreamObjects(drop):
     """
@@ -395,4 +421,70 @@ def get_roots(pg_spec):
             if dropspec.get('streamingConsumers', None):
                 nonroots |= set(dropspec['streamingConsumers'])
 
-    return all_oids - nonroots
\ No newline at end of file
+    return all_oids - nonroots
+# The relationship each 1-N relationship is mirrored by on the other DROP
+_reverse_rels = {
+    'consumers':          'inputs',
+    'streamingConsumers': 'streamingInputs',
+    'outputs':            'producers',
+}
+_reverse_rels.update({v:k for k,v in _reverse_rels.items()})
+
+
+def chunk_graph(pg_spec, chunk_size, roots=None):
+    """
+    Splits the physical graph specification `pg_spec`, which can be any
+    iterable of dropspecs (e.g., one read from a stream), into lists of at most
+    `chunk_size` dropspecs. Relationships pointing to a dropspec that hasn't
+    been seen yet are removed and patched in (in their reverse form) into that
+    dropspec once it's reached, so each chunk only references dropspecs of
+    itself or of previous chunks, and can be appended on its own to a session.
+
+    Only the pending relationships and the OIDs seen so far are kept in memory;
+    when `pg_spec` is topologically sorted (like the dropspecs yielded by
+    `LG.unroll_to_tpl_iter`) the former stay small.
+
+    If `roots` is given, it's a set that is filled with the OIDs of the roots
+    of the graph.
+    """
+
+    seen = set()
+    pending = collections.defaultdict(list)
+    chunk = []
+    for dropspec in pg_spec:
+
+        oid = dropspec['oid']
+        for rel, other in pending.pop(oid, ()):
+            others = dropspec.setdefault(rel, [])
+            if other not in others:
+                others.append(other)
+
+        for rel in _reverse_rels:
+            if rel not in dropspec:
+                continue
+            kept = []
+            for other in dropspec[rel]:
+                if other in seen:
+                    kept.append(other)
+                    if roots is not None and rel in ('consumers', 'streamingConsumers', 'outputs'):
+                        roots.discard(other)
+                else:
+                    pending[other].append((_reverse_rels[rel], oid))
+            if kept:
+                dropspec[rel] = kept
+            else:
+                del dropspec[rel]
+
+        if roots is not None and not any(dropspec.get(rel, None) for rel in ('inputs', 'streamingInputs', 'producers')):
+            roots.add(oid)
+
+        seen.add(oid)
+        chunk.append(dropspec)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if pending:
+        raise InvalidGraphException("DROPs reference unknown DROPs: %r" % (list(pending),))
+    if chunk:
+        yield chunk
@@ -161,14 +161,18 @@ def check_dropspec(n, dropSpec):
     if 'type' not in dropSpec:
         raise InvalidGraphException("Drop %s is missing its 'type' argument" % (dropSpec['oid']))
 
-def loadDropSpecs(dropSpecList):
+def loadDropSpecs(dropSpecList, existing=None):
     """
     Loads the DROP definitions from `dropSpectList`, checks that
     the DROPs are correctly specified, and return a dictionary containing
     all DROP specifications (i.e., a dictionary of dictionaries) keyed on
     the OID of each DROP. Unlike `readObjectGraph` and `readObjectGraphS`,
     this method doesn't actually create the DROPs themselves.
+
+    Relationships can also point to the DROP specifications in `existing`,
+    which were loaded previously.
     """
+    existing = existing or {}
 
     # Step #1: Check the DROP specs and collect them
     dropSpecs = {}
@@ -193,12 +197,13 @@ def loadDropSpecs(dropSpecList):
 
                 # A KeyError will be raised if a oid has been specified in the
                 # relationship list but doesn't exist in the list of DROPs
-                for oid in dropSpec[rel]: dropSpecs[oid]
+                for oid in dropSpec[rel]:
+                    if oid not in existing: dropSpecs[oid]
 
         # N-1 relationships
             elif rel in __TOONE:
                 # See comment above
-                dropSpecs[dropSpec[rel]]
+                if dropSpec[rel] not in existing: dropSpecs[dropSpec[rel]]
 
     # Done!
     return dropSpecs
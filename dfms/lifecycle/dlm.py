@@ -118,7 +118,12 @@ configured (and/or hardcoded) DLM
 @author: rtobar
 '''
 
+import collections
+import heapq
+import itertools
 import logging
+import multiprocessing.pool
+import os
 import random
 import string
 import threading
@@ -126,9 +131,9 @@ import time
 
 from dfms import droputils
 from dfms.ddap_protocol import DROPStates, DROPPhases, AppDROPStates
-from dfms.drop import ContainerDROP
+from dfms.drop import AppDROP, ContainerDROP, InMemoryDROP
 from dfms.lifecycle import registry
-from dfms.lifecycle.hsm import manager
+from dfms.lifecycle.hsm import manager, store
 
 
 logger = logging.getLogger(__name__)
@@ -151,7 +156,10 @@ class DataLifecycleManagerBackgroundTask(threading.Thread):
         while True:
             if ev.wait(p):
                 break
-            self.doTask(dlm)
+            try:
+                self.doTask(dlm)
+            except:
+                logger.exception("Error in %s, will try again in %.1f [s]", self.__class__.__name__, p)
 
 class DROPChecker(DataLifecycleManagerBackgroundTask):
     '''
@@ -179,9 +187,8 @@ class DROPGarbageCollector(DataLifecycleManagerBackgroundTask):
 class DROPMover(DataLifecycleManagerBackgroundTask):
     '''
     A thread that automatically moves DROPs between layers of the HSM.
-    This is supposed to be based on rules and configuration parameters which we
-    still don't consider here. The driving rule we currently use is how
-    frequently is the DROP accessed.
+    The driving rule we currently use is how frequently and how recently the
+    DROP is accessed.
     '''
 
     def doTask(self, dlm):
@@ -198,6 +205,83 @@ class DropEventListener(object):
         elif event.type == 'status':
             if event.status == DROPStates.COMPLETED:
                 self._dlm.handleCompletedDrop(event.uid)
+            elif event.status == DROPStates.EXPIRED:
+                self._dlm.handleExpiredDrop(event.uid)
+
+class ConsumersFinishedListener(object):
+    '''
+    Listens to the execStatus events of the consumers of an expire-after-use
+    DROP, and schedules its expiration in the DLM once they have all finished
+    '''
+
+    def __init__(self, dlm, uid, consumers):
+        self._dlm = dlm
+        self._uid = uid
+        self._pending = set([c.uid for c in consumers])
+        self._lock = threading.Lock()
+        self._fired = False
+
+    def handleEvent(self, event):
+        if event.execStatus in (AppDROPStates.FINISHED, AppDROPStates.ERROR):
+            self.consumerFinished(event.uid)
+
+    def consumerFinished(self, uid):
+        with self._lock:
+            self._pending.discard(uid)
+            if self._pending or self._fired:
+                return
+            self._fired = True
+        self._dlm._scheduleExpiration(self._uid, time.time())
+
+class DropAccessStats(object):
+    '''
+    How often and how recently a DROP has been accessed. The access count
+    decays on each pass of the DROPMover, so it reflects recent usage
+    '''
+
+    def __init__(self, since):
+        self.count = 0.
+        self.lastAccess = since
+
+    def accessed(self, when):
+        self.count += 1
+        self.lastAccess = when
+
+    def decay(self):
+        self.count /= 2
+
+class ReplicaStats(object):
+    '''
+    The progress and throughput of the replication of a DROP into a new
+    replica
+    '''
+
+    def __init__(self, uid, store, size):
+        self.uid = uid
+        self.replicaUid = None
+        self.store = str(store)
+        self.size = size
+        self.copied = 0
+        self.status = 'queued'
+        self.start = None
+        self.end = None
+
+    def copiedBytes(self, n):
+        self.copied += n
+
+    @property
+    def throughput(self):
+        """The copy throughput, in bytes per second"""
+        if self.start is None:
+            return 0.
+        elapsed = (self.end or time.time()) - self.start
+        return self.copied / elapsed if elapsed > 0 else 0.
+
+    def toDict(self):
+        return {'uid': self.uid, 'replicaUid': self.replicaUid,
+                'store': self.store, 'size': self.size, 'copied': self.copied,
+                'status': self.status, 'start': self.start, 'end': self.end,
+                'throughput': self.throughput}
 
 class DataLifecycleManager(object):
 
@@ -220,6 +304,84 @@ class DataLifecycleManager(object):
         if 'cleanupPeriod' in kwargs:
             self._cleanupPeriod = float(kwargs['cleanupPeriod'])
 
+        # How many DROPs are checked for existence on each checkPeriod.
+        # Checking requires going to the underlying storage, so DROPs are
+        # swept incrementally instead of being checked all at once
+        self._lostDropsBatch = 1000
+        if 'lostDropsBatch' in kwargs:
+            self._lostDropsBatch = int(kwargs['lostDropsBatch'])
+        self._lostDropsSweep = iter(())
+
+        # COMPLETED DROPs are scheduled for expiration in a heap of
+        # (expiration date, uid) tuples, EXPIRED DROPs are queued for deletion
+        self._expirations = []
+        self._expired = []
+        self._expirationsLock = threading.Lock()
+
+        # Consumers living in other Node Managers (i.e., DropProxy objects)
+        # cannot send their events to us, so their execStatus is polled
+        # instead, as (listener, consumer) tuples
+        self._polledConsumers = []
+
+        # DROPs are moved between the stores of the HSM every movePeriod
+        # seconds, if given. DROPs accessed promoteAccesses times or more
+        # (with accesses decaying by half on each move period) are moved to
+        # a faster store, DROPs not accessed in demoteAge seconds are moved
+        # to a slower store. A fraction storeReserve of the total space of
+        # each store is never used by these moves
+        self._movePeriod = kwargs.get('movePeriod', None)
+        if self._movePeriod is not None:
+            self._movePeriod = float(self._movePeriod)
+        self._promoteAccesses = float(kwargs.get('promoteAccesses', 3))
+        self._demoteAge = float(kwargs.get('demoteAge', 10))
+        self._storeReserve = float(kwargs.get('storeReserve', 0.1))
+        self._accessStats = {}
+        self._accessStatsLock = threading.Lock()
+        # Moved DROPs are replaced by their new instance in the inputs of
+        # their consumers and by the move listeners, and their original
+        # instances are deleted only after all their consumers finished
+        self._moveListeners = []
+        self._movedAway = set()
+        # uid -> number of replications reading it
+        self._copying = collections.Counter()
+
+        # Replicas are created in the background by a pool of
+        # replicationWorkers threads, copying replicationBufsize bytes at a
+        # time, and their contents are verified against the original's unless
+        # verifyReplicas is False. The stats of the latest replications are
+        # kept for monitoring
+        self._replicationWorkers = int(kwargs.get('replicationWorkers', 4))
+        self._replicationBufsize = int(kwargs.get('replicationBufsize', 4 * 1024**2))
+        self._verifyReplicas = kwargs.get('verifyReplicas', True)
+        self._replicationPool = None
+        self._replicationCond = threading.Condition()
+        self._pendingReplicas = 0
+        self._reservedSpace = {}
+        self._replicas = collections.deque(maxlen=1000)
+
+        # Once the COMPLETED InMemoryDROPs we know about hold more than
+        # memoryHighWatermark bytes, the least recently used are spilled into
+        # a scratch store until memoryLowWatermark bytes are left in memory
+        self._memoryHighWatermark = kwargs.get('memoryHighWatermark', None)
+        self._memoryLowWatermark = None
+        self._spillStore = None
+        if self._memoryHighWatermark is not None:
+            self._memoryHighWatermark = int(self._memoryHighWatermark)
+            self._memoryLowWatermark = int(kwargs.get('memoryLowWatermark', 0.8 * self._memoryHighWatermark))
+            spillDir = os.path.abspath(kwargs.get('spillDir', '/tmp/daliuge_spill'))
+            mountPoint = spillDir
+            while not os.path.ismount(mountPoint):
+                mountPoint = os.path.dirname(mountPoint)
+            self._spillStore = store.FileSystemStore(mountPoint, spillDir)
+        self._memoryLock = threading.Lock()
+        self._inMemory = collections.OrderedDict()
+        self._spilled = {}
+        # DROPs being spilled or unspilled, with their sizes
+        self._beingMoved = {}
+        self._memoryUsage = 0
+        self._spills = 0
+        self._unspills = 0
+
     def startup(self):
         # Spawn the background threads
         finishedEvent = threading.Event()
@@ -232,6 +394,11 @@ class DataLifecycleManager(object):
         self._dropGarbageCollector = dropGarbageCollector
         self._finishedEvent = finishedEvent
 
+        self._dropMover = None
+        if self._movePeriod is not None:
+            self._dropMover = DROPMover(self, self._movePeriod, finishedEvent)
+            self._dropMover.start()
+
     def cleanup(self):
         logger.info("Cleaning up the DLM")
 
@@ -239,6 +406,15 @@ class DataLifecycleManager(object):
         self._finishedEvent.set()
         self._dropChecker.join()
         self._dropGarbageCollector.join()
+        if self._dropMover is not None:
+            self._dropMover.join()
+
+        # Let ongoing replications finish
+        with self._replicationCond:
+            pool, self._replicationPool = self._replicationPool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
 
         # Unsubscribe to all events coming from the DROPs
         for drop in self._drops.values():
@@ -257,54 +433,109 @@ class DataLifecycleManager(object):
 
     def _deleteDrop(self, drop):
         logger.debug("Deleting DROP %r", drop)
+        self._untrackMemory(drop)
         drop.delete()
         drop.status = DROPStates.DELETED
 
     def deleteExpiredDrops(self):
-        for drop in list(self._drops.values()):
-            if drop.status == DROPStates.EXPIRED:
-                self._deleteDrop(drop)
+        with self._expirationsLock:
+            expired, self._expired = self._expired, []
+        deferred = []
+        for uid in expired:
+            drop = self._drops.get(uid)
+            if drop is None or drop.status != DROPStates.EXPIRED:
+                continue
+            if uid in self._movedAway:
+                if drop.isBeingRead() or not self._consumersFinished(drop):
+                    deferred.append(uid)
+                    continue
+                self._movedAway.discard(uid)
+            self._deleteDrop(drop)
+        with self._expirationsLock:
+            self._expired.extend(deferred)
+
+    def _scheduleExpiration(self, uid, date):
+        with self._expirationsLock:
+            heapq.heappush(self._expirations, (date, uid))
+
+    def _pollConsumers(self):
+        with self._expirationsLock:
+            polled, self._polledConsumers = self._polledConsumers, []
+        pending = []
+        for listener, c in polled:
+            try:
+                finished = c.execStatus in (AppDROPStates.FINISHED, AppDROPStates.ERROR)
+            except Exception:
+                logger.warning("Error while polling the execStatus of %r", c, exc_info=True)
+                finished = False
+            if finished:
+                listener.consumerFinished(c.uid)
+            else:
+                pending.append((listener, c))
+        with self._expirationsLock:
+            self._polledConsumers.extend(pending)
 
     def expireCompletedDrops(self):
+        self._pollConsumers()
         now = time.time()
-        for drop in self._drops.values():
+        deferred = []
+        while True:
+
+            with self._expirationsLock:
+                if not self._expirations or self._expirations[0][0] > now:
+                    break
+                _, uid = heapq.heappop(self._expirations)
 
-            if drop.status != DROPStates.COMPLETED:
+            drop = self._drops.get(uid)
+            if drop is None or drop.status != DROPStates.COMPLETED:
                 continue
 
-            # Expire-after-use: mark as expired if all consumers
-            # are finished using this DROP
-            if drop.expireAfterUse:
-                allDone = all([c.execStatus in [AppDROPStates.FINISHED, AppDROPStates.ERROR] for c in drop.consumers])
-                if not allDone:
+            # Expire-after-use DROPs are scheduled when all their consumers
+            # are finished using them. For the rest we double-check the
+            # expiration date, since in containers it depends on their children
+            if not drop.expireAfterUse:
+                expirationDate = drop.expirationDate
+                if expirationDate == -1:
+                    continue
+                if now <= expirationDate:
+                    self._scheduleExpiration(uid, expirationDate)
                     continue
-
-            # Otherwise, we check the expiration date
-            # (if no lifespan was specified for the DROP, its expiration
-            # date will be -1 and it will be skipped)
-            elif drop.expirationDate == -1 or \
-                 now <= drop.expirationDate:
-                continue
 
             if drop.isBeingRead():
                 logger.info("%r has expired but is currently being read, " \
                              "will skip expiration for the time being", drop)
+                deferred.append(uid)
                 continue
 
             # Finally!
             logger.debug('Marking %r as EXPIRED', drop)
             drop.status = DROPStates.EXPIRED
 
+        for uid in deferred:
+            self._scheduleExpiration(uid, now)
+
     def _disappeared(self, drop):
-        return drop.status != DROPStates.DELETED and not drop.exists()
+        # Only DROPs whose data has been completely written can be lost
+        return drop.status == DROPStates.COMPLETED and not drop.exists()
+
+    def _nextLostDropsBatch(self):
+        n = self._lostDropsBatch
+        uids = list(itertools.islice(self._lostDropsSweep, n))
+        if len(uids) < n:
+            # Start a new sweep over the current DROPs
+            self._lostDropsSweep = iter(list(self._drops))
+            checked = set(uids)
+            uids += [uid for uid in itertools.islice(self._lostDropsSweep, n - len(uids)) if uid not in checked]
+        return uids
 
     def deleteLostDrops(self):
 
         toRemove = []
-        for drop in self._drops.values():
+        for uid in self._nextLostDropsBatch():
 
             # We only care about disappeared drops
-            if not self._disappeared(drop):
+            drop = self._drops.get(uid)
+            if drop is None or not self._disappeared(drop):
                 continue
 
             toRemove.append(drop.uid)
@@ -320,7 +551,7 @@ class DataLifecycleManager(object):
                 # Replicas haven't disappeared as well, right?
                 replicas = []
                 for uid in uids:
-                    if uid == drop.uid:
+                    if uid == drop.uid or uid not in self._drops:
                         continue
                     siblingDrop = self._drops[uid]
                     if not self._disappeared(siblingDrop):
@@ -344,12 +575,13 @@ class DataLifecycleManager(object):
 
         # All those objects identified as lost have to go now
         for uid in toRemove:
-            del self._drops[uid]
+            self._drops.pop(uid, None)
 
     def moveDropsAround(self):
         '''
-        Moves DROPs to different layers of the HSM if necessary, currently based
-        only on the access times
+        Moves DROPs to different layers of the HSM if necessary, based on how
+        frequently and how recently they are accessed, and on the space
+        available on each layer
         '''
         # Big questions here that need some answers/experimentation
         #  1 "Migrating" implies that the data is no longer in its original
@@ -379,7 +611,14 @@ class DataLifecycleManager(object):
         #    flexibility).
         #
         # Answering #4 is probably the key to clarify the entire situation. For
-        # the time being, we simply "pass"...
+        # the time being we take the approach of #2: the DROP is copied into a
+        # new DROP instance (i.e., a new uid for the same oid) on the target
+        # store, which replaces the original instance in the inputs of its
+        # consumers and, via the move listeners, wherever else it's referenced
+        # (e.g., in its session). The original instance is expired, and it's
+        # deleted once its consumers are all finished, since they could still
+        # hold a reference to it. This way DROPs can be promoted while they are
+        # being used, which is when it pays off.
         #
         # PS: The Open DataObject Activity is actually used as part of the
         # "Data Object Lifecycle (nominal)" State Diagram, used as the activity
@@ -392,23 +631,131 @@ class DataLifecycleManager(object):
         # activity is really run from DROPs it would mean that DROPs depend on the
         # DLM, while the DLM manages DROPs.
 
-        for drop in self._drops.values:
+        # Stores go from the fastest to the slowest. We keep track of the
+        # space we can still use in each of them as we decide what to move
+        stores = self._hsm.getStores()
+        if len(stores) < 2:
+            return
+        freeSpace = {}
+        for store in stores:
+            store.updateSpaces()
+            reserve = store.getTotalSpace() * self._storeReserve
+            freeSpace[store] = store.getAvailableSpace() - reserve
 
-            # Don't touch these
-            if drop.isBeingRead():
+        now = time.time()
+        promotions = []
+        demotions = []
+        for drop in list(self._drops.values()):
+
+            if not self._isMovable(drop):
                 continue
 
-            # EXPIRED DROPs will soon be deleted
-            # DELETED DROPs drop not exist anymore
-            if drop.status in (DROPStates.DELETED, DROPStates.EXPIRED):
+            store = self._hsm.getStoreOf(drop)
+            if store is None:
+                continue
+            level = stores.index(store)
+            with self._accessStatsLock:
+                stats = self._accessStats.get(drop.uid)
+                if stats is None:
+                    continue
+                count, lastAccess = stats.count, stats.lastAccess
+                stats.decay()
+
+            # 1. Data that is frequently used should be moved up in the
+            #    hierarchy, data that is not being used anymore (and won't be
+            #    by its consumers) should be moved down in the hierarchy
+            if count >= self._promoteAccesses and level > 0:
+                promotions.append((count, drop, level))
+            elif now - lastAccess > self._demoteAge and level < len(stores) - 1 and \
+                 self._consumersFinished(drop):
+                demotions.append((lastAccess, drop, level))
+
+        # Demote the coldest DROPs first, then promote the hottest ones, so
+        # demotions can make room for promotions
+        demotions.sort(key=lambda x: x[0])
+        promotions.sort(key=lambda x: -x[0])
+        moves = [(drop, level, level + 1) for _, drop, level in demotions]
+        moves += [(drop, level, level - 1) for _, drop, level in promotions]
+        for drop, level, targetLevel in moves:
+            target = stores[targetLevel]
+            size = drop.size
+            if freeSpace[target] < size:
+                logger.debug("Not enough space in %s to move %r there", target, drop)
+                continue
+            try:
+                self.moveDrop(drop, target)
+            except:
+                logger.exception("Problem while moving %r to %s", drop, target)
                 continue
+            freeSpace[target] -= size
+            freeSpace[stores[level]] += size
+
+    def _isMovable(self, drop):
+
+        # Only DROPs with data can be moved. EXPIRED DROPs will soon be
+        # deleted, DELETED DROPs do not exist anymore
+        if drop.status != DROPStates.COMPLETED or drop.size is None:
+            return False
+
+        # Don't touch these
+        if drop.isBeingRead() or not self.isReplicable(drop):
+            return False
+        return True
+
+    def _consumersFinished(self, drop):
+        for c in drop.consumers + drop.streamingConsumers:
+            if c.execStatus not in (AppDROPStates.FINISHED, AppDROPStates.ERROR):
+                return False
+        return True
 
-            # 1. Data that is not being used anymore should be moved down in the
-            #    hierarchy
-            lastAccess = self._reg.getLastAccess(drop.oid)
-            timeUnread = time.time() - lastAccess
-            if lastAccess != -1 and timeUnread > 10:
-                self.moveDropDown(drop)
+    def addMoveListener(self, listener):
+        '''
+        Adds `listener`, a callable that is called with the original and the
+        new instance of each DROP moved by this DLM, so it can replace its
+        references to the original one, which is then expired
+        '''
+        self._moveListeners.append(listener)
+
+    def moveDrop(self, drop, store):
+        '''
+        Moves the contents of `drop` into a new instance of it living in
+        `store`. The original DROP is then expired, and thus eventually
+        deleted.
+
+        :param dfms.drop.AbstractDROP drop:
+        '''
+        logger.debug("Moving %r to %s", drop, store)
+
+        kwargs = {}
+        if drop.expirationDate != -1:
+            kwargs['lifespan'] = max(0, drop.expirationDate - time.time())
+
+        newDrop, newUid = self._replicate(drop, store, **kwargs)
+        newDrop.phase = drop.phase
+
+        # The new instance keeps the access history of the original one, and
+        # expires after the same consumers are done with it
+        self._drops[newUid] = newDrop
+        newDrop.subscribe(self._listener)
+        self._reg.addDropInstance(newDrop)
+        with self._accessStatsLock:
+            self._accessStats[newUid] = self._accessStats.pop(drop.uid, DropAccessStats(time.time()))
+        self._scheduleExpirationOf(newDrop, drop.consumers)
+
+        # Consumers that haven't read the original yet will read the new one
+        for c in drop.consumers + drop.streamingConsumers:
+            for inputs in (getattr(c, '_inputs', {}), getattr(c, '_streamingInputs', {})):
+                if inputs.get(drop.uid) is drop:
+                    inputs[drop.uid] = newDrop
+        for listener in self._moveListeners:
+            try:
+                listener(drop, newDrop)
+            except:
+                logger.exception("Error while notifying the move of %r to %r", drop, newDrop)
+
+        self._movedAway.add(drop.uid)
+        drop.status = DROPStates.EXPIRED
+        return newDrop
 
     def addDrop(self, drop):
 
@@ -418,17 +765,42 @@ class DataLifecycleManager(object):
         drop.subscribe(self._listener)
         self._reg.addDrop(drop)
 
-        # TODO: We currently use a background thread that scans
-        #       all DROPs for their status and compares its expiration date
-        #       with the current time in order to determine which DROPs must be
-        #       moved to EXPIRED. We might want to explore other alternatives to
-        #       perform this task, like using threading.Timers (probably not) or
-        #       any other that doesn't mean looping over all DROPs
+        # DROPs are otherwise scheduled for expiration when they complete
+        if drop.status == DROPStates.COMPLETED:
+            with self._accessStatsLock:
+                self._accessStats[drop.uid] = DropAccessStats(time.time())
+            self._scheduleExpirationOf(drop)
+            self._trackMemory(drop)
+
+    def _scheduleExpirationOf(self, drop, consumers=None):
+        if drop.expireAfterUse:
+            if consumers is None:
+                consumers = drop.consumers
+            listener = ConsumersFinishedListener(self, drop.uid, consumers)
+            local = [c for c in consumers if isinstance(c, AppDROP)]
+            for c in local:
+                c.subscribe(listener, 'execStatus')
+            for c in local:
+                if c.execStatus in (AppDROPStates.FINISHED, AppDROPStates.ERROR):
+                    listener.consumerFinished(c.uid)
+            remote = [(listener, c) for c in consumers if not isinstance(c, AppDROP)]
+            if remote:
+                with self._expirationsLock:
+                    self._polledConsumers.extend(remote)
+            if not consumers:
+                self._scheduleExpiration(drop.uid, time.time())
+        elif drop.expirationDate != -1:
+            self._scheduleExpiration(drop.uid, drop.expirationDate)
 
     def handleOpenedDrop(self, oid, uid):
         drop = self._drops[uid]
-        if drop.status == DROPStates.COMPLETED:
+        if drop.status == DROPStates.COMPLETED and uid not in self._copying:
             self._reg.recordNewAccess(oid)
+            with self._accessStatsLock:
+                stats = self._accessStats.get(uid)
+                if stats is not None:
+                    stats.accessed(time.time())
+            self._touchMemory(drop)
 
     def handleCompletedDrop(self, uid):
         '''
@@ -438,6 +810,11 @@ class DataLifecycleManager(object):
         # in a persistent storage media we don't need to save it again
 
         drop = self._drops[uid]
+        with self._accessStatsLock:
+            self._accessStats[uid] = DropAccessStats(time.time())
+        self._scheduleExpirationOf(drop)
+        self._trackMemory(drop)
+
         if drop.precious and self.isReplicable(drop):
             logger.debug("Replicating %r because it's precious", drop)
             try:
@@ -445,11 +822,144 @@ class DataLifecycleManager(object):
             except:
                 logger.exception("Problem while replicating %r", drop)
 
+    def _trackMemory(self, drop):
+        if not isinstance(drop, InMemoryDROP) or drop.spilled:
+            return
+        with self._memoryLock:
+            if drop.uid in self._inMemory:
+                return
+            size = drop.size or 0
+            self._inMemory[drop.uid] = size
+            self._memoryUsage += size
+        self._relieveMemoryPressure()
+
+    def _untrackMemory(self, drop):
+        with self._memoryLock:
+            size = self._inMemory.pop(drop.uid, None)
+            if size is not None:
+                self._memoryUsage -= size
+            self._spilled.pop(drop.uid, None)
+            self._beingMoved.pop(drop.uid, None)
+
+    def _touchMemory(self, drop):
+        '''
+        Marks `drop` as recently used. Spilled DROPs are brought back into
+        memory if there is room enough for them
+        '''
+        # The memory is reserved while holding the lock, but the file is read
+        # outside it so other DROPs can be opened meanwhile
+        with self._memoryLock:
+            uid = drop.uid
+            if uid in self._inMemory:
+                size = self._inMemory.pop(uid)
+                self._inMemory[uid] = size
+                return
+            if uid not in self._spilled:
+                return
+            size = self._spilled[uid]
+            if self._memoryUsage + size > self._memoryLowWatermark:
+                return
+            del self._spilled[uid]
+            self._beingMoved[uid] = size
+            self._memoryUsage += size
+
+        try:
+            drop.unspill()
+            unspilled = True
+        except:
+            logger.exception("Problem while unspilling %r", drop)
+            unspilled = False
+
+        with self._memoryLock:
+            if self._beingMoved.pop(uid, None) is None:
+                # untracked meanwhile
+                self._memoryUsage -= size
+                return
+            if unspilled:
+                self._inMemory[uid] = size
+                self._unspills += 1
+            else:
+                self._spilled[uid] = size
+                self._memoryUsage -= size
+
+    def _relieveMemoryPressure(self):
+        # Victims are chosen while holding the lock, but spilled outside it
+        with self._memoryLock:
+            if self._memoryHighWatermark is None or self._memoryUsage <= self._memoryHighWatermark:
+                return
+            memoryUsage = self._memoryUsage
+
+        logger.info("%d bytes held in memory, spilling DROPs into %s", memoryUsage, self._spillStore)
+        self._spillStore.updateSpaces()
+        availableSpace = self._spillStore.getAvailableSpace()
+
+        victims = []
+        with self._memoryLock:
+            for uid, size in list(self._inMemory.items()):
+                if self._memoryUsage <= self._memoryLowWatermark:
+                    break
+                drop = self._drops.get(uid)
+                if drop is None:
+                    del self._inMemory[uid]
+                    self._memoryUsage -= size
+                    continue
+                if drop.isBeingRead():
+                    continue
+                if size > availableSpace:
+                    logger.warning("No space left in %s to spill %r", self._spillStore, drop)
+                    break
+                del self._inMemory[uid]
+                self._beingMoved[uid] = size
+                self._memoryUsage -= size
+                availableSpace -= size
+                victims.append((drop, size))
+
+        spillDir = self._spillStore.getSavingDir()
+        for drop, size in victims:
+            try:
+                drop.spill(spillDir)
+                spilled = True
+            except:
+                logger.exception("Problem while spilling %r", drop)
+                spilled = False
+
+            with self._memoryLock:
+                if self._beingMoved.pop(drop.uid, None) is None:
+                    # untracked meanwhile
+                    continue
+                if spilled:
+                    self._spilled[drop.uid] = size
+                    self._spills += 1
+                else:
+                    self._inMemory[drop.uid] = size
+                    self._memoryUsage += size
+
+    def getMemoryStatus(self):
+        '''
+        Returns the number of bytes held in memory and spilled by the
+        COMPLETED InMemoryDROPs, and how many times they were spilled and
+        unspilled
+        '''
+        with self._memoryLock:
+            return {'inMemory': self._memoryUsage,
+                    'spilled': sum(self._spilled.values()),
+                    'spills': self._spills,
+                    'unspills': self._unspills}
+
+    def handleExpiredDrop(self, uid):
+        with self._expirationsLock:
+            self._expired.append(uid)
+
     def isReplicable(self, drop):
         return not isinstance(drop, ContainerDROP)
 
     def replicateDrop(self, drop):
         '''
+        Schedules the creation of a new replica of `drop` in the slowest
+        store of the HSM. The replica is created in the background; this
+        method returns the `ReplicaStats` that follow its progress, or None if
+        the DROP cannot be replicated.
+
         :param dfms.drop.AbstractDROP drop:
         '''
 
@@ -461,44 +971,122 @@ class DataLifecycleManager(object):
         # like in the AbstractDROP
         size = drop.size
         if size is None:
-            return
+            return None
 
-        # Check which layer of the hsm should host the replicated copy
+        # Check which layer of the hsm should host the replicated copy, taking
+        # into account the space needed by the replications still in progress
         store = self._hsm.getSlowestStore()
-        availableSpace = store.getAvailableSpace()
-
-        if size > availableSpace:
-            raise Exception("Cannot replicate DROP to store %s: not enough space left")
-
-        # Create new DROP and write the contents of the original into it
-        # TODO: In a real world application this will probably happen in a separate
-        #       worker thread with a working queue, or in separate threads, one
-        #       for each replication task (or a mix of the two)
-        newDrop, newUid = self._replicate(drop, store)
-
-        # The DROPs (both) should now be tagged as SOLID
-        newDrop.phase = DROPPhases.SOLID
-        drop.phase = DROPPhases.SOLID
-
-        # Update our own registry
-        self._drops[newUid] = newDrop
-        self._reg.addDropInstance(newDrop)
-        self._reg.setDropPhase(drop, DROPPhases.SOLID)
+        with self._replicationCond:
+            reserved = self._reservedSpace.get(store, 0)
+            if size > store.getAvailableSpace() - reserved:
+                raise Exception("Cannot replicate DROP to store %s: not enough space left" % (store,))
+            self._reservedSpace[store] = reserved + size
+
+            stats = ReplicaStats(drop.uid, store, size)
+            self._replicas.append(stats)
+            self._pendingReplicas += 1
+            if self._replicationPool is None:
+                self._replicationPool = multiprocessing.pool.ThreadPool(self._replicationWorkers)
+            pool = self._replicationPool
+
+        pool.apply_async(self._replicateInBackground, (drop, store, stats))
+        return stats
+
+    def _replicateInBackground(self, drop, store, stats):
+        try:
+            newDrop, newUid = self._replicate(drop, store, stats)
+
+            # The DROPs (both) should now be tagged as SOLID
+            newDrop.phase = DROPPhases.SOLID
+            drop.phase = DROPPhases.SOLID
+
+            # Update our own registry
+            self._drops[newUid] = newDrop
+            self._reg.addDropInstance(newDrop)
+            self._reg.setDropPhase(drop, DROPPhases.SOLID)
+        except:
+            logger.exception("Problem while replicating %r", drop)
+        finally:
+            with self._replicationCond:
+                self._reservedSpace[store] -= stats.size
+                self._pendingReplicas -= 1
+                self._replicationCond.notify_all()
+
+    def waitForReplicas(self, timeout=None):
+        '''
+        Waits until all scheduled replications have finished, or until
+        `timeout` seconds have passed. Returns whether they all finished.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._replicationCond:
+            while self._pendingReplicas:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._replicationCond.wait(remaining)
+            return True
+
+    def getReplicationStatus(self):
+        '''
+        Returns the stats of the latest replications as a list of dictionaries
+        '''
+        with self._replicationCond:
+            return [stats.toDict() for stats in self._replicas]
 
     def getDropUids(self, drop):
         return self._reg.getDropUids(drop)
 
-    def _replicate(self, drop, store):
+    def _replicate(self, drop, store, stats=None, **kwargs):
 
         # Dummy, but safe, new UID
         newUid = 'uid:' + ''.join([random.SystemRandom().choice(string.ascii_letters + string.digits) for _ in range(10)])
 
         logger.debug('Creating new DROP with uid %s from %r', newUid, drop)
 
-        # For the time being we manually copy the contents of the current DROP into it
-        newDrop = store.createDrop(drop.oid, newUid, expectedSize=drop.size, precious=drop.precious)
-        droputils.copyDropContents(drop, newDrop)
-
-        logger.debug('%r successfully replicated to %r', drop, newDrop)
-
-        return newDrop, newUid
\ No newline at end of file
+        stats = stats or ReplicaStats(drop.uid, store, drop.size)
+        stats.replicaUid = newUid
+        stats.status = 'copying'
+        stats.start = time.time()
+
+        # Reads done to create the replica are not real accesses
+        with self._replicationCond:
+            self._copying[drop.uid] += 1
+        newDrop = None
+        try:
+            newDrop = store.createDrop(drop.oid, newUid, expectedSize=drop.size, precious=drop.precious, **kwargs)
+            bufsize = self._replicationBufsize
+            checksum = droputils.copyDropContents(drop, newDrop, bufsize, stats.copiedBytes)
+            if newDrop.status != DROPStates.COMPLETED:
+                newDrop.setCompleted()
+
+            # Make sure what we read is what was originally written, when the
+            # original's checksum was computed like ours, and that what was
+            # stored is what we read
+            if drop.checksum is not None and drop.checksumType == newDrop.checksumType:
+                if checksum != drop.checksum:
+                    raise Exception("Checksum of the data read from %r (%d) doesn't match its own (%d)" % (drop, checksum, drop.checksum))
+            if self._verifyReplicas:
+                stats.status = 'verifying'
+                replicaChecksum = droputils.checksumDropContents(newDrop, bufsize)
+                if replicaChecksum != checksum:
+                    raise Exception("Checksum of %r (%d) doesn't match the one of %r (%d)" % (newDrop, replicaChecksum, drop, checksum))
+        except:
+            stats.status = 'failed'
+            stats.end = time.time()
+            if newDrop is not None:
+                try:
+                    newDrop.delete()
+                except:
+                    logger.exception("Problem while deleting failed replica %r", newDrop)
+            raise
+        finally:
+            with self._replicationCond:
+                self._copying[drop.uid] -= 1
+                if not self._copying[drop.uid]:
+                    del self._copying[drop.uid]
+
+        stats.status = 'done'
+        stats.end = time.time()
+        logger.debug('%r successfully replicated to %r at %.1f [MB/s]', drop, newDrop, stats.throughput / 1024**2)
+
+        return newDrop, newUid
@@ -40,15 +40,49 @@ class HierarchicalStorageManager(object):
         self.addStore(store.MemoryStore())
         self.addStore(store.FileSystemStore('/', '/tmp/daliuge_tfiles'))
 
-    def addStore(self, newStore):
+    def addStore(self, newStore, measureSpeeds=False):
         '''
+        Adds a new store to this HSM. If `measureSpeeds` is True the reading
+        and writing speeds of the store are measured first, which is used to
+        order the stores; remote stores (i.e., those with no `speedTestSize`)
+        are never measured.
+
         @param newStore store.AbstractStore
         '''
         logger.debug("Adding store to HSM: " + str(newStore))
+        if measureSpeeds and newStore.speedTestSize:
+            try:
+                newStore.measureSpeeds()
+            except:
+                logger.exception("Error while measuring the speeds of %s", newStore)
         self._stores.append(newStore)
 
     def getSlowestStore(self):
         """
+        Returns the store where data is replicated to, which is the last
+        non-volatile store added to this HSM, regardless of its speed.
+
         :return store.AbstractStore:
         """
-        return self._stores[-1]
\ No newline at end of file
+        persistent = [s for s in self._stores if not s.volatile]
+        return persistent[-1] if persistent else self._stores[-1]
+
+    def getStores(self):
+        """
+        Returns the stores of this HSM, from the fastest to the slowest one.
+        Stores are sorted by their reading speed; stores with the same reading
+        speed keep the order in which they were added.
+
+        :return list:
+        """
+        return sorted(self._stores, key=lambda s: -s.getReadingSpeed())
+
+    def getStoreOf(self, drop):
+        """
+        Returns the store holding the data of `drop`, or None if it's not held
+        by any of the stores of this HSM
+        """
+        for s in self._stores:
+            if s.holds(drop):
+                return s
+        return None
\ No newline at end of file
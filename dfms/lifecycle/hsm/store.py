@@ -31,30 +31,82 @@ from abc import ABCMeta, abstractmethod
 import json
 import logging
 import os
+import threading
+import time
 
 import psutil
 
+from dfms.ddap_protocol import DROPStates
 from dfms.drop import FileDROP, InMemoryDROP, NgasDROP
 
 
 logger = logging.getLogger(__name__)
 
+class StoredDropListener(object):
+    """
+    Keeps the space accounting of a store up to date as the DROPs it created
+    are completed and deleted
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._size = None
+
+    def handleEvent(self, evt):
+        if evt.status == DROPStates.COMPLETED and self._size is None:
+            self._size = self._store._dropSize(evt.uid)
+            self._store._spaceUsed(self._size)
+        elif evt.status == DROPStates.DELETED and self._size is not None:
+            self._store._spaceUsed(-self._size)
+            self._size = None
+
 class AbstractStore(object):
     """
-    The abstract store implementation, see the subclasses for details
+    The abstract store implementation, see the subclasses for details.
+
+    Stores measure their space usage via `_measureSpaces`, which might be
+    expensive, so they do it at most every `reconcilePeriod` seconds and
+    without holding `_spaceLock`. In between, the space used by the DROPs
+    created by the store is accounted for incrementally as they are completed
+    and deleted.
     """
 
     __metaclass__ = ABCMeta
 
+    reconcilePeriod = 0
+
+    # Amount of data written and read by `measureSpeeds`, stores whose speed
+    # shouldn't be measured set it to 0
+    speedTestSize = 4 * 1024**2
+
+    # Whether the data of this store is lost when the process finishes, in
+    # which case it's never used to hold replicas
+    volatile = False
+
     def __init__(self, *args, **kwargs):
         super(AbstractStore, self).__init__()
         self._setTotalSpace(0)
         self._setAvailableSpace(0)
         self._setWritingSpeed(0)
         self._setReadingSpeed(0)
+        self._spaceLock = threading.Lock()
+        self._lastReconciliation = None
+        self._drops = {}
 
     def updateSpaces(self):
-        self._updateSpaces()
+        now = time.time()
+        with self._spaceLock:
+            first = self._lastReconciliation is None
+            reconcile = first or now - self._lastReconciliation >= self.reconcilePeriod
+            if reconcile:
+                self._lastReconciliation = now
+        if reconcile:
+            totalSpace, availableSpace = self._measureSpaces()
+            with self._spaceLock:
+                if not first and availableSpace != self.getAvailableSpace():
+                    logger.debug("Space accounting of %s was off by %d bytes", self, self.getAvailableSpace() - availableSpace)
+                self._setTotalSpace(totalSpace)
+                self._setAvailableSpace(availableSpace)
         if logger.isEnabledFor(logging.DEBUG):
             avail = self.getAvailableSpace()
             total = self.getTotalSpace()
@@ -62,6 +114,50 @@ class AbstractStore(object):
             logger.debug("Available/Total space on %s: %d/%d (%.2f %%)" % (self, avail, total, perc))
         pass
 
+    def _track(self, drop):
+        """
+        Follows `drop`, created by this store, to account for its space
+        """
+        self._drops[drop.uid] = drop
+        drop.subscribe(StoredDropListener(self), 'status')
+        return drop
+
+    def _dropSize(self, uid):
+        drop = self._drops.pop(uid, None)
+        return (drop.size or 0) if drop is not None else 0
+
+    def _spaceUsed(self, nbytes):
+        with self._spaceLock:
+            self._setAvailableSpace(self.getAvailableSpace() - nbytes)
+
+    def measureSpeeds(self):
+        """
+        Measures the writing and reading speeds of this store by writing and
+        reading `speedTestSize` bytes through a temporary DROP
+        """
+        chunk = b' ' * (64 * 1024)
+        nchunks = max(1, self.speedTestSize // len(chunk))
+        size = nchunks * len(chunk)
+        uid = '__speedtest__%d' % (id(self),)
+        drop = self.createDrop(uid, uid, expectedSize=size, precious=False)
+        try:
+            start = time.time()
+            for _ in range(nchunks):
+                drop.write(chunk)
+            self._setWritingSpeed(size / max(time.time() - start, 1e-6))
+
+            start = time.time()
+            desc = drop.open()
+            while drop.read(desc, len(chunk)):
+                pass
+            drop.close(desc)
+            self._setReadingSpeed(size / max(time.time() - start, 1e-6))
+        finally:
+            drop.delete()
+            drop.status = DROPStates.DELETED
+        logger.info("Measured speeds on %s: %.1f [MB/s] writing, %.1f [MB/s] reading",
+                    self, self._writingSpeed / 1024**2, self._readingSpeed / 1024**2)
+
     def _setTotalSpace(self, totalSpace):
         self._totalSpace = totalSpace
 
@@ -80,12 +176,27 @@ class AbstractStore(object):
     def getTotalSpace(self):
         return self._totalSpace
 
+    def getWritingSpeed(self):
+        return self._writingSpeed
+
+    def getReadingSpeed(self):
+        return self._readingSpeed
+
+    def holds(self, drop):
+        """
+        Returns whether the data of `drop` is stored in this store
+        """
+        return False
+
     @abstractmethod
     def createDrop(self, oid, uid, **kwargs):
         pass
 
     @abstractmethod
-    def _updateSpaces(self):
+    def _measureSpaces(self):
+        """
+        Returns the total and available space of this store
+        """
         pass
 
 class FileSystemStore(AbstractStore):
@@ -95,6 +206,9 @@ class FileSystemStore(AbstractStore):
     device fully. It creates FileDROPs that live directly in the root of
     the filesystem, and monitors the usage of the filesystem.
     """
+
+    reconcilePeriod = 10
+
     def __init__(self, mountPoint, savingDir=None):
         super(FileSystemStore, self).__init__()
 
@@ -113,7 +227,7 @@ class FileSystemStore(AbstractStore):
             os.mkdir(self._savingDir)
         self.updateSpaces()
 
-    def _updateSpaces(self):
+    def _measureSpaces(self):
         stat = os.statvfs(self._mountPoint)
         blocks = stat.f_blocks
         blockSize = stat.f_bsize
@@ -122,12 +236,18 @@ class FileSystemStore(AbstractStore):
 
         totalSpace = blocks * fragmentSize
         availableSpace=freeBlocks * blockSize
-        self._setTotalSpace(totalSpace)
-        self._setAvailableSpace(availableSpace)
+        return totalSpace, availableSpace
 
     def createDrop(self, oid, uid, **kwargs):
         kwargs['dirname'] = self._savingDir
-        return FileDROP(oid, uid, **kwargs)
+        return self._track(FileDROP(oid, uid, **kwargs))
+
+    def getSavingDir(self):
+        return self._savingDir
+
+    def holds(self, drop):
+        return isinstance(drop, FileDROP) and \
+               os.path.dirname(drop.path) == os.path.abspath(self._savingDir)
 
     def __str__(self):
         return self._mountPoint
@@ -138,17 +258,21 @@ class MemoryStore(AbstractStore):
     InMemoryDROPs and monitors the RAM usage of the system.
     """
 
+    volatile = True
+
     def __init__(self):
         super(MemoryStore, self).__init__()
         self.updateSpaces()
 
-    def _updateSpaces(self):
+    def _measureSpaces(self):
         vmem = psutil.virtual_memory()
-        self._setTotalSpace(vmem.total)
-        self._setAvailableSpace(vmem.free)
+        return vmem.total, vmem.free
 
     def createDrop(self, oid, uid, **kwargs):
-        return InMemoryDROP(oid, uid, **kwargs)
+        return self._track(InMemoryDROP(oid, uid, **kwargs))
+
+    def holds(self, drop):
+        return isinstance(drop, InMemoryDROP)
 
     def __str__(self):
         return 'Memory'
@@ -158,7 +282,14 @@ class NgasStore(AbstractStore):
     A store that a given NGAS server as its storage mechanism. It creates
     NgasDROPs and monitors the disks usage of the NGAS system.
     """
+
+    reconcilePeriod = 60
+
+    # Don't push test data through the network into the archive
+    speedTestSize = 0
+
     def __init__(self, host=None, port=None, initialCheck=True):
+        super(NgasStore, self).__init__()
 
         try:
             from ngamsPClient import ngamsPClient  # @UnusedImport
@@ -179,7 +310,7 @@ class NgasStore(AbstractStore):
 
         self.updateSpaces()
 
-    def _updateSpaces(self):
+    def _measureSpaces(self):
         client = self._getClient()
         data = client.sendCmd("QUERY", pars=[['query', 'disks_list'], ['format', 'json']]).getData()
         disks = json.loads(data)['disks_list']
@@ -195,13 +326,16 @@ class NgasStore(AbstractStore):
         # TODO: Check if these computations are correct, I'm not sure if the
         #       quantities stored by NGAS should be interpreted like this, or
         #       if "available" should be read as "total"
-        self._setTotalSpace(totalAvailable + totalStored)
-        self._setAvailableSpace(totalAvailable)
+        return totalAvailable + totalStored, totalAvailable
 
     def createDrop(self, oid, uid, **kwargs):
         kwargs['ngasSrv']  = self._host
         kwargs['ngasPort'] = self._port
-        return NgasDROP(oid, uid, **kwargs)
+        return self._track(NgasDROP(oid, uid, **kwargs))
+
+    def holds(self, drop):
+        return isinstance(drop, NgasDROP) and \
+               drop.dataURL.startswith("ngas://%s:%d/" % (self._host, self._port))
 
     def _getClient(self):
         from ngamsPClient import ngamsPClient
@@ -218,13 +352,17 @@ class DirectoryStore(AbstractStore):
     The "available" size of the directory is determined by the content of the
     SIZES file that must be present at the root level, while the currently used
     space is determined by summing up the individual sizes of all files within
-    the directory, recursively.
+    the directory, recursively. Since this is expensive it is done every
+    `reconcilePeriod` seconds only.
     This store creates FileDROPs that live inside the store's directory.
     """
 
     __SIZE_FILE = 'SIZE'
 
+    reconcilePeriod = 300
+
     def __init__(self, dirName, initialize=False):
+        super(DirectoryStore, self).__init__()
 
         if not dirName:
             raise Exception("No directory given to DirectoryStore")
@@ -249,21 +387,28 @@ class DirectoryStore(AbstractStore):
 
     def createDrop(self, oid, uid, **kwargs):
         kwargs['dirname'] = self._dirName
-        return FileDROP(oid, uid, **kwargs)
+        return self._track(FileDROP(oid, uid, **kwargs))
+
+    def holds(self, drop):
+        return isinstance(drop, FileDROP) and \
+               os.path.dirname(drop.path) == os.path.abspath(self._dirName)
 
-    def _updateSpaces(self):
+    def _measureSpaces(self):
         used = self._dirUsage(self._dirName)
-        self._setAvailableSpace(self.getTotalSpace() - used)
+        return self.getTotalSpace(), self.getTotalSpace() - used
 
     def _dirUsage(self, dirName):
         total = 0
-        for f in os.listdir(dirName):
-            if os.path.isdir(f):
-                total += self._dirUsage(os.path.join(dirName, f))
-            elif os.path.isfile(f):
+        for root, _, files in os.walk(dirName):
+            for f in files:
                 # Don't count our special file
-                if f != self.__SIZE_FILE or dirName != self._dirName:
-                    total += os.stat(os.path.join(dirName, f))
+                if f == self.__SIZE_FILE and root == dirName:
+                    continue
+                try:
+                    total += os.stat(os.path.join(root, f)).st_size
+                except OSError:
+                    # Removed while we were walking
+                    pass
         return total
 
     @staticmethod
@@ -34,7 +34,9 @@ The registry simply (for the time being) keeps a record of:
 from abc import abstractmethod, ABCMeta
 import importlib
 import logging
+import threading
 import time
+import weakref
 
 from dfms.ddap_protocol import DROPPhases
 from dfms.utils import prepare_sql
@@ -150,9 +152,46 @@ class InMemoryRegistry(Registry):
         else:
             return -1
 
+class _ConnectionHolder(object):
+    """
+    Holds a thread's database connection, closing it when the thread finishes
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def close(self):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            # e.g., sqlite3 connections can only be closed by their threads
+            self.conn = conn
+
+    def __del__(self):
+        self.close()
+
 class RDBMSRegistry(Registry):
+    '''
+    A registry backed by a relational database, accessed through the given
+    DB-API module.
+
+    Database connections are kept open and reused; there is one per thread,
+    since some modules (e.g., sqlite3) don't allow sharing connections across
+    threads. If ``writeBehind=True`` is given, modifications are queued and
+    written by a background thread in batched transactions, either every
+    ``flushPeriod`` seconds or once ``batchSize`` modifications are queued;
+    modifying the registry blocks while ``maxQueued`` modifications are
+    waiting to be written. Only the last access time of each DROP is written
+    on each batch. Queries see all the modifications done before them; other
+    database readers can call `flush` to make sure everything has been
+    written. If a batch cannot be written as a whole its modifications are
+    written one by one, so only the offending ones are lost.
+    '''
 
-    def __init__(self, dbModuleName, *connArgs):
+    def __init__(self, dbModuleName, *connArgs, **kwargs):
         try:
             self._dbmod = importlib.import_module(dbModuleName)
             self._paramstyle = self._dbmod.paramstyle
@@ -161,9 +200,45 @@ class RDBMSRegistry(Registry):
             logger.error("Cannot import module %s, RDBMSRegistry cannot start" % (dbModuleName))
             raise
 
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._writeBehind = kwargs.get('writeBehind', False)
+        self._flushPeriod = float(kwargs.get('flushPeriod', 1))
+        self._batchSize = int(kwargs.get('batchSize', 1000))
+        self._maxQueued = max(self._batchSize, int(kwargs.get('maxQueued', 10 * self._batchSize)))
+
+        # Modifications waiting to be written, and the sequence numbers of the
+        # last queued and written ones
+        self._cond = threading.Condition()
+        self._newDrops = []
+        self._newInstances = []
+        self._phases = {}
+        self._accesses = {}
+        self._nPending = 0
+        self._queued = 0
+        self._written = 0
+        self._flushRequested = False
+        self._closed = False
+        self._writer = None
+
     def _connect(self):
         return self._dbmod.connect(*self._connArgs)
 
+    def _getConnection(self):
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = _ConnectionHolder(self._connect())
+            self._connections.add(holder)
+        return holder.conn
+
+    def _closeConnections(self):
+        # Connections of threads that are still alive may not be closable
+        # from here (e.g., sqlite3's), those are closed when their threads
+        # finish and the thread-local storage is released
+        self._local = threading.local()
+        for holder in list(self._connections):
+            holder.close()
+
     # The following tables should be defined in the database we're pointing at
     #
     # dfms_drop:
@@ -179,23 +254,23 @@ class RDBMSRegistry(Registry):
     #   oid (FK, PK)
     #   accessTime (PK)
 
-    # A small helper class to make all methods transactional, and to create
+    # A small helper class to make all methods transactional, and to get
     # connections when needed
     class transactional(object):
 
         def __init__(self, registry, conn):
-            self._connect = registry._connect
+            self._getConnection = registry._getConnection
             self._conn = conn
-            self._connCreated = False
+            self._connTaken = False
 
         def __enter__(self):
             if self._conn is None:
-                self._conn = self._connect()
-                self._connCreated = True
+                self._conn = self._getConnection()
+                self._connTaken = True
             return self._conn
 
         def __exit__(self, typ, value, traceback):
-            if not self._connCreated:
+            if not self._connTaken:
                 return
             if typ is None:
                 self._conn.commit()
@@ -203,13 +278,179 @@ class RDBMSRegistry(Registry):
                 self._conn.rollback()
                 return False
 
-            self._conn.close()
-
     def execute(self, cursor, sql, values=()):
         sql, values = prepare_sql(sql, self._paramstyle, values)
         cursor.execute(sql, values)
 
+    def executemany(self, cursor, sql, rows):
+        if not rows:
+            return
+        prepared = [prepare_sql(sql, self._paramstyle, values) for values in rows]
+        cursor.executemany(prepared[0][0], [values for _, values in prepared])
+
+    #
+    # Write-behind support
+    #
+    def _queue(self, conn, queueit):
+        '''
+        Queues a modification via `queueit` if it can be written later;
+        otherwise returns False
+        '''
+        if conn is not None or not self._writeBehind:
+            return False
+        with self._cond:
+            while True:
+                if self._closed:
+                    return False
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._writeQueued, name="RDBMSRegistry writer")
+                    self._writer.daemon = True
+                    self._writer.start()
+                if self._nPending < self._maxQueued:
+                    break
+                # Wait for the writer to make room in the queue
+                self._cond.notify_all()
+                self._cond.wait()
+            queueit()
+            self._nPending += 1
+            self._queued += 1
+            if self._nPending >= self._batchSize:
+                self._cond.notify_all()
+        return True
+
+    def _takeQueued(self):
+        batch = (self._newDrops, self._newInstances, self._phases, self._accesses)
+        self._newDrops, self._newInstances, self._phases, self._accesses = [], [], {}, {}
+        self._nPending = 0
+        return batch, self._queued
+
+    def _writeQueued(self):
+        conn = None
+        # Access times have limited resolution, don't write the same twice
+        lastAccesses = {}
+        try:
+            while True:
+                with self._cond:
+                    deadline = time.time() + self._flushPeriod
+                    while not (self._closed or self._flushRequested or self._nPending >= self._batchSize):
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    batch, seq = self._takeQueued()
+                    self._flushRequested = False
+                    closed = self._closed
+                    # Writers waiting for room in the queue can go on
+                    self._cond.notify_all()
+
+                # Batches are marked as written even if they fail, so flush()
+                # never blocks forever
+                if seq != self._written:
+                    newDrops, newInstances, phases, accesses = batch
+                    accesses = dict((oid, t) for oid, t in accesses.items() if lastAccesses.get(oid) != t)
+                    try:
+                        if conn is None:
+                            conn = self._connect()
+                        lastAccesses.update(self._writeBatch(conn, newDrops, newInstances, phases, accesses))
+                    except Exception:
+                        logger.exception("Error while writing to the registry, %d modifications were lost",
+                                         len(newDrops) + len(newInstances) + len(phases) + len(accesses))
+                        # Connect again for the next batch
+                        if conn is not None:
+                            _ConnectionHolder(conn).close()
+                            conn = None
+                with self._cond:
+                    self._written = seq
+                    self._cond.notify_all()
+                if closed:
+                    break
+        finally:
+            if conn is not None:
+                _ConnectionHolder(conn).close()
+            # Let flush() return, and a new writer be started, even if this
+            # one died unexpectedly
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+    def _writeBatch(self, conn, newDrops, newInstances, phases, accesses):
+        '''
+        Writes a batch of modifications and returns the access times that
+        were actually written
+        '''
+        accessesSql = 'INSERT INTO dfms_dropaccesstime (oid, accessTime) VALUES ({0},{1})'
+        statements = [('INSERT INTO dfms_drop (oid, phase) VALUES ({0},{1})', newDrops),
+                      ('INSERT INTO dfms_dropinstance (oid, uid, dataRef) VALUES ({0},{1},{2})', newInstances),
+                      ('UPDATE dfms_drop SET phase = {0} WHERE oid = {1}', [(phase, oid) for oid, phase in phases.items()]),
+                      (accessesSql, list(accesses.items()))]
+        try:
+            cur = conn.cursor()
+            for sql, rows in statements:
+                self.executemany(cur, sql, rows)
+            cur.close()
+            conn.commit()
+            return accesses
+        except Exception:
+            conn.rollback()
+            logger.warning("Error while writing a batch to the registry, writing its modifications one by one", exc_info=True)
+
+        # A failed statement aborts the whole transaction in some databases,
+        # so each row goes in its own one
+        written = {}
+        lost = 0
+        for sql, rows in statements:
+            for values in rows:
+                try:
+                    cur = conn.cursor()
+                    self.execute(cur, sql, values)
+                    cur.close()
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    lost += 1
+                    logger.debug("Error while executing %s with %r", sql, values, exc_info=True)
+                    continue
+                if sql is accessesSql:
+                    written[values[0]] = values[1]
+        if lost:
+            logger.error("%d modifications could not be written to the registry and were lost", lost)
+        return written
+
+    def flush(self):
+        '''
+        Waits until all modifications queued so far have been written
+        '''
+        with self._cond:
+            target = self._queued
+            if self._written >= target:
+                return
+            self._flushRequested = True
+            self._cond.notify_all()
+            while self._written < target and self._writer is not None:
+                self._cond.wait()
+
+    def close(self):
+        '''
+        Writes all pending modifications, stops the background writer and
+        closes the database connections
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+        self._closeConnections()
+
+    #
+    # The registry methods
+    #
     def addDrop(self, drop, conn=None):
+        def queueit():
+            self._newDrops.append((drop.oid, drop.phase))
+            self._newInstances.append((drop.oid, drop.uid, drop.dataURL))
+        if self._queue(conn, queueit):
+            return
         with self.transactional(self, conn) as conn:
             cur = conn.cursor()
             self.execute(cur, "INSERT INTO dfms_drop (oid, phase) VALUES ({0},{1})", (drop.oid, drop.phase))
@@ -217,12 +458,17 @@ class RDBMSRegistry(Registry):
             cur.close()
 
     def addDropInstance(self, drop, conn=None):
+        def queueit():
+            self._newInstances.append((drop.oid, drop.uid, drop.dataURL))
+        if self._queue(conn, queueit):
+            return
         with self.transactional(self, conn) as conn:
             cur = conn.cursor()
             self.execute(cur, 'INSERT INTO dfms_dropinstance (oid, uid, dataRef) VALUES ({0},{1},{2})', (drop.oid, drop.uid, drop.dataURL))
             cur.close()
 
     def getDropUids(self, drop, conn=None):
+        self.flush()
         with self.transactional(self, conn) as conn:
             cur = conn.cursor()
             self.execute(cur, 'SELECT uid FROM dfms_dropinstance WHERE oid = {0}', (drop.oid,))
@@ -231,18 +477,28 @@ class RDBMSRegistry(Registry):
             return [r[0] for r in rows]
 
     def setDropPhase(self, drop, phase, conn=None):
+        def queueit():
+            self._phases[drop.oid] = phase
+        if self._queue(conn, queueit):
+            return
         with self.transactional(self, conn) as conn:
             cur = conn.cursor()
-            self.execute(cur, 'UPDATE dfms_drop SET phase = {0} WHERE oid = {1}', (drop.oid, drop.phase))
+            self.execute(cur, 'UPDATE dfms_drop SET phase = {0} WHERE oid = {1}', (phase, drop.oid))
             cur.close()
 
     def recordNewAccess(self, oid, conn=None):
+        accessTime = self._dbmod.TimestampFromTicks(time.time())
+        def queueit():
+            self._accesses[oid] = accessTime
+        if self._queue(conn, queueit):
+            return
         with self.transactional(self, conn) as conn:
             cur = conn.cursor()
-            self.execute(cur, 'INSERT INTO dfms_dropaccesstime (oid, accessTime) VALUES ({0},{1})', (oid, self._dbmod.TimestampFromTicks(time.time())))
+            self.execute(cur, 'INSERT INTO dfms_dropaccesstime (oid, accessTime) VALUES ({0},{1})', (oid, accessTime))
             cur.close()
 
     def getLastAccess(self, oid, conn=None):
+        self.flush()
         with self.transactional(self, conn) as conn:
             cur = conn.cursor()
             self.execute(cur, 'SELECT accessTime FROM dfms_dropaccesstime WHERE oid = {0} ORDER BY accessTime DESC LIMIT 1', (oid,))
@@ -250,4 +506,4 @@ class RDBMSRegistry(Registry):
             cur.close()
             if row is None:
                 return -1
-            return row[0]
\ No newline at end of file
+            return row[0]
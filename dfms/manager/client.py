@@ -19,6 +19,7 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 #
+import json
 import logging
 import os
 
@@ -126,6 +127,39 @@ class BaseDROPManagerClient(RestClient):
         logger.debug('Successfully read session %s graph size (%d) from %s:%s', sessionId, count, self.host, self.port)
         return count
 
+    def session_events(self, sessionId, since=None):
+        """
+        Returns an iterator over the changes in the status of the DROPs of
+        session `sessionId` as (version, status) tuples, where status is a
+        dictionary like those returned by `graph_status`. The iteration ends
+        when the session finishes; streams ended earlier by the server are
+        resumed transparently. A stream can also be resumed by passing the
+        last version received as `since`.
+        """
+        url = '/sessions/%s/events' % (urllib.quote(sessionId),)
+        while True:
+            query = '?since=%s' % (urllib.quote(str(since)),) if since else ''
+            self._GET(url + query)
+
+            # Events come one per line; we read them directly from the
+            # response so they are delivered as soon as they arrive
+            try:
+                while True:
+                    line = self._resp.readline()
+                    if not line:
+                        break
+                    line = line.strip()
+                    if not line:
+                        continue
+                    evt = json.loads(line.decode('utf-8'))
+                    if evt.get('finished'):
+                        self._resp.read()
+                        return
+                    since = evt['version']
+                    yield since, evt['drops']
+            finally:
+                self._release_connection()
+
     # Offer an API similar to that exposed by Drop Managers objects
     createSession = create_session
     destroySession = destroy_session
@@ -152,6 +186,16 @@ class NodeManagerClient(BaseDROPManagerClient):
     def shutdown_node_manager(self):
         self._GET('/shutdown')
 
+    def relay(self, method, args, host, hosts, port, fanout):
+        """
+        Invokes `method` with `args` on this NodeManager (known as `host`) and
+        on all `hosts`, which this NodeManager reaches through a tree of relay
+        NodeManagers with the given `fanout`. See `dfms.manager.fanout`.
+        """
+        content = {'method': method, 'args': args, 'host': host,
+                   'hosts': hosts, 'port': port, 'fanout': fanout}
+        return self._post_json('/relay', content)
+
 class CompositeManagerClient(BaseDROPManagerClient):
 
     def nodes(self):
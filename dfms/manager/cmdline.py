@@ -54,7 +54,7 @@ def launchServer(opts):
     logger.info('Creating %s' % (dmName))
     dm = opts.dmType(*opts.dmArgs, **opts.dmKwargs)
 
-    server = opts.restType(dm, opts.maxreqsize)
+    server = opts.restType(dm, opts.maxreqsize, max_workers=opts.rest_workers)
 
     # Signal handling
     def handle_signal(signNo, stack_frame):
@@ -85,6 +85,8 @@ def addCommonOptions(parser, defaultPort):
                       dest="port", help = "The port to bind this instance on", default=defaultPort)
     parser.add_option("-m", "--max-request-size", action="store", type="int",
                       dest="maxreqsize", help="The maximum allowed HTTP request size, in MB", default=10)
+    parser.add_option("--rest-workers", action="store", type="int",
+                      dest="rest_workers", help="Serve REST requests with a bounded pool of this many threads instead of a new thread per connection", default=None)
     parser.add_option("-d", "--daemon", action="store_true",
                       dest="daemon", help="Run as daemon", default=False)
     parser.add_option("-s", "--stop", action="store_true",
@@ -205,6 +207,18 @@ def dlgNM(parser, args):
                       dest="enable_luigi", help="Enable integration with Luigi. Disabled by default.", default=False)
     parser.add_option("-t", "--max-threads", action="store", type="int",
                       dest="max_threads", help="Max thread pool size used for executing drops. 0 (default) means no pool.", default=0)
+    parser.add_option("--enforce-resources", action="store_true",
+                      dest="enforce_resources", help="Run applications only when the resources they declare are available", default=False)
+    parser.add_option("--cpus", action="store", type="int",
+                      dest="cpus", help="Number of cores available to applications. 0 (default) means all cores", default=0)
+    parser.add_option("--memory", action="store", type="int",
+                      dest="memory", help="Memory available to applications, in MB. 0 (default) means all memory", default=0)
+    parser.add_option("--scratch", action="store", type="int",
+                      dest="scratch", help="Scratch disk space available to applications, in MB. 0 (default) means all free space", default=0)
+    parser.add_option("--memory-watermark", action="store", type="int",
+                      dest="memory_watermark", help="Memory held by completed in-memory drops above which they are spilled to disk, in MB. 0 (default) means never spill", default=0)
+    parser.add_option("--spill-dir", action="store", type="string",
+                      dest="spill_dir", help="Directory where in-memory drops are spilled to", default=None)
     (options, args) = parser.parse_args(args)
 
     # Add DM-specific options
@@ -217,7 +231,13 @@ def dlgNM(parser, args):
                         'host': options.host,
                         'error_listener': options.errorListener,
                         'enable_luigi': options.enable_luigi,
-                        'max_threads': options.max_threads}
+                        'max_threads': options.max_threads,
+                        'enforce_resources': options.enforce_resources,
+                        'resources': {'num_cpus': options.cpus,
+                                      'memory': options.memory,
+                                      'scratch': options.scratch},
+                        'memory_watermark': options.memory_watermark * 1024**2,
+                        'spill_dir': options.spill_dir}
     options.dmAcronym = 'NM'
     options.restType = NMRestServer
 
@@ -238,12 +258,17 @@ def dlgCompositeManager(parser, args, dmType, acronym, dmPort, dmRestServer):
                       dest="pkeyPath", help = "Path to the private SSH key to use when connecting to the nodes", default=None)
     parser.add_option("--dmCheckTimeout", action="store", type="int",
                       dest="dmCheckTimeout", help="Maximum timeout used when automatically checking for DM presence", default=10)
+    parser.add_option("--push-status", action="store_true",
+                      dest="pushStatus", help="Keep track of the status of the sessions from the events pushed by the sub-DMs instead of querying them", default=False)
     (options, args) = parser.parse_args(args)
 
     # Add DIM-specific options
     options.dmType = dmType
     options.dmArgs = ([s for s in options.nodes.split(',') if s],)
-    options.dmKwargs = {'pkeyPath': options.pkeyPath, 'dmCheckTimeout': options.dmCheckTimeout}
+    options.dmKwargs = {'pkeyPath': options.pkeyPath, 'dmCheckTimeout': options.dmCheckTimeout,
+                        'pushStatus': options.pushStatus}
+    if getattr(options, 'fanout', None):
+        options.dmKwargs['fanout'] = options.fanout
     options.dmAcronym = acronym
     options.restType = dmRestServer
 
@@ -253,6 +278,8 @@ def dlgDIM(parser, args):
     """
     Entry point for the dlg dim command
     """
+    parser.add_option("--fanout", action="store", type="int",
+                      dest="fanout", help="Relay commands to the NMs through a tree with this fanout instead of contacting all NMs directly", default=None)
     dlgCompositeManager(parser, args, DataIslandManager, 'DIM', ISLAND_DEFAULT_REST_PORT, CompositeManagerRestServer)
 
 def dlgMM(parser, args):
@@ -27,14 +27,17 @@ import multiprocessing.pool
 import threading
 
 from dfms import remote, graph_loader
+from dfms.restutils import connection_pool, decode_exception
 from dfms.ddap_protocol import DROPRel
 from dfms.exceptions import InvalidGraphException, DaliugeException, \
-    SubManagerException
+    SubManagerException, NoSessionException
 from dfms.manager.client import NodeManagerClient
-from dfms.manager.constants import ISLAND_DEFAULT_REST_PORT, NODE_DEFAULT_REST_PORT
+from dfms.manager.constants import ISLAND_DEFAULT_REST_PORT, NODE_DEFAULT_REST_PORT, \
+    ISLAND_DEFAULT_EVENTS_PORT, NODE_DEFAULT_EVENTS_PORT
 from dfms.manager.drop_manager import DROPManager
+from dfms.manager.status import StatusAggregator
 from dfms.utils import portIsOpen
-from dfms.manager import constants
+from dfms.manager import constants, fanout
 
 
 logger = logging.getLogger(__name__)
@@ -78,6 +81,16 @@ def group_by_node(uids, graph):
         uids_by_node[graph[uid]['node']].append(uid)
     return uids_by_node
 
+class _RelayedDM(object):
+    """
+    Stands for a DM whose result has been already obtained through a relay; any
+    method invoked on it returns that result.
+    """
+    def __init__(self, result):
+        self._result = result
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._result
+
 class CompositeManager(DROPManager):
     """
     A DROPManager that in turn manages DROPManagers (sigh...).
@@ -101,7 +114,8 @@ class CompositeManager(DROPManager):
 
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, dmPort, partitionAttr, dmExec, subDmId, dmHosts=[], pkeyPath=None, dmCheckTimeout=10):
+    def __init__(self, dmPort, partitionAttr, dmExec, subDmId, dmHosts=[], pkeyPath=None, dmCheckTimeout=10, fanout=None,
+                 dmEventsPort=None, eventsPort=None):
         """
         Creates a new CompositeManager. The sub-DMs it manages are to be located
         at `dmHosts`, and should be listening on port `dmPort`.
@@ -117,6 +131,17 @@ class CompositeManager(DROPManager):
                 of `None` means that the default path should be used
         :param: dmCheckTimeout The timeout used before giving up and declaring
                 a sub-DM as not-yet-present in a given host
+        :param: fanout If given, commands that are the same for all sub-DMs
+                are sent only to this many of them, which relay them to the
+                rest following a tree (see `dfms.manager.fanout`). Sub-DMs
+                must be NodeManagers for this to work.
+        :param: dmEventsPort If given, the port at which the sub-DMs publish
+                the status of their drops. This manager then keeps an
+                aggregated view of the status of each session and answers
+                status queries from it when possible, instead of querying all
+                sub-DMs (see `dfms.manager.status`).
+        :param: eventsPort If given, the port at which the status information
+                received from the sub-DMs is published for upper managers.
         """
         self._dmPort = dmPort
         self._partitionAttr = partitionAttr
@@ -128,6 +153,7 @@ class CompositeManager(DROPManager):
         self._sessionIds = [] # TODO: it's still unclear how sessions are managed at the composite-manager level
         self._pkeyPath = pkeyPath
         self._dmCheckTimeout = dmCheckTimeout
+        self._fanout = fanout
         n_threads = max(1,min(len(dmHosts),20))
         self._tp = multiprocessing.pool.ThreadPool(n_threads)
 
@@ -137,6 +163,13 @@ class CompositeManager(DROPManager):
         # machines)
         self._nodes = []
 
+        self._status = None
+        if dmEventsPort:
+            self._status = StatusAggregator(dmEventsPort, eventsPort)
+            self._status.start()
+            for host in dmHosts:
+                self._status.subscribe(host)
+
         self.startDMChecker()
 
     def startDMChecker(self):
@@ -154,6 +187,8 @@ class CompositeManager(DROPManager):
         self.stopDMChecker()
         self._tp.close()
         self._tp.join()
+        if self._status:
+            self._status.shutdown()
 
     def _checkDM(self):
         while True:
@@ -173,6 +208,8 @@ class CompositeManager(DROPManager):
 
     def addDmHost(self, host):
         self._dmHosts.append(host)
+        if self._status:
+            self._status.subscribe(host)
 
     @property
     def nodes(self):
@@ -203,6 +240,10 @@ class CompositeManager(DROPManager):
 
         port = port or self._dmPort
 
+        # Hosts that answered a request recently don't need to be checked
+        if connection_pool.is_alive(host, port):
+            return
+
         logger.debug("Checking DM presence at %s:%d", host, port)
         if portIsOpen(host, port, timeout):
             logger.debug("DM already present at %s:%d", host, port)
@@ -239,24 +280,46 @@ class CompositeManager(DROPManager):
             self.ensureDM(host, port)
             with self.dmAt(host, port) as dm:
                 res = f(dm, iterable, sessionId)
-
-            if isinstance(collect, dict):
-                collect.update(res)
-            elif isinstance(collect, list):
-                collect.append(res)
+            self._collect(collect, res)
 
         except Exception as e:
             exceptions[host] = e
             logger.exception("Error while %s on host %s, session %s", action, host, sessionId)
 
-    def replicate(self, sessionId, f, action, collect=None, iterable=None, port=None):
+    def _collect(self, collect, res):
+        if isinstance(collect, dict):
+            collect.update(res)
+        elif isinstance(collect, list):
+            collect.append(res)
+
+    def _do_through_relays(self, action, sessionId, exceptions, f, collect, port, method):
+
+        results = fanout.relay(None, None, method, [sessionId], self._dmHosts, port, self._fanout)
+
+        # Results are fed into the per-host functions as if they had been
+        # returned by each DM
+        for host, outcome in results.items():
+            if 'error' in outcome:
+                exceptions[host] = decode_exception(outcome['error'])
+                logger.error("Error while %s on host %s, session %s: %s", action, host, sessionId, exceptions[host])
+                continue
+            self._collect(collect, f(_RelayedDM(outcome['result']), host, sessionId))
+
+    def replicate(self, sessionId, f, action, collect=None, iterable=None, port=None, relay=None):
         """
-        Replicates the given function call on each of the underlying drop managers
+        Replicates the given function call on each of the underlying drop managers.
+
+        If this manager has a fanout, `relay` names the DM method that `f`
+        invokes and no `iterable` is given, the call is sent down a tree of
+        relaying DMs instead of to each DM from here.
         """
         thrExs = {}
-        iterable = iterable or self._dmHosts
         port = port or self._dmPort
-        self._tp.map(functools.partial(self._do_in_host, action, sessionId, thrExs, f, collect, port), iterable)
+        if self._fanout and relay and not iterable:
+            self._do_through_relays(action, sessionId, thrExs, f, collect, port, relay)
+        else:
+            iterable = iterable or self._dmHosts
+            self._tp.map(functools.partial(self._do_in_host, action, sessionId, thrExs, f, collect, port), iterable)
         if thrExs:
             msg = "More than one error occurred while %s on session %s" % (action, sessionId)
             raise SubManagerException(msg, thrExs)
@@ -273,7 +336,9 @@ class CompositeManager(DROPManager):
         Creates a session in all underlying DMs.
         """
         logger.info('Creating Session %s in all hosts', sessionId)
-        self.replicate(sessionId, self._createSession, "creating sessions")
+        if self._status:
+            self._status.forget(sessionId)
+        self.replicate(sessionId, self._createSession, "creating sessions", relay='createSession')
         logger.info('Successfully created session %s in all hosts', sessionId)
         self._sessionIds.append(sessionId)
 
@@ -286,8 +351,10 @@ class CompositeManager(DROPManager):
         Destroy a session in all underlying DMs.
         """
         logger.info('Destroying Session %s in all hosts', sessionId)
-        self.replicate(sessionId, self._destroySession, "creating sessions")
+        self.replicate(sessionId, self._destroySession, "creating sessions", relay='destroySession')
         self._sessionIds.remove(sessionId)
+        if self._status:
+            self._status.forget(sessionId)
 
     def _add_node_subscriptions(self, dm, host_and_subscriptions, sessionId):
         host, subscriptions = host_and_subscriptions
@@ -325,22 +392,32 @@ class CompositeManager(DROPManager):
         # At each partition the relationships between DROPs should be local at the
         # moment of submitting the graph; thus we record the inter-partition
         # relationships separately and remove them from the original graph spec
+        # A graph can be appended in several parts though, so relationships
+        # with DROPs from previous parts in the same partition are kept
         inter_partition_rels = []
-        for dropSpecs in perPartition.values():
-            inter_partition_rels += graph_loader.removeUnmetRelationships(dropSpecs)
+        for partition, dropSpecs in perPartition.items():
+            for rel in graph_loader.removeUnmetRelationships(dropSpecs):
+                if rel.lhs not in self._graph:
+                    msg = "Drop %s has a relationship with unknown drop %s" % (rel.rhs, rel.lhs)
+                    raise InvalidGraphException(msg)
+                if self._graph[rel.lhs][self._partitionAttr] == partition:
+                    graph_loader.addLink(rel.rel, self._graph[rel.rhs], rel.lhs)
+                else:
+                    inter_partition_rels.append(rel)
         sanitize_relations(inter_partition_rels, self._graph)
         logger.info('Removed (and sanitized) %d inter-dm relationships', len(inter_partition_rels))
 
         # Store the inter-partition relationships; later on they have to be
         # communicated to the NMs so they can establish them as needed.
-        drop_rels = collections.defaultdict(functools.partial(collections.defaultdict, list))
+        if sessionId not in self._drop_rels:
+            self._drop_rels[sessionId] = collections.defaultdict(functools.partial(collections.defaultdict, list))
+        drop_rels = self._drop_rels[sessionId]
         for rel in inter_partition_rels:
             rhn = self._graph[rel.rhs]['node']
             lhn = self._graph[rel.lhs]['node']
             drop_rels[lhn][rhn].append(rel)
             drop_rels[rhn][lhn].append(rel)
 
-        self._drop_rels[sessionId] = drop_rels
         logger.debug("Calculated NM-level drop relationships: %r", drop_rels)
 
         # Create the individual graphs on each DM now that they are correctly
@@ -369,7 +446,7 @@ class CompositeManager(DROPManager):
             logger.info("Delivered node subscription list to node managers")
 
         logger.info('Deploying Session %s in all hosts', sessionId)
-        self.replicate(sessionId, self._deploySession, "deploying session")
+        self.replicate(sessionId, self._deploySession, "deploying session", relay='deploySession')
         logger.info('Successfully deployed session %s in all hosts', sessionId)
 
         # Now that everything is wired up we move the requested DROPs to COMPLETED
@@ -390,17 +467,35 @@ class CompositeManager(DROPManager):
         return dm.getGraphStatus(sessionId)
 
     def getGraphStatus(self, sessionId):
+
+        # Answer from the status pushed by the sub-DMs if possible
+        if self._status:
+            allStatus = self._status.graph_status(sessionId, self._dmHosts)
+            if allStatus is not None:
+                return allStatus
+
         allStatus = {}
-        self.replicate(sessionId, self._getGraphStatus, "getting graph status", collect=allStatus)
+        self.replicate(sessionId, self._getGraphStatus, "getting graph status", collect=allStatus, relay='getGraphStatus')
         return allStatus
 
+    def getStatusTracker(self, sessionId):
+        """
+        Returns the `StatusTracker` with the aggregated status of the drops of
+        session `sessionId`, or None if the status is not pushed by the sub-DMs.
+        """
+        if sessionId not in self._sessionIds:
+            raise NoSessionException(sessionId)
+        if self._status:
+            return self._status.tracker(sessionId)
+        return None
+
     def _getGraph(self, dm, host, sessionId):
         return dm.getGraph(sessionId)
 
     def getGraph(self, sessionId):
 
         allGraphs = {}
-        self.replicate(sessionId, self._getGraph, "getting the graph", collect=allGraphs)
+        self.replicate(sessionId, self._getGraph, "getting the graph", collect=allGraphs, relay='getGraph')
 
         # The graphs coming from the DMs are not interconnected, we need to
         # add the missing connections to the graph before returning upstream
@@ -414,8 +509,14 @@ class CompositeManager(DROPManager):
         return {host: dm.getSessionStatus(sessionId)}
 
     def getSessionStatus(self, sessionId):
+
+        if self._status:
+            allStatus = self._status.session_status(sessionId, self._dmHosts)
+            if allStatus is not None:
+                return allStatus
+
         allStatus = {}
-        self.replicate(sessionId, self._getSessionStatus, "getting the graph status", collect=allStatus)
+        self.replicate(sessionId, self._getSessionStatus, "getting the graph status", collect=allStatus, relay='getSessionStatus')
         return allStatus
 
     def _getGraphSize(self, dm, host, sessionId):
@@ -423,7 +524,7 @@ class CompositeManager(DROPManager):
 
     def getGraphSize(self, sessionId):
         allCounts = []
-        self.replicate(sessionId, self._getGraphSize, "getting the graph size", collect=allCounts)
+        self.replicate(sessionId, self._getGraphSize, "getting the graph size", collect=allCounts, relay='getGraphSize')
         return sum(allCounts)
 
 class DataIslandManager(CompositeManager):
@@ -431,14 +532,17 @@ class DataIslandManager(CompositeManager):
     The DataIslandManager, which manages a number of NodeManagers.
     """
 
-    def __init__(self, dmHosts=[], pkeyPath=None, dmCheckTimeout=10):
+    def __init__(self, dmHosts=[], pkeyPath=None, dmCheckTimeout=10, fanout=None, pushStatus=False):
         super(DataIslandManager, self).__init__(NODE_DEFAULT_REST_PORT,
                                                 'node',
                                                 'dfmsNM',
                                                 'nm',
                                                 dmHosts=dmHosts,
                                                 pkeyPath=pkeyPath,
-                                                dmCheckTimeout=dmCheckTimeout)
+                                                dmCheckTimeout=dmCheckTimeout,
+                                                fanout=fanout,
+                                                dmEventsPort=NODE_DEFAULT_EVENTS_PORT if pushStatus else None,
+                                                eventsPort=ISLAND_DEFAULT_EVENTS_PORT if pushStatus else None)
 
         # In the case of the Data Island the dmHosts are the final nodes as well
         self._nodes = dmHosts
@@ -447,18 +551,21 @@ class DataIslandManager(CompositeManager):
     def add_node(self, node):
         CompositeManager.add_node(self, node)
         self._dmHosts.append(node)
+        if self._status:
+            self._status.subscribe(node)
 
 class MasterManager(CompositeManager):
     """
     The MasterManager, which manages a number of DataIslandManagers.
     """
 
-    def __init__(self, dmHosts=[], pkeyPath=None, dmCheckTimeout=10):
+    def __init__(self, dmHosts=[], pkeyPath=None, dmCheckTimeout=10, pushStatus=False):
         super(MasterManager, self).__init__(ISLAND_DEFAULT_REST_PORT,
                                             'island',
                                             'dfmsDIM',
                                             'dim',
                                             dmHosts=dmHosts,
                                             pkeyPath=pkeyPath,
-                                            dmCheckTimeout=dmCheckTimeout)
+                                            dmCheckTimeout=dmCheckTimeout,
+                                            dmEventsPort=ISLAND_DEFAULT_EVENTS_PORT if pushStatus else None)
         logger.info('Created MasterManager for hosts: %r', self._dmHosts)
@@ -32,4 +32,5 @@ DAEMON_DEFAULT_REST_PORT = 9000
 
 # Others ports used by the Node Managers
 NODE_DEFAULT_EVENTS_PORT = 5555
+ISLAND_DEFAULT_EVENTS_PORT = 5560
 NODE_DEFAULT_RPC_PORT    = 6666
\ No newline at end of file
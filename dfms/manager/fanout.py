@@ -0,0 +1,122 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Module implementing the hierarchical fan-out of commands to Node Managers.
+
+Instead of contacting each Node Manager of a Data Island individually, a
+CompositeManager can send a command to a handful of Node Managers only, each of
+which executes it locally and relays it to a subset of the remaining ones,
+forming a k-ary tree. Results travel back up the tree and are aggregated on the
+way, so no single process needs to talk to all Node Managers.
+"""
+
+import logging
+import multiprocessing.pool
+
+from dfms.manager.client import NodeManagerClient
+from dfms.restutils import encode_exception
+
+
+logger = logging.getLogger(__name__)
+
+# The methods that can be relayed down the tree. They all take the same
+# arguments on every Node Manager
+relayable_methods = frozenset(['createSession', 'destroySession',
+                               'deploySession', 'getSessionStatus',
+                               'getGraphStatus', 'getGraphSize', 'getGraph'])
+
+def subtrees(hosts, fanout):
+    """
+    Splits `hosts` into at most `fanout` groups of similar sizes, and returns
+    them as (relay, hosts) tuples, where the first host of each group is the
+    relay for the rest of the group.
+    """
+    n = min(fanout, len(hosts))
+    groups = []
+    start = 0
+    for i in range(n):
+        end = start + len(hosts) // n + (1 if i < len(hosts) % n else 0)
+        groups.append((hosts[start], hosts[start + 1:end]))
+        start = end
+    return groups
+
+def _error(e):
+    status, error = encode_exception(e)
+    if status is None:
+        error = {'type': 'DaliugeException', 'args': [str(e)]}
+    return {'error': error}
+
+def _relay_to_subtree(method, args, port, fanout, relay_and_hosts):
+    host, hosts = relay_and_hosts
+    try:
+        with NodeManagerClient(host, port) as c:
+            return c.relay(method, args, host, hosts, port, fanout)
+    except Exception as e:
+        logger.warning("Error while relaying %s to %s, contacting its %d sub-hosts directly", method, host, len(hosts))
+
+        # The relay is down, but the rest of its subtree is probably not. We
+        # take its role for them, but keep fanning out below it
+        results = {host: _error(e)}
+        if hosts:
+            results.update(relay(None, None, method, args, hosts, port, fanout))
+        return results
+
+def relay(dm, host, method, args, hosts, port, fanout):
+    """
+    Invokes `method` with `args` on `dm` (if given, known to the rest of the
+    system as `host`) and on all Node Managers listening on `port` in `hosts`,
+    which are reached through a tree of relay Node Managers with the given
+    `fanout`.
+
+    Returns a dictionary with the outcome of the invocation on each host,
+    indexed by host. Each outcome is in turn a dictionary with either a
+    ``result`` or an ``error`` key, the latter as produced by
+    `dfms.restutils.encode_exception`.
+    """
+
+    if method not in relayable_methods:
+        raise ValueError("Method %s cannot be relayed" % (method,))
+
+    results = {}
+    groups = subtrees(hosts, fanout)
+    tp = multiprocessing.pool.ThreadPool(len(groups)) if groups else None
+    try:
+        if tp:
+            pending = tp.map_async(lambda g: _relay_to_subtree(method, args, port, fanout, g), groups)
+
+        # The local invocation runs in parallel with our subtrees
+        if dm is not None:
+            try:
+                results[host] = {'result': getattr(dm, method)(*args)}
+            except Exception as e:
+                logger.exception("Error while invoking %s locally", method)
+                results[host] = _error(e)
+
+        if tp:
+            for subtree_results in pending.get():
+                results.update(subtree_results)
+    finally:
+        if tp:
+            tp.close()
+            tp.join()
+
+    return results
@@ -32,24 +32,32 @@ import multiprocessing.pool
 import os
 import socket
 import sys
+import tempfile
 import threading
 import time
 
 import six
+from six.moves import cPickle as pickle  # @UnresolvedImport
 from six.moves import queue as Queue  # @UnresolvedImport
 
 from dfms import utils
-from dfms.drop import AppDROP
+from dfms.drop import AppDROP, InputFiredAppDROP
 from dfms.exceptions import NoSessionException, SessionAlreadyExistsException,\
     DaliugeException
 from dfms.lifecycle.dlm import DataLifecycleManager
 from dfms.manager import constants
 from dfms.manager.drop_manager import DROPManager
-from dfms.manager.session import Session
+from dfms.manager.resources import ResourceLedger
+from dfms.manager.session import Session, SessionStates
+from dfms.manager.status import StatusTracker, status_event, status_topic
 
 
 logger = logging.getLogger(__name__)
 
+# The topic under which the events of drops are published for other Node
+# Managers. Status events are published under status.status_topic
+drop_events_topic = six.b('drop')
+
 class NMDropEventListener(object):
 
     def __init__(self, nm, session_id):
@@ -83,6 +91,11 @@ class NodeManagerBase(DROPManager):
 
     __metaclass__ = abc.ABCMeta
 
+    # How often status changes are published, and how often a full snapshot
+    # is published for sessions that are still running
+    status_period = 0.5
+    status_snapshot_period = 10
+
     def __init__(self,
                  useDLM=True,
                  dfmsPath=None,
@@ -91,14 +104,33 @@ class NodeManagerBase(DROPManager):
                  enable_luigi=False,
                  events_port = constants.NODE_DEFAULT_EVENTS_PORT,
                  rpc_port = constants.NODE_DEFAULT_RPC_PORT,
-                 max_threads = 0):
-
-        self._dlm = DataLifecycleManager() if useDLM else None
+                 max_threads = 0,
+                 enforce_resources = False,
+                 resources = None,
+                 memory_watermark = None,
+                 spill_dir = None):
+
+        self._dlm = None
+        if useDLM:
+            dlm_kwargs = {}
+            if memory_watermark:
+                dlm_kwargs['memoryHighWatermark'] = memory_watermark
+            if spill_dir:
+                dlm_kwargs['spillDir'] = spill_dir
+            self._dlm = DataLifecycleManager(**dlm_kwargs)
+            self._dlm.addMoveListener(self._drop_moved)
         self._host = host or 'localhost'
         self._events_port = events_port
         self._rpc_port = rpc_port
         self._sessions = {}
 
+        # The status of the drops is tracked and pushed only after somebody
+        # subscribes to our status events (e.g., our Data Island Manager)
+        self._status_lock = threading.Lock()
+        self._status_trackers = {}
+        self._push_status = False
+        self._status_publisher = None
+
         # dfmsPath contains code added by the user with possible
         # DROP applications
         if dfmsPath:
@@ -132,6 +164,12 @@ class NodeManagerBase(DROPManager):
             logger.info("Initializing thread pool with %d threads", max_threads)
             self._threadpool = multiprocessing.pool.ThreadPool(processes=max_threads)
 
+        # Applications wait until the resources they need are available in
+        # this node. Resources not given in ``resources`` are detected
+        self._resource_ledger = None
+        if enforce_resources:
+            self._resource_ledger = ResourceLedger(resources)
+
         # Event handler that only logs status changes
         debugging = logger.isEnabledFor(logging.DEBUG)
         self._logging_event_listener = LogEvtListener() if debugging else None
@@ -158,9 +196,11 @@ class NodeManagerBase(DROPManager):
         """
 
     @abc.abstractmethod
-    def publish_event(self, evt):
+    def publish_event(self, evt, topic=drop_events_topic):
         """
-        Publishes the event ``evt`` for other Node Managers to receive it
+        Publishes the event ``evt`` under ``topic``. Drop events are received
+        by other Node Managers, while status events are received only by
+        whoever asked for them.
         """
 
     @abc.abstractmethod
@@ -210,6 +250,14 @@ class NodeManagerBase(DROPManager):
         self._check_session_id(sessionId)
         return self._sessions[sessionId].getGraph()
 
+    def getStatusTracker(self, sessionId):
+        """
+        Returns the `StatusTracker` following the status of the drops of
+        session `sessionId`, or None if their status is not being tracked
+        """
+        self._check_session_id(sessionId)
+        return self._status_trackers.get(sessionId)
+
     def deploySession(self, sessionId, completedDrops=[]):
         self._check_session_id(sessionId)
         session = self._sessions[sessionId]
@@ -217,6 +265,8 @@ class NodeManagerBase(DROPManager):
         def foreach(drop):
             if self._threadpool is not None:
                 drop._tp = self._threadpool
+            if self._resource_ledger is not None and isinstance(drop, InputFiredAppDROP):
+                drop._resource_ledger = self._resource_ledger
             if self._dlm:
                 self._dlm.addDrop(drop)
 
@@ -236,9 +286,15 @@ class NodeManagerBase(DROPManager):
 
         session.deploy(completedDrops=completedDrops, foreach=foreach)
 
+        with self._status_lock:
+            if self._push_status:
+                self._track_status(sessionId, session)
+
     def destroySession(self, sessionId):
         self._check_session_id(sessionId)
         session = self._sessions.pop(sessionId)
+        with self._status_lock:
+            self._status_trackers.pop(sessionId, None)
         session.destroy()
 
     def getSessionIds(self):
@@ -249,6 +305,108 @@ class NodeManagerBase(DROPManager):
         session = self._sessions[sessionId]
         return len(session._graph)
 
+    def push_status_requested(self, requested):
+        """
+        Method called by subclasses when the first subscriber to our status
+        events arrives (``requested`` is True), and when the last one leaves.
+        """
+        with self._status_lock:
+            self._push_status = requested
+            if requested and self._status_publisher is None:
+                self._status_publisher = threading.Thread(target=self._publish_status, name="Status publisher")
+                self._status_publisher.daemon = True
+                self._status_publisher.start()
+        logger.info("%s pushing the status of drops", "Started" if requested else "Stopped")
+
+    def _drop_moved(self, drop, newDrop):
+        # The DLM moved `drop` into a new instance, which takes its place in
+        # its session. The tracker of the session follows the new instance,
+        # since the original one is expired afterwards
+        for sessionId, session in list(self._sessions.items()):
+            if session.replaceDrop(drop, newDrop):
+                with self._status_lock:
+                    tracker = self._status_trackers.get(sessionId)
+                    if tracker is not None:
+                        drop.unsubscribe(tracker, 'status')
+                        newDrop.subscribe(tracker, 'status')
+                        tracker.add(newDrop)
+                return
+
+    def _track_status(self, sessionId, session):
+        # Follows the status of the drops of a deployed session. Trackers are
+        # subscribed first so no change is missed in between
+        if sessionId in self._status_trackers:
+            return
+        tracker = self._status_trackers[sessionId] = StatusTracker()
+        for drop in session.drops.values():
+            drop.subscribe(tracker, 'status')
+            if isinstance(drop, AppDROP):
+                drop.subscribe(tracker, 'execStatus')
+            tracker.add(drop)
+
+    def _publish_status(self):
+
+        # Session ID -> (version, session status, time of last snapshot)
+        published = {}
+        while self._running:
+            time.sleep(self.status_period)
+            with self._status_lock:
+                if not self._push_status:
+                    published.clear()
+                    continue
+                # Sessions deployed before status was requested
+                for sessionId, session in list(self._sessions.items()):
+                    if session.status in (SessionStates.RUNNING, SessionStates.FINISHED):
+                        self._track_status(sessionId, session)
+                trackers = dict(self._status_trackers)
+            for sessionId in set(published) - set(trackers):
+                del published[sessionId]
+            for sessionId, tracker in trackers.items():
+                session = self._sessions.get(sessionId)
+                if session is None:
+                    continue
+                evt = self._status_event(session, tracker, published)
+                if evt is not None:
+                    self.publish_event(evt, topic=status_topic)
+
+    def _status_event(self, session, tracker, published):
+
+        now = time.time()
+        sessionId = session.sessionId
+        status = session.status
+        last = published.get(sessionId)
+
+        if last is None or (status != SessionStates.FINISHED and
+                            now - last[2] >= self.status_snapshot_period):
+            since, snapshot_time = None, now
+            version, changes = tracker.snapshot()
+        else:
+            since, _, snapshot_time = last
+            version, changes = tracker.changes_since(since)
+            if not changes and status == last[1]:
+                return None
+
+        published[sessionId] = (version, status, snapshot_time)
+        return status_event(sessionId, self._host, since, version, status, changes)
+
+    def get_resource_status(self):
+        """
+        Returns the status of the resources ledger of this Node Manager, or
+        ``None`` if resource limits are not enforced.
+        """
+        if self._resource_ledger is None:
+            return None
+        return self._resource_ledger.status
+
+    def get_memory_status(self):
+        """
+        Returns how much data is held in memory and spilled to disk by the
+        in-memory drops of this Node Manager, or ``None`` if there is no DLM.
+        """
+        if self._dlm is None:
+            return None
+        return self._dlm.getMemoryStatus()
+
     def trigger_drops(self, sessionId, uids):
         self._check_session_id(sessionId)
         t = threading.Thread(target=self._sessions[sessionId].trigger_drops,
@@ -273,7 +431,14 @@ class NodeManagerBase(DROPManager):
             # TODO: we also have to unsubscribe from them at some point
             self.subscribe(host, events_port)
 
-    def get_drop_attribute(self, hostname, port, session_id, uid, name):
+    def get_drop_attribute(self, hostname, port, session_id, uid, name, is_method=None):
+        """
+        Returns the attribute ``name`` of the remote drop ``uid``, which lives
+        in the node manager at ``hostname``:``port``. If the attribute is a
+        method a callable is returned that forwards its invocations to the
+        remote drop. Callers that already know whether ``name`` is a method or
+        not can indicate so via ``is_method``, saving one round trip.
+        """
 
         logger.debug("Getting attribute %s for drop %s of session %s at %s:%d", name, uid, session_id, hostname, port)
 
@@ -287,12 +452,11 @@ class NodeManagerBase(DROPManager):
             def __call__(self, *args):
                 return client.call_drop(session_id, uid, name, *args)
 
-        # Shortcut to avoid extra calls
-        known_methods = ()
-        #known_methods = ('open', 'read', 'write', 'close')
         closeit = False
         try:
-            if name in known_methods or client.has_method(session_id, uid, name):
+            if is_method is None:
+                is_method = client.has_method(session_id, uid, name)
+            if is_method:
                 return remote_method()
             closeit = True
             return client.get_drop_property(session_id, uid, name)
@@ -300,6 +464,22 @@ class NodeManagerBase(DROPManager):
             if closeit:
                 closer()
 
+    def get_drop_attributes(self, hostname, port, session_id, uids, names):
+        """
+        Returns the properties ``names`` of the remote drops ``uids``, which
+        live in the node manager at ``hostname``:``port``, in a single round
+        trip. The result is a dictionary indexed by drop UID, each value being
+        a dictionary with the values of the requested properties.
+        """
+
+        logger.debug("Getting attributes %r for drops %r of session %s at %s:%d", names, uids, session_id, hostname, port)
+
+        client, closer = self.get_rpc_client(hostname, port)
+        try:
+            return client.get_drop_properties(session_id, uids, names)
+        finally:
+            closer()
+
     def has_method(self, sessionId, uid, mname):
         self._check_session_id(sessionId)
         return self._sessions[sessionId].has_method(uid, mname)
@@ -308,6 +488,10 @@ class NodeManagerBase(DROPManager):
         self._check_session_id(sessionId)
         return self._sessions[sessionId].get_drop_property(uuid, prop_name)
 
+    def get_drop_properties(self, sessionId, uids, prop_names):
+        self._check_session_id(sessionId)
+        return self._sessions[sessionId].get_drop_properties(uids, prop_names)
+
     def call_drop(self, sessionId, uid, method, *args):
         self._check_session_id(sessionId)
         return self._sessions[sessionId].call_drop(uid, method, *args)
@@ -321,6 +505,57 @@ def zmq_safe(host_or_addr):
     # Return otherwise always an IP address
     return socket.gethostbyname(host_or_addr)
 
+# Node Managers running on the same host communicate through IPC endpoints
+# instead of going through the TCP stack. This can be switched off by setting
+# DALIUGE_IPC=0 in the environment
+use_ipc = os.environ.get('DALIUGE_IPC', '1') == '1' and hasattr(socket, 'AF_UNIX')
+
+def ipc_endpoint(kind, port):
+    """
+    Returns the ZeroMQ IPC endpoint through which the Node Manager listening on
+    ``port`` for ``kind`` (i.e., events or rpc) communications in this host
+    can also be reached.
+    """
+    fname = os.path.join(tempfile.gettempdir(), 'dfms-%s-%d' % (kind, port))
+    return "ipc://%s" % (fname,)
+
+def _ipc_endpoint_is_live(endpoint):
+    # ZeroMQ IPC endpoints are UNIX stream sockets. A file left behind by a
+    # dead Node Manager refuses connections, while connecting to a live one
+    # succeeds straight away
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # @UndefinedVariable
+    s.settimeout(1)
+    try:
+        s.connect(endpoint[len('ipc://'):])
+        return True
+    except socket.error:
+        return False
+    finally:
+        s.close()
+
+def remove_ipc_endpoint(kind, port):
+    """
+    Removes the socket file of the IPC endpoint for ``kind`` communications
+    of the Node Manager listening on ``port``, if any.
+    """
+    try:
+        os.unlink(ipc_endpoint(kind, port)[len('ipc://'):])
+    except OSError:
+        pass
+
+def connect_endpoint(kind, host, port):
+    """
+    Returns the ZeroMQ endpoint that should be used to connect to the Node
+    Manager listening on ``host``:``port`` for ``kind`` communications. If the
+    Node Manager runs on this same host and is actively listening on an IPC
+    endpoint then that endpoint is used; otherwise a TCP endpoint is returned.
+    """
+    if use_ipc and utils.is_local_host(host):
+        endpoint = ipc_endpoint(kind, port)
+        if os.path.exists(endpoint[len('ipc://'):]) and _ipc_endpoint_is_live(endpoint):
+            return endpoint
+    return "tcp://%s:%d" % (host, port)
+
 class BaseMixIn(object):
     def start(self):
         self._running = True
@@ -374,14 +609,16 @@ class ZMQPubSubMixIn(BaseMixIn):
         self._zmqsubthread.join()
         self._zmqctx.destroy()
         logger.info("ZMQ context used for event pub/sub destroyed")
+        if use_ipc:
+            remove_ipc_endpoint('events', self._events_port)
 
-    def publish_event(self, evt):
-        self._pubevts.put(evt)
+    def publish_event(self, evt, topic=drop_events_topic):
+        self._pubevts.put((topic, evt))
 
     def subscribe(self, host, port):
         timeout = 5
         finished_evt = threading.Event()
-        endpoint = "tcp://%s:%d" % (host, port)
+        endpoint = connect_endpoint('events', host, port)
         self._subscriptions.put(ZMQPubSubMixIn.subscription(endpoint, finished_evt))
         if not finished_evt.wait(timeout):
             raise DaliugeException("ZMQ subscription not achieved within %d seconds" % (timeout,))
@@ -390,24 +627,39 @@ class ZMQPubSubMixIn(BaseMixIn):
     def _zmq_pub_thread(self, sock_created):
         import zmq
 
-        pub = self._zmqctx.socket(zmq.PUB)  # @UndefinedVariable
+        # An XPUB socket lets us know when someone subscribes to our status
+        pub = self._zmqctx.socket(zmq.XPUB)  # @UndefinedVariable
         pub.set_hwm(0) # Never drop messages that should be sent
         endpoint = "tcp://%s:%d" % (zmq_safe(self._host), self._events_port)
         pub.bind(endpoint)
         logger.info("Listening for events via ZeroMQ on %s", endpoint)
+        if use_ipc:
+            endpoint = ipc_endpoint('events', self._events_port)
+            pub.bind(endpoint)
+            logger.info("Listening for events via ZeroMQ on %s", endpoint)
         sock_created.set()
 
         while self._running:
 
+            # The first subscription to a topic and the last unsubscription
+            # are reported to us
             try:
-                obj = self._pubevts.get_nowait()
+                msg = pub.recv(flags = zmq.NOBLOCK)  # @UndefinedVariable
+                if msg[1:] == status_topic:
+                    self.push_status_requested(msg[:1] == b'\x01')
+            except zmq.error.Again:
+                pass
+
+            try:
+                topic, obj = self._pubevts.get_nowait()
             except Queue.Empty:
                 time.sleep(0.01)
                 continue
 
+            msg = [topic, pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)]
             while self._running:
                 try:
-                    pub.send_pyobj(obj, flags = zmq.NOBLOCK)  # @UndefinedVariable
+                    pub.send_multipart(msg, flags = zmq.NOBLOCK)  # @UndefinedVariable
                     break
                 except zmq.error.Again:
                     logger.debug("Got an 'Again' when publishing event")
@@ -426,7 +678,7 @@ class ZMQPubSubMixIn(BaseMixIn):
         import zmq
 
         sub = self._zmqctx.socket(zmq.SUB)  # @UndefinedVariable
-        sub.setsockopt(zmq.SUBSCRIBE, six.b(''))  # @UndefinedVariable
+        sub.setsockopt(zmq.SUBSCRIBE, drop_events_topic)  # @UndefinedVariable
         sock_created.set()
 
         while self._running:
@@ -440,8 +692,8 @@ class ZMQPubSubMixIn(BaseMixIn):
                 pass
 
             try:
-                evt = sub.recv_pyobj(flags = zmq.NOBLOCK)  # @UndefinedVariable
-                self._recvevts.put(evt)
+                _, msg = sub.recv_multipart(flags = zmq.NOBLOCK)  # @UndefinedVariable
+                self._recvevts.put(pickle.loads(msg))
             except zmq.error.Again:
                 time.sleep(0.01)
             except Exception:
@@ -452,7 +704,11 @@ class ZMQPubSubMixIn(BaseMixIn):
 class ZeroRPCMixIn(BaseMixIn):
 
     request = collections.namedtuple('request', 'method args queue')
-    response = collections.namedtuple('response', 'async_result queue')
+    response = collections.namedtuple('response', 'value is_exception')
+
+    # Maximum number of requests that can be simultaneously in flight
+    # towards a single remote endpoint
+    max_inflight_requests = 64
 
     def start(self):
         super(ZeroRPCMixIn, self).start()
@@ -487,6 +743,10 @@ class ZeroRPCMixIn(BaseMixIn):
         endpoint = "tcp://%s:%d" % (zmq_safe(host), port,)
         self._zrpcserver.bind(endpoint)
         logger.info("Listening for RPC requests via ZeroRPC on %s", endpoint)
+        if use_ipc:
+            endpoint = ipc_endpoint('rpc', port)
+            self._zrpcserver.bind(endpoint)
+            logger.info("Listening for RPC requests via ZeroRPC on %s", endpoint)
         server_started.set()
 
         runner = gevent.spawn(self._zrpcserver.run)
@@ -505,6 +765,8 @@ class ZeroRPCMixIn(BaseMixIn):
         super(ZeroRPCMixIn, self).shutdown()
         for t in [self._zrpcserverthread] + self._zrpcclientthreads:
             t.join()
+        if use_ipc:
+            remove_ipc_endpoint('rpc', self._rpc_port)
 
     def get_client_for_endpoint(self, host, port):
 
@@ -528,11 +790,16 @@ class ZeroRPCMixIn(BaseMixIn):
                 def __make_call(self, method, *args):
                     res_queue = Queue.Queue()
                     req_queue.put(ZeroRPCMixIn.request(method, args, res_queue))
-                    return res_queue.get()
+                    res = res_queue.get()
+                    if res.is_exception:
+                        raise res.value
+                    return res.value
                 def call_drop(self, session_id, uid, name, *args):
                     return self.__make_call('call_drop', session_id, uid, name, *args)
                 def get_drop_property(self, session_id, uid, name):
                     return self.__make_call('get_drop_property', session_id, uid, name)
+                def get_drop_properties(self, session_id, uids, names):
+                    return self.__make_call('get_drop_properties', session_id, uids, names)
                 def has_method(self, session_id, uid, name):
                     return self.__make_call('has_method', session_id, uid, name)
 
@@ -549,7 +816,9 @@ class ZeroRPCMixIn(BaseMixIn):
         # and generates the same channel IDs, confusing the server
         import zerorpc
         ctx = zerorpc.Context()
-        client = zerorpc.Client("tcp://%s:%d" % (host,port), context=ctx)
+        endpoint = connect_endpoint('rpc', host, port)
+        client = zerorpc.Client(endpoint, context=ctx)
+        logger.info("Connected ZeroRPC client to %s", endpoint)
 
         forwarder = gevent.spawn(self.forward_requests, req_queue, client)
         gevent.joinall([forwarder])
@@ -560,16 +829,31 @@ class ZeroRPCMixIn(BaseMixIn):
 
     def forward_requests(self, req_queue, client):
         import gevent
+        import gevent.pool
+
+        # All requests waiting on the queue are sent before yielding, so
+        # requests coming from different threads are pipelined through the
+        # same client instead of waiting for each other. The pool caps the
+        # number of requests in flight, blocking us when it's full.
+        pool = gevent.pool.Pool(self.max_inflight_requests)
         while self._running:
             try:
-                req = req_queue.get_nowait()
-                gevent.spawn(self.queue_request, client, req)
+                while True:
+                    req = req_queue.get_nowait()
+                    pool.spawn(self.queue_request, client, req)
             except Queue.Empty:
                 gevent.sleep(0.005)
 
     def queue_request(self, client, req):
-        async_result = client.__call__(req.method, *req.args, async=True)
-        async_result.rawlink(lambda x: req.queue.put(x.value))
+        # "async" is a reserved keyword in newer python versions
+        async_result = client.__call__(req.method, *req.args, **{'async': True})
+        async_result.rawlink(lambda x: req.queue.put(self._to_response(x)))
+        async_result.wait()
+
+    def _to_response(self, async_result):
+        if async_result.successful():
+            return ZeroRPCMixIn.response(async_result.value, False)
+        return ZeroRPCMixIn.response(async_result.exception, True)
 
     def get_rpc_client(self, hostname, port):
         client = self.get_client_for_endpoint(hostname, port)
@@ -590,6 +874,8 @@ class RPyCMixIn(BaseMixIn): # pragma: no cover
                 return nm.call_drop(session_id, uid, name, *args)
             def exposed_get_drop_property(self, session_id, uid, name):
                 return nm.get_drop_attribute(session_id, uid, name)
+            def exposed_get_drop_properties(self, session_id, uids, names):
+                return nm.get_drop_properties(session_id, uids, names)
             def exposed_has_method(self, session_id, uid, name):
                 return nm.has_method(session_id, uid, name)
 
@@ -0,0 +1,164 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Module containing the resource ledger used by Node Managers to decide when
+applications can be executed based on the resources they declare.
+"""
+
+import collections
+import logging
+import multiprocessing
+import tempfile
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# The resources accounted for by the ledger. Memory and scratch disk space are
+# expressed in MB
+RESOURCES = ('num_cpus', 'memory', 'scratch')
+
+def detect_resources(scratch_dir=None):
+    """
+    Returns a dictionary with the total amount of each resource found in this
+    node. Scratch space is measured as the free space in ``scratch_dir``,
+    which defaults to the temporary directory.
+    """
+    import psutil
+    scratch_dir = scratch_dir or tempfile.gettempdir()
+    mb = 1024. * 1024.
+    return {'num_cpus': multiprocessing.cpu_count(),
+            'memory': psutil.virtual_memory().total / mb,
+            'scratch': psutil.disk_usage(scratch_dir).free / mb}
+
+class ResourceLedger(object):
+    """
+    Keeps track of the resources (cores, memory and scratch disk space) of a
+    node that are currently reserved by running applications.
+
+    Applications ask to be admitted via `admit`, declaring the resources they
+    need and a callback that will be invoked once those resources have been
+    reserved for them, either immediately or when enough resources are freed
+    by other applications via `release`. Applications waiting for resources
+    are queued and admitted in order of arrival; an application further back
+    in the queue is admitted before those in front of it only if they don't
+    fit but it does.
+
+    Applications declaring more of a resource than the node's total are
+    reduced to the total, so they eventually run (alone) instead of waiting
+    forever.
+    """
+
+    def __init__(self, totals=None):
+        detected = None
+        self._totals = {}
+        for res in RESOURCES:
+            total = (totals or {}).get(res, None)
+            if not total:
+                if detected is None:
+                    detected = detect_resources()
+                total = detected[res]
+            self._totals[res] = total
+
+        self._used = {res: 0 for res in RESOURCES}
+        self._waiting = collections.deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        logger.info("Resource ledger created with totals %r", self._totals)
+
+    def _normalize(self, needs):
+        normalized = {}
+        for res in RESOURCES:
+            need = needs.get(res, 0) or 0
+            if need > self._totals[res]:
+                logger.warning("%s requirement of %r exceeds the node's total (%r), using the total instead", res, need, self._totals[res])
+                need = self._totals[res]
+            normalized[res] = need
+        return normalized
+
+    def _fits(self, needs):
+        return all(self._used[res] + needs[res] <= self._totals[res] for res in RESOURCES)
+
+    def _reserve(self, needs):
+        for res in RESOURCES:
+            self._used[res] += needs[res]
+        self._running += 1
+
+    def admit(self, needs, callback):
+        """
+        Reserves the resources in ``needs`` and invokes ``callback``. If the
+        resources are not currently available the request is queued, and
+        ``callback`` is invoked later from the thread that frees enough
+        resources. In both cases the caller must eventually invoke `release`
+        with the same ``needs``.
+        """
+        needs = self._normalize(needs)
+        with self._lock:
+            admitted = not self._waiting and self._fits(needs)
+            if admitted:
+                self._reserve(needs)
+            else:
+                self._waiting.append((needs, callback))
+                logger.debug("Queueing application with needs %r, %d waiting", needs, len(self._waiting))
+        if admitted:
+            callback()
+
+    def release(self, needs):
+        """
+        Frees the resources in ``needs``, admitting as many waiting
+        applications as the freed resources allow.
+        """
+        needs = self._normalize(needs)
+        to_start = []
+        with self._lock:
+            self._running -= 1
+            for res in RESOURCES:
+                self._used[res] = max(0, self._used[res] - needs[res])
+                # Avoid accumulating rounding errors
+                if not self._running:
+                    self._used[res] = 0
+
+            still_waiting = collections.deque()
+            while self._waiting:
+                waiting_needs, callback = self._waiting.popleft()
+                if self._fits(waiting_needs):
+                    self._reserve(waiting_needs)
+                    to_start.append(callback)
+                else:
+                    still_waiting.append((waiting_needs, callback))
+            self._waiting = still_waiting
+
+        for callback in to_start:
+            callback()
+
+    @property
+    def status(self):
+        """
+        A dictionary with the total, used and free amounts of each resource,
+        plus the number of running and queued applications.
+        """
+        with self._lock:
+            return {'total': dict(self._totals),
+                    'used': dict(self._used),
+                    'free': {res: self._totals[res] - self._used[res] for res in RESOURCES},
+                    'running': self._running,
+                    'queued': len(self._waiting)}
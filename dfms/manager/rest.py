@@ -27,17 +27,20 @@ Data Managers (DROPManager and DataIslandManager) to the outside world.
 import functools
 import json
 import logging
+import time
+import zlib
 
 import bottle
 import pkg_resources
 
 from dfms import utils
-from dfms.exceptions import InvalidGraphException, InvalidSessionState, \
-    DaliugeException, NoSessionException, SessionAlreadyExistsException, \
-    InvalidDropException, InvalidRelationshipException, SubManagerException
-from dfms.manager import constants
+from dfms.exceptions import NoSessionException
+from dfms.manager import constants, fanout
 from dfms.manager.client import NodeManagerClient
-from dfms.restutils import RestServer, RestClient, RestClientException
+from dfms.manager.session import SessionStates
+from dfms.manager.status import StatusPoller, to_graph_status
+from dfms.restutils import RestServer, RestClient, encode_exception, \
+    content_encodings
 
 
 logger = logging.getLogger(__name__)
@@ -46,6 +49,92 @@ def file_as_string(fname, enc='utf8'):
     b = pkg_resources.resource_string(__name__, fname) # @UndefinedVariable
     return utils.b2s(b, enc)
 
+# Results with at least this many members are streamed
+stream_threshold = 1000
+
+def _iter_json(res, bufsize=65536):
+    # Dumps the members of a dictionary or list one by one, yielding them in
+    # blocks of roughly bufsize bytes
+    if isinstance(res, dict):
+        start, end = b'{', b'}'
+        members = (json.dumps({k: v})[1:-1] for k, v in res.items())
+    else:
+        start, end = b'[', b']'
+        members = (json.dumps(x) for x in res)
+
+    buf, buflen = [start], 1
+    for i, member in enumerate(members):
+        member = (',' + member if i else member).encode('utf8')
+        buf.append(member)
+        buflen += len(member)
+        if buflen >= bufsize:
+            yield b''.join(buf)
+            buf, buflen = [], 0
+    buf.append(end)
+    yield b''.join(buf)
+
+def _compress(blocks, wbits):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, wbits)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _accepted_encoding():
+    accepted = bottle.request.headers.get('Accept-Encoding', '')
+    accepted = [x.split(';')[0].strip().lower() for x in accepted.split(',')]
+    for encoding in content_encodings:
+        if encoding in accepted:
+            return encoding
+    return None
+
+def json_response(res):
+    """
+    Returns the JSON representation of `res` as the body of the current
+    response. Big dictionaries and lists are streamed member by member instead
+    of being dumped all at once, and are compressed if the client accepts it.
+    """
+    if not isinstance(res, (dict, list)) or len(res) < stream_threshold:
+        return json.dumps(res)
+
+    body = _iter_json(res)
+    encoding = _accepted_encoding()
+    if encoding:
+        bottle.response.set_header('Content-Encoding', encoding)
+        body = _compress(body, content_encodings[encoding])
+    return body
+
+def _event_id(tracker, version):
+    # Event IDs identify the tracker they come from, so streams can only be
+    # resumed from versions of that same tracker
+    return '%s-%d' % (tracker.epoch, version)
+
+def _resume_version(tracker, event_id):
+    if not event_id:
+        return 0
+    epoch, _, version = event_id.rpartition('-')
+    if epoch != tracker.epoch or not version.isdigit() or int(version) > tracker.version:
+        return 0
+    return int(version)
+
+def _format_events(event_id, changes, sse):
+    drops = json.dumps(to_graph_status(changes))
+    if sse:
+        return ('id: %s\nevent: status\ndata: %s\n\n' % (event_id, drops)).encode('utf8')
+    return ('{"version": "%s", "drops": %s}\n' % (event_id, drops)).encode('utf8')
+
+def _format_finished(sse):
+    if sse:
+        return b'event: finished\ndata: {}\n\n'
+    return b'{"finished": true}\n'
+
+def _all_finished(status):
+    # Composite managers return the status of the session in each sub-DM
+    if isinstance(status, dict):
+        return all(_all_finished(s) for s in status.values())
+    return status == SessionStates.FINISHED
+
 def daliuge_aware(func):
 
     @functools.wraps(func)
@@ -54,39 +143,14 @@ def daliuge_aware(func):
             res = func(*args, **kwargs)
             if res is not None:
                 bottle.response.content_type = 'application/json'
-                return json.dumps(res)
+                return json_response(res)
         except Exception as e:
             logger.exception("Error while fulfilling request")
 
-            status, eargs = 500, ()
-            if isinstance(e, NotImplementedError):
-                status, eargs = 501, e.args
-            elif isinstance(e, NoSessionException):
-                status, eargs = 404, (e._session_id,)
-            elif isinstance(e, SessionAlreadyExistsException):
-                status, eargs = 409, (e._session_id,)
-            elif isinstance(e, InvalidDropException):
-                status, eargs = 409, ((e.oid, e.uid), e.reason)
-            elif isinstance(e, InvalidRelationshipException):
-                status, eargs = 409, (e.rel, e.reason)
-            elif isinstance(e, InvalidGraphException):
-                status, eargs = 400, e.args
-            elif isinstance(e, InvalidSessionState):
-                status, eargs = 400, e.args
-            elif isinstance(e, RestClientException):
-                status, eargs = 556, e.args
-            elif isinstance(e, SubManagerException):
-                status = 555
-                eargs = {}
-                # args[1] is a dictionary of host:exception
-                for host,subex in e.args[1].items():
-                    eargs[host] = {'type': subex.__class__.__name__, 'args': subex.args}
-            elif isinstance(e, DaliugeException):
-                status, eargs = 555, e.args
-            else:
+            status, error = encode_exception(e)
+            if status is None:
                 raise
 
-            error = {'type': e.__class__.__name__, 'args': eargs}
             bottle.response.status = status
             return json.dumps(error)
 
@@ -102,14 +166,32 @@ class ManagerRestServer(RestServer):
     (i.e. those not under /api).
     """
 
-    def __init__(self, dm, maxreqsize=10):
+    # The maximum number of concurrent invocations of heavy endpoints when
+    # serving requests with a bounded pool of workers, so they cannot take
+    # all of them
+    default_endpoint_limits = {'getGraph': 2, 'getGraphStatus': 4, 'addGraphParts': 2}
+
+    # How long event streams wait for changes before checking if the session
+    # finished, after how long idle streams send something to the client, and
+    # after how long streams are ended so they don't hold on to a server
+    # thread forever (clients then resume them)
+    events_period = 1
+    events_keepalive = 15
+    events_max_duration = 120
 
-        super(ManagerRestServer, self).__init__()
+    def __init__(self, dm, maxreqsize=10, max_workers=None, endpoint_limits=None):
+
+        super(ManagerRestServer, self).__init__(max_workers=max_workers)
 
         # Increase maximum file sizes
         bottle.BaseRequest.MEMFILE_MAX = maxreqsize * 1024 * 1024
 
         self.dm = dm
+        self._status_poller = StatusPoller(dm, self.events_period)
+        if endpoint_limits is None and max_workers:
+            endpoint_limits = self.default_endpoint_limits
+        for name, n in (endpoint_limits or {}).items():
+            setattr(self, name, self.limit_concurrency(getattr(self, name), n))
 
         # Mappings
         app = self.app
@@ -122,6 +204,7 @@ class ManagerRestServer(RestServer):
         app.get(   '/api/sessions/<sessionId>/graph',        callback=self.getGraph)
         app.get(   '/api/sessions/<sessionId>/graph/size',   callback=self.getGraphSize)
         app.get(   '/api/sessions/<sessionId>/graph/status', callback=self.getGraphStatus)
+        app.get(   '/api/sessions/<sessionId>/events',       callback=self.getSessionEvents)
         app.post(  '/api/sessions/<sessionId>/graph/append', callback=self.addGraphParts)
 
         # The non-REST mappings that serve HTML-related content
@@ -187,6 +270,88 @@ class ManagerRestServer(RestServer):
     def getGraphStatus(self, sessionId):
         return self.dm.getGraphStatus(sessionId)
 
+    def getSessionEvents(self, sessionId):
+        """
+        Streams the changes in the status of the drops of session `sessionId`
+        until the session finishes. Each message carries the status of the
+        drops that changed since the previous one (the first one carries all
+        drops), in the same format used by getGraphStatus, and a version
+        identifier. A final message signals that the session finished;
+        streams ending without it were cut by the server, and clients can
+        resume them from the version of the last message they received via
+        the ``since`` parameter, or the ``Last-Event-ID`` header. Versions not
+        issued by the current tracker of the session give all drops again.
+
+        Messages are sent as server-sent events if the client accepts them,
+        otherwise as JSON objects in separate lines.
+        """
+        try:
+            tracker = self.dm.getStatusTracker(sessionId)
+        except Exception as e:
+            logger.exception("Error while fulfilling request")
+            status, error = encode_exception(e)
+            if status is None:
+                raise
+            bottle.response.status = status
+            bottle.response.content_type = 'application/json'
+            return json.dumps(error)
+
+        since = bottle.request.params.get('since') or bottle.request.headers.get('Last-Event-ID')
+        sse = 'text/event-stream' in bottle.request.headers.get('Accept', '')
+        bottle.response.content_type = 'text/event-stream' if sse else 'application/x-ndjson'
+        bottle.response.set_header('Cache-Control', 'no-cache')
+        return self._session_events(sessionId, tracker, since, sse)
+
+    def _session_events(self, sessionId, tracker, since, sse):
+
+        # Managers that don't keep track of the status of their drops are
+        # polled instead, once for all the streams following the session
+        polled = tracker is None
+        if polled:
+            tracker = self._status_poller.subscribe(sessionId)
+
+        try:
+            version = _resume_version(tracker, since)
+            start = time.time()
+            idle = 0
+            while True:
+                new_version, changes = tracker.wait_for_changes(version, self.events_period)
+                if changes:
+                    yield _format_events(_event_id(tracker, new_version), changes, sse)
+                    version, idle = new_version, 0
+
+                elif self._session_finished(sessionId, polled):
+                    # Changes could have happened right before finishing
+                    new_version, changes = tracker.changes_since(version)
+                    if changes:
+                        yield _format_events(_event_id(tracker, new_version), changes, sse)
+                    yield _format_finished(sse)
+                    break
+
+                else:
+                    idle += self.events_period
+                    if idle >= self.events_keepalive:
+                        yield b': keepalive\n\n' if sse else b'\n'
+                        idle = 0
+
+                if time.time() - start >= self.events_max_duration:
+                    break
+        finally:
+            if polled:
+                self._status_poller.unsubscribe(sessionId)
+
+    def _session_finished(self, sessionId, polled=False):
+        # Streams are closed also on errors; clients can resume them later
+        try:
+            if polled:
+                return _all_finished(self._status_poller.session_status(sessionId))
+            return _all_finished(self.dm.getSessionStatus(sessionId))
+        except NoSessionException:
+            return True
+        except Exception:
+            logger.exception("Error while checking the status of session %s", sessionId)
+            return True
+
     # TODO: addGraphParts v/s addGraphSpec
     @daliuge_aware
     def addGraphParts(self, sessionId):
@@ -237,6 +402,7 @@ class NMRestServer(ManagerRestServer):
         app.post(  '/api/sessions/<sessionId>/graph/link',    callback=self.linkGraphParts)
         app.post(  '/api/sessions/<sessionId>/subscriptions', callback=self.add_node_subscriptions)
         app.post(  '/api/sessions/<sessionId>/trigger',       callback=self.trigger_drops)
+        app.post(  '/api/relay',                              callback=self.relay)
         # The non-REST mappings that serve HTML-related content
         app.get(   '/', callback=self.visualizeDM)
         app.get(   '/api/shutdown',                            callback=self.shutdown_node_manager)
@@ -247,9 +413,16 @@ class NMRestServer(ManagerRestServer):
 
     @daliuge_aware
     def getNMStatus(self):
-        # we currently return the sessionIds, more things might be added in the
-        # future
-        return {'sessions': self.sessions()}
+        # we currently return the sessionIds, the status of the resources
+        # ledger and the memory usage, more things might be added in the future
+        status = {'sessions': self.sessions()}
+        resources = self.dm.get_resource_status()
+        if resources is not None:
+            status['resources'] = resources
+        memory = self.dm.get_memory_status()
+        if memory is not None:
+            status['memory'] = memory
+        return status
 
     @daliuge_aware
     def linkGraphParts(self, sessionId):
@@ -273,6 +446,15 @@ class NMRestServer(ManagerRestServer):
             return
         self.dm.trigger_drops(sessionId, bottle.request.json)
 
+    @daliuge_aware
+    def relay(self):
+        if bottle.request.content_type != 'application/json':
+            bottle.response.status = 415
+            return
+        req = bottle.request.json
+        return fanout.relay(self.dm, req['host'], req['method'], req['args'],
+                            req['hosts'], req['port'], req['fanout'])
+
     #===========================================================================
     # non-REST methods
     #===========================================================================
@@ -26,17 +26,20 @@ Module containing the logic of a session -- a given graph execution
 import collections
 import inspect
 import logging
+import os
 import threading
 
 from luigi import scheduler, worker
+import six.moves.urllib.parse as urlparse  # @UnresolvedImport
 
-from dfms import droputils
+from dfms import droputils, utils
 from dfms import luigi_int, graph_loader
 from dfms.ddap_protocol import DROPStates, DROPLinkType, DROPRel
 from dfms.drop import AbstractDROP, AppDROP, InputFiredAppDROP, \
     LINKTYPE_1TON_APPEND_METHOD, LINKTYPE_1TON_BACK_APPEND_METHOD
 from dfms.exceptions import InvalidSessionState, InvalidGraphException, \
     NoDropException, DaliugeException
+from dfms.io import FileIO, OpenMode
 from dfms.manager import constants
 
 
@@ -65,24 +68,91 @@ class DropProxy(object):
 
     It forwards attribute requests through the given Node Manager.
     It also forwards procedure calls through the Node Manager.
+
+    Attributes that never change during the lifetime of a drop are fetched
+    from the remote drop in a single batch the first time one of them is
+    requested, and are served locally afterwards. The proxy also remembers
+    which of the attributes requested so far are methods, so it doesn't need
+    to ask the remote side about it more than once.
+
+    When the remote drop lives in this same host and its data is stored in a
+    file, its contents are read directly from the file instead of being
+    transferred through RPC calls. The remote drop is still opened and closed
+    so its reference counting and events work as usual.
     """
 
+    immutable_attributes = ('oid', 'uid', 'dataURL', 'node', 'dataIsland')
+
     def __init__(self, nm, hostname, port, sessionId, uid):
         self.nm = nm
         self.hostname = hostname
         self.port = port
         self.session_id = sessionId
         self.uid = uid
+        self._is_method = {}
+        self._immutables_fetched = False
+        self._local_ios = {}
 
     def handleEvent(self, evt):
         pass
 
+    def _fetch_immutable_attributes(self):
+        attrs = self.nm.get_drop_attributes(self.hostname, self.port,
+                                            self.session_id, [self.uid],
+                                            DropProxy.immutable_attributes)
+        self.__dict__.update(attrs.get(self.uid, {}))
+        self._immutables_fetched = True
+
     def __getattr__(self, name):
         if name == 'uid':
             return self.uid
         elif name in ('inputs', 'streamingInputs', 'outputs', 'consumers', 'producers'):
             return []
-        return self.nm.get_drop_attribute(self.hostname, self.port, self.session_id, self.uid, name)
+
+        # Avoid recursion if our internal attributes are missing for whatever
+        # reason (e.g., while unpickling)
+        if name in ('_is_method', '_immutables_fetched', '_local_ios'):
+            raise AttributeError(name)
+
+        if name in DropProxy.immutable_attributes and not self._immutables_fetched:
+            self._fetch_immutable_attributes()
+            if name in self.__dict__:
+                return self.__dict__[name]
+
+        attr = self.nm.get_drop_attribute(self.hostname, self.port,
+                                          self.session_id, self.uid, name,
+                                          is_method=self._is_method.get(name, None))
+        self._is_method[name] = callable(attr)
+        return attr
+
+    def _local_path(self):
+        if not utils.is_local_host(self.hostname):
+            return None
+        url = urlparse.urlparse(self.dataURL)
+        if url.scheme != 'file' or not os.path.isfile(url.path):
+            return None
+        return url.path
+
+    def open(self, **kwargs):
+        descriptor = self.__getattr__('open')()
+        path = self._local_path()
+        if path is not None:
+            logger.debug("Reading %r directly from %s", self, path)
+            io = FileIO(path)
+            io.open(OpenMode.OPEN_READ, **kwargs)
+            self._local_ios[descriptor] = io
+        return descriptor
+
+    def read(self, descriptor, count=4096, **kwargs):
+        if descriptor in self._local_ios:
+            return self._local_ios[descriptor].read(count, **kwargs)
+        return self.__getattr__('read')(descriptor, count)
+
+    def close(self, descriptor, **kwargs):
+        io = self._local_ios.pop(descriptor, None)
+        if io is not None:
+            io.close(**kwargs)
+        self.__getattr__('close')(descriptor)
 
     def __repr__(self, *args, **kwargs):
         return '<DropProxy %s, session %s @%s:%d>' % (self.uid, self.session_id, self.hostname, self.port)
@@ -182,8 +252,9 @@ class Session(object):
 
         self.status = SessionStates.BUILDING
 
-        # This will check the consistency of each dropSpec
-        graphSpecDict = graph_loader.loadDropSpecs(graphSpec)
+        # This will check the consistency of each dropSpec. Graphs can be
+        # appended in several parts, so they can point to previous parts
+        graphSpecDict = graph_loader.loadDropSpecs(graphSpec, existing=self._graph)
 
         # Check for duplicates
         duplicates = set(graphSpecDict) & set(self._graph)
@@ -404,15 +475,29 @@ class Session(object):
         statusDict = collections.defaultdict(dict)
         for drop, downStreamDrops in droputils.breadFirstTraverse(self._roots):
             downStreamDrops[:] = [dsDrop for dsDrop in downStreamDrops if isinstance(dsDrop, AbstractDROP)]
+            # Drops moved by the DLM are represented by their new instance
+            current = self._drops.get(drop.uid, drop)
             if isinstance(drop, AppDROP):
-                statusDict[drop.oid]['execStatus'] = drop.execStatus
-            statusDict[drop.oid]['status'] = drop.status
+                statusDict[drop.oid]['execStatus'] = current.execStatus
+            statusDict[drop.oid]['status'] = current.status
 
         return statusDict
 
     def getGraph(self):
         return dict(self._graph)
 
+    def replaceDrop(self, drop, newDrop):
+        """
+        Makes `newDrop`, a new instance of `drop` (e.g., created when the DLM
+        moves `drop` into a different store), be the drop accessed through
+        the UID of `drop` from now on. Returns False if `drop` doesn't belong
+        to this session.
+        """
+        if self._drops.get(drop.uid) is not drop:
+            return False
+        self._drops[drop.uid] = newDrop
+        return True
+
     def destroy(self):
         pass
 
@@ -436,6 +521,28 @@ class Session(object):
         except AttributeError:
             raise DaliugeException("%r has no property called %s" % (drop, prop_name))
 
+    def get_drop_properties(self, uids, prop_names):
+        """
+        Returns the value of the properties ``prop_names`` for each of the
+        drops in ``uids`` as a dictionary of dictionaries, indexed by drop UID
+        and property name respectively. Properties that a drop doesn't have,
+        or that are methods, are not present in its dictionary.
+        """
+        props = {}
+        for uid in uids:
+            if uid not in self._drops:
+                raise NoDropException(uid)
+            drop = self._drops[uid]
+            props[uid] = drop_props = {}
+            for prop_name in prop_names:
+                try:
+                    value = getattr(drop, prop_name)
+                except AttributeError:
+                    continue
+                if not inspect.ismethod(value):
+                    drop_props[prop_name] = value
+        return props
+
     def call_drop(self, uid, method, *args):
         if uid not in self._drops:
             raise NoDropException(uid)
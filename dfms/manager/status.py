@@ -0,0 +1,510 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Module implementing the push-based propagation of drop status information up
+the DROP management hierarchy.
+
+Node Managers keep track of the status changes of the drops of each of their
+sessions using a `StatusTracker`, and periodically publish the latest changes
+as compact events through their event publishing channel, under their own
+topic. They do so only after somebody subscribes to that topic. Each event carries
+the version of the tracker it was built from, plus the version it builds on
+top of, so receivers can detect when they missed one. Full snapshots are sent
+every now and then so receivers can recover from such situations.
+
+Composite Managers subscribe to these events and keep an aggregated view of
+the status of each session in a `StatusAggregator`, answering status queries
+from there as long as the view is complete and up to date. Data Island
+Managers also republish the events they receive so Master Managers can
+aggregate them in turn.
+
+Managers whose status is not pushed to them are followed by a `StatusPoller`
+instead, which polls them once for all the clients following a session.
+"""
+
+import collections
+import logging
+import threading
+import time
+import uuid
+
+import six
+from six.moves import cPickle as pickle  # @UnresolvedImport
+from six.moves import queue as Queue  # @UnresolvedImport
+
+from dfms.event import Event
+from dfms.exceptions import NoSessionException
+from dfms.manager.session import SessionStates
+
+
+logger = logging.getLogger(__name__)
+
+# The type of the events carrying status information, and the topic under
+# which they are published
+status_event_type = 'graphStatusDelta'
+status_topic = six.b('status')
+
+def status_event(session_id, node, since, version, session_status, changes):
+    """
+    Creates a status event for session `session_id` in `node`. `changes` is a
+    dictionary with the (status, execStatus) of the drops that changed since
+    version `since` of the status tracker of the session (or all drops if
+    `since` is None), up to `version`.
+    """
+    evt = Event()
+    evt.type = status_event_type
+    evt.session_id = session_id
+    evt.node = node
+    evt.since = since
+    evt.version = version
+    evt.session_status = session_status
+    evt.changes = changes
+    return evt
+
+def to_graph_status(drops):
+    """
+    Converts a dictionary with (status, execStatus) values, as held by
+    `StatusTracker`, into the structure returned by `getGraphStatus`
+    """
+    graph_status = {}
+    for oid, (status, execStatus) in drops.items():
+        graph_status[oid] = {'status': status}
+        if execStatus is not None:
+            graph_status[oid]['execStatus'] = execStatus
+    return graph_status
+
+class StatusTracker(object):
+    """
+    Keeps track of the status and execution status of a set of drops, indexed
+    by OID. Each change increases the version of the tracker, and changes that
+    happened after a given version can be retrieved at any time.
+
+    Trackers are drop event listeners, and are usually subscribed to the
+    ``status`` and ``execStatus`` events of the drops they follow.
+
+    Versions are meaningful only for the tracker that issued them; each
+    tracker has a unique `epoch` with which they can be told apart.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._lock = threading.Condition()
+        self._version = 0
+        self._drops = {}
+        # OID -> version of its latest change, in order of change
+        self._changes = collections.OrderedDict()
+
+    @property
+    def version(self):
+        with self._lock:
+            return self._version
+
+    def add(self, drop):
+        self.update(drop.oid, drop.status, getattr(drop, 'execStatus', None))
+
+    def handleEvent(self, evt):
+        if evt.type == 'status':
+            self.update(evt.oid, status=evt.status)
+        elif evt.type == 'execStatus':
+            self.update(evt.oid, execStatus=evt.execStatus)
+
+    def update(self, oid, status=None, execStatus=None):
+        with self._lock:
+            self._update(oid, status, execStatus)
+
+    def merge(self, changes):
+        """
+        Applies `changes`, a dictionary of (status, execStatus) values
+        """
+        with self._lock:
+            for oid, (status, execStatus) in changes.items():
+                self._update(oid, status, execStatus)
+
+    def _update(self, oid, status, execStatus):
+        old = self._drops.get(oid, (None, None))
+        new = (old[0] if status is None else status,
+               old[1] if execStatus is None else execStatus)
+        if new == old:
+            return
+        self._drops[oid] = new
+        self._version += 1
+        self._changes.pop(oid, None)
+        self._changes[oid] = self._version
+        self._lock.notify_all()
+
+    def snapshot(self):
+        """
+        Returns the current version of this tracker and the status of all drops
+        """
+        with self._lock:
+            return self._version, dict(self._drops)
+
+    def changes_since(self, version):
+        """
+        Returns the current version of this tracker and the status of the
+        drops that changed after `version`
+        """
+        with self._lock:
+            return self._changes_since(version)
+
+    def wait_for_changes(self, version, timeout):
+        """
+        Like `changes_since`, but waits up to `timeout` seconds for changes to
+        happen after `version` if there are none yet
+        """
+        with self._lock:
+            if self._version <= version:
+                self._lock.wait(timeout)
+            return self._changes_since(version)
+
+    def _changes_since(self, version):
+        changes = {}
+        for oid in reversed(self._changes):
+            if self._changes[oid] <= version:
+                break
+            changes[oid] = self._drops[oid]
+        return self._version, changes
+
+class _NodeView(object):
+    """What we know about a session in a given node"""
+
+    def __init__(self, island):
+        self.island = island
+        self.version = None
+        self.session_status = None
+        self.updated = None
+        self.stale = False
+
+class _SessionView(object):
+    """The aggregated status of a session across nodes"""
+
+    def __init__(self):
+        self.tracker = StatusTracker()
+        self.nodes = {}
+
+class StatusAggregator(object):
+    """
+    Aggregates the status events published by a number of sub-DMs into a
+    single view per session.
+
+    The sub-DMs publish their events on `dm_events_port`. If `events_port` is
+    given, the received events are republished on that port, after being
+    tagged with the node they originated from and the nodes that are being
+    followed; this way an aggregator one level above can follow all nodes
+    through us. The information of each node is considered out of date if it
+    wasn't refreshed in `max_age` seconds, unless the session finished there.
+    """
+
+    max_age = 30
+
+    def __init__(self, dm_events_port, events_port=None):
+        self._dm_events_port = dm_events_port
+        self._events_port = events_port
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._island_nodes = {}
+        self._subscriptions = Queue.Queue()
+        self._hosts = []
+
+    def start(self):
+        import zmq
+        self._running = True
+        self._zmqctx = zmq.Context()
+        self._thread = threading.Thread(target=self._zmq_thread, name="Status aggregator")
+        self._thread.start()
+
+    def shutdown(self):
+        self._running = False
+        self._thread.join()
+        self._zmqctx.destroy(linger=0)
+        if self._events_port:
+            from dfms.manager.node_manager import remove_ipc_endpoint, use_ipc
+            if use_ipc:
+                remove_ipc_endpoint('events', self._events_port)
+
+    def subscribe(self, host):
+        """
+        Starts following the status events published by the DM at `host`
+        """
+        self._subscriptions.put(host)
+
+    def forget(self, sessionId):
+        """
+        Discards everything known about session `sessionId`
+        """
+        with self._lock:
+            self._sessions.pop(sessionId, None)
+
+    def tracker(self, sessionId):
+        """
+        Returns the `StatusTracker` with the aggregated status of the drops of
+        session `sessionId`
+        """
+        with self._lock:
+            view = self._sessions.get(sessionId)
+            if view is None:
+                view = self._sessions[sessionId] = _SessionView()
+            return view.tracker
+
+    def _zmq_thread(self):
+        import zmq
+        from dfms.manager.node_manager import connect_endpoint, ipc_endpoint, use_ipc
+
+        pub = None
+        if self._events_port:
+            pub = self._zmqctx.socket(zmq.PUB)  # @UndefinedVariable
+            endpoint = "tcp://*:%d" % (self._events_port,)
+            pub.bind(endpoint)
+            logger.info("Republishing status events via ZeroMQ on %s", endpoint)
+            if use_ipc:
+                endpoint = ipc_endpoint('events', self._events_port)
+                pub.bind(endpoint)
+                logger.info("Republishing status events via ZeroMQ on %s", endpoint)
+
+        poller = zmq.Poller()
+        hosts = {}
+        while self._running:
+
+            try:
+                while True:
+                    host = self._subscriptions.get_nowait()
+                    sub = self._zmqctx.socket(zmq.SUB)  # @UndefinedVariable
+                    sub.setsockopt(zmq.SUBSCRIBE, status_topic)  # @UndefinedVariable
+                    sub.connect(connect_endpoint('events', host, self._dm_events_port))
+                    poller.register(sub, zmq.POLLIN)  # @UndefinedVariable
+                    hosts[sub] = host
+                    self._hosts.append(host)
+            except Queue.Empty:
+                pass
+
+            if not hosts:
+                time.sleep(0.1)
+                continue
+
+            for sock, _ in poller.poll(100):
+                host = hosts[sock]
+                try:
+                    _, msg = sock.recv_multipart(flags=zmq.NOBLOCK)  # @UndefinedVariable
+                except zmq.error.Again:
+                    continue
+
+                evt = pickle.loads(msg)
+                if getattr(evt, 'type', None) != status_event_type:
+                    continue
+
+                try:
+                    self._apply(host, evt)
+                except Exception:
+                    logger.exception("Error while applying status event from %s", host)
+                    continue
+
+                if pub is not None:
+                    if getattr(evt, 'island_nodes', None) is None:
+                        evt.node = host
+                        evt.island_nodes = list(self._hosts)
+                    pub.send_multipart([status_topic, pickle.dumps(evt, pickle.HIGHEST_PROTOCOL)])
+
+    def _apply(self, host, evt):
+
+        # Events republished by a DIM say which node they come from, and which
+        # nodes that DIM is following
+        island, node = None, host
+        if getattr(evt, 'island_nodes', None) is not None:
+            island, node = host, evt.node
+
+        with self._lock:
+            if island is not None:
+                self._island_nodes[island] = evt.island_nodes
+
+            view = self._sessions.get(evt.session_id)
+            if view is None:
+                view = self._sessions[evt.session_id] = _SessionView()
+
+            nodeview = view.nodes.get(node)
+            if evt.since is None:
+                nodeview = view.nodes[node] = _NodeView(island)
+            elif nodeview is None or nodeview.stale or nodeview.version != evt.since:
+                if nodeview is not None and not nodeview.stale:
+                    logger.warning("Missed status events for session %s in %s, waiting for a snapshot", evt.session_id, node)
+                    nodeview.stale = True
+                return
+
+            nodeview.version = evt.version
+            nodeview.session_status = evt.session_status
+            nodeview.updated = time.time()
+            view.tracker.merge(evt.changes)
+
+    def _view(self, sessionId, hosts):
+        """
+        Returns the view of session `sessionId` and the view of all nodes
+        under `hosts`, if they are all complete and up to date
+        """
+        with self._lock:
+            view = self._sessions.get(sessionId)
+            if view is None:
+                return None, None
+
+            now = time.time()
+            nodes = {}
+            for host in hosts:
+                for node in self._island_nodes.get(host, [host]):
+                    nodeview = view.nodes.get(node)
+                    if nodeview is None or nodeview.stale:
+                        return None, None
+                    if nodeview.session_status != SessionStates.FINISHED and \
+                       now - nodeview.updated > self.max_age:
+                        return None, None
+                    nodes[node] = nodeview
+            return view, nodes
+
+    def graph_status(self, sessionId, hosts):
+        """
+        Returns the status of the graph of session `sessionId` across `hosts`,
+        or None if it's not known
+        """
+        view, _ = self._view(sessionId, hosts)
+        if view is None:
+            return None
+        return to_graph_status(view.tracker.snapshot()[1])
+
+    def session_status(self, sessionId, hosts):
+        """
+        Returns the status of session `sessionId` in each of `hosts`, or None
+        if it's not known. Nodes that are followed through a DIM are grouped
+        under it.
+        """
+        _, nodes = self._view(sessionId, hosts)
+        if nodes is None:
+            return None
+        status = {}
+        for node, nodeview in nodes.items():
+            if nodeview.island is None:
+                status[node] = nodeview.session_status
+            else:
+                status.setdefault(nodeview.island, {})[node] = nodeview.session_status
+        return status
+
+class StatusPoller(object):
+    """
+    Follows the status of the drops of the sessions of `dm`, a manager that
+    doesn't track it itself, by polling it every `period` seconds and feeding
+    the results into one `StatusTracker` per session.
+
+    All sessions are polled from a single thread, and only while they have
+    subscribers. Trackers are kept after their last subscriber leaves, so the
+    versions they issued can still be used to resume, until their session
+    goes away.
+    """
+
+    def __init__(self, dm, period=1):
+        self._dm = dm
+        self.period = period
+        self._lock = threading.Lock()
+        self._trackers = {}
+        self._session_status = {}
+        self._subscribers = collections.Counter()
+        self._thread = None
+
+    def subscribe(self, sessionId):
+        """
+        Starts polling session `sessionId` if needed, and returns its tracker
+        """
+        self._forget_gone()
+        with self._lock:
+            tracker = self._trackers.get(sessionId)
+            new = tracker is None
+            if new:
+                tracker = self._trackers[sessionId] = StatusTracker()
+            self._subscribers[sessionId] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll_sessions, name="Status poller")
+                self._thread.daemon = True
+                self._thread.start()
+        if new:
+            self.poll(sessionId)
+        return tracker
+
+    def unsubscribe(self, sessionId):
+        with self._lock:
+            self._subscribers[sessionId] -= 1
+            if self._subscribers[sessionId] <= 0:
+                del self._subscribers[sessionId]
+
+    def session_status(self, sessionId):
+        """
+        Returns the status of session `sessionId` as of the last time it was
+        polled, which was after the status of its drops was fed into its
+        tracker, or None if it has not been polled yet
+        """
+        with self._lock:
+            if sessionId not in self._trackers:
+                raise NoSessionException(sessionId)
+            return self._session_status.get(sessionId)
+
+    def poll(self, sessionId):
+        with self._lock:
+            tracker = self._trackers.get(sessionId)
+        if tracker is None:
+            return
+        try:
+            # The session status is read first, so once it says the session
+            # finished the drops status fed into the tracker is final
+            session_status = self._dm.getSessionStatus(sessionId)
+            graph_status = self._dm.getGraphStatus(sessionId)
+        except NoSessionException:
+            self.forget(sessionId)
+            return
+        except Exception:
+            # Possibly the session is simply not running yet
+            logger.debug("Couldn't get the graph status of session %s", sessionId, exc_info=True)
+            return
+        tracker.merge(dict((oid, (s['status'], s.get('execStatus'))) for oid, s in graph_status.items()))
+        with self._lock:
+            if sessionId in self._trackers:
+                self._session_status[sessionId] = session_status
+
+    def forget(self, sessionId):
+        with self._lock:
+            self._trackers.pop(sessionId, None)
+            self._session_status.pop(sessionId, None)
+
+    def _forget_gone(self):
+        # Trackers of sessions that are gone, and nobody is following
+        with self._lock:
+            unfollowed = [s for s in self._trackers if s not in self._subscribers]
+        if not unfollowed:
+            return
+        sessionIds = set(self._dm.getSessionIds())
+        for sessionId in unfollowed:
+            if sessionId not in sessionIds:
+                self.forget(sessionId)
+
+    def _poll_sessions(self):
+        while True:
+            time.sleep(self.period)
+            with self._lock:
+                sessionIds = list(self._subscribers)
+                if not sessionIds:
+                    self._thread = None
+                    return
+            for sessionId in sessionIds:
+                self.poll(sessionId)
@@ -20,9 +20,19 @@
 #    MA 02111-1307  USA
 #
 import codecs
+import collections
+import functools
 import json
 import logging
-from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+import os
+import select
+import socket
+import threading
+import time
+import types
+import zlib
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler, \
+    ServerHandler
 
 import bottle
 import six
@@ -41,17 +51,335 @@ class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
     daemon_threads = True
     allow_reuse_address = True
 
+    def __init__(self, *args, **kwargs):
+        WSGIServer.__init__(self, *args, **kwargs)
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        with self._connections_lock:
+            self._connections.discard(request)
+        WSGIServer.shutdown_request(self, request)
+
+    def close_connections(self):
+        """
+        Closes all the connections currently open, including those kept alive
+        between requests, so no more requests are served after stopping.
+        """
+        with self._connections_lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+class WorkerPoolWSGIServer(ThreadingWSGIServer):
+    """
+    A WSGI server that serves connections with a fixed number of worker threads
+    instead of starting a new thread for each of them. Connections accepted
+    while all workers are busy are queued, and rejected with a 503 response
+    when the queue is full.
+    """
+
+    def __init__(self, server_address, handler_class, max_workers=32, max_queued=1024):
+        ThreadingWSGIServer.__init__(self, server_address, handler_class)
+        self._queue = six.moves.queue.Queue(max_queued)
+
+        # busy_fd is readable while there are queued connections, so workers
+        # waiting on kept-alive connections can select() on it
+        self.busy_fd, self._busy_wfd = os.pipe()
+        self._busy_lock = threading.Lock()
+        self._busy_signalled = False
+
+        self._workers = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._work, name='REST worker %d' % (i,))
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    @property
+    def busy(self):
+        """Whether there are connections waiting for a worker"""
+        return not self._queue.empty()
+
+    def _update_busy_fd(self):
+        # Called after each change to the queue, so the last call always
+        # leaves busy_fd in line with the queue
+        with self._busy_lock:
+            busy = self.busy
+            if busy == self._busy_signalled:
+                return
+            if busy:
+                os.write(self._busy_wfd, b'x')
+            else:
+                os.read(self.busy_fd, 1)
+            self._busy_signalled = busy
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        try:
+            self._queue.put_nowait((request, client_address))
+        except six.moves.queue.Full:
+            logger.warning("Too many queued connections, rejecting connection from %s:%d", *client_address[:2])
+            # This runs in the thread accepting connections, so we don't wait
+            # for slow clients; the response fits in the socket buffer anyway
+            try:
+                request.setblocking(False)
+                request.send(b'HTTP/1.1 503 Service Unavailable\r\n'
+                             b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+            except socket.error:
+                pass
+            self.shutdown_request(request)
+            return
+        self._update_busy_fd()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            self._update_busy_fd()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        ThreadingWSGIServer.server_close(self)
+        for _ in self._workers:
+            self._queue.put(None)
+
+    def close_connections(self):
+        ThreadingWSGIServer.close_connections(self)
+        # Workers might still be selecting on busy_fd until they exit
+        for t in self._workers:
+            t.join(self.RequestHandlerClass.timeout)
+        if not any(t.is_alive() for t in self._workers):
+            os.close(self.busy_fd)
+            os.close(self._busy_wfd)
+
+class BoundedReader(object):
+    """
+    A reader that reads at most ``length`` bytes from ``content``, so
+    request bodies are never read past their end.
+    """
+    def __init__(self, content, length):
+        self.content = content
+        self.remaining = length
+    def read(self, n=-1):
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.content.read(n) if n else b''
+        self.remaining -= len(data)
+        return data
+    def readline(self, n=-1):
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.content.readline(n) if n else b''
+        self.remaining -= len(data)
+        return data
+    def drain(self):
+        while self.remaining and self.read(65536):
+            pass
+
+class ChunkedBodyReader(object):
+    """
+    A reader that returns the raw, chunk-encoded body of a request, following
+    its chunks so it never reads past the end of the body.
+    """
+    def __init__(self, content):
+        self.content = content
+        self._state = 'size'
+        self._line = b''
+        self._remaining = 0
+    def read(self, n=-1):
+        if self._state == 'done':
+            return b''
+        if self._state in ('size', 'trailer'):
+            n = 1
+        elif n < 0 or n > self._remaining:
+            n = self._remaining
+        data = self.content.read(n)
+        if not data:
+            self._state = 'done'
+            return data
+        self._feed(data)
+        return data
+    def _feed(self, data):
+        if self._state == 'data':
+            self._remaining -= len(data)
+            if not self._remaining:
+                self._state = 'size'
+            return
+        self._line += data
+        if len(self._line) > 4096:
+            self._state = 'done'
+            return
+        if not self._line.endswith(b'\r\n'):
+            return
+        line, self._line = self._line[:-2], b''
+        if self._state == 'trailer':
+            if not line:
+                self._state = 'done'
+            return
+        try:
+            size = int(line.split(b';')[0].strip(), 16)
+        except ValueError:
+            self._state = 'done'
+            return
+        if size:
+            # Chunk data is followed by \r\n
+            self._state = 'data'
+            self._remaining = size + 2
+        else:
+            self._state = 'trailer'
+    def drain(self):
+        while self.read(65536):
+            pass
+
+class KeepAliveServerHandler(ServerHandler):
+    """
+    A ServerHandler that asks the client to keep the connection open after the
+    response if the request handler allows so and the response has a known
+    length or can be sent in chunks.
+    """
+    http_version = '1.1'
+    _chunked = False
+
+    def cleanup_headers(self):
+        ServerHandler.cleanup_headers(self)
+        handler = self.request_handler
+
+        # Responses of unknown length are sent in chunks to HTTP/1.1 clients
+        if 'Content-Length' not in self.headers and \
+           handler.request_version == 'HTTP/1.1' and handler.command != 'HEAD':
+            self.headers['Transfer-Encoding'] = 'chunked'
+            self._chunked = True
+
+        handler.keep_alive = handler.keep_alive and \
+                             ('Content-Length' in self.headers or self._chunked)
+        self.headers['Connection'] = 'keep-alive' if handler.keep_alive else 'close'
+
+    def write(self, data):
+        if not self.headers_sent:
+            self.bytes_sent = len(data)
+            self.send_headers()
+            self.bytes_sent = 0
+        if self._chunked:
+            # An empty chunk would signal the end of the body
+            if not data:
+                return
+            data = chunk(data)
+        ServerHandler.write(self, data)
+
+    def finish_content(self):
+        ServerHandler.finish_content(self)
+        if self._chunked:
+            self._write(b'0\r\n\r\n')
+            self._flush()
+
 class LoggingWSGIRequestHandler(WSGIRequestHandler):
+    """
+    A request handler that logs through our logger, and that serves several
+    requests over the same connection (i.e., HTTP keep-alive) when clients ask
+    for it.
+    """
+
+    # Idle connections are closed after this many seconds
+    timeout = 60
+
     def log_message(self, fmt, *args):
         logger.debug(fmt, *args)
 
+    def _wait_for_request(self):
+        # Wait for the next request on a kept-alive connection, but give up
+        # early if other connections are waiting for this thread
+        busy_fd = getattr(self.server, 'busy_fd', None)
+        fds = [self.connection] if busy_fd is None else [self.connection, busy_fd]
+        deadline = time.time() + self.timeout
+        while True:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return False
+            try:
+                ready = select.select(fds, [], [], timeout)[0]
+            except (socket.error, ValueError):
+                return False
+            if busy_fd in ready and self.server.busy:
+                return False
+            if self.connection in ready:
+                return True
+
+    def _keep_alive_requested(self):
+        connection = self.headers.get('Connection', '').lower()
+        if self.request_version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+    def handle(self):
+        self.keep_alive = True
+        first = True
+        while self.keep_alive:
+            if not first and not self._wait_for_request():
+                return
+            first = False
+            try:
+                self.raw_requestline = self.rfile.readline(65537)
+            except socket.timeout:
+                return
+            if not self.raw_requestline:
+                return
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                return
+            if not self.parse_request():
+                return
+
+            # Request bodies are read only up to their end, so any following
+            # request on the same connection can be read afterwards
+            transfer_encoding = self.headers.get('Transfer-Encoding', None)
+            if transfer_encoding is None:
+                body = BoundedReader(self.rfile, int(self.headers.get('Content-Length', 0) or 0))
+            elif transfer_encoding.lower() == 'chunked':
+                body = ChunkedBodyReader(self.rfile)
+            else:
+                body = None
+            self.keep_alive = body is not None and self._keep_alive_requested()
+            stdin = body if self.keep_alive else self.rfile
+
+            handler = KeepAliveServerHandler(stdin, self.wfile, self.get_stderr(),
+                                             self.get_environ(), multithread=False)
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+
+            # Consume whatever the application didn't read from the request
+            if self.keep_alive:
+                body.drain()
+
 class RestServerWSGIServer:
-    def __init__(self, wsgi_app, listen = '127.0.0.1', port = 8080):
+    def __init__(self, wsgi_app, listen = '127.0.0.1', port = 8080, max_workers=None):
         self.wsgi_app = wsgi_app
         self.listen = listen
         self.port = port
+        server_class = ThreadingWSGIServer
+        if max_workers:
+            server_class = functools.partial(WorkerPoolWSGIServer, max_workers=max_workers)
         self.server = make_server(self.listen, self.port, self.wsgi_app,
-                                  server_class=ThreadingWSGIServer,
+                                  server_class=server_class,
                                   handler_class=LoggingWSGIRequestHandler)
 
     def serve_forever(self):
@@ -60,17 +388,63 @@ class RestServerWSGIServer:
     def server_close(self):
         self.server.shutdown()
         self.server.server_close()
+        self.server.close_connections()
+
+class _ReleasingIterable(object):
+    """
+    Wraps the iterable body of a response so ``release`` is called once the
+    server is done with it
+    """
+    def __init__(self, iterable, release):
+        self.iterable = iterable
+        self._release = release
+    def __iter__(self):
+        return iter(self.iterable)
+    def close(self):
+        release, self._release = self._release, None
+        try:
+            self.iterable.close()
+        finally:
+            if release is not None:
+                release()
 
 class RestServer(object):
     """
     The base class for our REST servers
     """
 
-    def __init__(self):
+    def __init__(self, max_workers=None):
+        """
+        If `max_workers` is given requests are served by a bounded pool of
+        that many threads; otherwise a new thread serves each connection.
+        """
         self._server = None
         self._server_thr = None
+        self._max_workers = max_workers
         self.app = bottle.Bottle()
 
+    def limit_concurrency(self, callback, n):
+        """
+        Returns `callback` wrapped so that at most `n` invocations of it run
+        concurrently; the rest wait for their turn.
+        """
+        sem = threading.Semaphore(n)
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            sem.acquire()
+            try:
+                res = callback(*args, **kwargs)
+            except:
+                sem.release()
+                raise
+            # Streamed responses are produced while the server sends them, so
+            # they hold on to their slot until they are closed
+            if isinstance(res, types.GeneratorType):
+                return _ReleasingIterable(res, sem.release)
+            sem.release()
+            return res
+        return wrapper
+
     def start(self, host, port):
         host = host or 'localhost'
         port = port or 8080
@@ -79,7 +453,7 @@ class RestServer(object):
         # tornado's IOLoop directly instead
         logger.info("Starting REST server on %s:%d" % (host, port))
 
-        self._server = RestServerWSGIServer(self.app, host, port)
+        self._server = RestServerWSGIServer(self.app, host, port, self._max_workers)
         self._server.serve_forever()
 
     def stop(self, timeout=None):
@@ -94,6 +468,59 @@ class RestClientException(DaliugeException):
     Exception thrown by the RestClient
     """
 
+def encode_exception(e):
+    """
+    Returns the HTTP status and the JSON-able description of exception ``e``
+    with which servers report errors to their clients, or ``(None, None)`` if
+    ``e`` is not one of our exceptions.
+    """
+    status, eargs = 500, ()
+    if isinstance(e, NotImplementedError):
+        status, eargs = 501, e.args
+    elif isinstance(e, exceptions.NoSessionException):
+        status, eargs = 404, (e._session_id,)
+    elif isinstance(e, exceptions.SessionAlreadyExistsException):
+        status, eargs = 409, (e._session_id,)
+    elif isinstance(e, exceptions.InvalidDropException):
+        status, eargs = 409, ((e.oid, e.uid), e.reason)
+    elif isinstance(e, exceptions.InvalidRelationshipException):
+        status, eargs = 409, (e.rel, e.reason)
+    elif isinstance(e, exceptions.InvalidGraphException):
+        status, eargs = 400, e.args
+    elif isinstance(e, exceptions.InvalidSessionState):
+        status, eargs = 400, e.args
+    elif isinstance(e, RestClientException):
+        status, eargs = 556, e.args
+    elif isinstance(e, SubManagerException):
+        status = 555
+        eargs = {}
+        # args[1] is a dictionary of host:exception
+        for host,subex in e.args[1].items():
+            eargs[host] = {'type': subex.__class__.__name__, 'args': subex.args}
+    elif isinstance(e, DaliugeException):
+        status, eargs = 555, e.args
+    else:
+        return None, None
+    return status, {'type': e.__class__.__name__, 'args': eargs}
+
+def decode_exception(error):
+    """
+    Returns the exception described by ``error``, as produced by
+    `encode_exception`.
+    """
+    etype = getattr(exceptions, error['type'], None)
+    if etype is None:
+        etype = globals()[error['type']]
+    eargs = error['args']
+
+    if etype == SubManagerException:
+        for host,args in eargs.items():
+            subetype = getattr(exceptions, args['type'])
+            subargs = args['args']
+            eargs[host] = subetype(*subargs)
+        return etype(eargs)
+    return etype(*eargs)
+
 def hexdigits(n):
     digits = 0
     while n:
@@ -110,8 +537,10 @@ class chunked(object):
     """
     def __init__(self, content):
         self.content = content
+        self.started = False
         self.finished = False
     def read(self, n):
+        self.started = True
         if self.finished:
             return b''
         n = n - hexdigits(n) - 4
@@ -121,6 +550,111 @@ class chunked(object):
             return b"0\r\n\r\n"
         return chunk(data)
 
+# The content encodings we understand in responses, and the zlib wbits
+# value used to decode them
+content_encodings = collections.OrderedDict([('gzip', 16 + zlib.MAX_WBITS),
+                                             ('deflate', zlib.MAX_WBITS)])
+
+# Requests that can be sent again if the connection they were sent through
+# broke before we got an answer
+idempotent_methods = ('GET', 'DELETE')
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTP connections, indexed by host and
+    port. Connections are given back to the pool by clients once they are done
+    with them so they can be reused by subsequent requests, avoiding a new TCP
+    handshake for each request.
+
+    The pool also keeps track of the servers that recently answered a request,
+    so clients don't need to check whether they are up before each request.
+    """
+
+    # Maximum number of idle connections kept per server
+    max_idle = 8
+
+    # Idle connections older than this (in seconds) are not reused; this is
+    # kept below the idle timeout of our servers
+    max_idle_time = 30
+
+    # A server that answered a request within this amount of seconds is
+    # considered alive
+    liveness_period = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = collections.defaultdict(list)
+        self._last_seen = {}
+
+    def get(self, host, port):
+        """
+        Returns a connection to ``host``:``port``, reusing an idle connection
+        if possible, and whether the connection was reused or not.
+        """
+        stale = []
+        conn = None
+        with self._lock:
+            idle = self._idle[(host, port)]
+            while idle:
+                idle_conn, since = idle.pop()
+                if time.time() - since < self.max_idle_time and \
+                   not self._is_dropped(idle_conn):
+                    conn = idle_conn
+                    break
+                stale.append(idle_conn)
+        for c in stale:
+            c.close()
+        if conn is not None:
+            return conn, True
+        return httplib.HTTPConnection(host, port), False
+
+    def _is_dropped(self, conn):
+        # An idle connection should have nothing to read; if it has, the
+        # server has closed it already
+        if conn.sock is None:
+            return True
+        try:
+            return bool(select.select([conn.sock], [], [], 0)[0])
+        except (socket.error, ValueError):
+            return True
+
+    def put(self, host, port, conn):
+        """
+        Gives back ``conn`` to the pool for reuse
+        """
+        with self._lock:
+            idle = self._idle[(host, port)]
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        """
+        Closes all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, collections.defaultdict(list)
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def mark_alive(self, host, port):
+        self._last_seen[(host, port)] = time.time()
+
+    def mark_dead(self, host, port):
+        self._last_seen.pop((host, port), None)
+
+    def is_alive(self, host, port):
+        """
+        Returns ``True`` if ``host``:``port`` recently answered a request.
+        """
+        last_seen = self._last_seen.get((host, port), None)
+        return last_seen is not None and time.time() - last_seen < self.liveness_period
+
+# The process-wide connection pool used by all RestClients
+connection_pool = ConnectionPool()
+
 class RestClient(object):
     """
     The base class for our REST clients
@@ -134,10 +668,24 @@ class RestClient(object):
         self._resp = None
 
     def _close(self):
-        if self._resp:
-            self._resp.close()
-        if self._conn:
-            self._conn.close()
+        self._release_connection()
+
+    def _release_connection(self):
+        """
+        Gives back the current connection to the pool if its response has been
+        fully read and the server allows to keep it open; otherwise it is
+        closed.
+        """
+        conn, resp = self._conn, self._resp
+        self._conn = self._resp = None
+        if conn is None:
+            return
+        if resp is not None and resp.isclosed() and not resp.will_close:
+            connection_pool.put(self.host, self.port, conn)
+            return
+        if resp is not None:
+            resp.close()
+        conn.close()
 
     __del__ = _close
     def __enter__(self):
@@ -148,21 +696,35 @@ class RestClient(object):
             raise value
 
 
+    def _load_json(self, ret):
+        # The response is fully read at this point, and thus the connection
+        # can go back to the pool straight away
+        try:
+            if not ret:
+                return None
+            # Only big responses are streamed by our servers; the rest come
+            # with a Content-Length and are quicker to decode all at once
+            if self._resp.length is not None:
+                return json.loads(ret.stream.read().decode('utf-8'))
+            return utils.load_json_stream(ret.stream)
+        finally:
+            self._release_connection()
+
     def _get_json(self, url):
         ret = self._GET(url)
-        return json.load(ret) if ret else None
+        return self._load_json(ret)
 
     def _post_form(self, url, content=None):
         if content is not None:
             content = urllib.urlencode(content)
         ret = self._POST(url, content, content_type='application/x-www-form-urlencoded')
-        return json.load(ret) if ret else None
+        return self._load_json(ret)
 
     def _post_json(self, url, content, compress=False):
         if not isinstance(content, (six.text_type, six.binary_type)):
             content = utils.JSONStream(content)
         ret = self._POST(url, content, content_type='application/json', compress=compress)
-        return json.load(ret) if ret else None
+        return self._load_json(ret)
 
     def _GET(self, url):
         return self._request(url, 'GET')
@@ -183,21 +745,69 @@ class RestClient(object):
     def _DELETE(self, url):
         return self._request(url, 'DELETE')
 
+    def _wait_for_server(self):
+        if not utils.portIsOpen(self.host, self.port, self.timeout):
+            raise RestClientException("Cannot connect to %s:%d after %.2f [s]" % (self.host, self.port, self.timeout))
+
     def _request(self, url, method, content=None, headers={}):
 
         # Do the HTTP stuff...
         logger.debug("Sending %s request to %s:%d%s", method, self.host, self.port, url)
 
-        if not utils.portIsOpen(self.host, self.port, self.timeout):
-            raise RestClientException("Cannot connect to %s:%d after %.2f [s]" % (self.host, self.port, self.timeout))
+        # The connection used by our previous request is not needed anymore
+        self._release_connection()
 
+        # Servers that answered recently are assumed to be still there
+        checked = not connection_pool.is_alive(self.host, self.port)
+        if checked:
+            self._wait_for_server()
+
+        headers = dict(headers)
+        headers.setdefault('Accept-Encoding', ', '.join(content_encodings))
         if content and hasattr(content, 'read'):
             headers['Transfer-Encoding'] = 'chunked'
             content = chunked(content)
 
-        self._conn = httplib.HTTPConnection(self.host, self.port)
-        self._conn.request(method, url, content, headers)
-        self._resp = self._conn.getresponse()
+        self._conn, reused = connection_pool.get(self.host, self.port)
+        connected = sent = False
+        try:
+            if not reused:
+                self._conn.connect()
+            connected = True
+            self._conn.request(method, url, content, headers)
+            sent = True
+            self._resp = self._conn.getresponse()
+        except (httplib.HTTPException, socket.error):
+            self._conn.close()
+            self._conn = None
+
+            # If we couldn't connect the server might be restarting, so we
+            # wait for it like we would have done without the liveness cache.
+            # Nothing was sent yet, so the request can be safely retried.
+            # If a reused connection failed instead the server might have
+            # closed it while idle. In that case we retry only if the content
+            # can be sent again (i.e., it's not a stream that has been already
+            # consumed) and if the server cannot have acted on the request,
+            # either because it wasn't fully sent or because it's idempotent
+            if not connected:
+                if checked:
+                    raise
+                connection_pool.mark_dead(self.host, self.port)
+                self._wait_for_server()
+            elif not reused:
+                raise
+            else:
+                replayable = content is None or \
+                             isinstance(content, (six.binary_type, six.text_type)) or \
+                             (isinstance(content, chunked) and not content.started)
+                if not replayable or (sent and method not in idempotent_methods):
+                    raise
+            logger.debug("Request to %s:%d failed, retrying with a new connection", self.host, self.port)
+            self._conn = httplib.HTTPConnection(self.host, self.port)
+            self._conn.request(method, url, content, headers)
+            self._resp = self._conn.getresponse()
+
+        connection_pool.mark_alive(self.host, self.port)
 
         # Server errors are encoded in the body as json content
         if self._resp.status != httplib.OK:
@@ -207,17 +817,7 @@ class RestClient(object):
 
             try:
                 error = json.loads(self._resp.read().decode('utf-8'))
-                etype = getattr(exceptions, error['type'])
-                eargs = error['args']
-
-                if etype == SubManagerException:
-                    for host,args in eargs.items():
-                        subetype = getattr(exceptions, args['type'])
-                        subargs = args['args']
-                        eargs[host] = subetype(*subargs)
-                    ex = etype(eargs)
-                else:
-                    ex = etype(*eargs)
+                ex = decode_exception(error)
                 if hasattr(ex, 'msg'):
                     ex.msg = msg + ex.msg
             except Exception:
@@ -225,6 +825,13 @@ class RestClient(object):
 
             raise ex
 
-        if not self._resp.length:
+        # Chunked responses have no length, but might still have content
+        if self._resp.length == 0:
+            self._resp.read()
             return None
-        return codecs.getreader('utf-8')(self._resp)
\ No newline at end of file
+
+        content = self._resp
+        encoding = self._resp.getheader('Content-Encoding', None)
+        if encoding in content_encodings:
+            content = utils.ZlibUncompressedStream(content, content_encodings[encoding])
+        return codecs.getreader('utf-8')(content)
\ No newline at end of file
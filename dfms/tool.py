@@ -43,17 +43,18 @@ def _open_o(path, flags=None):
         return sys.stdout
     return open(os.path.expanduser(path), flags or 'w')
 
-def unroll(lg_path, oid_prefix, zerorun=False, app=None):
+def unroll(lg_path, oid_prefix, zerorun=False, app=None, processes=1):
     '''
     Unrolls the Logical Graph in `lg_graph` into a Physical Graph Template
     and return the latter.
     This method prepends `oid_prefix` to all generated Drop OIDs.
+    The top-level constructs are unrolled using `processes` processes.
     '''
 
     from dfms.dropmake.pg_generator import LG
     lg = LG(_open_i(lg_path), ssid=oid_prefix)
     logger.info("Start to unroll %s", lg_path)
-    drop_list = lg.unroll_to_tpl()
+    drop_list = lg.unroll_to_tpl(processes=processes)
     logger.info("Unroll completed for %s with # of Drops: %d", lg_path, len(drop_list))
 
     # Optionally set sleepTimes to 0 and apps to a specific type
@@ -68,19 +69,48 @@ def unroll(lg_path, oid_prefix, zerorun=False, app=None):
 
     return drop_list
 
-def partition(pgt, pip_name, num_partitions, num_islands, algo='metis'):
+def _patch_drops(drops, zerorun=False, app=None):
+    for dropspec in drops:
+        if zerorun and 'sleepTime' in dropspec:
+            dropspec['sleepTime'] = 0
+        if app and 'app' in dropspec:
+            dropspec['app'] = app
+        yield dropspec
+
+def unroll_iter(lg_path, oid_prefix, zerorun=False, app=None, processes=1):
+    '''
+    Like `unroll`, but returns a generator that yields the Drops of the
+    Physical Graph Template one by one, in topological order.
+    '''
+
+    from dfms.dropmake.pg_generator import LG
+    lg = LG(_open_i(lg_path), ssid=oid_prefix)
+    logger.info("Start to unroll %s", lg_path)
+    return _patch_drops(lg.unroll_to_tpl_iter(processes=processes), zerorun=zerorun, app=app)
+
+def partition(pgt, pip_name, num_partitions, num_islands, algo='metis', stream=False,
+              partitioner='auto'):
     '''
     Partitions the Physical Graph Template `pgt` with the algorithm `algo`
-    using `num_partitions` partitions.
+    using `num_partitions` partitions. `pgt` can be any iterable of Drops, which
+    are stored in columns while partitioning. If `stream` is True a generator
+    yielding the partitioned Drops is returned instead of a list.
+    The graph partitioning (or partition merging) is done by the METIS library
+    or by the native `dfms.dropmake.utils.multilevel` partitioner, depending on
+    `partitioner` ('metis', 'native' or 'auto', i.e. METIS if available).
     '''
 
+    from dfms.dropmake.drop_columns import DropColumns
     from dfms.dropmake.pg_generator import MySarkarPGTP, MetisPGTP
 
+    if not isinstance(pgt, DropColumns):
+        pgt = DropColumns(pgt)
+
     logger.info("Initialising PGTP %s", algo)
     if algo == 'sarkar':
-        pgtp = MySarkarPGTP(pgt, num_partitions, merge_parts=True)
+        pgtp = MySarkarPGTP(pgt, num_partitions, merge_parts=True, partitioner=partitioner)
     else:
-        pgtp = MetisPGTP(pgt, num_partitions, merge_parts=True)
+        pgtp = MetisPGTP(pgt, num_partitions, merge_parts=True, partitioner=partitioner)
     del pgt
     logger.info("PGTP initialised %s", algo)
 
@@ -88,7 +118,8 @@ def partition(pgt, pip_name, num_partitions, num_islands, algo='metis'):
     pgtp.to_gojs_json(string_rep=False, visual=True)
     pgt = pgtp.to_pg_spec([], ret_str=False,
                           num_islands=num_islands,
-                          tpl_nodes_len=num_partitions+num_islands)
+                          tpl_nodes_len=num_partitions+num_islands,
+                          ret_iter=stream)
     logger.info("Partitioning completed for %s", pip_name)
 
     return pgt
@@ -103,6 +134,22 @@ def resource_map(pgt, nodes, pip_name, num_islands):
         raise ValueError(err_info)
 
     logger.info("Start to translate {0}".format(pip_name))
+    for _ in resource_map_iter(pgt, nodes, num_islands):
+        pass
+    logger.info("Translation completed for {0}".format(pip_name))
+
+    return pgt # now it's a PG
+
+def resource_map_iter(pgt, nodes, num_islands):
+    '''
+    Like `resource_map`, but maps the Drops of `pgt` (any iterable) as they are
+    consumed from the returned generator
+    '''
+
+    if not nodes:
+        err_info = "Empty node_list, cannot map the PG template"
+        raise ValueError(err_info)
+
     dim_list = nodes[0:num_islands]
     nm_list = nodes[num_islands:]
     for drop_spec in pgt:
@@ -110,9 +157,7 @@ def resource_map(pgt, nodes, pip_name, num_islands):
         drop_spec['node'] = nm_list[nidx]
         iidx = int(drop_spec['island'][1:]) # skip '#'
         drop_spec['island'] = dim_list[iidx]
-    logger.info("Translation completed for {0}".format(pip_name))
-
-    return pgt # now it's a PG
+        yield drop_spec
 
 def submit(host, port, pg,
            skip_deploy=False, session_id=None, completed_uids=None):
@@ -132,6 +177,32 @@ def submit(host, port, pg,
             client.deploy_session(session_id, completed_uids=completed_uids)
             logger.info("Session %s deployed", session_id)
 
+def submit_iter(host, port, pg, chunk_size=10000,
+                skip_deploy=False, session_id=None):
+    '''
+    Like `submit`, but the Physical Graph `pg` can be any iterable of Drops
+    (e.g., one read from a stream), which are appended to the session in chunks
+    of `chunk_size` Drops. The roots of the graph are calculated on the way.
+    '''
+
+    from dfms import droputils
+    from dfms.manager.client import CompositeManagerClient
+
+    session_id = session_id or "%f" % (time.time())
+    roots = set()
+
+    with CompositeManagerClient(host, port, timeout=10) as client:
+        client.create_session(session_id)
+        logger.info("Session %s created", session_id)
+        n_drops = 0
+        for chunk in droputils.chunk_graph(pg, chunk_size, roots=roots):
+            client.append_graph(session_id, chunk)
+            n_drops += len(chunk)
+            logger.info("%d drops appended to session %s", n_drops, session_id)
+        if not skip_deploy:
+            client.deploy_session(session_id, completed_uids=list(roots))
+            logger.info("Session %s deployed", session_id)
+
 def _add_logging_options(parser):
     parser.add_option("-v", "--verbose", action="count",
                       dest="verbose", help="Become more verbose. The more flags, the more verbose")
@@ -143,6 +214,8 @@ def _add_output_options(parser):
                       help='Where the output should be written to (default: stdout)', default='-')
     parser.add_option('-f', '--format', action="store_true",
                       dest='format', help="Format JSON output (newline, 2-space indent)")
+    parser.add_option('--stream', action="store_true",
+                      dest='stream', help="Write one Drop per line (newline-delimited JSON) as they are produced", default=False)
 
 def _setup_logging(opts):
 
@@ -177,9 +250,31 @@ def _setup_logging(opts):
 def _setup_output(opts):
     def dump(obj):
         with _open_o(opts.output) as f:
-            json.dump(obj, f, indent=None if opts.format is None else 2)
+            if opts.stream:
+                for drop_spec in obj:
+                    f.write(json.dumps(drop_spec))
+                    f.write('\n')
+            else:
+                json.dump(obj, f, indent=None if opts.format is None else 2)
     return dump
 
+def _load_graph(f):
+    '''
+    Reads a graph from `f`, either a JSON list of Drops, in which case it is
+    returned as a list, or a newline-delimited JSON stream of Drops, in which
+    case a generator yielding them as they are read is returned
+    '''
+    first = f.readline()
+    if first.lstrip().startswith('['):
+        return json.loads(first + f.read())
+    def stream():
+        line = first
+        while line:
+            if line.strip():
+                yield json.loads(line)
+            line = f.readline()
+    return stream()
+
 
 commands = {}
 def cmdwrap(cmdname, desc):
@@ -228,6 +323,8 @@ def _add_unroll_options(parser):
                       dest="zerorun", help="Generate a Physical Graph Template that takes no time to run", default=False)
     parser.add_option("--app", action="store", type="int",
                       dest="app", help="Force an app to be used in the Physical Graph. 0=Don't force, 1=SleepApp, 2=SleepAndCopy", default=0)
+    parser.add_option("-j", "--processes", action="store", type="int",
+                      dest="processes", help="Number of processes used to unroll the top-level constructs (linking their DROPs is always serial)", default=1)
     apps = (
         None,
         'test.graphsRepository.SleepApp',
@@ -246,7 +343,8 @@ def dlg_unroll(parser, args):
     _setup_logging(opts)
     dump = _setup_output(opts)
 
-    dump(unroll(opts.lg_path, opts.oid_prefix, zerorun=opts.zerorun, app=apps[opts.app]))
+    unroll_f = unroll_iter if opts.stream else unroll
+    dump(unroll_f(opts.lg_path, opts.oid_prefix, zerorun=opts.zerorun, app=apps[opts.app], processes=opts.processes))
 
 def _add_partition_options(parser):
     parser.add_option("-N", "--partitions", action="store", type="int",
@@ -255,6 +353,8 @@ def _add_partition_options(parser):
                       dest="islands", help="Number of islands to use during the partitioning", default=1)
     parser.add_option("-A", "--algorithm", action="store", type="choice", choices=['metis', 'sarkar'],
                       dest="algo", help="algorithm used to do the partitioning", default="metis")
+    parser.add_option("--partitioner", action="store", type="choice", choices=['auto', 'metis', 'native'],
+                      dest="partitioner", help="graph partitioner used by the algorithm: METIS, the native one, or METIS if available (auto)", default="auto")
 
 @cmdwrap('partition', 'Divides a Physical Graph Template into N logical partitions')
 def dlg_partition(parser, args):
@@ -268,10 +368,11 @@ def dlg_partition(parser, args):
     _setup_logging(opts)
     dump = _setup_output(opts)
 
+    # Partitioning needs the whole graph
     pip_name = utils.fname_to_pipname(opts.pgt_path)
     with _open_i(opts.pgt_path) as fi:
-        pgt = json.load(fi)
-    dump(partition(pgt, pip_name, opts.partitions, opts.islands, opts.algo))
+        pgt = partition(_load_graph(fi), pip_name, opts.partitions, opts.islands, opts.algo, stream=opts.stream, partitioner=opts.partitioner)
+    dump(pgt)
 
 @cmdwrap('unroll-and-partition', 'unroll + partition')
 def dlg_unroll_and_partition(parser, args):
@@ -285,8 +386,8 @@ def dlg_unroll_and_partition(parser, args):
     dump = _setup_output(opts)
 
     pip_name = utils.fname_to_pipname(opts.lg_path)
-    pgt = unroll(opts.lg_path, opts.oid_prefix, zerorun=opts.zerorun, app=apps[opts.app])
-    dump(partition(pgt, pip_name, opts.partitions, opts.islands, opts.algo))
+    pgt = unroll_iter(opts.lg_path, opts.oid_prefix, zerorun=opts.zerorun, app=apps[opts.app], processes=opts.processes)
+    dump(partition(pgt, pip_name, opts.partitions, opts.islands, opts.algo, stream=opts.stream, partitioner=opts.partitioner))
 
 @cmdwrap('map', 'Maps a Physical Graph Template to resources and produces a Physical Graph')
 def dlg_map(parser, args):
@@ -322,10 +423,12 @@ def dlg_map(parser, args):
         raise Exception("#nodes (%d) should be bigger than number of islands (%d)" % (n_nodes, opts.islands))
 
     with _open_i(opts.pgt_path) as f:
-        pgt = json.load(f)
-
-    pip_name = utils.fname_to_pipname(opts.pgt_path)
-    dump(resource_map(pgt, nodes, pip_name, opts.islands))
+        pgt = _load_graph(f)
+        if opts.stream:
+            dump(resource_map_iter(pgt, nodes, opts.islands))
+        else:
+            pip_name = utils.fname_to_pipname(opts.pgt_path)
+            dump(resource_map(list(pgt), nodes, pip_name, opts.islands))
 
 
 @cmdwrap('submit', 'Submits a Physical Graph to a Drop Manager')
@@ -345,11 +448,18 @@ def dlg_submit(parser, args):
                       help='Session ID (default: <pg_name>-<current-time>)', default=None)
     parser.add_option('-S', '--skip-deploy', action='store_true', dest='skip_deploy',
                       help='Skip the deployment step (default: False)', default=False)
+    parser.add_option('-c', '--chunk-size', action='store', type='int', dest='chunk_size',
+                      help='Number of Drops appended at a time when reading a newline-delimited JSON stream (default: 10000)', default=10000)
     (opts, args) = parser.parse_args(args)
 
     with _open_i(opts.pg_path) as f:
-        submit(opts.host, opts.port, json.load(f),
-               skip_deploy=opts.skip_deploy, session_id=opts.session_id)
+        pg = _load_graph(f)
+        if isinstance(pg, list):
+            submit(opts.host, opts.port, pg,
+                   skip_deploy=opts.skip_deploy, session_id=opts.session_id)
+        else:
+            submit_iter(opts.host, opts.port, pg, chunk_size=opts.chunk_size,
+                        skip_deploy=opts.skip_deploy, session_id=opts.session_id)
 
 
 def print_usage(prgname):
@@ -23,6 +23,7 @@
 Module containing miscellaneous utility classes and functions.
 """
 
+import codecs
 import contextlib
 import errno
 import json
@@ -98,6 +99,34 @@ def browse_service(zc, service_type_name, protocol, callback):
     browser = ServiceBrowser(zc, stn, handlers=[callback])
     return browser
 
+_local_hosts = {}
+def is_local_host(host):
+    """
+    Returns ``True`` if ``host`` refers to the machine this code is running on,
+    ``False`` otherwise. Results are cached per ``host``.
+    """
+    if host in _local_hosts:
+        return _local_hosts[host]
+
+    try:
+        addr = socket.gethostbyname(host)
+    except socket.error:
+        _local_hosts[host] = False
+        return False
+
+    local_addrs = set(['0.0.0.0'])
+    try:
+        local_addrs.add(socket.gethostbyname(socket.gethostname()))
+    except socket.error:
+        pass
+    try:
+        local_addrs.update(addr for addr, _ in get_local_ip_addr())
+    except ImportError:
+        pass
+
+    _local_hosts[host] = addr.startswith('127.') or addr in local_addrs
+    return _local_hosts[host]
+
 def portIsClosed(host, port, timeout):
     """
     Checks if a given ``host``/``port`` is closed, with a given ``timeout``.
@@ -343,12 +372,13 @@ def wait_or_kill(proc, timeout):
 class ZlibCompressedStream(object):
     """
     An object that takes a input of uncompressed stream and returns a compressed version of its
-    contents when .read() is read.
+    contents when .read() is read. The compressed format is given by ``wbits``,
+    as in the zlib module (e.g., ``16 + zlib.MAX_WBITS`` produces gzip content).
     """
 
-    def __init__(self, content):
+    def __init__(self, content, wbits=zlib.MAX_WBITS):
         self.content = content
-        self.compressor = zlib.compressobj()
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, wbits)
         self.buf = []
         self.buflen = 0
         self.exhausted = False
@@ -433,12 +463,13 @@ class ZlibCompressedStream(object):
 class ZlibUncompressedStream(object):
     """
     A class that reads gzip-compressed content and returns uncompressed content
-    each time its read() method is called.
+    each time its read() method is called. The compressed format is given by
+    ``wbits``, as in the zlib module.
     """
 
-    def __init__(self, content):
+    def __init__(self, content, wbits=zlib.MAX_WBITS):
         self.content = content
-        self.decompressor = zlib.decompressobj()
+        self.decompressor = zlib.decompressobj(wbits)
         self.buf = []
         self.buflen = 0
 
@@ -602,4 +633,102 @@ class JSONStream(object):
             if not self.isiter:
                 break
 
-        return b''.join(response)
\ No newline at end of file
+        return b''.join(response)
+
+_json_ws = ' \t\n\r'
+
+def load_json_stream(stream, bufsize=65536):
+    """
+    Like json.load, but reads ``stream`` incrementally. If the JSON content is
+    an array or an object their members are decoded one by one, so the whole
+    JSON text is never held in memory at once.
+    """
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    state = {'buf': '', 'pos': 0, 'eof': False}
+
+    def fill():
+        # Read at least as much as we already have so re-parsing values that
+        # span several reads doesn't become quadratic
+        if state['eof']:
+            return False
+        data = stream.read(max(bufsize, len(state['buf']) - state['pos']))
+        if not data:
+            state['eof'] = True
+            data = text_decoder.decode(b'', True) if not isinstance(data, six.text_type) else data
+        elif not isinstance(data, six.text_type):
+            data = text_decoder.decode(data)
+        buf, pos = state['buf'], state['pos']
+        state['buf'] = buf[pos:] + data
+        state['pos'] = 0
+        return True
+
+    def next_char():
+        while True:
+            buf, pos = state['buf'], state['pos']
+            while pos < len(buf) and buf[pos] in _json_ws:
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                raise ValueError("Unexpected end of JSON content")
+
+    def expect(c):
+        if next_char() != c:
+            raise ValueError("Expected %r at position %d" % (c, state['pos']))
+        state['pos'] += 1
+
+    def value():
+        next_char()
+        while True:
+            buf, pos = state['buf'], state['pos']
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # Values must be followed by a separator to be sure they are
+                # complete (e.g., "2" could be the beginning of "2.5")
+                following = end
+                while following < len(buf) and buf[following] in _json_ws:
+                    following += 1
+                if state['eof'] or (following < len(buf) and buf[following] in ',:]}'):
+                    state['pos'] = end
+                    return obj
+            except ValueError:
+                if state['eof']:
+                    raise
+            fill()
+
+    first = next_char()
+    if first not in '[{':
+        ret = value()
+    else:
+        state['pos'] += 1
+        is_object = first == '{'
+        closing = '}' if is_object else ']'
+        ret = {} if is_object else []
+        if next_char() == closing:
+            state['pos'] += 1
+        else:
+            while True:
+                if is_object:
+                    key = value()
+                    expect(':')
+                    ret[key] = value()
+                else:
+                    ret.append(value())
+                c = next_char()
+                state['pos'] += 1
+                if c == closing:
+                    break
+                if c != ',':
+                    raise ValueError("Expected ',' or %r at position %d" % (closing, state['pos'] - 1))
+
+    # Only whitespace can follow
+    while True:
+        buf, pos = state['buf'], state['pos']
+        if buf[pos:].strip(_json_ws):
+            raise ValueError("Extra data after JSON content")
+        state['pos'] = len(buf)
+        if not fill():
+            return ret
@@ -0,0 +1,128 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark comparing the networkx DAGs built by
+`DAGUtil.build_dag_from_drops` with the `ArrayDAG` objects built by
+`DAGUtil.build_array_dag_from_drops`. The sample logical graphs are scaled up
+like in unrollBenchmark.py and unrolled, and for both kinds of DAGs we time
+how long it takes to build them, to copy them and to compute their longest
+path, plus a full MySarkarScheduler partitioning and a number of evaluations
+of PSOScheduler's objective function (copy + partitioning + longest path).
+"""
+
+from optparse import OptionParser
+import glob
+import io
+import json
+import os
+import random
+import sys
+import time
+
+import six
+
+from dfms.dropmake.pg_generator import LG
+from dfms.dropmake.scheduler import DAGUtil, MySarkarScheduler, PSOScheduler
+from unrollBenchmark import scale_lg
+
+
+def timed(f, repeat=1):
+    """Returns the average time taken by `f` (seconds), and its last result"""
+    start = time.time()
+    for _ in range(repeat):
+        res = f()
+    return (time.time() - start) / repeat, res
+
+def run(name, f, repeat=1):
+    try:
+        return timed(f, repeat)
+    except Exception as e:
+        print("    %s failed (%s: %s)" % (name, e.__class__.__name__, e))
+        return None, None
+
+if __name__ == '__main__':
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-f", "--factors", action="store", type="string",
+                      dest="factors", help="Comma-separated factors by which constructs' DoP are multiplied", default="1,2,4")
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to use, defaults to all samples", default=None)
+    parser.add_option("-r", "--repeat", action="store", type="int",
+                      dest="repeat", help="Number of times the fast operations are repeated", default=5)
+    parser.add_option("-e", "--evaluations", action="store", type="int",
+                      dest="evaluations", help="Number of PSO objective function evaluations", default=5)
+    parser.add_option("-d", "--max-dop", action="store", type="int",
+                      dest="max_dop", help="Maximum DoP of the partitions", default=8)
+    parser.add_option("-s", "--no-scheduling", action="store_true",
+                      dest="no_scheduling", help="Don't run the MySarkar scheduler", default=False)
+    (options, args) = parser.parse_args(sys.argv)
+
+    if options.lgs:
+        fnames = [os.path.join(lg_dir, name) for name in options.lgs.split(',')]
+    else:
+        fnames = sorted(glob.glob(os.path.join(lg_dir, '*.json')))
+    factors = [int(f) for f in options.factors.split(',')]
+    repeat = options.repeat
+
+    for fname in fnames:
+        with open(fname) as f:
+            lg = json.load(f)
+        for factor in factors:
+            name = "%s x%d" % (os.path.basename(fname), factor)
+            try:
+                content = six.text_type(json.dumps(scale_lg(lg, factor)))
+                drop_list = LG(io.StringIO(content)).unroll_to_tpl()
+            except Exception as e:
+                print("%s: failed to unroll (%s)" % (name, e))
+                continue
+
+            builders = (('networkx', DAGUtil.build_dag_from_drops),
+                        ('array', DAGUtil.build_array_dag_from_drops))
+            dags = {}
+            for kind, build in builders:
+                dags[kind] = timed(lambda: build(drop_list, embed_drop=False))[1]
+            G = dags['array']
+            print("%s: %d nodes, %d edges" % (name, len(G), G.number_of_edges()))
+
+            x = [[random.choice((1, 2, 3)) for _ in range(G.number_of_edges())]
+                 for _ in range(options.evaluations)]
+            for kind, build in builders:
+                G = dags[kind]
+                results = []
+                results.append(run('build', lambda: build(drop_list, embed_drop=False))[0])
+                results.append(run('copy', lambda: G.copy(), repeat)[0])
+                results.append(run('longest path', lambda: DAGUtil.get_longest_path(G, show_path=False), repeat)[0])
+                if not options.no_scheduling:
+                    dag = build(drop_list, embed_drop=True)
+                    scheduler = MySarkarScheduler(drop_list, max_dop=options.max_dop, dag=dag)
+                    results.append(run('MySarkar', scheduler.partition_dag)[0])
+                else:
+                    results.append(None)
+                scheduler = PSOScheduler(drop_list, max_dop=options.max_dop, dag=G)
+                scheduler._lite_dag = G
+                evals = iter(x)
+                results.append(run('PSO', lambda: scheduler._partition_G(G.copy(), next(evals)), len(x))[0])
+                print("    %-8s build %8.3f [s], copy %8.4f [s], longest path %8.4f [s], MySarkar %8s [s], PSO eval %8s [s]" %
+                      ((kind,) + tuple(results[0:3]) +
+                       tuple('-' if r is None else '%.3f' % r for r in results[3:])))
@@ -0,0 +1,107 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark for the computation of the maximum degree of parallelism
+(DoP) and maximum weighted width of DAGs. The sample logical graphs are scaled
+up like in unrollBenchmark.py and unrolled, and the DoP and width of the
+resulting DAGs are computed with `DAGUtil`. For comparison, the antichains of
+the DAG are also enumerated (which is what DAGUtil used to do) until a time
+limit is reached.
+"""
+
+from optparse import OptionParser
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import networkx as nx
+import six
+
+from dfms.dropmake.pg_generator import LG
+from dfms.dropmake.scheduler import DAGUtil
+from unrollBenchmark import scale_lg
+
+
+def enumerate_antichains(G, time_limit):
+    """
+    Enumerates the antichains of `G` for up to `time_limit` seconds, and
+    returns the maximum DoP found, how many antichains were enumerated, and
+    whether the enumeration finished
+    """
+    start = time.time()
+    max_dop, n = 0, 0
+    for antichain in nx.antichains(G):
+        max_dop = max(max_dop, len(antichain))
+        n += 1
+        if (n % 1000 == 0 and time.time() - start > time_limit):
+            return max_dop, n, False
+    return max_dop, n, True
+
+if __name__ == '__main__':
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-f", "--factors", action="store", type="string",
+                      dest="factors", help="Comma-separated factors by which constructs' DoP are multiplied", default="1,2,4")
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to use, defaults to all samples", default=None)
+    parser.add_option("-t", "--time-limit", action="store", type="float",
+                      dest="time_limit", help="Time limit for enumerating antichains, in seconds", default=5)
+    (options, args) = parser.parse_args(sys.argv)
+
+    if options.lgs:
+        fnames = [os.path.join(lg_dir, name) for name in options.lgs.split(',')]
+    else:
+        fnames = sorted(glob.glob(os.path.join(lg_dir, '*.json')))
+    factors = [int(f) for f in options.factors.split(',')]
+
+    for fname in fnames:
+        with open(fname) as f:
+            lg = json.load(f)
+        for factor in factors:
+            name = "%s x%d" % (os.path.basename(fname), factor)
+            try:
+                content = six.text_type(json.dumps(scale_lg(lg, factor)))
+                drop_list = LG(io.StringIO(content)).unroll_to_tpl()
+            except Exception as e:
+                print("%s: failed to unroll (%s)" % (name, e))
+                continue
+            G = DAGUtil.build_dag_from_drops(drop_list, embed_drop=False)
+            print("%s: %d nodes, %d edges" % (name, len(G.nodes()), len(G.edges())))
+
+            start = time.time()
+            dop = DAGUtil.get_max_dop(G)
+            delta = time.time() - start
+            start = time.time()
+            width = DAGUtil.get_max_width(G, weight='num_cpus')
+            wdelta = time.time() - start
+            print("    max DoP = %d in %.3f [s], max width (num_cpus) = %d in %.3f [s]" % (dop, delta, width, wdelta))
+
+            edop, n, finished = enumerate_antichains(G, options.time_limit)
+            if finished:
+                print("    enumeration: max DoP = %d, %d antichains in %.3f [s]" % (edop, n, time.time() - start - wdelta))
+            else:
+                print("    enumeration: gave up after %d antichains and %.0f [s] (max DoP so far = %d)" % (n, options.time_limit, edop))
@@ -0,0 +1,109 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark comparing the native multilevel partitioner
+(dfms.dropmake.utils.multilevel) with METIS, when the latter is available.
+The sample logical graphs are scaled up like in unrollBenchmark.py and
+unrolled, and the METIS input graph of MetisPGTP is partitioned in a number
+of parts by both partitioners. For each of them we print the time taken, the
+edge cut and the load imbalance (the weight of the heaviest part over the
+average one).
+"""
+
+from optparse import OptionParser
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import six
+
+from dfms.dropmake.pg_generator import LG, MetisPGTP
+from dfms.dropmake.scheduler import DAGUtil
+from unrollBenchmark import scale_lg
+
+
+def imbalance(G, parts, nparts):
+    weights = [0] * nparts
+    for i, (_, d) in enumerate(G.nodes(data=True)):
+        weights[parts[i]] += d['tw']
+    return max(weights) / (float(sum(weights)) / nparts)
+
+if __name__ == '__main__':
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-f", "--factors", action="store", type="string",
+                      dest="factors", help="Comma-separated factors by which constructs' DoP are multiplied", default="1,4,16")
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to use, defaults to all samples", default=None)
+    parser.add_option("-k", "--parts", action="store", type="string",
+                      dest="parts", help="Comma-separated numbers of parts", default="2,8,32")
+    parser.add_option("-u", "--ufactor", action="store", type="int",
+                      dest="ufactor", help="Maximum load imbalance, in thousandths", default=10)
+    (options, args) = parser.parse_args(sys.argv)
+
+    if options.lgs:
+        fnames = [os.path.join(lg_dir, name) for name in options.lgs.split(',')]
+    else:
+        fnames = sorted(glob.glob(os.path.join(lg_dir, '*.json')))
+    factors = [int(f) for f in options.factors.split(',')]
+    nparts = [int(k) for k in options.parts.split(',')]
+
+    partitioners = [('native', DAGUtil.import_partitioner('native'))]
+    try:
+        partitioners.append(('metis', DAGUtil.import_partitioner('metis')))
+    except Exception as e:
+        print("METIS not available (%s), only the native partitioner is run" % (e,))
+
+    for fname in fnames:
+        with open(fname) as f:
+            lg = json.load(f)
+        for factor in factors:
+            name = "%s x%d" % (os.path.basename(fname), factor)
+            try:
+                content = six.text_type(json.dumps(scale_lg(lg, factor)))
+                drop_list = LG(io.StringIO(content)).unroll_to_tpl()
+            except Exception as e:
+                print("%s: failed to unroll (%s)" % (name, e))
+                continue
+
+            # Like in MetisPGTP, without loading METIS
+            pgtp = MetisPGTP.__new__(MetisPGTP)
+            pgtp._drop_list = drop_list
+            pgtp._drop_list_len = len(drop_list)
+            G = pgtp.to_partition_input()
+            print("%s: %d nodes, %d edges" % (name, len(G), G.number_of_edges()))
+
+            for k in nparts:
+                for kind, module in partitioners:
+                    start = time.time()
+                    try:
+                        cut, parts = module.part_graph(G, nparts=k, ufactor=options.ufactor)
+                    except Exception as e:
+                        print("    %-6s k=%-4d failed (%s: %s)" % (kind, k, e.__class__.__name__, e))
+                        continue
+                    print("    %-6s k=%-4d time %8.3f [s], edge cut %10d, imbalance %.3f" %
+                          (kind, k, time.time() - start, cut, imbalance(G, parts, k)))
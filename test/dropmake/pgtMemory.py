@@ -0,0 +1,97 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Measures the memory used by Physical Graph Templates when kept as a list of
+DROP specifications and when kept in a `DropColumns` object. The sample logical
+graphs are scaled up like in unrollBenchmark.py and unrolled; the memory of each
+representation is measured with tracemalloc, which requires python 3.
+"""
+
+from optparse import OptionParser
+import gc
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import six
+
+from dfms.dropmake.drop_columns import DropColumns
+from dfms.dropmake.pg_generator import LG
+from unrollBenchmark import scale_lg
+
+
+def measure(f):
+    """Returns the result of `f()` and the memory it holds onto"""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = f()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return result, used
+
+if __name__ == '__main__':
+
+    try:
+        import tracemalloc
+    except ImportError:
+        print("This benchmark requires the tracemalloc module (python 3)")
+        sys.exit(1)
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-f", "--factors", action="store", type="string",
+                      dest="factors", help="Comma-separated factors by which constructs' DoP are multiplied", default="1,4,16")
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to unroll, defaults to all samples", default=None)
+    (options, args) = parser.parse_args(sys.argv)
+
+    if options.lgs:
+        fnames = [os.path.join(lg_dir, name) for name in options.lgs.split(',')]
+    else:
+        fnames = sorted(glob.glob(os.path.join(lg_dir, '*.json')))
+    factors = [int(f) for f in options.factors.split(',')]
+
+    for fname in fnames:
+        with open(fname) as f:
+            lg = json.load(f)
+        for factor in factors:
+            content = json.dumps(scale_lg(lg, factor))
+            try:
+                drop_list, list_mem = measure(lambda: LG(io.StringIO(six.text_type(content))).unroll_to_tpl())
+            except Exception as e:
+                print("%s x%d: failed (%s)" % (os.path.basename(fname), factor, e))
+                continue
+            n = len(drop_list)
+            start = time.time()
+            columns, columns_mem = measure(lambda: DropColumns(drop_list))
+            delta = time.time() - start
+            print("%s x%d: %d drops, %d templates" % (os.path.basename(fname), factor, n, columns.num_templates))
+            print("    list of dropdicts: %.1f [MB] (%.0f bytes/drop)" % (list_mem / 1e6, float(list_mem) / n))
+            print("    DropColumns:       %.1f [MB] (%.0f bytes/drop, %.1fx smaller), built in %.3f [s]" %
+                  (columns_mem / 1e6, float(columns_mem) / n, float(list_mem) / columns_mem, delta))
+            del drop_list, columns
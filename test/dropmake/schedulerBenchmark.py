@@ -0,0 +1,131 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark for the partitioning of physical graph templates. The sample
+logical graphs are scaled up like in unrollBenchmark.py, unrolled, and
+partitioned with MySarkarScheduler, reporting the partitioning time against the
+size of the DAG.
+
+The edge-zeroing sequence of the scheduler is also replayed to compare the
+incremental maintenance of the longest path (`CriticalPath.update_edge`) with
+recomputing the longest path from scratch after each zeroing, which is what
+``dump_progress`` used to do. The latter is only done for the first few edges,
+and extrapolated to the rest.
+"""
+
+from optparse import OptionParser
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import networkx as nx
+import six
+
+from dfms.dropmake.pg_generator import LG
+from dfms.dropmake.scheduler import MySarkarScheduler, DAGUtil, CriticalPath
+from unrollBenchmark import scale_lg
+
+
+def replay(G, max_full):
+    """
+    Zeroes the edges of `G` in decreasing weight order, and returns how long
+    it takes per edge to keep the longest path up to date incrementally, and
+    by recomputing it from scratch
+    """
+    topo_sort = list(nx.topological_sort(G))
+    el = sorted(G.edges(data=True), key=lambda e: -e[2]['weight'])
+    weights = [e[2]['weight'] for e in el]
+
+    cp = CriticalPath(G, topo_sort=topo_sort)
+    start = time.time()
+    for u, v, d in el:
+        d['weight'] = 0
+        cp.update_edge(u, v)
+        cp.length
+    incremental = (time.time() - start) / max(1, len(el))
+
+    for (_, _, d), w in zip(el, weights):
+        d['weight'] = w
+    start = time.time()
+    for u, v, d in el[:max_full]:
+        d['weight'] = 0
+        CriticalPath(G, topo_sort=topo_sort).length
+    full = (time.time() - start) / max(1, min(max_full, len(el)))
+
+    for (_, _, d), w in zip(el, weights):
+        d['weight'] = w
+    return incremental, full
+
+if __name__ == '__main__':
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-f", "--factors", action="store", type="string",
+                      dest="factors", help="Comma-separated factors by which constructs' DoP are multiplied", default="1,2,4")
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to partition, defaults to all samples", default=None)
+    parser.add_option("-d", "--max-dop", action="store", type="int",
+                      dest="max_dop", help="Maximum DoP of each partition", default=8)
+    parser.add_option("-n", "--full", action="store", type="int",
+                      dest="full", help="Number of edges for which the longest path is recomputed from scratch", default=100)
+    (options, args) = parser.parse_args(sys.argv)
+
+    if options.lgs:
+        fnames = [os.path.join(lg_dir, name) for name in options.lgs.split(',')]
+    else:
+        fnames = sorted(glob.glob(os.path.join(lg_dir, '*.json')))
+    factors = [int(f) for f in options.factors.split(',')]
+
+    for fname in fnames:
+        with open(fname) as f:
+            lg = json.load(f)
+        for factor in factors:
+            name = "%s x%d" % (os.path.basename(fname), factor)
+            try:
+                content = six.text_type(json.dumps(scale_lg(lg, factor)))
+                drop_list = LG(io.StringIO(content)).unroll_to_tpl()
+            except Exception as e:
+                print("%s: failed to unroll (%s)" % (name, e))
+                continue
+            G = DAGUtil.build_dag_from_drops(drop_list)
+            n_edges = len(G.edges())
+            print("%s: %d nodes, %d edges" % (name, len(G.nodes()), n_edges))
+
+            incremental, full = replay(G, options.full)
+            print("    longest path per zeroed edge: %.3f [ms] incremental, %.3f [ms] from scratch (%.1fx)" %
+                  (incremental * 1e3, full * 1e3, full / incremental if incremental else float('inf')))
+            print("    over all edges: %.3f [s] incremental, ~%.3f [s] from scratch" %
+                  (incremental * n_edges, full * n_edges))
+
+            try:
+                start = time.time()
+                num_parts, lpl, _, _ = MySarkarScheduler(drop_list, max_dop=options.max_dop).partition_dag()
+                delta = time.time() - start
+            except Exception as e:
+                print("    partitioning failed (%s)" % (e,))
+                continue
+            print("    partitioned into %d partitions in %.3f [s] (%.0f edges/s), longest path = %d" %
+                  (num_parts, delta, n_edges / delta, lpl))
@@ -0,0 +1,80 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark for the search-based schedulers. The PSO scheduler is run
+evaluating its particles serially and in a pool of processes, and the SA and
+MCTS schedulers are run with a single search and with multiple searches in
+parallel. The time to solution and the quality of the solution (number of
+partitions and longest path) are reported for each run.
+"""
+
+from optparse import OptionParser
+import os
+import sys
+import time
+
+from dfms.dropmake.pg_generator import LG
+from dfms.dropmake.scheduler import PSOScheduler, SAScheduler, MCTSScheduler
+
+
+def run(name, scheduler):
+    start = time.time()
+    try:
+        num_parts, lpl, _, _ = scheduler.partition_dag()
+    except Exception as e:
+        print("    %s: failed (%s)" % (name, e))
+        return
+    print("    %s: %d partitions, longest path = %d in %.3f [s]" % (name, num_parts, lpl, time.time() - start))
+
+if __name__ == '__main__':
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to partition", default="lofar_std.json")
+    parser.add_option("-p", "--processes", action="store", type="int",
+                      dest="processes", help="Number of processes for the parallel runs", default=4)
+    parser.add_option("-d", "--max-dop", action="store", type="int",
+                      dest="max_dop", help="Maximum DoP of each partition", default=4)
+    parser.add_option("-D", "--deadline", action="store", type="int",
+                      dest="deadline", help="Deadline (optional)", default=None)
+    parser.add_option("-s", "--swarm-size", action="store", type="int",
+                      dest="swarm_size", help="Swarm size for PSO", default=40)
+    parser.add_option("-i", "--max-iter", action="store", type="int",
+                      dest="max_iter", help="Number of annealing steps for SA", default=1000)
+    parser.add_option("-t", "--calc-time", action="store", type="float",
+                      dest="calc_time", help="Calculation time per move for MCTS", default=0.25)
+    (options, args) = parser.parse_args(sys.argv)
+
+    p = options.processes
+    for lg_name in options.lgs.split(','):
+        drop_list = LG(os.path.join(lg_dir, lg_name)).unroll_to_tpl()
+        print("%s: %d drops" % (lg_name, len(drop_list)))
+        common = {'max_dop': options.max_dop, 'deadline': options.deadline}
+
+        run("PSO, serial", PSOScheduler(drop_list, swarm_size=options.swarm_size, **common))
+        run("PSO, %d processes" % p, PSOScheduler(drop_list, swarm_size=options.swarm_size, processes=p, **common))
+        run("SA, 1 start", SAScheduler(drop_list, max_iter=options.max_iter, **common))
+        run("SA, %d starts in %d processes" % (p, p), SAScheduler(drop_list, max_iter=options.max_iter, starts=p, processes=p, **common))
+        run("MCTS, 1 start", MCTSScheduler(drop_list, max_calc_time=options.calc_time, **common))
+        run("MCTS, %d starts in %d processes" % (p, p), MCTSScheduler(drop_list, max_calc_time=options.calc_time, starts=p, processes=p, **common))
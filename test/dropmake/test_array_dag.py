@@ -0,0 +1,181 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+import random
+import unittest
+
+import networkx as nx
+import pkg_resources
+
+from dfms.dropmake.array_dag import ArrayDAG
+from dfms.dropmake.drop_columns import DropColumns
+from dfms.dropmake.pg_generator import LG
+from dfms.dropmake.scheduler import DAGUtil, CriticalPath
+
+
+lgs = ['chiles_simple.json', 'cont_img.json', 'linked_loops.json',
+       'lofar_std.json', 'test_grpby_gather.json']
+
+def unroll(lg_name):
+    fname = pkg_resources.resource_filename(__name__, 'logical_graphs/{0}'.format(lg_name))  # @UndefinedVariable
+    return LG(fname, ssid='1').unroll_to_tpl()
+
+def random_dag(rand, n=60, p=0.1):
+    G = nx.gnp_random_graph(n, p, seed=rand.randint(0, 1000), directed=True)
+    G = nx.DiGraph([(u, v) for u, v in G.edges() if u < v])
+    for u, v, d in G.edges(data=True):
+        d['weight'] = rand.randint(1, 10)
+    for n, d in G.nodes(data=True):
+        d['weight'] = rand.randint(0, 5)
+    return G
+
+class TestArrayDAG(unittest.TestCase):
+
+    def test_build(self):
+        for lg_name in lgs:
+            drop_list = unroll(lg_name)
+            for drops in (drop_list, DropColumns(drop_list)):
+                G = DAGUtil.build_dag_from_drops(drops)
+                A = DAGUtil.build_array_dag_from_drops(drops)
+                # same nodes and edges, in the same order
+                self.assertEqual(list(G.nodes()), A.nodes())
+                self.assertEqual(list(G.edges(data=True)), [(u, v, dict(d)) for u, v, d in A.edges(data=True)])
+                self.assertEqual(dict(G.nodes(data=True)), dict((n, dict(d)) for n, d in A.nodes(data=True)))
+
+    def test_views(self):
+        A = ArrayDAG.from_networkx(nx.DiGraph([(1, 2, {'weight': 3}), (2, 3, {'weight': 4}), (1, 3, {})]))
+        self.assertEqual(3, len(A))
+        self.assertEqual(3, A.number_of_edges())
+        self.assertEqual([2, 3], A.successors(1))
+        self.assertEqual([1, 2], sorted(A.predecessors(3)))
+        self.assertEqual({'weight': 3}, A.edge[1][2])
+        self.assertNotIn('weight', A.edge[1][3])
+        self.assertEqual(1, A.edge[1][3].get('weight', 1))
+        self.assertRaises(KeyError, lambda: A.edge[2][1])
+
+        # writes go through to the columns
+        for n in A:
+            A.node[n]['gid'] = n + 6
+        A.node[2]['text'] = 'two'
+        A.edge[1][2]['weight'] /= 2.0
+        self.assertEqual({'gid': 7}, A.node[1])
+        gids = A.node_array('gid')
+        self.assertEqual([7, 8, 9], gids.tolist())
+        gids[gids > 7] -= 1
+        self.assertEqual(8, A.node[3]['gid'])
+        self.assertEqual(1.5, A.pred[2][1]['weight'])
+        self.assertEqual(4, A.edge[2][3]['weight'])
+        self.assertRaises(ValueError, A.node_array, 'text')
+        del A.node[1]['gid']
+        self.assertNotIn('gid', A.node[1])
+
+        # copies are independent
+        B = A.copy()
+        B.node[2]['text'] = 'three'
+        B.edge[2][3]['weight'] = 0
+        B.add_edge(3, 4, weight=1)
+        self.assertEqual('two', A.node[2]['text'])
+        self.assertEqual(4, A.edge[2][3]['weight'])
+        self.assertEqual([1, 2, 3], A.nodes())
+        self.assertEqual([1, 2, 3, 4], B.nodes())
+
+        # structure changes
+        A.add_nodes_from([(-1, {'gid': None})])
+        A.add_edges_from([(3, -1), (1, 2, {'weight': 2})])
+        A.remove_edges_from([(1, 3), (3, 1)])
+        self.assertEqual([(1, 2), (2, 3), (3, -1)], A.edges())
+        self.assertEqual(2, A.edge[1][2]['weight'])
+        self.assertIsNone(A.node[-1]['gid'])
+        self.assertEqual([1, 2, 3, -1], A.topological_sort())
+        self.assertRaises(nx.NetworkXError, A.remove_edge, 1, 3)
+        A.add_edge(-1, 1)
+        self.assertFalse(A.is_directed_acyclic_graph())
+
+    def test_copy_on_write(self):
+        A = ArrayDAG.from_networkx(nx.DiGraph([(1, 2, {'weight': 3}), (2, 3, {'weight': 4})]))
+        for n in A:
+            A.node[n]['gid'] = n
+        A.add_edge(1, 3, weight=5)
+        B = A.copy()
+        self.assertIs(A._src, B._src)
+        self.assertIs(A._ncols['gid'], B._ncols['gid'])
+
+        # changes on either side are not seen by the other, even when made
+        # to the room left in the arrays for new edges
+        A.node_array('gid')[:] = 0
+        A.add_edge(3, 4, weight=1)
+        B.add_edge(3, 5, weight=2)
+        B.node[1]['gid'] = 10
+        del A.edge[1][2]['weight']
+        B.remove_edge(2, 3)
+        self.assertEqual([(1, 2), (1, 3), (2, 3), (3, 4)], A.edges())
+        self.assertEqual([(1, 2), (1, 3), (3, 5)], B.edges())
+        self.assertEqual([0, 0, 0, None], [A.node[n].get('gid') for n in A])
+        self.assertEqual([10, 2, 3, None], [B.node[n].get('gid') for n in B])
+        self.assertEqual({}, A.edge[1][2])
+        self.assertEqual({'weight': 3}, B.edge[1][2])
+        self.assertEqual(5, B.edge[1][3]['weight'])
+        self.assertTrue(A.has_path(1, 4))
+        self.assertTrue(B.has_path(1, 5))
+        self.assertFalse(B.has_path(2, 3))
+        self.assertFalse(4 in B)
+        self.assertFalse(5 in A)
+
+    def test_longest_path(self):
+        rand = random.Random(1)
+        for _ in range(20):
+            G = random_dag(rand)
+            A = ArrayDAG.from_networkx(G)
+            cp = CriticalPath(G)
+            path, length = DAGUtil.get_longest_path(A)
+            self.assertEqual(cp.length, length)
+            expected = A.node[path[-1]]['weight']
+            for u, v in zip(path, path[1:]):
+                expected += A.node[u]['weight'] + A.edge[u][v]['weight']
+            self.assertEqual(expected, length)
+
+            top, bottom = A.levels()
+            self.assertEqual(cp._top, top)
+            self.assertEqual(cp._bottom, bottom)
+
+            # the incremental version works on ArrayDAGs too
+            cpa = CriticalPath(A)
+            for u, v, d in DAGUtil.edges_by_weight(A):
+                d['weight'] = 0
+                cpa.update_edge(u, v)
+                self.assertEqual(DAGUtil.get_longest_path(A, show_path=False)[1], cpa.length)
+
+    def test_has_path(self):
+        rand = random.Random(2)
+        for _ in range(10):
+            G = random_dag(rand, p=0.05)
+            A = ArrayDAG.from_networkx(G)
+            nodes = list(G.nodes())
+            for _ in range(200):
+                u, v = rand.choice(nodes), rand.choice(nodes)
+                self.assertEqual(nx.has_path(G, u, v), A.has_path(u, v))
+                # edges that keep the graph acyclic are searched before
+                # the structure is rebuilt
+                if (rand.random() < 0.1 and not A.has_path(v, u)):
+                    G.add_edge(u, v)
+                    A.add_edge(u, v)
+            self.assertTrue(A.is_directed_acyclic_graph())
+            self.assertEqual(list(G.edges()), A.edges())
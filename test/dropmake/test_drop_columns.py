@@ -0,0 +1,127 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+import copy
+import json
+import unittest
+
+import pkg_resources
+
+from dfms.drop import dropdict
+from dfms.dropmake.drop_columns import DropColumns
+from dfms.dropmake.pg_generator import LG, PGT, MetisPGTP
+from dfms.dropmake.scheduler import DAGUtil
+
+
+lgs = ['chiles_simple.json', 'cont_img.json', 'linked_loops.json',
+       'lofar_std.json', 'test_grpby_gather.json']
+
+def unroll(lg_name):
+    fname = pkg_resources.resource_filename(__name__, 'logical_graphs/{0}'.format(lg_name))  # @UndefinedVariable
+    return LG(fname, ssid='1').unroll_to_tpl()
+
+class TestDropColumns(unittest.TestCase):
+
+    def test_roundtrip(self):
+        for lg_name in lgs:
+            drop_list = unroll(lg_name)
+            drops = DropColumns(drop_list)
+            self.assertEqual(len(drop_list), len(drops))
+            self.assertLess(drops.num_templates, len(drops) + 1)
+            expanded = list(drops.expanded())
+            self.assertEqual(drop_list, expanded)
+            # including the order of the keys
+            self.assertEqual(json.dumps(drop_list), json.dumps(expanded))
+
+    def test_views(self):
+
+        drops = DropColumns([
+            dropdict({'oid': 'A_0', 'iid': '0', 'type': 'plain', 'storage': 'memory', 'nm': 'A', 'consumers': ['B_0']}),
+            dropdict({'oid': 'A_1', 'iid': '1', 'type': 'plain', 'storage': 'memory', 'nm': 'A', 'dw': 2, 'consumers': ['B_0', 'X']}),
+            dropdict({'oid': 'B_0', 'iid': '0', 'type': 'app', 'app': 'test.graphsRepository.SleepApp', 'nm': 'B', 'inputs': ['A_0', 'A_1']}),
+        ])
+
+        # A_* share a template, and the extra 'dw' is an override
+        self.assertEqual(2, drops.num_templates)
+        a0, a1, b0 = drops
+        self.assertEqual('A_1', a1['oid'])
+        self.assertNotIn('dw', a0)
+        self.assertEqual(2, a1['dw'])
+        self.assertEqual(['B_0', 'X'], a1['consumers'])
+        self.assertEqual(['A_0', 'A_1'], b0['inputs'])
+        self.assertEqual([2], list(drops.neighbours(0, 'consumers')))
+        self.assertEqual([0, 1], list(drops.neighbours(2, 'inputs')))
+        self.assertEqual(1, drops.index('A_1'))
+        self.assertRaises(KeyError, lambda: a0['dw'])
+
+        # Writes go through to the columns
+        a0['node'] = '#1'
+        a0.addConsumer({'oid': 'A_1'})
+        a0.addConsumer({'oid': 'B_0'})
+        self.assertEqual('#1', drops[0]['node'])
+        self.assertEqual(['B_0', 'A_1'], drops[0]['consumers'])
+        self.assertEqual([2, 1], list(drops.neighbours(0, 'consumers')))
+        self.assertNotIn('node', drops[1])
+        self.assertEqual({'oid': 'A_0', 'iid': '0', 'type': 'plain', 'storage': 'memory',
+                          'nm': 'A', 'consumers': ['B_0', 'A_1'], 'node': '#1'}, a0.expand())
+
+    def test_missing_keys(self):
+        # x_2 lacks 'b' but has as many keys as x_1 thanks to 'consumers'
+        drops = DropColumns([
+            {'oid': 'x_1', 'iid': '1', 'type': 'plain', 'nm': 'n', 'a': 1, 'b': 2},
+            {'oid': 'x_2', 'iid': '2', 'type': 'plain', 'nm': 'n', 'a': 1, 'consumers': ['x_1']},
+        ])
+        self.assertEqual(1, drops.num_templates)
+        self.assertEqual({'oid': 'x_2', 'iid': '2', 'type': 'plain', 'nm': 'n', 'a': 1, 'consumers': ['x_1']},
+                         drops.expand(1))
+
+    def test_build_dag(self):
+        for lg_name in lgs:
+            drop_list = unroll(lg_name)
+            G1 = DAGUtil.build_dag_from_drops(drop_list, embed_drop=False)
+            G2 = DAGUtil.build_dag_from_drops(DropColumns(drop_list), embed_drop=False)
+            self.assertEqual(dict(G1.nodes(data=True)), dict(G2.nodes(data=True)))
+            self.assertEqual(sorted(G1.edges(data=True)), sorted(G2.edges(data=True)))
+
+    def test_pgt(self):
+        for lg_name in lgs:
+            drop_list = unroll(lg_name)
+            drops = DropColumns(copy.deepcopy(drop_list))
+            self.assertEqual(PGT(drop_list).to_gojs_json(string_rep=False),
+                             PGT(drops).to_gojs_json(string_rep=False))
+
+            # The extra drops created for the visualisation are linked to the
+            # DROPs in the columns
+            self.assertEqual(drop_list, list(drops.expanded()))
+
+    def test_metis_partition_input(self):
+        for lg_name in lgs:
+            drop_list = unroll(lg_name)
+            inputs = []
+            for drops in (drop_list, DropColumns(drop_list)):
+                # Don't require the METIS library to be installed
+                pgtp = MetisPGTP.__new__(MetisPGTP)
+                pgtp._drop_list = drops
+                pgtp._drop_list_len = len(drops)
+                inputs.append(pgtp.to_partition_input())
+            G1, G2 = inputs
+            self.assertEqual(dict(G1.nodes(data=True)), dict(G2.nodes(data=True)))
+            self.assertEqual(sorted(G1.edges(data=True)), sorted(G2.edges(data=True)))
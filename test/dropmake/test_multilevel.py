@@ -0,0 +1,119 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+import unittest
+
+import networkx as nx
+import numpy as np
+import pkg_resources
+
+from dfms.dropmake.pg_generator import LG, MetisPGTP, MySarkarPGTP
+from dfms.dropmake.scheduler import DAGUtil, SchedulerException
+from dfms.dropmake.utils import multilevel
+
+
+def unroll(lg_name):
+    fname = pkg_resources.resource_filename(__name__, 'logical_graphs/{0}'.format(lg_name))  # @UndefinedVariable
+    return LG(fname, ssid='1').unroll_to_tpl()
+
+def cut_of(G, parts, weight=None):
+    index = dict((n, i) for i, n in enumerate(G.nodes()))
+    return sum(d.get(weight, 1) if weight else 1 for u, v, d in G.edges(data=True)
+               if parts[index[u]] != parts[index[v]])
+
+class TestMultilevel(unittest.TestCase):
+
+    def test_grid(self):
+        G = nx.grid_2d_graph(40, 40)
+        for k in (2, 5, 16):
+            cut, parts = multilevel.part_graph(G, k, ufactor=30)
+            self.assertEqual(cut_of(G, parts), cut)
+            sizes = np.bincount(parts, minlength=k)
+            self.assertEqual(k, np.count_nonzero(sizes))
+            self.assertLessEqual(sizes.max(), max(1.03 * len(G) / k, len(G) // k + 1))
+            # a straight cut is 40 edges long per part boundary
+            self.assertLess(cut, 2 * 40 * k)
+            # the same seed gives the same partition
+            self.assertEqual(parts, multilevel.part_graph(G, k, ufactor=30)[1])
+
+    def test_weights(self):
+        # two weighted cliques joined by a light edge
+        G = nx.Graph()
+        G.graph['edge_weight_attr'] = 'weight'
+        G.graph['node_weight_attr'] = 'tw'
+        for offset in (0, 10):
+            G.add_edges_from(((offset + i, offset + j, {'weight': 5})
+                              for i in range(10) for j in range(i + 1, 10)))
+        G.add_edge(0, 10, weight=1)
+        for n in G.nodes():
+            G.node[n]['tw'] = 1
+        cut, parts = multilevel.part_graph(G, 2)
+        self.assertEqual(1, cut)
+        self.assertEqual(1, len(set(parts[:10])))
+        self.assertNotEqual(parts[0], parts[10])
+        self.assertEqual(2, multilevel.part_graph(G, 2, objtype='vol')[0])
+
+        # a heavy vertex is balanced by many light ones
+        G.node[0]['tw'] = 18
+        cut, parts = multilevel.part_graph(G, 2)
+        weights = [0, 0]
+        for i, n in enumerate(G.nodes()):
+            weights[parts[i]] += G.node[n]['tw']
+        # within the average plus the mean vertex weight
+        self.assertLessEqual(max(weights), 37 / 2.0 + 37 / 20.0)
+
+    def test_corner_cases(self):
+        G = nx.Graph()
+        self.assertEqual((0, []), multilevel.part_graph(G, 4))
+        G.add_nodes_from(range(3))
+        self.assertEqual((0, [0, 1, 2]), multilevel.part_graph(G, 4))
+        G.add_nodes_from(range(20))
+        cut, parts = multilevel.part_graph(G, 4)
+        self.assertEqual(0, cut)
+        self.assertEqual([5, 5, 5, 5], np.bincount(parts).tolist())
+        # stars are coarsened by matching their leaves together
+        G = nx.star_graph(1000)
+        cut, parts = multilevel.part_graph(G, 4)
+        self.assertEqual(cut_of(G, parts), cut)
+        self.assertEqual(4, len(set(parts)))
+
+    def test_import_partitioner(self):
+        self.assertIs(multilevel, DAGUtil.import_partitioner('native'))
+        self.assertRaises(SchedulerException, DAGUtil.import_partitioner, 'unknown')
+        self.assertTrue(hasattr(DAGUtil.import_partitioner('auto'), 'part_graph'))
+
+    def test_pgtp(self):
+        drop_list = unroll('lofar_std.json')
+        pgtp = MetisPGTP(drop_list, 8, merge_parts=True, partitioner='native')
+        outdict = {}
+        pgtp.to_gojs_json(string_rep=False, visual=True, outdict=outdict)
+        G = pgtp._G
+        parts = [G.node[n]['gid'] for n in G.nodes()]
+        self.assertEqual(8, len(set(parts)))
+        self.assertEqual(cut_of(G, parts, 'weight'), outdict['edgecuts'])
+        pgtp.merge_partitions(2, form_island=True, island_type=1, visual=True)
+        self.assertEqual(set([0, 1]), set(pgtp._gid_island_id_map.values()))
+
+        pgtp = MySarkarPGTP(drop_list, merge_parts=True, partitioner='native')
+        pgtp.to_gojs_json(string_rep=False, visual=True)
+        pgtp.merge_partitions(2, form_island=False)
+        self.assertEqual(2, pgtp._num_parts_done)
+        self.assertEqual(set([0, 1]), set(pgtp._oid_gid_map.values()))
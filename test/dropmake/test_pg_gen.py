@@ -53,6 +53,52 @@ class TestPGGen(unittest.TestCase):
         #lg.to_pg_tpl(input_dict)
         #pprint.pprint(dict(lg._drop_dict))
 
+    def test_linked_loops(self):
+        fp = get_lg_fname('linked_loops.json')
+        lg = LG(fp)
+        drop_list = lg.unroll_to_tpl()
+        drops = dict((d['oid'], d) for d in drop_list)
+        self.assertEqual(20, len(drops))
+        # each iteration of Loop B consumes the output of the same iteration of Loop A
+        for d in drop_list:
+            if d['nm'] != 'App B':
+                continue
+            loop_a_inputs = [drops[i] for i in d['inputs'] if drops[i]['nm'] == 'Data A']
+            self.assertEqual(1, len(loop_a_inputs))
+            self.assertEqual(d['loop_cxt'], loop_a_inputs[0]['loop_cxt'])
+
+    def test_unroll_iter(self):
+
+        # Some weights are random, so compare the drops and their links
+        def links(drops):
+            rels = ('inputs', 'consumers', 'outputs', 'producers')
+            return dict((d['oid'], [sorted(d.get(rel, [])) for rel in rels]) for d in drops)
+
+        for lg_name in ['lofar_std.json', 'cont_img.json', 'linked_loops.json']:
+            drop_list = LG(get_lg_fname(lg_name)).unroll_to_tpl()
+            drop_iter = LG(get_lg_fname(lg_name)).unroll_to_tpl_iter()
+            self.assertNotIsInstance(drop_iter, list)
+            streamed = list(drop_iter)
+            self.assertEqual(links(drop_list), links(streamed))
+
+            # Drops come after all the drops they are linked from
+            seen = set()
+            for drop in streamed:
+                for rel in ('inputs', 'streamingInputs', 'producers'):
+                    self.assertTrue(seen.issuperset(drop.get(rel, [])))
+                seen.add(drop['oid'])
+
+    def test_unroll_parallel(self):
+
+        # Weights are sometimes random, the rest must be exactly the same
+        def strip(drops):
+            return [dict((k, v) for k, v in d.items() if k not in ('tw', 'sleepTime')) for d in drops]
+
+        for lg_name in ['lofar_std.json', 'cont_img.json', 'test_grpby_gather.json', 'linked_loops.json']:
+            serial = LG(get_lg_fname(lg_name), ssid='1').unroll_to_tpl()
+            parallel = LG(get_lg_fname(lg_name), ssid='1').unroll_to_tpl(processes=2)
+            self.assertEqual(strip(serial), strip(parallel))
+
     def test_pgt_to_json(self):
         fp = get_lg_fname('lofar_std.json')
         lg = LG(fp)
@@ -20,14 +20,18 @@
 #    MA 02111-1307  USA
 
 import os
+import random
 import unittest
 
+import networkx as nx
+import numpy as np
 import pkg_resources
 import psutil
 
 from dfms.dropmake.pg_generator import LG
 from dfms.dropmake.scheduler import (Scheduler, MySarkarScheduler, DAGUtil,
-Partition, MinNumPartsScheduler, PSOScheduler, SAScheduler, MCTSScheduler)
+Partition, MinNumPartsScheduler, PSOScheduler, SAScheduler, MCTSScheduler,
+CriticalPath, SchedulerException)
 
 
 if 'DALIUGE_TESTS_RUNLONGTESTS' in os.environ:
@@ -47,16 +51,109 @@ class TestScheduler(unittest.TestCase):
     def test_incremental_antichain(self):
         part = Partition(100, 8)
         G = part._dag
-        assert(part.probe_max_dop(1, 2, True, True, True) == DAGUtil.get_max_dop(part._dag))
+        assert(part.probe_max_dop(True) == DAGUtil.get_max_dop(part._dag))
         G.add_edge(2, 3)
-        assert(part.probe_max_dop(2, 3, False, True, True) == DAGUtil.get_max_dop(part._dag))
+        assert(part.probe_max_dop(True) == DAGUtil.get_max_dop(part._dag))
         # G.add_edge(1, 4)
-        # assert(part.probe_max_dop(1, 4, False, True, True) == DAGUtil.get_max_dop(part._dag))
+        # assert(part.probe_max_dop(True) == DAGUtil.get_max_dop(part._dag))
         # G.add_edge(2, 5)
-        l = part.probe_max_dop(2, 5, False, True, True)
+        l = part.probe_max_dop(True)
         r = DAGUtil.get_max_dop(part._dag)
         assert l == r, "l = {0}, r = {1}".format(l, r)
 
+    def test_max_antichain(self):
+        rand = random.Random(1)
+        for _ in range(100):
+            n = rand.randint(0, 10)
+            G = nx.DiGraph()
+            G.add_nodes_from(range(n))
+            G.add_edges_from((u, v) for u in range(n) for v in range(u + 1, n) if rand.random() < 0.25)
+            weights = dict((m, rand.randint(0, 5)) for m in range(n))
+            for m, w in weights.items():
+                G.add_node(m, weight=w)
+
+            max_dop = max(len(ac) for ac in nx.antichains(G))
+            max_width = max(sum(weights[m] for m in ac) for ac in nx.antichains(G))
+            self.assertEqual(max_dop, DAGUtil.get_max_dop(G))
+            self.assertEqual(max_width, DAGUtil.get_max_width(G))
+
+            for weight, width in ((None, max_dop), ('weight', max_width)):
+                antichain, w = DAGUtil.get_max_antichain(G, weight=weight)
+                self.assertEqual(width, w)
+                for u in antichain:
+                    self.assertFalse(nx.descendants(G, u).intersection(antichain))
+
+    def test_critical_path(self):
+        G = nx.DiGraph()
+        G.add_weighted_edges_from([(1, 2, 2), (2, 3, 4), (1, 4, 1), (4, 3, 1), (5, 6, 1)])
+        G.add_node(7)
+        for n, w in ((2, 10), (3, 5)):
+            G.add_node(n, weight=w)
+        cp = CriticalPath(G)
+        self.assertEqual(21, cp.length)
+        self.assertEqual([1, 2, 3], cp.path)
+        self.assertEqual(21, cp.length_through(2, 3))
+        self.assertEqual(7, cp.length_through(4, 3))
+
+        for (u, v), w, length in (((2, 3), 0, 17), ((1, 2), 0, 15), ((1, 2), 2, 17)):
+            G[u][v]['weight'] = w
+            cp.update_edge(u, v)
+            self.assertEqual(length, cp.length)
+            self.assertEqual([1, 2, 3], cp.path)
+
+    def test_incremental_critical_path(self):
+        rand = random.Random(1)
+        for _ in range(10):
+            G = nx.gnp_random_graph(60, 0.1, seed=rand.randint(0, 1000), directed=True)
+            G = nx.DiGraph([(u, v) for u, v in G.edges() if u < v])
+            for u, v, d in G.edges(data=True):
+                d['weight'] = rand.randint(1, 10)
+            for n, d in G.nodes(data=True):
+                d['weight'] = rand.randint(0, 5)
+
+            # Zero the edges like MySarkarScheduler does, and sometimes
+            # revert the change
+            cp = CriticalPath(G)
+            el = sorted(G.edges(data=True), key=lambda e: -e[2]['weight'])
+            for u, v, d in el:
+                ow = d['weight']
+                d['weight'] = 0 if rand.random() < 0.7 else ow * 2
+                cp.update_edge(u, v)
+                expected = CriticalPath(G)
+                self.assertEqual(expected.length, cp.length)
+                self.assertEqual(expected.path, cp.path)
+                for e in G.edges():
+                    self.assertEqual(expected.length_through(*e), cp.length_through(*e))
+
+    def test_multi_start(self):
+
+        class FakeSearchScheduler(SAScheduler):
+            def _search(self, seed):
+                return (seed, seed % 1000)
+
+        drop_list = LG(get_lg_fname('chiles_simple.json')).unroll_to_tpl()
+        for starts in (2, 5):
+            results = []
+            for processes in (1, 3):
+                sched = FakeSearchScheduler(drop_list, starts=starts, processes=processes)
+                random.seed(starts)
+                results.append(sched._multi_start(starts, processes))
+            state, score = results[0]
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(state % 1000, score)
+            random.seed(starts)
+            self.assertEqual(score, min(random.randint(0, 2 ** 31 - 1) % 1000 for _ in range(starts)))
+
+    def test_parallel_searches(self):
+        drop_list = LG(get_lg_fname('chiles_simple.json')).unroll_to_tpl()
+        for sched in (SAScheduler(drop_list, max_dop=4, max_iter=100, starts=2, processes=2),
+                      PSOScheduler(drop_list, max_dop=4, swarm_size=4, processes=2),
+                      PSOScheduler(drop_list, max_dop=4, deadline=1000, swarm_size=4, processes=2)):
+            num_parts, lpl, _, parts = sched.partition_dag()
+            self.assertGreater(num_parts, 0)
+            self.assertGreater(lpl, 0)
+            self.assertEqual(len(drop_list), sum(part.cardinality for part in parts))
+
     def test_basic_scheduler(self):
         fp = get_lg_fname('lofar_std.json')
         lg = LG(fp)
@@ -92,6 +189,51 @@ class TestScheduler(unittest.TestCase):
                 """
             #mys.merge_partitions(numparts)
 
+    def test_schedule_runs(self):
+
+        def block_means(ma, rf, cf):
+            M, N = ma.shape
+            return np.array([[ma[i:i + rf, j:j + cf].mean() for j in range(0, N, cf)]
+                             for i in range(0, M, rf)])
+
+        fp = get_lg_fname('lofar_std.json')
+        drop_list = LG(fp).unroll_to_tpl()
+        mys = MySarkarScheduler(drop_list, max_dop=8)
+        _, _, _, parts = mys.partition_dag()
+        checked = 0
+        for part in parts:
+            if (part.cardinality == 0):
+                continue
+            sched = part.schedule
+            try:
+                ma = sched.schedule_matrix
+            except SchedulerException:
+                # lanes cannot always be assigned greedily
+                continue
+            checked += 1
+            self.assertEqual(int(np.mean(np.count_nonzero(ma, axis=0))), sched.workload)
+            runs, shape = sched.schedule_runs
+            self.assertEqual(ma.shape, shape)
+            ds, scale = DAGUtil.downsample_runs(runs, shape, 3, 5)
+            self.assertLessEqual(ds.shape[0], 3)
+            self.assertLessEqual(ds.shape[1], 5)
+            self.assertTrue(np.allclose(block_means(ma != 0, *scale), ds))
+        self.assertGreater(checked, 0)
+
+        # gantt chart of the whole graph
+        G = mys._dag
+        DAGUtil.label_schedule(G)
+        ma = DAGUtil.ganttchart_matrix(G)
+        runs, shape = DAGUtil.ganttchart_runs(G)
+        self.assertEqual((len(G), DAGUtil.get_longest_path(G)[1]), ma.shape)
+        self.assertEqual(len(runs), np.count_nonzero(ma.any(axis=1)))
+        for i, n in enumerate(DAGUtil.topological_sort(G)):
+            node = G.node[n]
+            self.assertEqual(node['edt'] - node['stt'], ma[i].sum())
+        for max_rows, max_cols in ((10, 10), (7, 1000), (1000, 3), (1000, 1000)):
+            ds, scale = DAGUtil.downsample_runs(runs, shape, max_rows, max_cols)
+            self.assertTrue(np.allclose(block_means(ma, *scale), ds))
+
     @unittest.skipIf(skip_long_tests, "Skipping because they take too long. Chen to eventually shorten them")
     def test_pso_scheduler(self):
         lgs = {'cont_img.json': 540, 'lofar_std.json': 450, 'test_grpby_gather.json': 70, 'chiles_simple.json': 160}
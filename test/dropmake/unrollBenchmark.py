@@ -0,0 +1,110 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark for the unrolling of logical graphs. Each of the sample
+logical graphs is scaled up by multiplying the degree of parallelism of its
+constructs (i.e., the number of copies, splits, iterations and processes) by
+the given factors, and then unrolled. Optionally the unrolling is also done
+with a pool of processes, reporting the speedup against the serial unrolling
+and the best speedup possible given the fraction of the time that is spent in
+the parallel part (i.e., converting the constructs, but not linking them).
+"""
+
+from optparse import OptionParser
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import six
+
+from dfms.dropmake.pg_generator import LG
+
+
+dop_keys = ('num_of_copies', 'num_of_splits', 'num_of_iter', 'num_of_procs')
+
+def scale_lg(lg, factor):
+    """
+    Returns a copy of logical graph `lg` with the DoP of its constructs
+    multiplied by `factor`
+    """
+    lg = json.loads(json.dumps(lg))
+    for node in lg['nodeDataArray']:
+        for k in dop_keys:
+            if k in node:
+                node[k] = int(node[k]) * factor
+    return lg
+
+def unroll(lg, processes=1):
+    """Unrolls `lg` and returns the number of drops and how long it took"""
+    start = time.time()
+    drop_list = LG(io.StringIO(six.text_type(json.dumps(lg)))).unroll_to_tpl(processes=processes)
+    return len(drop_list), time.time() - start
+
+def conversion_time(lg):
+    """
+    Returns how long it takes to convert the constructs of `lg` into drops,
+    without linking them; this is the only part done in parallel
+    """
+    lg = LG(io.StringIO(six.text_type(json.dumps(lg))))
+    start = time.time()
+    for lgn in lg._start_list:
+        lg.lgn_to_pgn(lgn)
+    return time.time() - start
+
+if __name__ == '__main__':
+
+    lg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logical_graphs')
+
+    parser = OptionParser()
+    parser.add_option("-f", "--factors", action="store", type="string",
+                      dest="factors", help="Comma-separated factors by which constructs' DoP are multiplied", default="1,2,4")
+    parser.add_option("-l", "--lgs", action="store", type="string",
+                      dest="lgs", help="Comma-separated logical graphs to unroll, defaults to all samples", default=None)
+    parser.add_option("-p", "--processes", action="store", type="int",
+                      dest="processes", help="Number of processes to also unroll with, 1 means serial only", default=1)
+    (options, args) = parser.parse_args(sys.argv)
+
+    if options.lgs:
+        fnames = [os.path.join(lg_dir, name) for name in options.lgs.split(',')]
+    else:
+        fnames = sorted(glob.glob(os.path.join(lg_dir, '*.json')))
+    factors = [int(f) for f in options.factors.split(',')]
+
+    for fname in fnames:
+        with open(fname) as f:
+            lg = json.load(f)
+        for factor in factors:
+            try:
+                n, delta = unroll(scale_lg(lg, factor))
+            except Exception as e:
+                print("%s x%d: failed (%s)" % (os.path.basename(fname), factor, e))
+                continue
+            print("%s x%d: %d drops in %.3f [s] (%.0f drops/s)" % (os.path.basename(fname), factor, n, delta, n / delta))
+            if options.processes > 1:
+                _, pdelta = unroll(scale_lg(lg, factor), processes=options.processes)
+                parallel = min(1., conversion_time(scale_lg(lg, factor)) / delta)
+                best = 1 / (1 - parallel + parallel / options.processes)
+                print("    with %d processes: %.3f [s] (%.2fx, at most %.2fx since %.0f%% of the time is parallel)" %
+                      (options.processes, pdelta, delta / pdelta, best, parallel * 100))
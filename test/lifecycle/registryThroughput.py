@@ -0,0 +1,99 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small throughput benchmark for the RDBMSRegistry against an sqlite database.
+A number of threads register DROPs, change their phases and record accesses to
+them, like the DLM and the DROPs themselves do, first with each modification
+written in its own transaction and then with the write-behind mode.
+"""
+
+from optparse import OptionParser
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from dfms.drop import InMemoryDROP
+from dfms.lifecycle.registry import RDBMSRegistry
+
+
+def create_db(dbfile):
+    conn = sqlite3.connect(dbfile)  # @UndefinedVariable
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE dfms_drop(oid varchar(64) PRIMARY KEY, phase integer)')
+    cur.execute('CREATE TABLE dfms_dropinstance(uid varchar(64) PRIMARY KEY, oid varchar(64), dataRef varchar(128))')
+    cur.execute('CREATE TABLE dfms_dropaccesstime(oid varchar(64), accessTime TIMESTAMP, PRIMARY KEY (oid, accessTime))')
+    cur.close()
+    conn.close()
+
+def worker(registry, prefix, options):
+    # Access times have a resolution of one second, so each drop is accessed
+    # once only; the synchronous mode would fail otherwise
+    for i in range(options.drops):
+        d = InMemoryDROP('%s_%d' % (prefix, i), '%s_%d' % (prefix, i))
+        registry.addDrop(d)
+        registry.setDropPhase(d, 1)
+        registry.recordNewAccess(d.oid)
+
+def measure(options, **kwargs):
+    """
+    Runs the workers against a fresh database and returns how long it took
+    until everything was written
+    """
+    fd, dbfile = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.unlink(dbfile)
+    create_db(dbfile)
+
+    # sqlite serializes writers; wait for the lock instead of failing
+    registry = RDBMSRegistry('sqlite3', dbfile, 60, **kwargs)
+    threads = [threading.Thread(target=worker, args=(registry, 't%d' % (i,), options))
+               for i in range(options.threads)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    registry.close()
+    delta = time.time() - start
+
+    os.unlink(dbfile)
+    return delta
+
+if __name__ == '__main__':
+
+    parser = OptionParser()
+    parser.add_option("-t", "--threads", action="store", type="int",
+                      dest="threads", help="Number of concurrent threads", default=4)
+    parser.add_option("-d", "--drops", action="store", type="int",
+                      dest="drops", help="Number of drops registered by each thread", default=2000)
+    parser.add_option("-b", "--batch-size", action="store", type="int",
+                      dest="batchSize", help="Maximum number of queued modifications in write-behind mode", default=1000)
+    (options, args) = parser.parse_args(sys.argv)
+
+    n = options.threads * options.drops * 3
+    for name, kwargs in (('synchronous', {'writeBehind': False}),
+                         ('write-behind', {'writeBehind': True, 'batchSize': options.batchSize})):
+        delta = measure(options, **kwargs)
+        print("%s: %d modifications in %.2f [s] (%.1f mod/s)" % (name, n, delta, n / delta))
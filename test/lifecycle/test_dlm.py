@@ -28,13 +28,28 @@ Created on 22 Jun 2015
 import os
 import shutil
 import tempfile
+import threading
 import time
 import unittest
 
-from dfms.ddap_protocol import DROPStates, DROPPhases
-from dfms.drop import FileDROP, DirectoryContainer, BarrierAppDROP
+from dfms.ddap_protocol import DROPStates, DROPPhases, AppDROPStates
+from dfms.drop import FileDROP, DirectoryContainer, BarrierAppDROP, \
+    InMemoryDROP
 from dfms.droputils import DROPWaiterCtx
 from dfms.lifecycle import dlm
+from dfms.lifecycle.hsm import store
+from dfms.lifecycle.hsm.manager import HierarchicalStorageManager
+
+
+class CorruptingDROP(InMemoryDROP):
+    """An InMemoryDROP that doesn't store what it's given"""
+    def write(self, data, **kwargs):
+        return InMemoryDROP.write(self, b'x' * len(data), **kwargs)
+
+class CorruptingStore(store.MemoryStore):
+    volatile = False
+    def createDrop(self, oid, uid, **kwargs):
+        return CorruptingDROP(oid, uid, **kwargs)
 
 
 class TestDataLifecycleManager(unittest.TestCase):
@@ -68,7 +83,8 @@ class TestDataLifecycleManager(unittest.TestCase):
             self._writeAndClose(drop)
 
             # The call to close() should have turned it into a SOLID object
-            # because the DLM replicated it
+            # because the DLM replicated it in the background
+            self.assertTrue(manager.waitForReplicas(10))
             self.assertEqual(DROPPhases.SOLID, drop.phase)
             self.assertEqual(2, len(manager.getDropUids(drop)))
 
@@ -79,6 +95,112 @@ class TestDataLifecycleManager(unittest.TestCase):
             self.assertEqual(DROPPhases.GAS, drop.phase)
             self.assertEqual(1, len(manager.getDropUids(drop)))
 
+    def test_replicationStatus(self):
+        """
+        Replicas are created in the background, their contents are verified
+        and their progress is reported
+        """
+        with dlm.DataLifecycleManager(replicationBufsize=100) as manager:
+            drops = [FileDROP('oid:%d' % i, 'uid:%d' % i, expectedSize=1000) for i in range(4)]
+            for drop in drops:
+                manager.addDrop(drop)
+                drop.write(b'a' * 1000)
+            self.assertTrue(manager.waitForReplicas(10))
+
+            status = manager.getReplicationStatus()
+            self.assertEqual(4, len(status))
+            for drop, replica in zip(drops, status):
+                self.assertEqual(drop.uid, replica['uid'])
+                self.assertEqual('done', replica['status'])
+                self.assertEqual(1000, replica['copied'])
+                self.assertGreater(replica['throughput'], 0)
+                self.assertEqual(2, len(manager.getDropUids(drop)))
+                self.assertEqual(DROPPhases.SOLID, drop.phase)
+                manager._drops[replica['replicaUid']].delete()
+
+            # Replicas that don't match their original are discarded
+            manager._hsm.addStore(CorruptingStore())
+            drop = FileDROP('oid:A', 'uid:A1', expectedSize=10)
+            manager.addDrop(drop)
+            drop.write(b'a' * 10)
+            self.assertTrue(manager.waitForReplicas(10))
+            self.assertEqual('failed', manager.getReplicationStatus()[-1]['status'])
+            self.assertEqual(1, len(manager.getDropUids(drop)))
+            self.assertEqual(DROPPhases.GAS, drop.phase)
+
+            # So are replicas of DROPs whose data changed after being written
+            drop = FileDROP('oid:B', 'uid:B1', expectedSize=10, precious=False)
+            manager.addDrop(drop)
+            drop.write(b'a' * 10)
+            with open(drop.path, 'wb') as f:
+                f.write(b'b' * 10)
+            self.assertRaises(Exception, manager._replicate, drop, manager._hsm.getSlowestStore())
+            self.assertEqual(1, len(manager.getDropUids(drop)))
+            self.assertFalse(manager._copying)
+
+            # Also when the replica cannot even be created
+            class FailingStore(store.MemoryStore):
+                def createDrop(self, oid, uid, **kwargs):
+                    raise Exception("No replicas here")
+            self.assertRaises(Exception, manager._replicate, drop, FailingStore())
+            self.assertFalse(manager._copying)
+
+    def test_storeSpaceAccounting(self):
+        """
+        Stores account for the space used by the DROPs they create without
+        measuring it every time, and measure their speeds when asked to
+        """
+        dirname = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dirname, True)
+        store.DirectoryStore.prepareDirectory(dirname, 1000)
+        dirStore = store.DirectoryStore(dirname)
+        self.assertEqual(1000, dirStore.getAvailableSpace())
+
+        hsm = HierarchicalStorageManager()
+        hsm.addStore(dirStore, measureSpeeds=True)
+        self.assertGreater(dirStore.getWritingSpeed(), 0)
+        self.assertGreater(dirStore.getReadingSpeed(), 0)
+        self.assertEqual(1000, dirStore.getAvailableSpace())
+
+        drop = dirStore.createDrop('a', 'a', expectedSize=100)
+        drop.write(b'a' * 100)
+        self.assertEqual(900, dirStore.getAvailableSpace())
+
+        # External changes are seen only when reconciling
+        with open(os.path.join(dirname, 'external'), 'wb') as f:
+            f.write(b'b' * 50)
+        dirStore.updateSpaces()
+        self.assertEqual(900, dirStore.getAvailableSpace())
+        dirStore._lastReconciliation = 0
+        dirStore.updateSpaces()
+        self.assertEqual(850, dirStore.getAvailableSpace())
+
+        drop.delete()
+        drop.status = DROPStates.DELETED
+        self.assertEqual(950, dirStore.getAvailableSpace())
+
+        # Directories are walked without blocking the accounting
+        dirUsage = dirStore._dirUsage
+        def checkUnlocked(dirName):
+            self.assertTrue(dirStore._spaceLock.acquire(False))
+            dirStore._spaceLock.release()
+            return dirUsage(dirName)
+        dirStore._dirUsage = checkUnlocked
+        dirStore._lastReconciliation = 0
+        dirStore.updateSpaces()
+        self.assertEqual(950, dirStore.getAvailableSpace())
+
+        # Remote stores are not measured
+        remoteStore = store.MemoryStore()
+        remoteStore.speedTestSize = 0
+        hsm.addStore(remoteStore, measureSpeeds=True)
+        self.assertEqual(0, remoteStore.getWritingSpeed())
+
+        # Stores are not benchmarked by default, and data is never replicated
+        # to volatile stores, however fast they are
+        self.assertEqual(0, hsm._stores[0].getWritingSpeed())
+        self.assertIs(dirStore, hsm.getSlowestStore())
+
     def test_expiringNormalDrop(self):
 
         with dlm.DataLifecycleManager(checkPeriod=0.5) as manager:
@@ -166,5 +288,231 @@ class TestDataLifecycleManager(unittest.TestCase):
             self.assertTrue(b.exists())
             b.delete()
 
+    def test_expireAfterUseRemoteConsumers(self):
+        """
+        Consumers living in other Node Managers cannot be subscribed to, and
+        their execution status is polled instead
+        """
+        class RemoteConsumer(object):
+            def __init__(self, uid):
+                self.oid = self.uid = uid
+                self.execStatus = AppDROPStates.NOT_RUN
+            def handleEvent(self, evt):
+                pass
+            def subscribe(self, listener, eventType=None):
+                raise Exception("Local listeners cannot be sent to remote drops")
+
+        manager = dlm.DataLifecycleManager()
+        a = InMemoryDROP('a', 'a', expireAfterUse=True, precious=False)
+        c, d = BarrierAppDROP('c', 'c'), RemoteConsumer('d')
+        a.addConsumer(c)
+        a.addConsumer(d, False)
+        manager.addDrop(a)
+        with DROPWaiterCtx(self, c, 1):
+            a.write(b' ')
+            a.setCompleted()
+
+        manager.expireCompletedDrops()
+        self.assertEqual(DROPStates.COMPLETED, a.status)
+        d.execStatus = AppDROPStates.FINISHED
+        manager.expireCompletedDrops()
+        self.assertEqual(DROPStates.EXPIRED, a.status)
+
+    def test_expirationOrder(self):
+        """
+        DROPs are expired according to their expiration date; those not
+        COMPLETED or without lifespan are never expired
+        """
+        manager = dlm.DataLifecycleManager()
+        drops = [InMemoryDROP('oid:%d' % i, 'uid:%d' % i, lifespan=i*0.2, precious=False) for i in range(1, 5)]
+        forever = InMemoryDROP('oid:forever', 'uid:forever', precious=False)
+        incomplete = InMemoryDROP('oid:incomplete', 'uid:incomplete', lifespan=0.1, precious=False)
+        for drop in drops + [forever, incomplete]:
+            manager.addDrop(drop)
+        for drop in drops + [forever]:
+            drop.write(b' ')
+            drop.setCompleted()
+
+        time.sleep(0.5)
+        manager.expireCompletedDrops()
+        self.assertEqual([DROPStates.EXPIRED] * 2 + [DROPStates.COMPLETED] * 2, [d.status for d in drops])
+
+        time.sleep(0.4)
+        manager.expireCompletedDrops()
+        self.assertEqual([DROPStates.EXPIRED] * 4, [d.status for d in drops])
+        self.assertEqual(DROPStates.COMPLETED, forever.status)
+        self.assertEqual(DROPStates.INITIALIZED, incomplete.status)
+
+        # Only EXPIRED DROPs are deleted
+        manager.deleteExpiredDrops()
+        self.assertEqual([DROPStates.DELETED] * 4, [d.status for d in drops])
+        self.assertEqual(DROPStates.COMPLETED, forever.status)
+
+    def test_lostDropsSweep(self):
+        """
+        Lost DROPs are detected incrementally, a few on each check
+        """
+        manager = dlm.DataLifecycleManager(lostDropsBatch=2)
+        drops = [FileDROP('oid:%d' % i, 'uid:%d' % i, expectedSize=1, precious=False) for i in range(5)]
+        for drop in drops:
+            manager.addDrop(drop)
+            self._writeAndClose(drop)
+            os.unlink(drop._fnm)
+
+        lost = lambda: len([d for d in drops if d.phase == DROPPhases.LOST])
+        for expected in (2, 4, 5):
+            manager.deleteLostDrops()
+            self.assertEqual(expected, lost())
+
+    def _read(self, drop):
+        desc = drop.open()
+        data = drop.read(desc)
+        drop.close(desc)
+        return data
+
+    def test_moveDropsAround(self):
+        """
+        Frequently accessed DROPs are moved to faster stores, and DROPs that
+        are not accessed anymore are moved to slower ones
+        """
+        manager = dlm.DataLifecycleManager(promoteAccesses=3, demoteAge=0.5)
+
+        drop = FileDROP('oid:A', 'uid:A1', expectedSize=1, precious=False)
+        manager.addDrop(drop)
+        self._writeAndClose(drop)
+
+        # Not accessed enough yet
+        for _ in range(2):
+            self._read(drop)
+        manager.moveDropsAround()
+        self.assertEqual(DROPStates.COMPLETED, drop.status)
+
+        # Accesses decay over time, so we need a few more
+        for _ in range(2):
+            self._read(drop)
+        manager.moveDropsAround()
+        self.assertEqual(DROPStates.EXPIRED, drop.status)
+        uids = manager.getDropUids(drop)
+        self.assertEqual(2, len(uids))
+        memDrop = manager._drops[[uid for uid in uids if uid != drop.uid][0]]
+        self.assertIsInstance(memDrop, InMemoryDROP)
+        self.assertEqual(DROPStates.COMPLETED, memDrop.status)
+        self.assertEqual(b' ', self._read(memDrop))
+
+        # The original instance is deleted eventually
+        manager.deleteExpiredDrops()
+        self.assertFalse(drop.exists())
+
+        # Once it gets cold it goes back to disk
+        time.sleep(0.6)
+        manager.moveDropsAround()
+        self.assertEqual(DROPStates.EXPIRED, memDrop.status)
+        uids = set(manager.getDropUids(drop)) - set([drop.uid, memDrop.uid])
+        self.assertEqual(1, len(uids))
+        fileDrop = manager._drops[uids.pop()]
+        self.assertIsInstance(fileDrop, FileDROP)
+        self.assertEqual(b' ', self._read(fileDrop))
+        fileDrop.delete()
+
+    def test_moveDropsAroundConstraints(self):
+        """
+        DROPs are not moved when there is no space for them in the target
+        store. DROPs whose consumers are still running can be promoted, but
+        their original instances are kept until the consumers finish
+        """
+        manager = dlm.DataLifecycleManager(promoteAccesses=1, storeReserve=1)
+        drop = FileDROP('oid:A', 'uid:A1', expectedSize=1, precious=False)
+        manager.addDrop(drop)
+        self._writeAndClose(drop)
+        self._read(drop)
+        manager.moveDropsAround()
+        self.assertEqual(DROPStates.COMPLETED, drop.status)
+
+        manager = dlm.DataLifecycleManager(promoteAccesses=1)
+        moves = []
+        manager.addMoveListener(lambda d, newDrop: moves.append((d, newDrop)))
+        drop = FileDROP('oid:B', 'uid:B1', expectedSize=1, precious=False)
+        c = BarrierAppDROP('c', 'c')
+        drop.addConsumer(c)
+        InMemoryDROP('oid:C', 'uid:C1').addConsumer(c)
+        manager.addDrop(drop)
+        self._writeAndClose(drop)
+        self._read(drop)
+        manager.moveDropsAround()
+        self.assertEqual(DROPStates.EXPIRED, drop.status)
+        self.assertEqual(1, len(moves))
+        memDrop = moves[0][1]
+        self.assertIs(drop, moves[0][0])
+        self.assertIsInstance(memDrop, InMemoryDROP)
+        self.assertIn(memDrop, c.inputs)
+        self.assertNotIn(drop, c.inputs)
+
+        manager.deleteExpiredDrops()
+        self.assertTrue(drop.exists())
+        c.execStatus = AppDROPStates.FINISHED
+        manager.deleteExpiredDrops()
+        self.assertFalse(drop.exists())
+
+    def test_backgroundTaskErrors(self):
+        """
+        Errors in the background tasks don't stop them
+        """
+        calls = []
+        class FailingMover(dlm.DROPMover):
+            def doTask(self, dlm):
+                calls.append(None)
+                raise Exception("Failing on purpose")
+
+        finishedEvent = threading.Event()
+        mover = FailingMover(None, 0.01, finishedEvent)
+        mover.start()
+        try:
+            time.sleep(0.2)
+            self.assertTrue(mover.is_alive())
+        finally:
+            finishedEvent.set()
+            mover.join()
+        self.assertGreater(len(calls), 1)
+
+    def test_spillInMemoryDrops(self):
+        """
+        The least recently used in-memory DROPs are spilled into disk when
+        they hold too much memory, and are brought back when there is room
+        """
+        spillDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spillDir, True)
+        manager = dlm.DataLifecycleManager(memoryHighWatermark=10, memoryLowWatermark=5, spillDir=spillDir)
+
+        drops = [InMemoryDROP('oid:%d' % i, 'uid:%d' % i, expectedSize=4, precious=False) for i in range(3)]
+        for i, drop in enumerate(drops):
+            manager.addDrop(drop)
+            drop.write(str(i) * 4)
+
+        # The first two DROPs were spilled, but they can still be read
+        self.assertEqual([True, True, False], [d.spilled for d in drops])
+        self.assertEqual(2, len(os.listdir(spillDir)))
+        self.assertEqual(b'0000', self._read(drops[0]))
+        self.assertEqual({'inMemory': 4, 'spilled': 8, 'spills': 2, 'unspills': 0}, manager.getMemoryStatus())
+
+        # When there's room again the spilled DROPs are unspilled on access
+        manager._deleteDrop(drops[2])
+        self.assertEqual(b'1111', self._read(drops[1]))
+        self.assertFalse(drops[1].spilled)
+        self.assertEqual(b'1111', self._read(drops[1]))
+        self.assertEqual({'inMemory': 4, 'spilled': 4, 'spills': 2, 'unspills': 1}, manager.getMemoryStatus())
+
+        # Spill files go away with their DROPs
+        manager._deleteDrop(drops[0])
+        self.assertEqual([], os.listdir(spillDir))
+
+        # DROPs from different sessions can share UIDs
+        same = [InMemoryDROP('oid', 'uid', precious=False) for _ in range(2)]
+        for i, drop in enumerate(same):
+            drop.write(str(i) * 4)
+            drop.setCompleted()
+            drop.spill(spillDir)
+        self.assertEqual(2, len(os.listdir(spillDir)))
+        self.assertEqual([b'0000', b'1111'], [self._read(d) for d in same])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
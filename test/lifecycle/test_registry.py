@@ -21,6 +21,7 @@
 #
 import os
 import sqlite3
+import threading
 import unittest
 
 from dfms.drop import InMemoryDROP
@@ -47,6 +48,7 @@ class TestRDBMSRegistry(unittest.TestCase):
         a = InMemoryDROP('a', 'a')
         registry = RDBMSRegistry('sqlite3', DBFILE)
         registry.addDrop(a)
+        registry.flush()
 
         conn = sqlite3.connect(DBFILE)  # @UndefinedVariable
         cur = conn.cursor()
@@ -56,6 +58,7 @@ class TestRDBMSRegistry(unittest.TestCase):
         self.assertEqual('a', r[0])
         cur.close()
         conn.close()
+        registry.close()
 
     def test_addDropInstances(self):
 
@@ -88,6 +91,7 @@ class TestRDBMSRegistry(unittest.TestCase):
         self.assertEqual('a2', uids[1])
         cur.close()
         conn.close()
+        registry.close()
 
     def test_dropAccess(self):
 
@@ -98,4 +102,102 @@ class TestRDBMSRegistry(unittest.TestCase):
         self.assertEqual(-1, registry.getLastAccess('a'))
         registry.recordNewAccess('a')
 
-        self.assertNotEqual(-1, registry.getLastAccess('a'))
\ No newline at end of file
+        self.assertNotEqual(-1, registry.getLastAccess('a'))
+        registry.close()
+
+    def test_writeBehind(self):
+
+        drops = [InMemoryDROP('a%d' % (i,), 'a%d' % (i,)) for i in range(10)]
+        registry = RDBMSRegistry('sqlite3', DBFILE, writeBehind=True, flushPeriod=60)
+        for d in drops:
+            registry.addDrop(d)
+            registry.setDropPhase(d, 1)
+            for _ in range(5):
+                registry.recordNewAccess(d.oid)
+
+        # Nothing has been written yet, but queries see the modifications
+        conn = sqlite3.connect(DBFILE)  # @UndefinedVariable
+        cur = conn.cursor()
+        cur.execute('SELECT count(*) FROM dfms_drop')
+        self.assertEqual(0, cur.fetchone()[0])
+        self.assertEqual(['a0'], registry.getDropUids(drops[0]))
+
+        # Phases were written, and only the last access of each drop
+        cur.execute('SELECT count(*) FROM dfms_drop WHERE phase = 1')
+        self.assertEqual(10, cur.fetchone()[0])
+        cur.execute('SELECT count(*) FROM dfms_dropaccesstime')
+        self.assertEqual(10, cur.fetchone()[0])
+        cur.close()
+        conn.close()
+
+        # Closing the registry writes everything else
+        registry.addDrop(InMemoryDROP('b', 'b'))
+        registry.close()
+        self.assertEqual(['b'], RDBMSRegistry('sqlite3', DBFILE, writeBehind=False).getDropUids(InMemoryDROP('b', 'b')))
+
+    def test_writeBehindBadRows(self):
+
+        # 'a' is already there, so its insertion fails
+        conn = sqlite3.connect(DBFILE)  # @UndefinedVariable
+        conn.execute("INSERT INTO dfms_drop (oid, phase) VALUES ('a', 0)")
+        conn.commit()
+        conn.close()
+
+        registry = RDBMSRegistry('sqlite3', DBFILE, writeBehind=True, flushPeriod=60)
+        for oid in ('a', 'b', 'c'):
+            registry.addDrop(InMemoryDROP(oid, oid + '1'))
+        registry.recordNewAccess('b')
+        registry.flush()
+
+        # The rest of the batch was written
+        conn = sqlite3.connect(DBFILE)  # @UndefinedVariable
+        cur = conn.cursor()
+        cur.execute('SELECT oid FROM dfms_drop ORDER BY oid')
+        self.assertEqual(['a', 'b', 'c'], [r[0] for r in cur.fetchall()])
+        cur.execute('SELECT uid FROM dfms_dropinstance ORDER BY uid')
+        self.assertEqual(['a1', 'b1', 'c1'], [r[0] for r in cur.fetchall()])
+        cur.execute('SELECT oid FROM dfms_dropaccesstime')
+        self.assertEqual(['b'], [r[0] for r in cur.fetchall()])
+        cur.close()
+        conn.close()
+        registry.close()
+
+    def test_writeBehindConnectionError(self):
+
+        registry = RDBMSRegistry('sqlite3', DBFILE, writeBehind=True, flushPeriod=60)
+        def connect():
+            raise sqlite3.OperationalError('no database')  # @UndefinedVariable
+        registry._connect = connect
+        registry.addDrop(InMemoryDROP('a', 'a'))
+
+        # The failed batch is given up, so flush() returns
+        t = threading.Thread(target=registry.flush)
+        t.daemon = True
+        t.start()
+        t.join(10)
+        self.assertFalse(t.is_alive())
+        registry.close()
+
+    def test_writeBehindBoundedQueue(self):
+
+        registry = RDBMSRegistry('sqlite3', DBFILE, writeBehind=True, flushPeriod=60, batchSize=2, maxQueued=2)
+        for i in range(10):
+            registry.addDrop(InMemoryDROP('a%d' % (i,), 'a%d' % (i,)))
+            with registry._cond:
+                self.assertLessEqual(registry._nPending, 2)
+        registry.close()
+
+        conn = sqlite3.connect(DBFILE)  # @UndefinedVariable
+        cur = conn.cursor()
+        cur.execute('SELECT count(*) FROM dfms_drop')
+        self.assertEqual(10, cur.fetchone()[0])
+        cur.close()
+        conn.close()
+
+    def test_closeConnections(self):
+
+        registry = RDBMSRegistry('sqlite3', DBFILE, writeBehind=False)
+        registry.addDrop(InMemoryDROP('a', 'a'))
+        conn = registry._getConnection()
+        registry.close()
+        self.assertRaises(sqlite3.ProgrammingError, conn.cursor)  # @UndefinedVariable
@@ -0,0 +1,120 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small load benchmark for the REST server of the managers. A number of
+clients poll a NodeManager's REST server concurrently, most of them with cheap
+requests (like monitoring tools do) and some with graph status requests on a
+big session. The benchmark is run against a server that starts a new thread per
+connection and against one with a bounded pool of worker threads.
+"""
+
+from optparse import OptionParser
+import sys
+import threading
+import time
+
+from dfms import utils
+from dfms.manager.client import NodeManagerClient
+from dfms.manager.node_manager import NodeManager
+from dfms.manager.rest import NMRestServer
+from dfms.restutils import connection_pool
+
+
+def client(port, session_id, n, heavy, latencies):
+    c = NodeManagerClient('localhost', port)
+    for _ in range(n):
+        start = time.time()
+        if heavy:
+            c.graph_status(session_id)
+        else:
+            c.sessions()
+        latencies.append(time.time() - start)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def measure(dm, port, session_id, max_workers, options):
+    """
+    Runs the clients against a REST server on top of `dm`, and returns the
+    total time it took, plus the latencies of the cheap and heavy requests
+    """
+
+    server = NMRestServer(dm, max_workers=max_workers)
+    server_t = threading.Thread(target=server.start, args=('localhost', port))
+    server_t.start()
+    utils.portIsOpen('localhost', port, 10)
+
+    light, heavy = [], []
+    threads = []
+    for i in range(options.clients):
+        is_heavy = i < options.heavy
+        args = (port, session_id, options.requests, is_heavy, heavy if is_heavy else light)
+        threads.append(threading.Thread(target=client, args=args))
+
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    delta = time.time() - start
+
+    server.stop()
+    server_t.join()
+    connection_pool.clear()
+    return delta, light, heavy
+
+if __name__ == '__main__':
+
+    parser = OptionParser()
+    parser.add_option("-c", "--clients", action="store", type="int",
+                      dest="clients", help="Number of concurrent clients", default=64)
+    parser.add_option("-H", "--heavy", action="store", type="int",
+                      dest="heavy", help="How many of the clients request the graph status", default=8)
+    parser.add_option("-n", "--requests", action="store", type="int",
+                      dest="requests", help="Number of requests sent by each client", default=50)
+    parser.add_option("-d", "--drops", action="store", type="int",
+                      dest="drops", help="Number of drops in the session", default=10000)
+    parser.add_option("-w", "--workers", action="store", type="int",
+                      dest="workers", help="Number of workers of the bounded server", default=16)
+    parser.add_option("-p", "--port", action="store", type="int",
+                      dest="port", help="TCP port to use", default=7778)
+    (options, args) = parser.parse_args(sys.argv)
+
+    session_id = 'restLoad'
+    dm = NodeManager(False)
+    dm.createSession(session_id)
+    dm.addGraphSpec(session_id, [{'oid': str(i), 'type': 'plain', 'storage': 'memory'} for i in range(options.drops)])
+    dm.deploySession(session_id)
+
+    try:
+        for name, max_workers in (('thread per connection', None),
+                                  ('%d workers' % (options.workers,), options.workers)):
+            delta, light, heavy = measure(dm, options.port, session_id, max_workers, options)
+            n = len(light) + len(heavy)
+            print("%s: %d requests in %.2f [s] (%.1f req/s)" % (name, n, delta, n / delta))
+            for kind, latencies in (('cheap', light), ('graph status', heavy)):
+                if latencies:
+                    print("    %s requests latency: median %.1f [ms], 99th percentile %.1f [ms]" %
+                          (kind, percentile(latencies, 0.5) * 1e3, percentile(latencies, 0.99) * 1e3))
+    finally:
+        dm.shutdown()
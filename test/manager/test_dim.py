@@ -31,6 +31,7 @@ import pkg_resources
 from dfms import droputils, tool
 from dfms import utils
 from dfms.ddap_protocol import DROPStates
+from dfms.exceptions import InvalidGraphException
 from dfms.manager import constants
 from dfms.manager.composite_manager import DataIslandManager
 from dfms.manager.node_manager import NodeManager
@@ -137,6 +138,35 @@ class TestDIM(unittest.TestCase):
 
         self.assertEqual(data, droputils.allDropContents(c))
 
+    def test_addGraphSpecInChunks(self):
+
+        sessionId = 'lalo'
+        graphSpec = [{'oid':'A', 'type':'plain', 'storage':'memory', 'node':hostname, 'consumers':['B']},
+                     {'oid':'B', 'type':'app', 'app':'test.graphsRepository.SleepAndCopyApp', 'sleepTime':0, 'outputs':['C'], 'node':hostname},
+                     {'oid':'C', 'type':'plain', 'storage':'memory', 'node':hostname}]
+        self.dim.createSession(sessionId)
+        for chunk in droputils.chunk_graph(graphSpec, 1):
+            self.dim.addGraphSpec(sessionId, chunk)
+        self.assertEqual(len(graphSpec), self.dim.getGraphSize(sessionId))
+
+        # The graph is linked as if it had been added at once
+        self.dim.deploySession(sessionId)
+        a, c = [self.dm._sessions[sessionId].drops[x] for x in ('A', 'C')]
+
+        data = os.urandom(10)
+        with droputils.DROPWaiterCtx(self, c, 3):
+            a.write(data)
+            a.setCompleted()
+
+        self.assertEqual(data, droputils.allDropContents(c))
+
+    def test_addGraphSpecUnknownDrop(self):
+
+        sessionId = 'lalo'
+        graphSpec = [{'oid':'A', 'type':'plain', 'storage':'memory', 'node':hostname, 'consumers':['B']}]
+        self.dim.createSession(sessionId)
+        self.assertRaises(InvalidGraphException, self.dim.addGraphSpec, sessionId, graphSpec)
+
     def test_deployGraphWithCompletedDOs(self):
         self._test_deployGraphWithCompletedDOs('lalo')
 
@@ -218,6 +248,62 @@ class TestDIM(unittest.TestCase):
             a.setCompleted()
         assertGraphStatus(sessionId, DROPStates.COMPLETED)
 
+class TestPushedStatus(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        graphsRepository.defaultSleepTime = 0
+        self.dm = NodeManager(False)
+        self._dm_server = NMRestServer(self.dm)
+        self._dm_t = threading.Thread(target=self._dm_server.start, args=(hostname,constants.NODE_DEFAULT_REST_PORT))
+        self._dm_t.start()
+        self.dim = DataIslandManager([hostname], pushStatus=True)
+        self.assertTrue(portIsOpen(hostname, constants.NODE_DEFAULT_REST_PORT, 5))
+
+    def tearDown(self):
+        if self._dm_t.is_alive():
+            self._dm_server.stop()
+            self._dm_t.join()
+        self.dm.shutdown()
+        self.dim.shutdown()
+        unittest.TestCase.tearDown(self)
+
+    def _wait_for_pushed_status(self, sessionId, status, timeout=5):
+        start = time.time()
+        while time.time() - start < timeout:
+            pushed = self.dim._status.session_status(sessionId, [hostname])
+            if pushed == {hostname: status}:
+                return
+            time.sleep(0.05)
+        self.fail("Session status not pushed to the DIM within %d seconds" % (timeout,))
+
+    def test_pushed_status(self):
+
+        sessionId = 'lala'
+        graphSpec = [{'oid':'A', 'type':'plain', 'storage':'memory', 'node':hostname, 'consumers':['B']},
+                     {'oid':'B', 'type':'app', 'app':'test.graphsRepository.SleepAndCopyApp', 'outputs':['C'], 'node':hostname},
+                     {'oid':'C', 'type':'plain', 'storage':'memory', 'node':hostname}]
+        self.dim.createSession(sessionId)
+        self.dim.addGraphSpec(sessionId, graphSpec)
+        self.dim.deploySession(sessionId)
+        self._wait_for_pushed_status(sessionId, SessionStates.RUNNING)
+        self.assertDictEqual(self.dm.getGraphStatus(sessionId), self.dim.getGraphStatus(sessionId))
+        self.assertIsNotNone(self.dm.getStatusTracker(sessionId))
+
+        a, c = [self.dm._sessions[sessionId].drops[x] for x in ('A', 'C')]
+        with droputils.DROPWaiterCtx(self, c, 3):
+            a.write(b'abcde')
+            a.setCompleted()
+        self._wait_for_pushed_status(sessionId, SessionStates.FINISHED)
+
+        # The NM is not queried anymore
+        self._dm_server.stop()
+        self._dm_t.join()
+        self.assertEqual({hostname: SessionStates.FINISHED}, self.dim.getSessionStatus(sessionId))
+        graphStatus = self.dim.getGraphStatus(sessionId)
+        self.assertDictEqual(self.dm.getGraphStatus(sessionId), graphStatus)
+        for dropStatus in graphStatus.values():
+            self.assertEqual(DROPStates.COMPLETED, dropStatus['status'])
 
 class TestREST(unittest.TestCase):
 
@@ -19,13 +19,17 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 #
+import os
+import socket
 import threading
 import unittest
 
 from dfms import droputils
 from dfms.ddap_protocol import DROPStates, DROPRel, DROPLinkType
-from dfms.drop import BarrierAppDROP, dropdict
+from dfms.drop import BarrierAppDROP, InMemoryDROP, dropdict
+from dfms.manager import node_manager
 from dfms.manager.node_manager import NodeManager
+from dfms.manager.session import DropProxy
 
 
 hostname = 'localhost'
@@ -91,6 +95,30 @@ class TestDM(unittest.TestCase):
 
         self.assertTrue(evt.wait(10), "Didn't receive errors on time")
 
+    def test_dropMoved(self):
+        """
+        Drops moved by the DLM are replaced by their new instance in their
+        session, including its status tracker
+        """
+        sessionId = 'moved'
+        dm = self._start_dm()
+        dm.push_status_requested(True)
+        quickDeploy(dm, sessionId, [memory('A')])
+        a = dm._sessions[sessionId].drops['A']
+        a.write(b'a')
+        a.setCompleted()
+
+        newA = InMemoryDROP('A', 'A2')
+        newA.write(b'a')
+        newA.setCompleted()
+        dm._drop_moved(a, newA)
+        a.status = DROPStates.EXPIRED
+
+        self.assertIs(newA, dm._sessions[sessionId].drops['A'])
+        self.assertEqual(DROPStates.COMPLETED, dm.getGraphStatus(sessionId)['A']['status'])
+        _, drops = dm.getStatusTracker(sessionId).snapshot()
+        self.assertEqual(DROPStates.COMPLETED, drops['A'][0])
+
     def test_runGraphOneDOPerDOM(self):
         """
         A test that creates three DROPs in two different DMs and runs the graph.
@@ -130,6 +158,121 @@ class TestDM(unittest.TestCase):
         dm1.destroySession(sessionId)
         dm2.destroySession(sessionId)
 
+    def test_remoteDropAttributes(self):
+        """
+        A test that checks that remote drops are correctly accessed via their
+        proxies, and that several properties of remote drops can be retrieved
+        in a single call.
+
+        DM #1      DM #2
+        =======    =======
+        | A --|----|-> B |
+        =======    =======
+        """
+        dm1, dm2 = [self._start_dm() for _ in range(2)]
+
+        sessionId = 's1'
+        g1 = [{"oid":"A", "type":"plain", "storage": "memory", "node": "node1"}]
+        g2 = [{"oid":"B", "type":"app", "app":"dfms.apps.crc.CRCApp"}]
+
+        rels = [DROPRel('B', DROPLinkType.CONSUMER, 'A')]
+        quickDeploy(dm1, sessionId, g1, {nm_conninfo(1): rels})
+        quickDeploy(dm2, sessionId, g2, {nm_conninfo(0): rels})
+
+        b = dm2._sessions[sessionId].drops['B']
+        a_proxy = b.inputs[0]
+        self.assertIsInstance(a_proxy, DropProxy)
+
+        # Immutable attributes are cached after the first access
+        self.assertEqual('A', a_proxy.oid)
+        self.assertEqual('node1', a_proxy.node)
+        self.assertIn('oid', a_proxy.__dict__)
+        self.assertIn('node', a_proxy.__dict__)
+        self.assertEqual(DROPStates.INITIALIZED, a_proxy.status)
+        self.assertNotIn('status', a_proxy.__dict__)
+
+        # Methods are not returned by the batched call
+        host, _, rpc_port = nm_conninfo(0)
+        props = dm2.get_drop_attributes(host, rpc_port, sessionId, ['A'], ['oid', 'status', 'open'])
+        self.assertEqual({'A': {'oid': 'A', 'status': DROPStates.INITIALIZED}}, props)
+
+        dm1.destroySession(sessionId)
+        dm2.destroySession(sessionId)
+
+    def test_sameHostEndpoints(self):
+        """
+        Node Managers running in the same host should talk to each other using
+        IPC endpoints when possible
+        """
+        self._start_dm()
+        host, events_port, rpc_port = nm_conninfo(0)
+        prefix = 'ipc://' if node_manager.use_ipc else 'tcp://'
+        self.assertTrue(node_manager.connect_endpoint('events', host, events_port).startswith(prefix))
+        self.assertTrue(node_manager.connect_endpoint('rpc', host, rpc_port).startswith(prefix))
+
+        # Nobody is listening here, so we go through TCP
+        self.assertTrue(node_manager.connect_endpoint('rpc', host, 1).startswith('tcp://'))
+
+    @unittest.skipUnless(node_manager.use_ipc, "IPC endpoints are disabled")
+    def test_staleIpcEndpoints(self):
+        """
+        IPC endpoints are removed on shutdown, and those left behind by dead
+        Node Managers are not used
+        """
+        host, events_port, rpc_port = nm_conninfo(0)
+        self._start_dm().shutdown()
+        self._dms = []
+        for kind, port in (('events', events_port), ('rpc', rpc_port)):
+            fname = node_manager.ipc_endpoint(kind, port)[len('ipc://'):]
+            self.assertFalse(os.path.exists(fname))
+
+        # A socket file nobody listens on anymore
+        fname = node_manager.ipc_endpoint('rpc', rpc_port)[len('ipc://'):]
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # @UndefinedVariable
+        s.bind(fname)
+        s.close()
+        try:
+            self.assertTrue(os.path.exists(fname))
+            self.assertTrue(node_manager.connect_endpoint('rpc', host, rpc_port).startswith('tcp://'))
+        finally:
+            os.unlink(fname)
+
+    def test_runGraphSameHostFileDrop(self):
+        """
+        Like test_runGraphOneDOPerDOM, but with A being a file drop which is
+        read by B directly from the filesystem since both DMs share the same
+        host.
+        """
+        dm1, dm2 = [self._start_dm() for _ in range(2)]
+
+        sessionId = 's1'
+        g1 = [{"oid":"A", "type":"plain", "storage": "file"}]
+        g2 = [{"oid":"B", "type":"app", "app":"dfms.apps.crc.CRCApp"},
+              {"oid":"C", "type":"plain", "storage": "memory", "producers":["B"]}]
+
+        rels = [DROPRel('B', DROPLinkType.CONSUMER, 'A')]
+        quickDeploy(dm1, sessionId, g1, {nm_conninfo(1): rels})
+        quickDeploy(dm2, sessionId, g2, {nm_conninfo(0): rels})
+
+        a = dm1._sessions[sessionId].drops['A']
+        b,c = [dm2._sessions[sessionId].drops[x] for x in ('B', 'C')]
+        with droputils.DROPWaiterCtx(self, c, 3):
+            a.write('a')
+            a.setCompleted()
+
+        for drop in a, b, c:
+            self.assertEqual(DROPStates.COMPLETED, drop.status)
+        self.assertEqual(a.checksum, int(droputils.allDropContents(c)))
+
+        # Nobody asked for the status of the drops
+        for dm in dm1, dm2:
+            self.assertIsNone(dm.getStatusTracker(sessionId))
+            self.assertIsNone(dm._status_publisher)
+
+        a.delete()
+        dm1.destroySession(sessionId)
+        dm2.destroySession(sessionId)
+
     def test_runGraphSeveralDropsPerDM(self):
         """
         A test that creates several DROPs in two different DMs and  runs
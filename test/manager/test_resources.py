@@ -0,0 +1,127 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+import threading
+import time
+import unittest
+
+from dfms import droputils
+from dfms.ddap_protocol import DROPStates
+from dfms.drop import BarrierAppDROP, InMemoryDROP
+from dfms.manager.resources import ResourceLedger
+
+
+class ConcurrencyCountingApp(BarrierAppDROP):
+    """
+    An application that records the maximum number of instances of its class
+    running at the same time
+    """
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def run(self):
+        cls = ConcurrencyCountingApp
+        with cls.lock:
+            cls.running += 1
+            cls.max_running = max(cls.max_running, cls.running)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.running -= 1
+
+class TestResourceLedger(unittest.TestCase):
+
+    totals = {'num_cpus': 4, 'memory': 1000, 'scratch': 100}
+
+    def test_admit_and_release(self):
+
+        ledger = ResourceLedger(self.totals)
+        started = []
+
+        ledger.admit({'num_cpus': 2, 'memory': 600}, lambda: started.append('a'))
+        ledger.admit({'num_cpus': 2, 'memory': 600}, lambda: started.append('b'))
+        self.assertEqual(['a'], started)
+        self.assertEqual(1, ledger.status['running'])
+        self.assertEqual(1, ledger.status['queued'])
+        self.assertEqual(400, ledger.status['free']['memory'])
+
+        # Doesn't fit yet, and queued after b anyway
+        ledger.admit({'num_cpus': 1}, lambda: started.append('c'))
+        self.assertEqual(['a'], started)
+
+        # Releasing a starts b and c, both fit
+        ledger.release({'num_cpus': 2, 'memory': 600})
+        self.assertEqual(['a', 'b', 'c'], started)
+        self.assertEqual(2, ledger.status['running'])
+        self.assertEqual(0, ledger.status['queued'])
+        self.assertEqual(3, ledger.status['used']['num_cpus'])
+
+    def test_backfill(self):
+
+        ledger = ResourceLedger(self.totals)
+        started = []
+
+        ledger.admit({'num_cpus': 3}, lambda: started.append('a'))
+        ledger.admit({'num_cpus': 1}, lambda: started.append('b'))
+        ledger.admit({'num_cpus': 3}, lambda: started.append('c'))
+        ledger.admit({'scratch': 50}, lambda: started.append('d'))
+        self.assertEqual(['a', 'b'], started)
+
+        # c doesn't fit after b finishes, but d does
+        ledger.release({'num_cpus': 1})
+        self.assertEqual(['a', 'b', 'd'], started)
+        self.assertEqual(1, ledger.status['queued'])
+
+    def test_oversized_requirements(self):
+
+        # More than the total; runs alone when possible
+        ledger = ResourceLedger(self.totals)
+        started = []
+        ledger.admit({'memory': 5000}, lambda: started.append('a'))
+        ledger.admit({'memory': 1}, lambda: started.append('b'))
+        self.assertEqual(['a'], started)
+        ledger.release({'memory': 5000})
+        self.assertEqual(['a', 'b'], started)
+
+    def test_apps(self):
+        """
+        Four applications requiring two cores each share a single input; only
+        two of them can run at the same time on a node with four cores.
+        """
+
+        ledger = ResourceLedger(self.totals)
+        a = InMemoryDROP('a', 'a')
+        apps = []
+        for i in range(4):
+            uid = 'app%d' % (i,)
+            app = ConcurrencyCountingApp(uid, uid, num_cpus=2)
+            app._resource_ledger = ledger
+            a.addConsumer(app)
+            apps.append(app)
+
+        with droputils.DROPWaiterCtx(self, apps, 5):
+            a.write(b'a')
+            a.setCompleted()
+
+        for app in apps:
+            self.assertEqual(DROPStates.COMPLETED, app.status)
+        self.assertEqual(2, ConcurrencyCountingApp.max_running)
+        self.assertEqual(0, ledger.status['running'])
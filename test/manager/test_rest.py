@@ -19,16 +19,23 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 #
+import json
+import socket
 import tempfile
 import threading
+import time
 import unittest
+import zlib
+
+import six.moves.http_client as httplib  # @UnresolvedImport
 
 from dfms import exceptions
-from dfms.manager import constants
+from dfms.manager import constants, rest
 from dfms.manager.client import NodeManagerClient, DataIslandManagerClient
 from dfms.manager.node_manager import NodeManager
 from dfms.manager.rest import NMRestServer, CompositeManagerRestServer
-from dfms.restutils import RestClient
+from dfms.restutils import RestClient, connection_pool, content_encodings, \
+    BoundedReader, ChunkedBodyReader
 from dfms.manager.composite_manager import DataIslandManager
 from dfms.exceptions import InvalidGraphException
 
@@ -112,4 +119,293 @@ class TestRest(unittest.TestCase):
             c.addGraphSpec(sid, [{'oid': 'a', 'type': 'app', 'app': 'doesnt.exist', 'node': hostname}])
         ex = cm.exception
         self.assertTrue(hostname in ex.args[0])
-        self.assertTrue(isinstance(ex.args[0][hostname], InvalidGraphException))
\ No newline at end of file
+        self.assertTrue(isinstance(ex.args[0][hostname], InvalidGraphException))
+    def test_keepalive(self):
+
+        # Successive requests to the same server reuse the same connection
+        connection_pool.clear()
+        c = NodeManagerClient(hostname)
+        c.sessions()
+        idle = connection_pool._idle[(hostname, constants.NODE_DEFAULT_REST_PORT)]
+        self.assertEqual(1, len(idle))
+        conn = idle[0][0]
+        c.createSession('keepalive')
+        c.sessions()
+        self.assertEqual(1, len(idle))
+        self.assertIs(conn, idle[0][0])
+        self.assertTrue(connection_pool.is_alive(hostname, constants.NODE_DEFAULT_REST_PORT))
+
+        # Stale connections are transparently replaced
+        conn.sock.close()
+        self.assertEqual(1, len(c.sessions()))
+
+    def test_keepalive_retries(self):
+
+        # A server that answers only the first request of each connection, and
+        # closes it after reading the second one
+        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        srv.bind((hostname, 0))
+        srv.listen(5)
+        requests = []
+        def serve():
+            while True:
+                try:
+                    conn, _ = srv.accept()
+                except socket.error:
+                    return
+                f = conn.makefile('rb')
+                for answer in (True, False):
+                    line = f.readline()
+                    if not line:
+                        break
+                    headers = {}
+                    for header in iter(lambda: f.readline().strip(), b''):
+                        name, value = header.split(b':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                    if b'transfer-encoding' in headers:
+                        ChunkedBodyReader(f).drain()
+                    else:
+                        BoundedReader(f, int(headers.get(b'content-length', 0))).drain()
+                    requests.append(line.split()[0].decode('ascii'))
+                    if answer:
+                        conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+                f.close()
+                conn.close()
+        t = threading.Thread(target=serve)
+        t.start()
+
+        connection_pool.clear()
+        c = RestClient(hostname, srv.getsockname()[1], 10)
+        try:
+            self.assertEqual({}, c._get_json('/'))
+
+            # Idempotent requests are sent again through a new connection
+            self.assertEqual({}, c._get_json('/'))
+            self.assertEqual(['GET'] * 3, requests)
+
+            # Streamed content is consumed when sent, and other requests might
+            # have been acted upon already, so they are not sent again
+            for content in ({'a': 1}, '{}'):
+                del requests[:]
+                self.assertRaises((socket.error, httplib.HTTPException), c._post_json, '/', content)
+                self.assertEqual(['POST'], requests)
+                self.assertEqual({}, c._get_json('/'))
+        finally:
+            c._close()
+            connection_pool.clear()
+            srv.shutdown(socket.SHUT_RDWR)
+            srv.close()
+            t.join()
+
+    def test_streamed_response(self):
+
+        # A graph big enough for its status to be streamed and compressed
+        sid = 'streamed'
+        n_drops = rest.stream_threshold * 2
+        c = NodeManagerClient(hostname)
+        c.createSession(sid)
+        c.addGraphSpec(sid, [{'oid': str(i), 'type': 'plain', 'storage': 'memory'} for i in range(n_drops)])
+        c.deploySession(sid)
+        status = c.getGraphStatus(sid)
+        self.assertEqual(self.dm.getGraphStatus(sid), status)
+        self.assertEqual(n_drops, len(status))
+
+        for encoding in ('gzip', 'deflate'):
+            conn = httplib.HTTPConnection(hostname, constants.NODE_DEFAULT_REST_PORT)
+            conn.request('GET', '/api/sessions/%s/graph/status' % (sid,), headers={'Accept-Encoding': encoding})
+            resp = conn.getresponse()
+            self.assertEqual(encoding, resp.getheader('Content-Encoding'))
+            self.assertEqual('chunked', resp.getheader('Transfer-Encoding'))
+            content = zlib.decompress(resp.read(), content_encodings[encoding])
+            self.assertEqual(status, json.loads(content.decode('utf8')))
+            conn.close()
+
+    def test_session_events(self):
+
+        sid = 'events'
+        graph = [{'oid': 'A', 'type': 'plain', 'storage': 'memory', 'consumers': ['B']},
+                 {'oid': 'B', 'type': 'app', 'app': 'test.graphsRepository.SleepAndCopyApp', 'sleepTime': 0, 'outputs': ['C']},
+                 {'oid': 'C', 'type': 'plain', 'storage': 'memory'}]
+        c = NodeManagerClient(hostname)
+        c.createSession(sid)
+        c.addGraphSpec(sid, graph)
+
+        # As if our DIM had asked for the status of the drops
+        self.dm.push_status_requested(True)
+        c.deploySession(sid)
+
+        # Follow the session until it finishes
+        events = []
+        def follow():
+            for version, drops in NodeManagerClient(hostname).session_events(sid):
+                events.append((version, drops))
+        t = threading.Thread(target=follow)
+        t.start()
+        time.sleep(0.5)
+        a = self.dm._sessions[sid].drops['A']
+        a.write(b'abcde')
+        a.setCompleted()
+        t.join(10)
+        self.assertFalse(t.is_alive())
+
+        # The first message has all drops, and the latest status of each drop
+        # is that of the graph
+        self.assertEqual(set(['A', 'B', 'C']), set(events[0][1]))
+        latest = {}
+        for _, drops in events:
+            latest.update(drops)
+        self.assertEqual(self.dm.getGraphStatus(sid), latest)
+        versions = [v for v, _ in events]
+        numbers = [int(v.rsplit('-', 1)[1]) for v in versions]
+        self.assertEqual(sorted(numbers), numbers)
+
+        # Resuming from the last version gives no more events, from an older
+        # version only the newer changes (merged)
+        self.assertEqual([], list(c.session_events(sid, since=versions[-1])))
+        resumed = list(c.session_events(sid, since=versions[0]))
+        self.assertEqual(versions[-1], resumed[-1][0])
+        newer = {}
+        for _, drops in events[1:]:
+            newer.update(drops)
+        self.assertEqual(newer, resumed[-1][1])
+
+        # Versions not issued by the tracker of the session give all drops
+        for since in ('abc-1', str(numbers[-1]), 'x'):
+            resumed = list(c.session_events(sid, since=since))
+            self.assertEqual([(versions[-1], latest)], resumed)
+
+        # Server-sent events format
+        conn = httplib.HTTPConnection(hostname, constants.NODE_DEFAULT_REST_PORT)
+        conn.request('GET', '/api/sessions/%s/events' % (sid,), headers={'Accept': 'text/event-stream'})
+        resp = conn.getresponse()
+        self.assertEqual('text/event-stream', resp.getheader('Content-Type'))
+        lines = resp.read().decode('utf8').split('\n')
+        self.assertEqual('id: %s' % (versions[-1],), lines[0])
+        self.assertEqual('event: status', lines[1])
+        self.assertEqual(latest, json.loads(lines[2][len('data: '):]))
+        self.assertEqual('event: finished', lines[4])
+        conn.close()
+
+        # Streams ended by the server are resumed
+        self._dm_server.events_max_duration = 0
+        self.assertEqual([(versions[-1], latest)], list(c.session_events(sid)))
+
+        # Errors are reported as usual
+        self.assertRaises(exceptions.NoSessionException, lambda: list(c.session_events('unknown')))
+
+    def test_polled_session_events(self):
+
+        sid = 'polled'
+        graph = [{'oid': 'A', 'type': 'plain', 'storage': 'memory', 'consumers': ['B']},
+                 {'oid': 'B', 'type': 'app', 'app': 'test.graphsRepository.SleepAndCopyApp', 'sleepTime': 0, 'outputs': ['C']},
+                 {'oid': 'C', 'type': 'plain', 'storage': 'memory'}]
+        c = NodeManagerClient(hostname)
+        c.createSession(sid)
+        c.addGraphSpec(sid, graph)
+        c.deploySession(sid)
+        self.assertIsNone(self.dm.getStatusTracker(sid))
+
+        # Concurrent streams are fed by the same tracker
+        events = [[], []]
+        def follow(n):
+            for version, drops in NodeManagerClient(hostname).session_events(sid):
+                events[n].append((version, drops))
+        threads = [threading.Thread(target=follow, args=(n,)) for n in range(2)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)
+        a = self.dm._sessions[sid].drops['A']
+        a.write(b'abcde')
+        a.setCompleted()
+        for t in threads:
+            t.join(10)
+            self.assertFalse(t.is_alive())
+
+        epochs = set(v.rsplit('-', 1)[0] for stream in events for v, _ in stream)
+        self.assertEqual(1, len(epochs))
+        self.assertEqual(events[0][-1][0], events[1][-1][0])
+        latest = {}
+        for _, drops in events[0]:
+            latest.update(drops)
+        self.assertEqual(self.dm.getGraphStatus(sid), latest)
+
+        # ...which is kept for later streams to resume from, but not polled
+        self.assertEqual([], list(c.session_events(sid, since=events[0][-1][0])))
+        resumed = list(c.session_events(sid, since=events[0][0][0]))
+        self.assertEqual(events[0][-1][0], resumed[-1][0])
+        self.assertFalse(self._dm_server._status_poller._subscribers)
+
+        # ...until the session is gone
+        c.destroySession(sid)
+        self.assertRaises(exceptions.NoSessionException, lambda: list(c.session_events(sid)))
+        self._dm_server._status_poller._forget_gone()
+        self.assertFalse(self._dm_server._status_poller._trackers)
+
+    def test_worker_pool(self):
+
+        # More concurrent clients than workers, all of them keeping their
+        # connections alive; they all get served eventually
+        port = constants.NODE_DEFAULT_REST_PORT + 100
+        server = NMRestServer(self.dm, max_workers=2)
+        server_t = threading.Thread(target=server.start, args=(hostname, port))
+        server_t.start()
+        try:
+            results = []
+            def poll():
+                c = NodeManagerClient(hostname, port)
+                for _ in range(5):
+                    results.append(c.sessions())
+            threads = [threading.Thread(target=poll) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(30)
+            self.assertEqual(40, len(results))
+        finally:
+            server.stop()
+            server_t.join()
+
+    def test_endpoint_limits(self):
+        # Heavy endpoints are only limited when using a bounded pool of
+        # workers, or when asked explicitly
+        self.assertNotIn('getGraph', vars(NMRestServer(self.dm)))
+        self.assertIn('getGraph', vars(NMRestServer(self.dm, max_workers=2)))
+        server = NMRestServer(self.dm, endpoint_limits={'getGraphStatus': 1})
+        self.assertIn('getGraphStatus', vars(server))
+        self.assertNotIn('getGraph', vars(server))
+
+    def test_limit_concurrency(self):
+
+        lock = threading.Lock()
+        counts = {'current': 0, 'max': 0}
+        def work():
+            with lock:
+                counts['current'] += 1
+                counts['max'] = max(counts['max'], counts['current'])
+            time.sleep(0.05)
+            with lock:
+                counts['current'] -= 1
+
+        limited = self._dm_server.limit_concurrency(work, 2)
+        threads = [threading.Thread(target=limited) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(2, counts['max'])
+
+        # Streamed responses keep their slot until the server closes them
+        def stream():
+            yield b'a'
+        limited = self._dm_server.limit_concurrency(stream, 1)
+        body = limited()
+        self.assertEqual([b'a'], list(body))
+        started = threading.Event()
+        t = threading.Thread(target=lambda: started.set() or limited().close())
+        t.start()
+        self.assertTrue(started.wait(5))
+        t.join(0.2)
+        self.assertTrue(t.is_alive())
+        body.close()
+        t.join(5)
+        self.assertFalse(t.is_alive())
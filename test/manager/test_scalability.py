@@ -20,11 +20,19 @@
 #    MA 02111-1307  USA
 #
 import logging
+import os
+import socket
+import threading
 import time
 import unittest
 
-from dfms import drop, tool
-from dfms.manager import client
+from dfms import drop, tool, utils
+from dfms.exceptions import NoSessionException, SessionAlreadyExistsException, \
+    SubManagerException
+from dfms.manager import client, constants
+from dfms.manager.composite_manager import DataIslandManager
+from dfms.manager.rest import NMRestServer
+from dfms.manager.session import SessionStates
 from dfms.utils import terminate_or_kill
 from test.manager import testutils
 
@@ -111,4 +119,134 @@ class TestBigGraph(unittest.TestCase):
 
             # A minute is more than enough, in my PC it takes around 4 or 5 [s]
             # A minute is also way less than the ~2 [h] we observed in AWS
-            self.assertLessEqual(delta, 60, "It took way too much time to create all drops")
\ No newline at end of file
+            self.assertLessEqual(delta, 60, "It took way too much time to create all drops")
+
+class LightweightNM(object):
+    """
+    A NodeManager stand-in that only keeps track of session states, so we can
+    have hundreds of them in a single process.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+
+    def _session(self, sessionId):
+        if sessionId not in self._sessions:
+            raise NoSessionException(sessionId)
+        return sessionId
+
+    def getSessionIds(self):
+        return list(self._sessions)
+
+    def createSession(self, sessionId):
+        if sessionId in self._sessions:
+            raise SessionAlreadyExistsException(sessionId)
+        self._sessions[sessionId] = SessionStates.PRISTINE
+
+    def destroySession(self, sessionId):
+        del self._sessions[self._session(sessionId)]
+
+    def deploySession(self, sessionId, completedDrops=[]):
+        self._sessions[self._session(sessionId)] = SessionStates.RUNNING
+
+    def getSessionStatus(self, sessionId):
+        return self._sessions[self._session(sessionId)]
+
+    def getGraphStatus(self, sessionId):
+        self._session(sessionId)
+        return {}
+
+    def getGraphSize(self, sessionId):
+        self._session(sessionId)
+        return 0
+
+    def getGraph(self, sessionId):
+        self._session(sessionId)
+        return {}
+
+def _loopback_aliases_usable(n):
+    # Only Linux routes the whole 127.0.0.0/8 block to the loopback interface
+    for i in (2, n + 1):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(('127.0.0.%d' % (i,), 0))
+        except socket.error:
+            return False
+        finally:
+            s.close()
+    return True
+
+run_long_tests = bool(os.environ.get('DALIUGE_TESTS_RUNLONGTESTS', ''))
+n_fanout_nms = int(os.environ.get('DALIUGE_SCALABILITY_NMS', 100))
+
+@unittest.skipUnless(run_long_tests, "Long test, set DALIUGE_TESTS_RUNLONGTESTS to run it")
+@unittest.skipUnless(_loopback_aliases_usable(n_fanout_nms), "Cannot bind to 127.0.0.x loopback aliases")
+class TestReplicationFanout(unittest.TestCase):
+    """
+    Compares the time it takes a DataIslandManager to replicate commands to a
+    big number of NodeManagers directly against doing it through a tree of
+    relaying NodeManagers. Each NodeManager listens on a different loopback
+    address so they can all use the default NM port.
+    """
+
+    n_nms = n_fanout_nms
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        port = constants.NODE_DEFAULT_REST_PORT
+        self.hosts = ['127.0.0.%d' % (i + 2,) for i in range(self.n_nms)]
+        self.servers = []
+        for host in self.hosts:
+            server = NMRestServer(LightweightNM())
+            t = threading.Thread(target=server.start, args=(host, port))
+            t.daemon = True
+            t.start()
+            self.servers.append((server, t))
+        for host in self.hosts:
+            self.assertTrue(utils.portIsOpen(host, port, 10))
+
+    def tearDown(self):
+        # Stopping each server takes a while, do it in parallel
+        stoppers = [threading.Thread(target=server.stop) for server, _ in self.servers]
+        for t in stoppers:
+            t.start()
+        for t in stoppers + [t for _, t in self.servers]:
+            t.join()
+        unittest.TestCase.tearDown(self)
+
+    def _replicate_commands(self, dim, sessionId):
+        start = time.time()
+        dim.createSession(sessionId)
+        dim.deploySession(sessionId)
+        status = dim.getSessionStatus(sessionId)
+        dim.destroySession(sessionId)
+        return time.time() - start, status
+
+    def test_fanout(self):
+
+        times = {}
+        for fanout in (None, 2, 8):
+            dim = DataIslandManager(dmHosts=list(self.hosts), fanout=fanout)
+            try:
+                times[fanout], status = self._replicate_commands(dim, 'lala-%r' % (fanout,))
+            finally:
+                dim.shutdown()
+            self.assertEqual(dict((h, SessionStates.RUNNING) for h in self.hosts), status)
+
+        logger.info("Replicating commands to %d NMs took %.3f [s] directly, "
+                    "%.3f [s] with fanout 2 and %.3f [s] with fanout 8",
+                    self.n_nms, times[None], times[2], times[8])
+
+    def test_fanout_with_dead_relay(self):
+
+        # The first host is the top-level relay of the first subtree; the rest
+        # of its subtree must be reached anyway
+        self.servers[0][0].stop()
+        dim = DataIslandManager(dmHosts=list(self.hosts), dmCheckTimeout=1, fanout=4)
+        try:
+            for f in (dim.createSession, dim.getSessionStatus):
+                with self.assertRaises(SubManagerException) as cm:
+                    f('lala')
+                self.assertEqual([self.hosts[0]], list(cm.exception.args[1]))
+        finally:
+            dim.shutdown()
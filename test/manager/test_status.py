@@ -0,0 +1,83 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+import unittest
+
+from dfms.ddap_protocol import DROPStates, AppDROPStates
+from dfms.manager.session import SessionStates
+from dfms.manager.status import StatusTracker, StatusAggregator, status_event
+
+
+class TestStatusTracker(unittest.TestCase):
+
+    def test_changes_since(self):
+
+        tracker = StatusTracker()
+        tracker.update('A', DROPStates.INITIALIZED)
+        tracker.update('B', DROPStates.INITIALIZED, AppDROPStates.NOT_RUN)
+        self.assertEqual(2, tracker.version)
+
+        # Updates that change nothing don't count
+        tracker.update('A', DROPStates.INITIALIZED)
+        self.assertEqual(2, tracker.version)
+
+        tracker.update('A', DROPStates.COMPLETED)
+        tracker.update('B', execStatus=AppDROPStates.RUNNING)
+        self.assertEqual((4, {'B': (DROPStates.INITIALIZED, AppDROPStates.RUNNING)}), tracker.changes_since(3))
+        self.assertEqual(2, len(tracker.changes_since(1)[1]))
+        self.assertEqual((4, {}), tracker.changes_since(4))
+        self.assertEqual(tracker.snapshot(), tracker.changes_since(0))
+
+class TestStatusAggregator(unittest.TestCase):
+
+    def test_missed_events(self):
+
+        RUNNING = SessionStates.RUNNING
+        agg = StatusAggregator(1234)
+        agg._apply('node1', status_event('s', 'node1', None, 2, RUNNING, {'A': (DROPStates.INITIALIZED, None)}))
+        self.assertEqual({'node1': RUNNING}, agg.session_status('s', ['node1']))
+        self.assertIsNone(agg.session_status('s', ['node1', 'node2']))
+
+        # A gap in the versions makes the view unusable until the next snapshot
+        agg._apply('node1', status_event('s', 'node1', 3, 4, RUNNING, {'A': (DROPStates.COMPLETED, None)}))
+        self.assertIsNone(agg.graph_status('s', ['node1']))
+        agg._apply('node1', status_event('s', 'node1', 4, 5, RUNNING, {'A': (DROPStates.ERROR, None)}))
+        self.assertIsNone(agg.graph_status('s', ['node1']))
+        agg._apply('node1', status_event('s', 'node1', None, 5, SessionStates.FINISHED, {'A': (DROPStates.COMPLETED, None)}))
+        self.assertEqual({'A': {'status': DROPStates.COMPLETED}}, agg.graph_status('s', ['node1']))
+
+    def test_islands(self):
+
+        FINISHED = SessionStates.FINISHED
+        agg = StatusAggregator(1234)
+        evt = status_event('s', 'node1', None, 1, FINISHED, {'A': (DROPStates.COMPLETED, None)})
+        evt.island_nodes = ['node1', 'node2']
+        agg._apply('island', evt)
+        self.assertIsNone(agg.session_status('s', ['island']))
+
+        evt = status_event('s', 'node2', None, 1, FINISHED, {'B': (DROPStates.COMPLETED, AppDROPStates.FINISHED)})
+        evt.island_nodes = ['node1', 'node2']
+        agg._apply('island', evt)
+        self.assertEqual({'island': {'node1': FINISHED, 'node2': FINISHED}}, agg.session_status('s', ['island']))
+        self.assertEqual(2, len(agg.graph_status('s', ['island'])))
+
+        agg.forget('s')
+        self.assertIsNone(agg.graph_status('s', ['island']))
@@ -0,0 +1,90 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2015
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A small benchmark comparing the round-trip latency of ZeroMQ messages sent
+between two processes in this host via TCP and via IPC, which is what Node
+Managers running in the same host use to talk to each other.
+"""
+
+import multiprocessing
+from optparse import OptionParser
+import os
+import sys
+import tempfile
+import time
+
+
+def echo(endpoint, n):
+    import zmq
+    ctx = zmq.Context()
+    rep = ctx.socket(zmq.REP)  # @UndefinedVariable
+    rep.bind(endpoint)
+    for _ in range(n):
+        rep.send(rep.recv())
+    rep.close()
+    ctx.destroy()
+
+def measure(endpoint, n, size):
+    """
+    Sends `n` messages of `size` bytes to an echo process listening on
+    `endpoint` and returns the average round-trip time, in seconds
+    """
+    import zmq
+
+    # One extra message to warm up the connection
+    p = multiprocessing.Process(target=echo, args=(endpoint, n + 1))
+    p.start()
+
+    ctx = zmq.Context()
+    req = ctx.socket(zmq.REQ)  # @UndefinedVariable
+    req.connect(endpoint)
+    msg = b'x' * size
+    req.send(msg)
+    req.recv()
+
+    start = time.time()
+    for _ in range(n):
+        req.send(msg)
+        req.recv()
+    delta = time.time() - start
+
+    req.close()
+    ctx.destroy()
+    p.join()
+    return delta / n
+
+if __name__ == '__main__':
+
+    parser = OptionParser()
+    parser.add_option("-n", "--messages", action="store", type="int",
+                      dest="n", help="Number of messages to send", default=10000)
+    parser.add_option("-s", "--size", action="store", type="int",
+                      dest="size", help="Size of each message, in bytes", default=64)
+    parser.add_option("-p", "--port", action="store", type="int",
+                      dest="port", help="TCP port to use", default=7777)
+    (options, args) = parser.parse_args(sys.argv)
+
+    ipc_file = os.path.join(tempfile.gettempdir(), 'dfms-transport-bench')
+    for name, endpoint in (('TCP', 'tcp://127.0.0.1:%d' % (options.port,)),
+                           ('IPC', 'ipc://%s' % (ipc_file,))):
+        latency = measure(endpoint, options.n, options.size)
+        print("%s: %.2f usec per round-trip (%d messages of %d bytes)" % (name, latency * 1e6, options.n, options.size))
@@ -33,6 +33,7 @@ from dfms import droputils
 from dfms.drop import InMemoryDROP, FileDROP, \
     BarrierAppDROP, dropdict
 from dfms.droputils import DROPFile
+from dfms.exceptions import InvalidGraphException
 
 
 class DropUtilsTest(unittest.TestCase):
@@ -214,4 +215,40 @@ class DropUtilsTest(unittest.TestCase):
         pg_spec_dropdicts = [dropdict(dropspec) for dropspec in pg_spec]
         roots = droputils.get_roots(pg_spec_dropdicts)
         self.assertEqual(2, len(roots))
-        self.assertListEqual(['A', 'B'], sorted(roots))
\ No newline at end of file
+        self.assertListEqual(['A', 'B'], sorted(roots))
+
+    def test_chunk_graph(self):
+        """
+        A --> C --> D --|
+                        |--> E --> F
+        B --------------|
+
+        Chunks must only reference drops from themselves or previous chunks
+        """
+        pg_spec = [{"oid":"A", "type":"plain", "storage": "memory", "consumers": ["C"]},
+                   {"oid":"C", "type":"app", "app":"dfms.apps.crc.CRCApp", "inputs": ['A'], "outputs": ["D"]},
+                   {"oid":"D", "type":"plain", "storage": "memory", "producers": ["C"]},
+                   {"oid":"F", "type":"plain", "storage": "memory", "producers":["E"]},
+                   {"oid":"E", "type":"app", "app":"test.test_drop.SumupContainerChecksum", "inputs": ["D", "B"]},
+                   {"oid":"B", "type":"plain", "storage": "memory"}]
+        roots = set()
+        chunks = list(droputils.chunk_graph(pg_spec, 2, roots=roots))
+        self.assertEqual([2, 2, 2], [len(c) for c in chunks])
+        self.assertListEqual(['A', 'B'], sorted(roots))
+
+        seen = set()
+        for chunk in chunks:
+            seen |= set(d['oid'] for d in chunk)
+            for d in chunk:
+                for rel in ('consumers', 'inputs', 'outputs', 'producers'):
+                    self.assertTrue(seen.issuperset(d.get(rel, [])))
+
+        # F -> E and E -> B were patched into E and B
+        drops = dict((d['oid'], d) for d in pg_spec)
+        self.assertNotIn('producers', drops['F'])
+        self.assertEqual(['D', 'F'], sorted(drops['E']['outputs'] + drops['E']['inputs']))
+        self.assertEqual(['E'], drops['B']['consumers'])
+
+        # Dangling references are an error
+        pg_spec = [{"oid":"A", "type":"plain", "storage": "memory", "consumers": ["X"]}]
+        self.assertRaises(InvalidGraphException, list, droputils.chunk_graph(pg_spec, 10))
@@ -180,4 +180,25 @@ class TestUtils(unittest.TestCase):
         for obj in (1, {'a': 2}, 'b', {'sessionId': sessionId}):
             stream = utils.JSONStream(obj)
             self.assertEqual(obj, json.loads(stream.read(100).decode('latin1')))
-            self.assertEqual(0, len(stream.read(100).decode('latin1')))
\ No newline at end of file
+            self.assertEqual(0, len(stream.read(100).decode('latin1')))
+    def test_load_json_stream(self):
+
+        objects = ({}, [], 1, 2.5, 'a', None,
+                   {'a': 1, 'b': [1, 2.5, {'c': u'é' * 10}], 'n': -1e10},
+                   dict((str(i), {'x': i, 'y': 'z' * i}) for i in range(100)))
+        for obj in objects:
+            content = json.dumps(obj, ensure_ascii=False, indent=1).encode('utf8')
+            for bufsize in (1, 3, 7, 65536):
+                loaded = utils.load_json_stream(six.BytesIO(content), bufsize=bufsize)
+                self.assertEqual(obj, loaded)
+
+        for content in (b'', b'[1,2', b'{"a" 1}', b'[1] x', b'[1 2]'):
+            self.assertRaises(ValueError, utils.load_json_stream, six.BytesIO(content), 2)
+
+    def test_zlib_streams_gzip(self):
+        wbits = 16 + zlib.MAX_WBITS
+        original = b'abcdefghijklmnopqrstuvwxyz' * 1000
+        compressed = utils.ZlibCompressedStream(six.BytesIO(original), wbits=wbits).read(-1)
+        self.assertEqual(original, zlib.decompress(compressed, wbits))
+        uncompressed = utils.ZlibUncompressedStream(six.BytesIO(compressed), wbits=wbits)
+        self.assertEqual(original, uncompressed.read(-1))